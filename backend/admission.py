@@ -0,0 +1,236 @@
+"""
+Admission control: token-bucket rate limits and bounded job queues
+
+- Per-socket limits are local token buckets (a socket lives on one worker).
+- Per-session and per-endpoint limits are token buckets kept in Redis, so
+  every replica draws from the same budget.
+- Canvas updates over the limit are merged (latest full state wins) and
+  flushed once the budget allows; chat over the limit is rejected. Either
+  way the sender gets an explicit `backpressure` frame.
+- Expensive jobs (code generation, deploys) run with bounded concurrency and
+  a bounded wait queue; a full queue is reported as HTTP 429.
+"""
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+import redis
+
+from metrics import ADMISSION_REJECTIONS, JOB_QUEUE_DEPTH, JOB_RUNNING
+
+logger = logging.getLogger(__name__)
+
+
+# Server-side token bucket; Redis TIME keeps every replica on the same clock
+TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= requested then
+    tokens = tokens - requested
+else
+    wait = (requested - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class TokenBucket:
+    """In-process token bucket"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """Take tokens; returns 0 on success, otherwise seconds until they are available"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return 0.0
+        return (tokens - self.tokens) / self.rate
+
+
+class QueueFullError(Exception):
+    """Raised when a job queue cannot accept more waiters"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} queue is full")
+        self.retry_after = retry_after
+
+
+class JobQueue:
+    """Bounded concurrency with a bounded number of waiters"""
+
+    def __init__(self, name: str, concurrency: int, max_waiting: int, typical_seconds: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_waiting = max_waiting
+        self.typical_seconds = typical_seconds
+        self.waiting = 0
+        self.running = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+        JOB_QUEUE_DEPTH.labels(name).set_function(lambda: self.waiting)
+        JOB_RUNNING.labels(name).set_function(lambda: self.running)
+
+    def full(self) -> bool:
+        """True when a new job would be rejected"""
+        return self._semaphore.locked() and self.waiting >= self.max_waiting
+
+    def check(self):
+        """Raise QueueFullError if a new job would be rejected"""
+        if self.full():
+            ADMISSION_REJECTIONS.labels("queue", self.name).inc()
+            # Rough estimate: one queue's worth of jobs has to finish first
+            raise QueueFullError(self.name, self.typical_seconds * (self.waiting + 1) / self.concurrency)
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one of the concurrency slots for the duration of a job"""
+        self.check()
+
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.running += 1
+        try:
+            yield
+        finally:
+            self.running -= 1
+            self._semaphore.release()
+
+
+class CanvasCoalescer:
+    """Keeps only the newest deferred canvas state per session and flushes it later"""
+
+    def __init__(self, flush: Callable[[str, object], Awaitable[None]]):
+        self.flush = flush
+        self.pending: Dict[str, object] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+
+    def defer(self, session_id: str, state, delay: float):
+        """Replace the session's pending state and make sure a flush is scheduled"""
+        self.pending[session_id] = state
+        if session_id not in self._timers:
+            loop = asyncio.get_running_loop()
+            self._timers[session_id] = loop.call_later(
+                delay, lambda: asyncio.ensure_future(self._flush(session_id))
+            )
+
+    def discard(self, session_id: str):
+        """Drop a pending state that a newer, admitted update has superseded"""
+        self.pending.pop(session_id, None)
+
+    async def _flush(self, session_id: str):
+        self._timers.pop(session_id, None)
+        state = self.pending.pop(session_id, None)
+        if state is not None:
+            try:
+                await self.flush(session_id, state)
+            except Exception as e:
+                logger.warning(f"Deferred canvas flush for {session_id} failed: {e}")
+
+
+def _env_rate(name: str, rate: float, burst: float) -> Tuple[float, float]:
+    """Read `<NAME>_RATE` / `<NAME>_BURST` overrides"""
+    return float(os.getenv(f"{name}_RATE", rate)), float(os.getenv(f"{name}_BURST", burst))
+
+
+class AdmissionController:
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self._script = None
+
+        # (rate per second, burst)
+        self.socket_limit = _env_rate("WS_SOCKET", 20, 40)
+        self.session_limits = {
+            "canvas_update": _env_rate("SESSION_CANVAS", 10, 20),
+            "chat_message": _env_rate("SESSION_CHAT", 20, 40)
+        }
+        self.endpoint_limits = {
+            "generate-code": _env_rate("GENERATE_CODE", 1, 5),
+            "deploy": _env_rate("DEPLOY", 0.2, 2)
+        }
+        self.jobs = {
+            "generate-code": JobQueue(
+                "generate-code",
+                int(os.getenv("GENERATE_CODE_CONCURRENCY", 4)),
+                int(os.getenv("GENERATE_CODE_QUEUE", 16)),
+                typical_seconds=60
+            ),
+            "deploy": JobQueue(
+                "deploy",
+                int(os.getenv("DEPLOY_CONCURRENCY", 2)),
+                int(os.getenv("DEPLOY_QUEUE", 8)),
+                typical_seconds=120
+            )
+        }
+
+        # WebSocket -> local bucket
+        self._socket_buckets: Dict[object, TokenBucket] = {}
+
+    async def _shared_acquire(self, key: str, rate: float, burst: float) -> float:
+        """Take a token from a Redis-backed bucket; fails open if Redis is unavailable"""
+        if self._script is None:
+            self._script = self.redis_client.async_client.register_script(TOKEN_BUCKET_LUA)
+        try:
+            return float(await self._script(keys=[f"ratelimit:{key}"], args=[rate, burst, 1]))
+        except redis.RedisError as e:
+            logger.warning(f"Rate limiter unavailable ({e}); admitting {key}")
+            return 0.0
+
+    async def admit_message(self, websocket, session_id: str, message_type: str) -> Tuple[float, Optional[str]]:
+        """
+        Check a WebSocket frame against the socket and session budgets
+
+        Returns (retry_after_seconds, limiting_scope); (0, None) means admitted.
+        """
+        bucket = self._socket_buckets.get(websocket)
+        if bucket is None:
+            bucket = TokenBucket(*self.socket_limit)
+            self._socket_buckets[websocket] = bucket
+
+        retry_after = bucket.try_acquire()
+        if retry_after:
+            ADMISSION_REJECTIONS.labels("socket", message_type).inc()
+            return retry_after, "socket"
+
+        limit = self.session_limits.get(message_type)
+        if limit is not None:
+            retry_after = await self._shared_acquire(f"session:{session_id}:{message_type}", *limit)
+            if retry_after:
+                ADMISSION_REJECTIONS.labels("session", message_type).inc()
+                return retry_after, "session"
+
+        return 0.0, None
+
+    async def admit_endpoint(self, endpoint: str) -> float:
+        """Check a cluster-wide endpoint budget; returns seconds to wait, 0 if admitted"""
+        retry_after = await self._shared_acquire(f"endpoint:{endpoint}", *self.endpoint_limits[endpoint])
+        if retry_after:
+            ADMISSION_REJECTIONS.labels("endpoint", endpoint).inc()
+        return retry_after
+
+    def forget(self, websocket):
+        """Drop per-socket state on disconnect"""
+        self._socket_buckets.pop(websocket, None)
@@ -3,35 +3,96 @@ AI-powered Infrastructure as Code generator
 GMS GPT-5 전용
 """
 import os
+import hashlib
+import json
 import logging
-from typing import Dict, List
-from openai import OpenAI
+import re
+import time
+from typing import Callable, Dict, List, Optional, Tuple, Union
 from models import CanvasState, AWSResource, Connection, CodeGenerationResponse
+from cost_estimator import estimate_canvas_cost, format_estimate
+from llm_resilience import (
+    CallerAborted,
+    CircuitBreaker,
+    CircuitOpenError,
+    DEFAULT_DEADLINE,
+    Deadline,
+    DeadlineExceeded,
+    LatencyTracker,
+    StreamInterrupted,
+    call_with_retries,
+    hedged,
+    is_out_of_time,
+    is_upstream_failure
+)
+from local_cache import LocalCache
+from metrics import LLM_FALLBACKS, LLM_LATENCY, LLM_TOKENS
+from tracing import tracer
 
 # 로깅 설정
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+GMS_BASE_URL = "https://gms.ssafy.io/gmsapi/api.openai.com/v1"
+
+
 class AICodeGenerator:
     def __init__(self):
-        self.openai_client = None
+        # openai SDK import와 클라이언트 생성은 첫 사용 시점까지 미룸 (콜드 스타트 단축)
+        self._openai_client = None
+
+        # 요청 전체 시간 예산 (호출자가 deadline을 주지 않을 때, LLM_DEADLINE)
+        self.default_deadline = DEFAULT_DEADLINE
+        self.retries = int(os.getenv("LLM_RETRIES", 2))
+        # 이 백분위 지연을 넘기면 같은 요청을 하나 더 보냄 (0 = 헤징 끔)
+        self.hedge_percentile = float(os.getenv("LLM_HEDGE_PERCENTILE", 95))
+        # 지연 샘플이 모이기 전 헤징 기준 (초)
+        self.hedge_after = float(os.getenv("LLM_HEDGE_AFTER", 60))
+        # 스트리밍은 첫 토큰까지, 비스트리밍은 전체 응답까지의 지연
+        self.latency = {True: LatencyTracker(), False: LatencyTracker()}
+        self.breaker = CircuitBreaker(
+            "gms",
+            failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", 5)),
+            reset_after=float(os.getenv("LLM_BREAKER_RESET", 30))
+        )
+        # 장애 시 대체 응답: template (캐시 → 템플릿), cache (캐시만), none (바로 실패)
+        self.fallback_mode = os.getenv("LLM_FALLBACK", "template")
+        self.recent = LocalCache(
+            max_keys=int(os.getenv("LLM_CACHE_SIZE", 256)),
+            ttl=float(os.getenv("LLM_CACHE_TTL", 86400))
+        )
+
+    @property
+    def openai_client(self):
+        """GMS OpenAI client, created on first use (None if no API key is configured)"""
+        if self._openai_client is None and os.getenv("OPENAI_API_KEY"):
+            from openai import OpenAI
 
-        if os.getenv("OPENAI_API_KEY"):
-            # GMS GPT-5 API
-            self.openai_client = OpenAI(
+            # GMS GPT-5 API; 타임아웃과 재시도는 요청별 deadline 안에서 직접 처리
+            self._openai_client = OpenAI(
                 api_key=os.getenv("OPENAI_API_KEY"),
-                base_url="https://gms.ssafy.io/gmsapi/api.openai.com/v1",
-                timeout=600.0,  # 10분 타임아웃 (GMS API 응답 대기)
-                max_retries=3   # 최대 3번 재시도
+                base_url=os.getenv("OPENAI_BASE_URL", GMS_BASE_URL),
+                timeout=self.default_deadline,
+                max_retries=0
             )
+        return self._openai_client
 
     def generate_terraform_code(
         self,
         canvas_state: CanvasState,
-        provider: str = "openai"  # GMS만 사용
+        provider: str = "openai",  # GMS만 사용
+        on_delta: Optional[Callable[[str], None]] = None,
+        deadline: Union[Deadline, float, None] = None
     ) -> CodeGenerationResponse:
-        """Generate Terraform code from canvas state using GMS GPT-5"""
+        """
+        Generate Terraform code from canvas state using GMS GPT-5
+
+        With `on_delta`, the completion is streamed and each text chunk is passed
+        to it as it arrives; an exception raised by `on_delta` aborts generation.
+        `deadline` (a Deadline or seconds) bounds the whole call; if the LLM is
+        down or out of time, the result may come from a fallback (see `fallback`).
+        """
 
         logger.info(f"🚀 Terraform 코드 생성 시작")
 
@@ -43,18 +104,12 @@ class AICodeGenerator:
                 )
 
             # Build the prompt
-            prompt = self._build_terraform_prompt(canvas_state)
+            with tracer.span("ai.build_prompt", resources=len(canvas_state.resources)):
+                prompt = self._build_terraform_prompt(canvas_state)
             logger.info(f"📝 프롬프트 생성 완료 - {len(canvas_state.resources)}개 리소스")
 
             # GPT-5로 코드 생성
-            code = self._generate_with_gpt(prompt, output_format="terraform")
-
-            logger.info(f"✅ Terraform 코드 생성 완료")
-            return CodeGenerationResponse(
-                success=True,
-                code=code,
-                estimated_cost="SSAFY GMS 사용 (무료)"
-            )
+            code, fallback = self._generate_resilient(prompt, "terraform", canvas_state, on_delta, deadline)
 
         except Exception as e:
             logger.error(f"❌ 생성 실패: {str(e)}")
@@ -63,6 +118,23 @@ class AICodeGenerator:
                 error=str(e)
             )
 
+        logger.info(f"✅ Terraform 코드 생성 완료")
+        return CodeGenerationResponse(
+            success=True,
+            code=code,
+            estimated_cost=self._estimate_cost(canvas_state),
+            fallback=fallback,
+            degraded=fallback is not None
+        )
+
+    def _estimate_cost(self, canvas_state: CanvasState) -> Optional[str]:
+        """Cost estimate for the response; None rather than failing a finished generation"""
+        try:
+            return format_estimate(estimate_canvas_cost(canvas_state))
+        except Exception as e:
+            logger.warning(f"Cost estimate skipped: {e}")
+            return None
+
     def _build_terraform_prompt(self, canvas_state: CanvasState) -> str:
         """Build a detailed prompt for Terraform code generation"""
 
@@ -109,33 +181,201 @@ DO NOT include explanations outside of code comments. Start directly with the co
 """
         return prompt
 
-    def _generate_with_gpt(self, prompt: str, output_format: str = "terraform") -> str:
-        """Generate code using GPT-5-nano (SSAFY GMS)"""
+    def _generate_resilient(
+        self,
+        prompt: str,
+        output_format: str,
+        canvas_state: CanvasState,
+        on_delta: Optional[Callable[[str], None]],
+        deadline: Union[Deadline, float, None]
+    ) -> Tuple[str, Optional[str]]:
+        """
+        (code, fallback source) through the circuit breaker, retries and deadline
+
+        When the circuit is open, or the upstream keeps failing or runs out of
+        time, the last good result for the same prompt (or a template) is
+        returned instead, depending on LLM_FALLBACK. Only upstream errors (and
+        timeouts of a full-length budget) count against the breaker.
+        """
+        deadline = Deadline.coerce(deadline, self.default_deadline)
+        key = hashlib.sha256(f"{output_format}\n{prompt}".encode("utf-8")).hexdigest()
+
+        if not self.breaker.allow():
+            logger.warning("⚡ LLM 회로 차단 중 - 호출하지 않음")
+            return self._fallback(key, output_format, canvas_state, CircuitOpenError("LLM upstream circuit is open"))
+
+        # Half-open probes go out alone (no hedge)
+        hedge = not self.breaker.probing
+        try:
+            code = call_with_retries(
+                lambda: self._generate_with_gpt(prompt, output_format, on_delta, deadline, hedge),
+                deadline,
+                retries=self.retries
+            )
+        except CallerAborted as e:
+            self.breaker.release()
+            raise e.__cause__ or e
+        except Exception as e:
+            if is_upstream_failure(e, deadline, self.default_deadline):
+                self.breaker.record_failure()
+            elif is_out_of_time(e, deadline):
+                # The caller's budget ran out; that says nothing about the upstream
+                self.breaker.release()
+            else:
+                # The upstream answered (e.g. 400/401); nothing a fallback should hide
+                self.breaker.record_success()
+                raise
+            logger.warning(f"⚠️ LLM 호출 실패 ({type(e).__name__}: {e}) - 회로 상태 {self.breaker.state}")
+            return self._fallback(key, output_format, canvas_state, e)
+
+        self.breaker.record_success()
+        self.recent.set(key, "code", code)
+        return code, None
+
+    def _fallback(self, key: str, output_format: str, canvas_state: CanvasState, error: Exception) -> Tuple[str, str]:
+        """A cached or template result standing in for the LLM, or `error` if none is allowed"""
+        reason = "open" if isinstance(error, CircuitOpenError) else "deadline" if isinstance(error, DeadlineExceeded) else "error"
+        if self.fallback_mode in ("cache", "template"):
+            cached = self.recent.get(key, "code")
+            if cached is not None:
+                LLM_FALLBACKS.labels("cache", reason).inc()
+                return cached, "cache"
+        if self.fallback_mode == "template":
+            LLM_FALLBACKS.labels("template", reason).inc()
+            return template_code(canvas_state, output_format), "template"
+        LLM_FALLBACKS.labels("none", reason).inc()
+        raise error
+
+    def _generate_with_gpt(
+        self,
+        prompt: str,
+        output_format: str = "terraform",
+        on_delta: Optional[Callable[[str], None]] = None,
+        deadline: Union[Deadline, float, None] = None,
+        hedge: bool = True
+    ) -> str:
+        """Generate code using GPT-5-nano (SSAFY GMS), one attempt (plus a hedge) within `deadline`"""
 
         system_msg = f"You are an expert AWS infrastructure engineer. Generate production-ready {output_format.upper()} code in Korean. Answer in Korean."
 
         logger.info(f"🤖 GPT-5-nano API 호출 시작... (format: {output_format})")
 
-        response = self.openai_client.chat.completions.create(
-            model="gpt-5-nano",
-            messages=[
-                {
-                    "role": "developer",
-                    "content": system_msg
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            max_completion_tokens=100000
-        )
+        deadline = Deadline.coerce(deadline, self.default_deadline)
+        model = "gpt-5-nano"
+        streaming = on_delta is not None
+        hedge_after = None
+        if hedge and self.hedge_percentile > 0:
+            observed = self.latency[streaming].percentile(self.hedge_percentile)
+            hedge_after = observed if observed is not None else self.hedge_after
+
+        start = time.perf_counter()
+        try:
+            with tracer.span("ai.llm_call", model=model, output_format=output_format) as span:
+                messages = [
+                    {
+                        "role": "developer",
+                        "content": system_msg
+                    },
+                    {
+                        "role": "user",
+                        "content": prompt
+                    }
+                ]
+                if not streaming:
+                    response = hedged(
+                        lambda timeout: self.openai_client.chat.completions.create(
+                            model=model,
+                            messages=messages,
+                            max_completion_tokens=100000,
+                            timeout=timeout
+                        ),
+                        deadline,
+                        hedge_after,
+                        latency=self.latency[False]
+                    )
+                    content, usage = response.choices[0].message.content, response.usage
+                else:
+                    # 스트리밍: 첫 토큰이 먼저 온 요청을 쓰고, 부분 출력을 받는 즉시 전달 (usage는 마지막 청크에 포함)
+                    stream, first = hedged(
+                        lambda timeout: self._open_stream(model, messages, timeout),
+                        deadline,
+                        hedge_after,
+                        discard=lambda opened: opened[0].close(),
+                        latency=self.latency[True]
+                    )
+                    content, usage = self._consume_stream(stream, first, on_delta, deadline)
+        except Exception:
+            LLM_LATENCY.labels(model, output_format, "error").observe(time.perf_counter() - start)
+            raise
+
+        LLM_LATENCY.labels(model, output_format, "success").observe(time.perf_counter() - start)
+        if usage is not None:
+            LLM_TOKENS.labels(model, "prompt").inc(usage.prompt_tokens)
+            LLM_TOKENS.labels(model, "completion").inc(usage.completion_tokens)
+            if span is not None:
+                span.set("prompt_tokens", usage.prompt_tokens)
+                span.set("completion_tokens", usage.completion_tokens)
 
         logger.info(f"✅ GPT-5-nano 응답 받음")
-        return response.choices[0].message.content
+        return content
+
+    def _open_stream(self, model: str, messages: List[Dict], timeout: float):
+        """Start a streamed completion and read up to its first content chunk"""
+        stream = self.openai_client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_completion_tokens=100000,
+            stream=True,
+            stream_options={"include_usage": True},
+            timeout=timeout
+        )
+        first = []
+        try:
+            for chunk in stream:
+                first.append(chunk)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    break
+        except Exception:
+            stream.close()
+            raise
+        return stream, first
+
+    def _consume_stream(self, stream, first: List, on_delta: Callable[[str], None], deadline: Deadline):
+        """Pass the rest of a stream to `on_delta`; (content, usage)"""
+        parts, usage = [], None
+
+        def chunks():
+            yield from first
+            yield from stream
 
-    def generate_cloudformation_code(self, canvas_state: CanvasState) -> CodeGenerationResponse:
-        """Generate CloudFormation YAML from canvas state using GPT-5"""
+        try:
+            for chunk in chunks():
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    try:
+                        on_delta(chunk.choices[0].delta.content)
+                    except Exception as e:
+                        raise CallerAborted() from e
+                if deadline.expired:
+                    raise DeadlineExceeded(f"LLM deadline of {deadline.seconds:.1f}s exceeded mid-stream")
+        except (CallerAborted, DeadlineExceeded):
+            raise
+        except Exception as e:
+            # Part of the answer has already been handed out; a retry would repeat it
+            raise StreamInterrupted(f"Stream failed after {len(parts)} chunks: {e}") from e
+        finally:
+            stream.close()
+        return "".join(parts), usage
+
+    def generate_cloudformation_code(
+        self,
+        canvas_state: CanvasState,
+        on_delta: Optional[Callable[[str], None]] = None,
+        deadline: Union[Deadline, float, None] = None
+    ) -> CodeGenerationResponse:
+        """Generate CloudFormation YAML from canvas state using GPT-5 (streams to `on_delta` if given)"""
 
         logger.info(f"🚀 CloudFormation 코드 생성 시작")
 
@@ -147,18 +387,12 @@ DO NOT include explanations outside of code comments. Start directly with the co
                 )
 
             # Build the prompt for CloudFormation
-            prompt = self._build_cloudformation_prompt(canvas_state)
+            with tracer.span("ai.build_prompt", resources=len(canvas_state.resources)):
+                prompt = self._build_cloudformation_prompt(canvas_state)
             logger.info(f"📝 프롬프트 생성 완료 - {len(canvas_state.resources)}개 리소스")
 
             # GPT-5로 코드 생성
-            code = self._generate_with_gpt(prompt, output_format="cloudformation")
-
-            logger.info(f"✅ CloudFormation 코드 생성 완료")
-            return CodeGenerationResponse(
-                success=True,
-                code=code,
-                estimated_cost="SSAFY GMS 사용 (무료)"
-            )
+            code, fallback = self._generate_resilient(prompt, "cloudformation", canvas_state, on_delta, deadline)
 
         except Exception as e:
             logger.error(f"❌ 생성 실패: {str(e)}")
@@ -167,6 +401,15 @@ DO NOT include explanations outside of code comments. Start directly with the co
                 error=str(e)
             )
 
+        logger.info(f"✅ CloudFormation 코드 생성 완료")
+        return CodeGenerationResponse(
+            success=True,
+            code=code,
+            estimated_cost=self._estimate_cost(canvas_state),
+            fallback=fallback,
+            degraded=fallback is not None
+        )
+
     def _build_cloudformation_prompt(self, canvas_state: CanvasState) -> str:
         """Build a detailed prompt for CloudFormation code generation"""
 
@@ -207,3 +450,106 @@ DO NOT include explanations outside of code comments. Start directly with the co
 CloudFormation YAML 코드만 제공하세요. 설명은 코드 주석으로만 포함하세요.
 """
         return prompt
+
+
+# -- 템플릿 대체 응답 (LLM 장애 시) ----------------------------------------------
+
+TERRAFORM_TEMPLATES = {
+    "vpc": ("aws_vpc", {"cidr_block": '"10.0.0.0/16"', "enable_dns_hostnames": "true"}),
+    "ec2": ("aws_instance", {"ami": "var.ami_id", "instance_type": '"t3.micro"'}),
+    "rds": ("aws_db_instance", {
+        "engine": '"mysql"', "instance_class": '"db.t3.micro"', "allocated_storage": "20",
+        "username": "var.db_username", "password": "var.db_password", "skip_final_snapshot": "true"
+    }),
+    "redis": ("aws_elasticache_cluster", {"engine": '"redis"', "node_type": '"cache.t3.micro"', "num_cache_nodes": "1"}),
+    "s3": ("aws_s3_bucket", {}),
+    "alb": ("aws_lb", {"load_balancer_type": '"application"', "subnets": "var.subnet_ids"}),
+    "lambda": ("aws_lambda_function", {
+        "role": "var.lambda_role_arn", "handler": '"index.handler"', "runtime": '"python3.12"', "filename": '"lambda.zip"'
+    }),
+    "apigateway": ("aws_apigatewayv2_api", {"protocol_type": '"HTTP"'}),
+}
+
+CLOUDFORMATION_TEMPLATES = {
+    "vpc": ("AWS::EC2::VPC", {"CidrBlock": "10.0.0.0/16", "EnableDnsHostnames": "true"}),
+    "ec2": ("AWS::EC2::Instance", {"ImageId": "!Ref AmiId", "InstanceType": "t3.micro"}),
+    "rds": ("AWS::RDS::DBInstance", {
+        "Engine": "mysql", "DBInstanceClass": "db.t3.micro", "AllocatedStorage": "20",
+        "MasterUsername": "!Ref DBUsername", "MasterUserPassword": "!Ref DBPassword"
+    }),
+    "redis": ("AWS::ElastiCache::CacheCluster", {"Engine": "redis", "CacheNodeType": "cache.t3.micro", "NumCacheNodes": "1"}),
+    "s3": ("AWS::S3::Bucket", {}),
+    "alb": ("AWS::ElasticLoadBalancingV2::LoadBalancer", {"Type": "application", "Subnets": "!Ref SubnetIds"}),
+    "lambda": ("AWS::Lambda::Function", {
+        "Role": "!Ref LambdaRoleArn", "Handler": "index.handler", "Runtime": "python3.12",
+        "Code": "{ZipFile: \"def handler(event, context): return {}\"}"
+    }),
+    "apigateway": ("AWS::ApiGatewayV2::Api", {"ProtocolType": "HTTP", "Name": "api"}),
+}
+
+
+def _identifiers(canvas_state: CanvasState, pattern: str) -> List[Tuple[AWSResource, str]]:
+    """Resources with unique code identifiers derived from their names"""
+    seen = set()
+    result = []
+    for resource in canvas_state.resources:
+        base = re.sub(pattern, "_", resource.name).strip("_") or resource.type
+        if base[0].isdigit():
+            base = f"{resource.type}_{base}"
+        name, n = base, 2
+        while name in seen:
+            name, n = f"{base}_{n}", n + 1
+        seen.add(name)
+        result.append((resource, name))
+    return result
+
+
+def template_code(canvas_state: CanvasState, output_format: str) -> str:
+    """Deterministic skeleton for the canvas, used when the LLM is unavailable"""
+    if output_format == "cloudformation":
+        lines = [
+            "# LLM 응답을 받을 수 없어 템플릿으로 생성한 기본 코드입니다. 배포 전에 검토하세요.",
+            "AWSTemplateFormatVersion: '2010-09-09'",
+            "Parameters:",
+            "  AmiId: {Type: 'AWS::EC2::Image::Id'}",
+            "  DBUsername: {Type: String}",
+            "  DBPassword: {Type: String, NoEcho: true}",
+            "  SubnetIds: {Type: 'List<AWS::EC2::Subnet::Id>'}",
+            "  LambdaRoleArn: {Type: String}",
+            "Resources:",
+        ]
+        for resource, name in _identifiers(canvas_state, r"[^A-Za-z0-9]"):
+            kind, properties = CLOUDFORMATION_TEMPLATES.get(resource.type, ("AWS::CloudFormation::WaitConditionHandle", {}))
+            lines.append(f"  {name.replace('_', '')}:")
+            lines.append(f"    Type: {kind}")
+            if properties:
+                lines.append("    Properties:")
+                lines.extend(f"      {key}: {value}" for key, value in properties.items())
+        if not canvas_state.resources:
+            lines.append("  Placeholder: {Type: 'AWS::CloudFormation::WaitConditionHandle'}")
+        return "\n".join(lines) + "\n"
+
+    lines = [
+        "# LLM 응답을 받을 수 없어 템플릿으로 생성한 기본 코드입니다. 배포 전에 검토하세요.",
+        'provider "aws" {',
+        '  region = "ap-northeast-2"',
+        "}",
+        "",
+        'variable "ami_id" { type = string }',
+        'variable "db_username" { type = string }',
+        'variable "db_password" {',
+        "  type      = string",
+        "  sensitive = true",
+        "}",
+        'variable "subnet_ids" { type = list(string) }',
+        'variable "lambda_role_arn" { type = string }',
+    ]
+    for resource, name in _identifiers(canvas_state, r"[^A-Za-z0-9_-]"):
+        kind, properties = TERRAFORM_TEMPLATES.get(resource.type, ("terraform_data", {}))
+        lines.append("")
+        lines.append(f'resource "{kind}" "{name}" {{')
+        lines.extend(f"  {key} = {value}" for key, value in properties.items())
+        lines.append(f"  tags = {{ Name = {json.dumps(resource.name)} }}" if kind != "terraform_data" else f'  input = "{resource.type}"')
+        lines.append("}")
+    return "\n".join(lines) + "\n"
+
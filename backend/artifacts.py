@@ -0,0 +1,270 @@
+"""
+Content-addressed store for generated IaC artifacts
+
+An artifact is a set of files ({relative path: text}) in one output format.
+Each file is stored once, gzip-compressed, under the SHA-256 of its content
+(`artifact_blob:{digest}`), so identical files across versions and sessions
+share storage. The manifest (`artifact:{artifact_id}`) lists the files and
+their digests; the artifact id is the SHA-256 of that list, so the same
+output always gets the same id. Every session keeps a list of its versions
+(`artifacts:{session_id}`); storing unchanged output does not add one.
+
+Blobs are gzip with a fixed header, so the stored bytes can be sent as-is to
+clients that accept `Content-Encoding: gzip`.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import posixpath
+import re
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple, Union
+
+from models import CodeGenerationResponse, DeploymentRequest
+
+logger = logging.getLogger(__name__)
+
+# Artifacts (and the blobs they use) expire this long after they were last stored
+ARTIFACT_TTL = int(os.getenv("ARTIFACT_TTL", 30 * 86400))
+# Limits per artifact (uncompressed)
+ARTIFACT_MAX_BYTES = int(os.getenv("ARTIFACT_MAX_BYTES", 20 * 1024 * 1024))
+ARTIFACT_MAX_FILES = int(os.getenv("ARTIFACT_MAX_FILES", 500))
+
+# File name used when generated code is stored as an artifact
+DEFAULT_FILENAMES = {"terraform": "main.tf", "cloudformation": "template.yaml"}
+
+MEDIA_TYPES = {
+    ".tf": "text/plain; charset=utf-8",
+    ".tfvars": "text/plain; charset=utf-8",
+    ".hcl": "text/plain; charset=utf-8",
+    ".yaml": "application/yaml",
+    ".yml": "application/yaml",
+    ".json": "application/json",
+}
+
+_ARTIFACT_ID = re.compile(r"^[0-9a-f]{64}$")
+
+
+class ArtifactTooLarge(ValueError):
+    """The artifact exceeds ARTIFACT_MAX_BYTES or ARTIFACT_MAX_FILES"""
+
+
+def normalize_path(path: str) -> str:
+    """A safe relative POSIX path, or ValueError"""
+    normalized = posixpath.normpath(path.replace("\\", "/"))
+    if not path or normalized.startswith(("/", "../")) or normalized in (".", "..") or "\x00" in normalized:
+        raise ValueError(f"Invalid artifact path: {path!r}")
+    return normalized
+
+
+def compress(data: bytes) -> bytes:
+    """Deterministic gzip (no timestamp), so equal content gives equal bytes"""
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def decompress(blob: bytes) -> bytes:
+    return gzip.decompress(blob)
+
+
+def gunzip_limited(body: bytes, limit: int) -> bytes:
+    """Decompress a gzip request body, refusing to inflate it past `limit` bytes"""
+    inflater = zlib.decompressobj(wbits=31)
+    data = inflater.decompress(body, limit + 1)
+    if len(data) > limit or inflater.unconsumed_tail:
+        raise ArtifactTooLarge(f"Artifact is larger than {limit} bytes")
+    return data
+
+
+def media_type(path: str) -> str:
+    return MEDIA_TYPES.get(posixpath.splitext(path)[1].lower(), "text/plain; charset=utf-8")
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """Whether an Accept-Encoding header allows gzip (q > 0)"""
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding.strip().lower() in ("gzip", "x-gzip", "*"):
+            q = params.strip()
+            if q.startswith("q="):
+                try:
+                    return float(q[2:]) > 0
+                except ValueError:
+                    return False
+            return True
+    return False
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match / If-Range header against `etag`"""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Inclusive (start, end) of a single `bytes=` range, or None to send the
+    whole representation (no header, several ranges, or another unit)
+
+    Raises ValueError if the range cannot be satisfied.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, sep, last = header[len("bytes="):].strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            # Suffix range: the last N bytes
+            start, end = max(0, size - int(last)), size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end or start < 0:
+        raise ValueError(f"Range not satisfiable for {size} bytes")
+    return start, min(end, size - 1)
+
+
+class ArtifactStore:
+    def __init__(self, redis_client, ttl: int = ARTIFACT_TTL):
+        self.redis_client = redis_client
+        self.ttl = ttl
+
+    def put(
+        self,
+        session_id: str,
+        files: Dict[str, str],
+        output_format: str,
+        source: str = "upload"
+    ) -> Dict:
+        """
+        Store files as an artifact of the session
+
+        Returns the session's version entry plus `stored_bytes` (bytes actually
+        written; 0 when every file was already stored).
+        """
+        if not files:
+            raise ValueError("An artifact needs at least one file")
+        if len(files) > ARTIFACT_MAX_FILES:
+            raise ArtifactTooLarge(f"An artifact may have at most {ARTIFACT_MAX_FILES} files")
+
+        entries, blobs, total = [], {}, 0
+        for path, text in files.items():
+            data = text.encode("utf-8")
+            total += len(data)
+            if total > ARTIFACT_MAX_BYTES:
+                raise ArtifactTooLarge(f"Artifact is larger than {ARTIFACT_MAX_BYTES} bytes")
+            digest = hashlib.sha256(data).hexdigest()
+            if digest not in blobs:
+                blobs[digest] = compress(data)
+            entries.append({"path": normalize_path(path), "digest": digest, "size": len(data), "stored": len(blobs[digest])})
+        entries.sort(key=lambda entry: entry["path"])
+        if len({entry["path"] for entry in entries}) != len(entries):
+            raise ValueError("Artifact paths must be unique after normalization")
+
+        identity = json.dumps(
+            {"format": output_format, "files": [[entry["path"], entry["digest"]] for entry in entries]},
+            separators=(",", ":")
+        )
+        artifact_id = hashlib.sha256(identity.encode("utf-8")).hexdigest()
+        manifest = {
+            "artifact_id": artifact_id,
+            "format": output_format,
+            "files": entries,
+            "size": total,
+            "stored_size": sum(len(blob) for blob in blobs.values()),
+            "created_at": time.time()
+        }
+        entry, stored_bytes = self.redis_client.save_artifact(
+            session_id,
+            manifest,
+            blobs,
+            {"artifact_id": artifact_id, "format": output_format, "source": source, "created_at": manifest["created_at"]},
+            self.ttl
+        )
+        return {**entry, "files": len(entries), "size": total, "stored_bytes": stored_bytes}
+
+    def put_generated(self, session_id: str, code: str, output_format: str, source: str = "generate") -> Dict:
+        """Store freshly generated code as the session's next version"""
+        return self.put(session_id, {DEFAULT_FILENAMES[output_format]: code}, output_format, source=source)
+
+    def record_generation(self, session_id: str, response: CodeGenerationResponse, output_format: str) -> CodeGenerationResponse:
+        """Store a successful generation and fill in its artifact id/version"""
+        if response.success and response.code:
+            try:
+                # Fallback output is kept too, but its version says where it came from
+                source = f"fallback:{response.fallback}" if response.degraded else "generate"
+                entry = self.put_generated(session_id, response.code, output_format, source)
+                response.artifact_id, response.artifact_version = entry["artifact_id"], entry["version"]
+            except Exception as e:
+                # The code is still returned inline; only deploy-by-id is unavailable
+                logger.warning(f"Could not store generated artifact for {session_id}: {e}")
+        return response
+
+    def deployment_code(self, request: DeploymentRequest) -> Union[str, Dict[str, str]]:
+        """
+        What to deploy: the inline code, or the files of `request.artifact_id`
+
+        Raises LookupError if the artifact is unknown (or expired, or not one
+        of the session's versions) and ValueError if its format is not the
+        requested one.
+        """
+        if not request.artifact_id:
+            return request.code
+        # Ids are not secret (they are content hashes), so a session only deploys its own
+        if not self.redis_client.session_has_artifact(request.session_id, request.artifact_id):
+            raise LookupError(f"Artifact {request.artifact_id} not found")
+        found = self.files(request.artifact_id)
+        if found is None:
+            raise LookupError(f"Artifact {request.artifact_id} not found")
+        output_format, files = found
+        if output_format != request.format:
+            raise ValueError(f"Artifact {request.artifact_id} is {output_format}, not {request.format}")
+        return files
+
+    def manifest(self, artifact_id: str) -> Optional[Dict]:
+        if not _ARTIFACT_ID.match(artifact_id):
+            return None
+        return self.redis_client.get_artifact(artifact_id)
+
+    def versions(self, session_id: str, limit: int = 20) -> List[Dict]:
+        """The session's versions, newest first"""
+        return self.redis_client.list_artifact_versions(session_id, limit)
+
+    def version(self, session_id: str, version: Union[int, str]) -> Optional[Dict]:
+        """A version entry with its manifest (`version` may be "latest")"""
+        entry = self.redis_client.get_artifact_version(session_id, -1 if version == "latest" else int(version))
+        if entry is None:
+            return None
+        manifest = self.manifest(entry["artifact_id"])
+        return {**entry, **manifest} if manifest is not None else None
+
+    def blob(self, artifact_id: str, path: str) -> Optional[Tuple[Dict, bytes]]:
+        """(file entry, gzip bytes) of one file of an artifact"""
+        manifest = self.manifest(artifact_id)
+        if manifest is None:
+            return None
+        entry = next((f for f in manifest["files"] if f["path"] == path), None)
+        if entry is None:
+            return None
+        blob = self.redis_client.get_artifact_blobs([entry["digest"]])[0]
+        return (entry, blob) if blob is not None else None
+
+    def files(self, artifact_id: str) -> Optional[Tuple[str, Dict[str, str]]]:
+        """(format, {path: text}) of an artifact, e.g. for deployment"""
+        manifest = self.manifest(artifact_id)
+        if manifest is None:
+            return None
+        blobs = self.redis_client.get_artifact_blobs([entry["digest"] for entry in manifest["files"]])
+        if any(blob is None for blob in blobs):
+            return None
+        return manifest["format"], {
+            entry["path"]: decompress(blob).decode("utf-8") for entry, blob in zip(manifest["files"], blobs)
+        }
@@ -0,0 +1,72 @@
+"""
+Microbenchmark: legacy dict-based WebSocket path vs. the TypeAdapter codec
+
+Usage (from backend/):
+    python -m benchmarks.bench_codec --sizes 10 100 1000 10000
+"""
+import argparse
+import json
+from typing import Dict, List
+
+from benchmarks.common import make_canvas, time_it
+
+from models import CanvasState
+from codec import decode_client_message, encode_canvas, encode_frame
+from storage_codec import pack_canvas, unpack_canvas
+
+
+def make_frame(resource_count: int) -> str:
+    """Build a canvas_update frame with the given number of resources"""
+    return json.dumps({"type": "canvas_update", "data": make_canvas("bench", resource_count)})
+
+
+def legacy_path(raw: str) -> str:
+    """json.loads -> CanvasState(**data) -> model_dump_json (Redis) + model_dump/json.dumps (broadcast)"""
+    message_data = json.loads(raw)
+    state = CanvasState(**message_data["data"])
+    state.model_dump_json()
+    return json.dumps({"type": "canvas_update", "data": state.model_dump(mode="json")})
+
+
+def codec_path(raw: str) -> str:
+    """Single-pass validate_json -> one dump_json shared by Redis and broadcast"""
+    message = decode_client_message(raw)
+    encoded = encode_canvas(message.data)
+    return encode_frame("canvas_update", encoded)
+
+
+def run(sizes: List[int], min_time: float) -> Dict[str, float]:
+    """Run the codec benchmarks, returning milliseconds per operation keyed by name"""
+    results = {}
+    for size in sizes:
+        raw = make_frame(size)
+        state = decode_client_message(raw).data
+        packed = pack_canvas(state)
+
+        results[f"codec.legacy_roundtrip.{size}"] = time_it(lambda: legacy_path(raw), min_time) * 1000
+        results[f"codec.fast_roundtrip.{size}"] = time_it(lambda: codec_path(raw), min_time) * 1000
+        results[f"codec.storage_pack.{size}"] = time_it(lambda: pack_canvas(state), min_time) * 1000
+        results[f"codec.storage_unpack.{size}"] = time_it(lambda: unpack_canvas(packed), min_time) * 1000
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--min-time", type=float, default=1.0, help="seconds per measurement")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.min_time)
+
+    print(f"{'resources':>10} {'frame KB':>10} {'legacy ms':>12} {'codec ms':>12} {'speedup':>8}")
+    for size in args.sizes:
+        legacy = results[f"codec.legacy_roundtrip.{size}"]
+        fast = results[f"codec.fast_roundtrip.{size}"]
+        print(
+            f"{size:>10} {len(make_frame(size)) / 1024:>10.1f} {legacy:>12.3f} "
+            f"{fast:>12.3f} {legacy / fast:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Drift sweep benchmark: DriftMonitor over many workspaces with a fake terraform
+
+The fake binary sleeps FAKE_TF_SECONDS per plan and exits 2 (drift) in
+workspaces holding a `drift` marker, hangs in those holding a `hang` marker,
+and exits 0 otherwise.
+
+Scenarios:
+- sweep: N stacks, 5% drifted; sweep time and stacks/sec
+- repeat: nothing changed; clean stacks are skipped, drifted ones re-checked
+- timeout: 2% of stacks hang; each is killed after the per-stack timeout
+- window: 5x slower plans in a 10 s window; the rest is deferred
+
+Usage (from backend/, with Redis on REDIS_HOST:REDIS_PORT):
+    python -m benchmarks.bench_drift --stacks 300 --workers 8
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import Dict
+
+from drift import DriftMonitor
+from redis_client import RedisClient
+from terraform_executor import SESSION_FILE, STATE_FILE, TerraformExecutor
+
+FAKE_TERRAFORM = f"""#!{sys.executable} -S
+import os, sys, time
+if sys.argv[1] == "init":
+    os.makedirs(".terraform", exist_ok=True)
+    sys.exit(0)
+if os.path.exists("hang"):
+    time.sleep(3600)
+time.sleep(float(os.getenv("FAKE_TF_SECONDS", "0.2")))
+if os.path.exists("drift"):
+    print("  # aws_instance.web has changed")
+    print("  # aws_s3_bucket.logs has been deleted")
+    sys.exit(2)
+print("No changes. Your infrastructure still matches the configuration.")
+"""
+
+
+def make_workspaces(root: Path, prefix: str, count: int, drifted: float, hung: float) -> Path:
+    """`count` deployed workspaces under root; returns the fake terraform binary"""
+    binary = root / "fake-terraform"
+    binary.write_text(FAKE_TERRAFORM)
+    binary.chmod(binary.stat().st_mode | stat.S_IEXEC)
+    for i in range(count):
+        workspace = root / f"{prefix}-{i:05d}"
+        workspace.mkdir()
+        (workspace / SESSION_FILE).write_text(f"{prefix}-{i:05d}")
+        (workspace / STATE_FILE).write_text(f'{{"version": 4, "serial": {i}, "resources": []}}')
+        (workspace / "main.tf").write_text(f'resource "aws_instance" "web" {{ ami = "ami-{i}" }}\n')
+        if i < count * drifted:
+            (workspace / "drift").touch()
+        elif i < count * (drifted + hung):
+            (workspace / "hang").touch()
+    return binary
+
+
+def sweep(monitor: DriftMonitor) -> Dict:
+    # Start the worker processes outside the measurement
+    list(monitor.pool.map(abs, range(monitor.workers)))
+    return asyncio.run(monitor.sweep())
+
+
+def run(stacks: int, workers: int, plan_seconds: float) -> Dict[str, float]:
+    os.environ["FAKE_TF_SECONDS"] = str(plan_seconds)
+    redis_client = RedisClient()
+    redis_client.client.ping()
+    prefix = f"bench-{uuid.uuid4().hex[:8]}"
+    results = {}
+
+    def monitor(root: Path, binary: Path, **options) -> DriftMonitor:
+        return DriftMonitor(redis_client, None, TerraformExecutor(str(root)), workers=workers, terraform_bin=str(binary), **options)
+
+    roots = []
+    try:
+        root = Path(tempfile.mkdtemp(prefix="drift-bench-"))
+        roots.append(root)
+        binary = make_workspaces(root, prefix, stacks, drifted=0.05, hung=0.0)
+        drift = monitor(root, binary, window=600, stack_timeout=60)
+        try:
+            summary = sweep(drift)
+            results[f"sweep {stacks} stacks (s)"] = summary["duration"]
+            results["sweep stacks/s"] = summary["checked"] / summary["duration"]
+            results["sweep drifted"] = summary["drifted"]
+
+            summary = sweep(drift)
+            results["repeat sweep (s)"] = summary["duration"]
+            results["repeat skipped"] = summary["skipped"]
+            results["repeat checked"] = summary["checked"]
+        finally:
+            drift.shutdown()
+
+        root = Path(tempfile.mkdtemp(prefix="drift-bench-"))
+        roots.append(root)
+        count = max(50, stacks // 4)
+        binary = make_workspaces(root, f"{prefix}-t", count, drifted=0.0, hung=0.02)
+        drift = monitor(root, binary, window=600, stack_timeout=1.0)
+        try:
+            summary = sweep(drift)
+            results[f"timeout sweep {count} stacks (s)"] = summary["duration"]
+            results["timeout stacks killed"] = summary["timeout"]
+        finally:
+            drift.shutdown()
+
+        root = Path(tempfile.mkdtemp(prefix="drift-bench-"))
+        roots.append(root)
+        binary = make_workspaces(root, f"{prefix}-w", stacks, drifted=0.0, hung=0.0)
+        # Slower plans, so the stacks need several times the window
+        os.environ["FAKE_TF_SECONDS"] = str(plan_seconds * 5)
+        window = 10.0
+        drift = monitor(root, binary, window=window, stack_timeout=60)
+        try:
+            summary = sweep(drift)
+            results[f"window {window:.0f}s sweep (s)"] = summary["duration"]
+            results["window checked"] = summary["checked"]
+            results["window deferred"] = summary["deferred"]
+        finally:
+            drift.shutdown()
+    finally:
+        for root in roots:
+            for workspace in root.iterdir():
+                redis_client.delete_drift_result(workspace.name)
+            shutil.rmtree(root, ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stacks", type=int, default=300)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--plan-seconds", type=float, default=0.2, help="duration of each fake plan")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    for name, value in run(args.stacks, args.workers, args.plan_seconds).items():
+        print(f"{name:40s} {value:10.2f}")
+    print(f"{'total (s)':40s} {time.perf_counter() - started:10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+LLM tail-latency benchmark: AICodeGenerator against the fake endpoint (fake_llm.py)
+
+Scenarios:
+- tail: 5% of requests stall; latency p50/p95/p99 with hedging off vs on
+- outage: the upstream returns 503; how fast the breaker opens, how fast
+  fallbacks answer while it is open, and recovery through a half-open probe
+- deadline: every request stalls; a generation with a 1 s budget must
+  answer (from a fallback) in about 1 s
+
+Usage (from backend/):
+    python -m benchmarks.bench_llm --requests 200 --concurrency 8
+"""
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from benchmarks.common import make_canvas, percentile
+
+import uvicorn
+
+from benchmarks import fake_llm
+from models import CanvasState
+
+PORT = 8911
+
+
+def start_fake_server() -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(fake_llm.app, port=PORT, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def configure(**changes):
+    defaults = {
+        "latency": 0.1, "jitter": 0.05, "stall_rate": 0.0, "stall_seconds": 2.0,
+        "error_rate": 0.0, "error_status": 503, "chunks": 5, "chunk_seconds": 0.01
+    }
+    fake_llm.config.update({**defaults, **changes})
+
+
+def make_generator(**env):
+    """A fresh AICodeGenerator (reads its LLM_* settings from the environment)"""
+    os.environ.update({key: str(value) for key, value in env.items()})
+    from ai_generator import AICodeGenerator
+    return AICodeGenerator()
+
+
+def canvas(i: int) -> CanvasState:
+    # Distinct prompts so the fallback cache is not what answers
+    return CanvasState.model_validate(make_canvas(f"bench-llm-{i}", 3, user_prompt=f"benchmark {i}"))
+
+
+def measure(generator, requests: int, concurrency: int, stream: bool, deadline=None) -> List[float]:
+    """Latency of each generation (seconds), sorted"""
+    def one(i: int) -> float:
+        start = time.perf_counter()
+        on_delta = (lambda text: None) if stream else None
+        result = generator.generate_terraform_code(canvas(i), on_delta=on_delta, deadline=deadline)
+        assert result.success, result.error
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return sorted(pool.map(one, range(requests)))
+
+
+def summarize(name: str, latencies: List[float], results: Dict[str, float]):
+    for pct in (50, 95, 99):
+        results[f"llm.{name}.p{pct}"] = percentile(latencies, pct) * 1000
+
+
+def run_tail(requests: int, concurrency: int) -> Dict[str, float]:
+    results = {}
+    for stream in (False, True):
+        mode = "stream" if stream else "plain"
+        for hedging in (False, True):
+            configure(stall_rate=0.05)
+            generator = make_generator(
+                LLM_HEDGE_PERCENTILE=95 if hedging else 0, LLM_HEDGE_AFTER=0.5, LLM_RETRIES=0, LLM_FALLBACK="none"
+            )
+            measure(generator, 25, concurrency, stream)  # warm-up: fill the latency window
+            before = fake_llm.stats["requests"]
+            latencies = measure(generator, requests, concurrency, stream)
+            label = f"{mode}.{'hedged' if hedging else 'unhedged'}"
+            summarize(f"tail.{label}", latencies, results)
+            results[f"llm.tail.{label}.upstream_requests_per_call"] = (fake_llm.stats["requests"] - before) / requests
+    return results
+
+
+def run_outage() -> Dict[str, float]:
+    configure(error_rate=1.0)
+    generator = make_generator(
+        LLM_HEDGE_PERCENTILE=0, LLM_RETRIES=0, LLM_BREAKER_FAILURES=5, LLM_BREAKER_RESET=1, LLM_FALLBACK="template"
+    )
+    calls = 0
+    while generator.breaker.state != "open":
+        result = generator.generate_terraform_code(canvas(calls))
+        assert result.fallback == "template", result
+        calls += 1
+
+    before = fake_llm.stats["requests"]
+    latencies = []
+    for i in range(50):
+        start = time.perf_counter()
+        result = generator.generate_terraform_code(canvas(i))
+        latencies.append(time.perf_counter() - start)
+        assert result.fallback == "template"
+    assert fake_llm.stats["requests"] == before, "calls went upstream while the circuit was open"
+
+    configure()
+    time.sleep(generator.breaker.reset_after)
+    start = time.perf_counter()
+    result = generator.generate_terraform_code(canvas(0))
+    recovery = time.perf_counter() - start
+    assert result.fallback is None and generator.breaker.state == "closed", result
+
+    results = {"llm.outage.calls_to_open": calls, "llm.outage.probe_ms": recovery * 1000}
+    summarize("outage.open_fallback", sorted(latencies), results)
+    return results
+
+
+def run_deadline() -> Dict[str, float]:
+    configure(stall_rate=1.0, stall_seconds=10.0)
+    results = {}
+    for stream in (False, True):
+        generator = make_generator(LLM_HEDGE_PERCENTILE=95, LLM_HEDGE_AFTER=0.3, LLM_RETRIES=2, LLM_FALLBACK="template")
+        start = time.perf_counter()
+        result = generator.generate_terraform_code(canvas(0), on_delta=(lambda text: None) if stream else None, deadline=1.0)
+        assert result.fallback == "template", result
+        results[f"llm.deadline.{'stream' if stream else 'plain'}.1s_budget_ms"] = (time.perf_counter() - start) * 1000
+    return results
+
+
+def run(requests: int, concurrency: int) -> Dict[str, float]:
+    """Run every scenario, returning metrics keyed by name (latencies in milliseconds)"""
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{PORT}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    server = start_fake_server()
+    try:
+        results = run_tail(requests, concurrency)
+        results.update(run_outage())
+        results.update(run_deadline())
+    finally:
+        server.should_exit = True
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="generations per tail-latency run")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    for name, value in run(args.requests, args.concurrency).items():
+        print(f"{name:55s} {value:10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Microbenchmark: RedisClient operations against a local Redis
+
+The local read cache is disabled so every call measures a real round trip.
+
+Usage (from backend/, with Redis on REDIS_HOST:REDIS_PORT):
+    python -m benchmarks.bench_redis --sizes 10 1000
+"""
+import argparse
+import os
+import uuid
+from typing import Dict, List
+
+os.environ.setdefault("LOCAL_CACHE_SIZE", "0")
+
+from benchmarks.common import make_canvas, time_it
+
+from models import CanvasState, ChatMessage
+from redis_client import RedisClient
+
+
+def run(sizes: List[int], min_time: float) -> Dict[str, float]:
+    """Run the RedisClient benchmarks, returning milliseconds per operation keyed by name"""
+    client = RedisClient()
+    client.client.ping()
+
+    prefix = f"bench-{uuid.uuid4().hex[:8]}"
+    results = {}
+    try:
+        for size in sizes:
+            session_id = f"{prefix}-{size}"
+            state = CanvasState.model_validate(make_canvas(session_id, size))
+            client.save_canvas_state(session_id, state)
+
+            results[f"redis.save_canvas.{size}"] = time_it(
+                lambda: client.save_canvas_state(session_id, state), min_time
+            ) * 1000
+            results[f"redis.get_canvas_raw.{size}"] = time_it(
+                lambda: client.get_canvas_state_raw(session_id), min_time
+            ) * 1000
+            results[f"redis.get_canvas.{size}"] = time_it(
+                lambda: client.get_canvas_state(session_id), min_time
+            ) * 1000
+
+        chat_session = f"{prefix}-chat"
+        message = ChatMessage(session_id=chat_session, user_id="bench", username="bench", message="hello " * 10)
+        burst = [message] * 20
+
+        results["redis.save_chat_message"] = time_it(lambda: client.save_chat_message(message), min_time) * 1000
+        results["redis.save_chat_batch.20"] = time_it(lambda: client.save_chat_messages(burst), min_time) * 1000
+        results["redis.get_chat_page.50"] = time_it(lambda: client.get_chat_page(chat_session, 50), min_time) * 1000
+    finally:
+        keys = list(client.client.scan_iter(match=f"canvas:{prefix}-*"))
+        keys += list(client.client.scan_iter(match=f"chat:{prefix}-*"))
+        if keys:
+            client.client.delete(*keys)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000])
+    parser.add_argument("--min-time", type=float, default=1.0, help="seconds per measurement")
+    args = parser.parse_args()
+
+    for name, value in run(args.sizes, args.min_time).items():
+        print(f"{name:<32} {value:>10.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Startup benchmark: `import main` time and time-to-first-request
+
+Each run starts a fresh interpreter / uvicorn process. Point --backend-dir at
+another checkout (e.g. `git worktree add /tmp/before <ref>`) to compare
+before and after a change.
+
+Usage (from backend/):
+    python -m benchmarks.bench_startup --runs 5
+    python -m benchmarks.bench_startup --backend-dir /tmp/before/backend
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from typing import Dict
+
+from benchmarks.common import BACKEND_DIR, percentile
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_import(backend_dir: str) -> float:
+    """Seconds to `import main` in a fresh interpreter"""
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=backend_dir, capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def measure_first_request(backend_dir: str, path: str, timeout: float = 60.0) -> float:
+    """Seconds from spawning uvicorn until `path` answers 200"""
+    port = _free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=backend_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.01)
+        raise TimeoutError(f"Server did not answer {path} within {timeout}s")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def run(backend_dir: str = BACKEND_DIR, runs: int = 5, path: str = "/") -> Dict[str, float]:
+    """Median import and time-to-first-request in milliseconds"""
+    imports = sorted(measure_import(backend_dir) for _ in range(runs))
+    first_requests = sorted(measure_first_request(backend_dir, path) for _ in range(runs))
+    return {
+        "startup.import_main_ms": round(percentile(imports, 50) * 1000, 1),
+        "startup.first_request_ms": round(percentile(first_requests, 50) * 1000, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend-dir", default=BACKEND_DIR)
+    parser.add_argument("--runs", type=int, default=5)
+    # "/" exists in every version, so before/after runs hit the same endpoint
+    parser.add_argument("--path", default="/")
+    args = parser.parse_args()
+
+    for name, value in run(os.path.abspath(args.backend_dir), args.runs, args.path).items():
+        print(f"{name:<32} {value:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
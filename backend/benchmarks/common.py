@@ -0,0 +1,61 @@
+"""
+Shared helpers for the benchmark suite
+"""
+import os
+import sys
+import time
+from typing import Callable, List
+
+# Benchmarks import backend modules (models, codec, redis_client, ...) directly
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+RESOURCE_TYPES = ["vpc", "ec2", "rds", "alb", "redis", "s3", "lambda", "apigateway"]
+
+
+def make_canvas(session_id: str, resource_count: int, user_prompt: str = "benchmark canvas") -> dict:
+    """Canvas state dict with `resource_count` resources chained by connections"""
+    resources = [
+        {
+            "id": f"r{i}",
+            "type": RESOURCE_TYPES[i % len(RESOURCE_TYPES)],
+            "name": f"Resource_{i}",
+            "x": float(i % 100) * 100,
+            "y": float(i // 100) * 100,
+            "properties": {"instance_type": "t3.micro", "count": 2},
+            "notes": "benchmark"
+        }
+        for i in range(resource_count)
+    ]
+    connections = [
+        {"from_resource": f"r{i}", "to_resource": f"r{i + 1}", "connection_type": "network"}
+        for i in range(resource_count - 1)
+    ]
+    return {
+        "session_id": session_id,
+        "resources": resources,
+        "connections": connections,
+        "user_prompt": user_prompt
+    }
+
+
+def time_it(func: Callable[[], object], min_time: float) -> float:
+    """Return mean seconds per call, running for at least `min_time` seconds"""
+    func()  # warm-up
+    iterations = 0
+    start = time.perf_counter()
+    while True:
+        func()
+        iterations += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return elapsed / iterations
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
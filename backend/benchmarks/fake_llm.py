@@ -0,0 +1,118 @@
+"""
+OpenAI-compatible fake chat-completions endpoint with injected latency and errors
+
+Serves POST /v1/chat/completions (plain and streamed), so AICodeGenerator can
+run unchanged with OPENAI_BASE_URL pointing here. Behaviour is set at start-up
+from the environment or at run time with POST /_config:
+
+    latency       seconds before the first token (plus up to `jitter` more)
+    stall_rate    fraction of requests that instead wait `stall_seconds`
+    error_rate    fraction of requests answered with HTTP `error_status`
+    chunks        streamed chunks per answer, `chunk_seconds` apart
+
+Usage (from backend/):
+    FAKE_LLM_STALL_RATE=0.05 uvicorn benchmarks.fake_llm:app --port 8900
+    OPENAI_BASE_URL=http://localhost:8900/v1 OPENAI_API_KEY=fake uvicorn main:app
+"""
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from typing import Dict
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="Fake LLM")
+
+config: Dict[str, float] = {
+    "latency": float(os.getenv("FAKE_LLM_LATENCY", 0.1)),
+    "jitter": float(os.getenv("FAKE_LLM_JITTER", 0.05)),
+    "stall_rate": float(os.getenv("FAKE_LLM_STALL_RATE", 0.0)),
+    "stall_seconds": float(os.getenv("FAKE_LLM_STALL_SECONDS", 30)),
+    "error_rate": float(os.getenv("FAKE_LLM_ERROR_RATE", 0.0)),
+    "error_status": int(os.getenv("FAKE_LLM_ERROR_STATUS", 503)),
+    "chunks": int(os.getenv("FAKE_LLM_CHUNKS", 5)),
+    "chunk_seconds": float(os.getenv("FAKE_LLM_CHUNK_SECONDS", 0.01)),
+}
+stats = {"requests": 0, "errors": 0, "stalls": 0, "in_flight": 0}
+
+ANSWER = 'resource "aws_instance" "web" {\n  ami           = var.ami_id\n  instance_type = "t3.micro"\n}\n'
+
+
+def _first_token_delay() -> float:
+    if random.random() < config["stall_rate"]:
+        stats["stalls"] += 1
+        return config["stall_seconds"]
+    return config["latency"] + random.uniform(0, config["jitter"])
+
+
+def _chunk(completion_id: str, model: str, content=None, usage=None) -> str:
+    body = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [] if content is None else [{"index": 0, "delta": {"content": content}, "finish_reason": None}],
+        "usage": usage
+    }
+    return f"data: {json.dumps(body)}\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+    if random.random() < config["error_rate"]:
+        stats["errors"] += 1
+        return JSONResponse({"error": {"message": "injected failure", "type": "server_error"}}, status_code=int(config["error_status"]))
+
+    model = body.get("model", "fake")
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    usage = {"prompt_tokens": 100, "completion_tokens": 40, "total_tokens": 140}
+    delay = _first_token_delay()
+
+    if not body.get("stream"):
+        stats["in_flight"] += 1
+        try:
+            await asyncio.sleep(delay + config["chunks"] * config["chunk_seconds"])
+        finally:
+            stats["in_flight"] -= 1
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": ANSWER}, "finish_reason": "stop"}],
+            "usage": usage
+        }
+
+    async def events():
+        stats["in_flight"] += 1
+        try:
+            await asyncio.sleep(delay)
+            count = max(1, int(config["chunks"]))
+            step = -(-len(ANSWER) // count)
+            for i in range(0, len(ANSWER), step):
+                yield _chunk(completion_id, model, ANSWER[i:i + step])
+                await asyncio.sleep(config["chunk_seconds"])
+            yield _chunk(completion_id, model, usage=usage)
+            yield "data: [DONE]\n\n"
+        finally:
+            stats["in_flight"] -= 1
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.post("/_config")
+async def set_config(changes: Dict[str, float]):
+    """Change latency/error injection; returns the full configuration"""
+    config.update({key: value for key, value in changes.items() if key in config})
+    return config
+
+
+@app.get("/_stats")
+async def get_stats():
+    return stats
@@ -0,0 +1,211 @@
+"""
+End-to-end WebSocket load test: N sessions x M clients
+
+Every client sends `canvas_update` and `chat_message` frames at the given
+rates with a send timestamp embedded in the payload; every receiving socket
+records the broadcast latency. Reports latency percentiles, delivered
+throughput, server RSS per connection (from /metrics, single-worker servers)
+and Redis ops/sec.
+
+Usage (from backend/, against `uvicorn benchmarks.stub_app:app` and a local Redis):
+    python -m benchmarks.loadtest --sessions 20 --clients 5 --canvas-rate 1 --chat-rate 2 --duration 30
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import time
+import urllib.request
+from typing import Dict, List, Optional
+
+import redis
+import websockets
+
+from benchmarks.common import make_canvas, percentile
+
+MARKER = "__LOADTEST_MARKER__"
+MESSAGE_TYPES = ("canvas_update", "chat_message")
+
+
+class Stats:
+    def __init__(self):
+        self.sent: Dict[str, int] = {t: 0 for t in MESSAGE_TYPES}
+        self.latencies: Dict[str, List[float]] = {t: [] for t in MESSAGE_TYPES}
+        self.connected = 0
+        self.errors = 0
+
+
+async def _periodic(rate: float, stop_at: float, send):
+    """Call `send` `rate` times per second until `stop_at`, starting at a random offset"""
+    if rate <= 0:
+        return
+    interval = 1.0 / rate
+    await asyncio.sleep(random.random() * interval)
+    while time.time() < stop_at:
+        await send()
+        await asyncio.sleep(interval)
+
+
+async def _receive(ws, stats: Stats):
+    async for raw in ws:
+        received_at = time.time()
+        message = json.loads(raw)
+        message_type = message.get("type")
+        if message_type == "canvas_update":
+            marker = message["data"].get("user_prompt", "")
+        elif message_type == "chat_message":
+            marker = message["data"].get("message", "")
+        elif message_type == "ping":
+            # Answer server heartbeats so receive-only clients are not reaped
+            await ws.send(json.dumps({"type": "pong", "ts": message.get("ts")}))
+            continue
+        else:
+            continue
+        if marker.startswith("lt|"):
+            stats.latencies[message_type].append(received_at - float(marker.split("|")[2]))
+
+
+async def _client(args, session_id: str, client_id: str, canvas_template: str,
+                  stats: Stats, start: asyncio.Event, stop_at: List[float]):
+    try:
+        async with websockets.connect(f"{args.url}/ws/{session_id}", max_size=None) as ws:
+            stats.connected += 1
+            await start.wait()
+            receiver = asyncio.create_task(_receive(ws, stats))
+
+            async def send_canvas():
+                marker = f"lt|{client_id}|{time.time()}"
+                await ws.send(canvas_template.replace(MARKER, marker))
+                stats.sent["canvas_update"] += 1
+
+            async def send_chat():
+                marker = f"lt|{client_id}|{time.time()}"
+                await ws.send(json.dumps({
+                    "type": "chat_message",
+                    "data": {
+                        "session_id": session_id,
+                        "user_id": client_id,
+                        "username": client_id,
+                        "message": marker
+                    }
+                }))
+                stats.sent["chat_message"] += 1
+
+            await asyncio.gather(
+                _periodic(args.canvas_rate, stop_at[0], send_canvas),
+                _periodic(args.chat_rate, stop_at[0], send_chat)
+            )
+            # Let in-flight broadcasts arrive
+            await asyncio.sleep(args.drain)
+            receiver.cancel()
+    except Exception:
+        stats.errors += 1
+
+
+def _server_rss(http_url: str) -> Optional[float]:
+    """process_resident_memory_bytes from the backend's /metrics"""
+    try:
+        with urllib.request.urlopen(f"{http_url}/metrics", timeout=5) as response:
+            text = response.read().decode("utf-8")
+    except OSError:
+        return None
+    match = re.search(r"^process_resident_memory_bytes\s+(\S+)", text, re.MULTILINE)
+    return float(match.group(1)) if match else None
+
+
+def _redis_commands(client: redis.Redis) -> Optional[int]:
+    try:
+        return int(client.info("stats")["total_commands_processed"])
+    except redis.RedisError:
+        return None
+
+
+async def run_load(args) -> Dict:
+    """Run the load test and return a flat result dict"""
+    http_url = re.sub(r"^ws", "http", args.url)
+    redis_conn = redis.Redis(host=os.getenv("REDIS_HOST", "localhost"), port=int(os.getenv("REDIS_PORT", 6379)))
+
+    stats = Stats()
+    start = asyncio.Event()
+    stop_at = [0.0]
+
+    rss_before = _server_rss(http_url)
+    tasks = []
+    for s in range(args.sessions):
+        session_id = f"loadtest-{s}"
+        template = json.dumps({
+            "type": "canvas_update",
+            "data": make_canvas(session_id, args.resources, user_prompt=MARKER)
+        })
+        for c in range(args.clients):
+            tasks.append(asyncio.create_task(
+                _client(args, session_id, f"c{s}-{c}", template, stats, start, stop_at)
+            ))
+
+    # Wait until every client is connected (or failed)
+    total = args.sessions * args.clients
+    while stats.connected + stats.errors < total:
+        await asyncio.sleep(0.1)
+    rss_after = _server_rss(http_url)
+
+    commands_before = _redis_commands(redis_conn)
+    began = time.time()
+    stop_at[0] = began + args.duration
+    start.set()
+    await asyncio.gather(*tasks)
+    commands_after = _redis_commands(redis_conn)
+    # Rates are per second of sending; the drain period only collects stragglers
+    elapsed = args.duration
+
+    results = {
+        "load.connections": stats.connected,
+        "load.errors": stats.errors,
+        "load.duration_s": round(elapsed, 2)
+    }
+    delivered = 0
+    for message_type in MESSAGE_TYPES:
+        latencies = sorted(stats.latencies[message_type])
+        delivered += len(latencies)
+        results[f"load.{message_type}.sent"] = stats.sent[message_type]
+        results[f"load.{message_type}.delivered"] = len(latencies)
+        for pct in (50, 95, 99):
+            results[f"load.{message_type}.p{pct}_ms"] = round(percentile(latencies, pct) * 1000, 3)
+    results["load.throughput_msgs_per_s"] = round(delivered / elapsed, 1)
+
+    if rss_before is not None and rss_after is not None and stats.connected:
+        results["load.rss_per_connection_bytes"] = round((rss_after - rss_before) / stats.connected)
+    if commands_before is not None and commands_after is not None:
+        results["load.redis_ops_per_s"] = round((commands_after - commands_before) / elapsed, 1)
+
+    return results
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--url", default="ws://localhost:8000", help="backend base URL (ws://...)")
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--clients", type=int, default=5, help="clients per session")
+    parser.add_argument("--canvas-rate", type=float, default=1.0, help="canvas updates per client per second")
+    parser.add_argument("--chat-rate", type=float, default=1.0, help="chat messages per client per second")
+    parser.add_argument("--resources", type=int, default=50, help="resources per canvas update")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of sending")
+    parser.add_argument("--drain", type=float, default=2.0, help="seconds to wait for in-flight messages")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    add_arguments(parser)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_load(args))
+    for name, value in results.items():
+        print(f"{name:<40} {value}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Run the benchmark suite and compare against benchmarks/baseline.json
+
+Exits non-zero when any metric regresses by more than --tolerance.
+
+Usage (from backend/):
+    python -m benchmarks.run_all                      # codec + Redis microbenchmarks
+    python -m benchmarks.run_all --loadtest           # also drive a running server
+    python -m benchmarks.run_all --update-baseline    # record current numbers
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from typing import Dict, Optional
+
+from benchmarks import bench_codec, bench_redis, bench_startup, loadtest
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+def _direction(name: str) -> Optional[str]:
+    """'lower' / 'higher' is better, or None for informational values"""
+    if name.endswith("per_s"):
+        return "higher"
+    if name.startswith(("codec.", "redis.")) or name.endswith(("_ms", "_bytes")):
+        return "lower"
+    return None
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], tolerance: float) -> int:
+    """Print a comparison table and return the number of regressions"""
+    regressions = 0
+    print(f"{'metric':<40} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, value in results.items():
+        reference = baseline.get(name)
+        direction = _direction(name)
+        if reference is None or direction is None or not reference:
+            print(f"{name:<40} {'-':>12} {value:>12.3f}")
+            continue
+
+        change = (value - reference) / reference
+        regressed = change > tolerance if direction == "lower" else change < -tolerance
+        regressions += regressed
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:<40} {reference:>12.3f} {value:>12.3f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--min-time", type=float, default=1.0, help="seconds per microbenchmark")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown")
+    parser.add_argument("--skip-redis", action="store_true", help="skip the Redis microbenchmarks")
+    parser.add_argument("--startup", action="store_true", help="also measure cold start")
+    parser.add_argument("--loadtest", action="store_true", help="also run the WebSocket load test")
+    parser.add_argument("--update-baseline", action="store_true")
+    loadtest.add_arguments(parser)
+    args = parser.parse_args()
+
+    results = bench_codec.run([10, 100, 1000, 10000], args.min_time)
+    if not args.skip_redis:
+        results.update(bench_redis.run([10, 1000], args.min_time))
+    if args.startup:
+        results.update(bench_startup.run())
+    if args.loadtest:
+        results.update(asyncio.run(loadtest.run_load(args)))
+
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+
+    if args.update_baseline:
+        baseline.update({name: round(value, 4) for name, value in results.items()})
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(dict(sorted(baseline.items())), f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {BASELINE_PATH}")
+        return
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\n{regressions} metric(s) regressed by more than {args.tolerance:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
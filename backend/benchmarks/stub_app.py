@@ -0,0 +1,98 @@
+"""
+Backend app with the LLM and Terraform replaced by latency-injecting stubs
+
+Lets the load test drive /api/generate-code and /api/deploy without an API
+key, AWS credentials or a terraform binary.
+
+Usage (from backend/):
+    STUB_LLM_SECONDS=2 STUB_TERRAFORM_SECONDS=5 \
+        uvicorn benchmarks.stub_app:app --port 8000 --workers 1
+"""
+import os
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+import benchmarks.common  # noqa: F401  (puts backend/ on sys.path)
+
+import main
+from cost_estimator import estimate_canvas_cost, format_estimate
+from models import CanvasState, CodeGenerationResponse
+
+
+class StubCodeGenerator:
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    def _emit(self, code: str, on_delta: Optional[Callable[[str], None]]) -> str:
+        """Sleep for the configured latency, streaming `code` line by line if asked"""
+        lines = code.splitlines(keepends=True) or [""]
+        for line in lines:
+            time.sleep(self.delay / len(lines))
+            if on_delta is not None:
+                on_delta(line)
+        return code
+
+    def generate_terraform_code(
+        self,
+        canvas_state: CanvasState,
+        provider: str = "openai",
+        on_delta: Optional[Callable[[str], None]] = None,
+        deadline=None
+    ) -> CodeGenerationResponse:
+        code = "\n".join(
+            f'resource "aws_instance" "{r.id}" {{}}' for r in canvas_state.resources
+        )
+        return CodeGenerationResponse(
+            success=True,
+            code=self._emit(code, on_delta),
+            estimated_cost=format_estimate(estimate_canvas_cost(canvas_state))
+        )
+
+    def generate_cloudformation_code(
+        self,
+        canvas_state: CanvasState,
+        on_delta: Optional[Callable[[str], None]] = None,
+        deadline=None
+    ) -> CodeGenerationResponse:
+        return CodeGenerationResponse(
+            success=True,
+            code=self._emit("Resources: {}", on_delta),
+            estimated_cost=format_estimate(estimate_canvas_cost(canvas_state))
+        )
+
+
+class StubTerraformExecutor:
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    def deploy(
+        self,
+        code,
+        session_id: str,
+        auto_approve: bool = False,
+        progress: Optional[Callable[[str], None]] = None
+    ) -> Tuple[bool, Dict, str]:
+        for stage in ("init", "plan"):
+            if progress is not None:
+                progress(f"$ terraform {stage}\n")
+            time.sleep(self.delay / 2)
+        text = code if isinstance(code, str) else "".join(code.values())
+        return True, {"plan": f"{text.count('resource')} to add"}, ""
+
+    def destroy(self, session_id: str) -> Tuple[bool, str]:
+        return True, "stub"
+
+    def get_state(self, session_id: str) -> Dict:
+        return {}
+
+    def workspaces(self):
+        return iter(())
+
+
+main.ai_generator = StubCodeGenerator(float(os.getenv("STUB_LLM_SECONDS", 2)))
+main.terraform_executor = StubTerraformExecutor(float(os.getenv("STUB_TERRAFORM_SECONDS", 5)))
+main.job_manager.ai_generator = main.ai_generator
+main.job_manager.terraform_executor = main.terraform_executor
+main.drift_monitor.terraform_executor = main.terraform_executor
+
+app = main.app
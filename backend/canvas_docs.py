@@ -0,0 +1,94 @@
+"""
+Per-session CRDT canvas documents on the owning node
+
+The document of a session lives in memory while it has sockets here and is
+persisted to Redis as a snapshot plus an append-only op log; every few
+hundred ops the log is folded into a new snapshot. The materialized canvas
+(`canvas:{session_id}`) is still written after each change, so HTTP reads,
+code generation and cost estimates keep working off plain CanvasState.
+"""
+import os
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from crdt import CanvasDocument
+from models import CanvasState
+
+
+class CanvasDocuments:
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        # Ops this server makes (from full-state clients) carry a per-process replica id
+        self.replica = f"srv-{uuid.uuid4().hex[:8]}"
+        self.docs: Dict[str, CanvasDocument] = {}
+        # Ops kept in memory per session for delta sync; older peers get a snapshot
+        self.log_size = int(os.getenv("CANVAS_OP_LOG", 2000))
+        # Redis op log length that triggers a new snapshot
+        self.snapshot_every = int(os.getenv("CANVAS_SNAPSHOT_EVERY", 500))
+
+    def get(self, session_id: str) -> CanvasDocument:
+        """The session's document, loaded from Redis on first use"""
+        doc = self.docs.get(session_id)
+        if doc is not None:
+            return doc
+
+        snapshot, ops = self.redis_client.load_canvas_doc(session_id)
+        if snapshot is not None:
+            doc = CanvasDocument.from_snapshot(session_id, self.replica, snapshot)
+        else:
+            doc = CanvasDocument(session_id, self.replica)
+        doc.apply_all(ops)
+
+        if snapshot is None and not ops:
+            # Sessions saved before the CRDT document existed start from their stored canvas
+            legacy = self.redis_client.get_canvas_state(session_id)
+            if legacy is not None and (legacy.resources or legacy.connections or legacy.user_prompt):
+                self.persist(session_id, doc.update_from_state(legacy.model_dump(mode="json")), doc)
+
+        self.docs[session_id] = doc
+        return doc
+
+    def apply_checked(
+        self,
+        session_id: str,
+        ops: List[Dict],
+        snapshot: Optional[Dict] = None
+    ) -> Tuple[List[Dict], bool, Optional[CanvasState]]:
+        """
+        Apply a client's ops (and snapshot) only if the resulting canvas is valid
+
+        They go to a scratch copy first, so a rejected batch leaves the document
+        and Redis untouched. Returns (applied ops, gap, validated canvas or None
+        if nothing changed); raises pydantic.ValidationError on an invalid result.
+        """
+        doc = self.get(session_id)
+        scratch = doc.fork()
+        if snapshot is not None:
+            scratch.merge(snapshot)
+        applied, gap = scratch.apply_all(ops, record=False)
+        if snapshot is None and not applied:
+            return [], gap, None
+        canvas_state = CanvasState.model_validate(scratch.to_canvas())
+
+        if snapshot is not None:
+            doc.merge(snapshot)
+            self.save_snapshot(session_id, doc)
+        doc.apply_all(applied)
+        return applied, gap, canvas_state
+
+    def persist(self, session_id: str, ops: List[Dict], doc: CanvasDocument = None):
+        """Append newly applied ops to Redis, folding the log into a snapshot when it grows"""
+        if not ops:
+            return
+        doc = doc or self.docs[session_id]
+        if self.redis_client.append_canvas_ops(session_id, ops) >= self.snapshot_every:
+            self.save_snapshot(session_id, doc)
+        doc.compact(self.log_size)
+
+    def save_snapshot(self, session_id: str, doc: CanvasDocument = None):
+        doc = doc or self.docs[session_id]
+        self.redis_client.save_canvas_doc(session_id, doc.snapshot())
+
+    def release(self, session_id: str):
+        """Drop the in-memory document (e.g. the last socket left or the session moved)"""
+        self.docs.pop(session_id, None)
@@ -0,0 +1,73 @@
+"""
+Live chat tail over Redis Streams
+
+One blocking XREAD loop per session per worker feeds every socket of that
+session, so chat written on any replica reaches all connected clients.
+"""
+import asyncio
+import json
+import logging
+from typing import Dict, Optional
+
+import redis
+
+from codec import encode_frame
+
+logger = logging.getLogger(__name__)
+
+
+class ChatTail:
+    def __init__(self, redis_client, ws_manager, block_ms: int = 5000):
+        self.redis_client = redis_client
+        self.ws_manager = ws_manager
+        self.block_ms = block_ms
+        # session_id -> tail task (None while the starting cursor is being read)
+        self.tails: Dict[str, Optional[asyncio.Task]] = {}
+
+    async def join(self, session_id: str):
+        """Make sure a tail is running for the session"""
+        if session_id in self.tails:
+            return
+
+        # Reserve the slot before awaiting so concurrent connects share one tail
+        self.tails[session_id] = None
+        try:
+            last_id = await self.redis_client.get_chat_tail_id(session_id)
+        except BaseException:
+            # Free the reservation, or later joins would think a tail is running
+            if session_id in self.tails and self.tails[session_id] is None:
+                del self.tails[session_id]
+            raise
+
+        if session_id in self.tails:
+            self.tails[session_id] = asyncio.create_task(self._tail(session_id, last_id))
+
+    def leave(self, session_id: str):
+        """Stop the session's tail"""
+        task = self.tails.pop(session_id, None)
+        if task is not None:
+            task.cancel()
+
+    async def _tail(self, session_id: str, last_id: str):
+        """Forward new stream entries to the session's sockets until it empties"""
+        try:
+            while self.ws_manager.get_session_count(session_id):
+                try:
+                    messages = await self.redis_client.read_chat_after(
+                        session_id, last_id, self.block_ms
+                    )
+                except redis.RedisError as e:
+                    logger.warning(f"Chat tail for {session_id} failed: {e}")
+                    await asyncio.sleep(1)
+                    continue
+
+                for message in messages:
+                    await self.ws_manager.broadcast_frame(
+                        session_id,
+                        encode_frame("chat_message", json.dumps(message))
+                    )
+                if messages:
+                    last_id = messages[-1]["message_id"]
+        finally:
+            if self.tails.get(session_id) is asyncio.current_task():
+                del self.tails[session_id]
@@ -0,0 +1,60 @@
+"""
+Fast JSON codec for models on the WebSocket hot path
+
+Validation and serialization go through precompiled TypeAdapters, straight
+from JSON text to models and back, without intermediate dicts.
+"""
+import json
+from typing import Optional, Union
+from pydantic import TypeAdapter, ValidationError
+from models import CanvasState, ChatMessage, ClientMessage
+
+
+CANVAS_STATE_ADAPTER = TypeAdapter(CanvasState)
+CHAT_MESSAGE_ADAPTER = TypeAdapter(ChatMessage)
+CLIENT_MESSAGE_ADAPTER = TypeAdapter(ClientMessage)
+
+# Errors raised when a frame's "type" is missing or not a known message type
+_UNKNOWN_TYPE_ERRORS = {"union_tag_invalid", "union_tag_not_found"}
+
+
+def decode_client_message(raw: Union[str, bytes]):
+    """
+    Validate a client WebSocket frame in a single pass
+
+    Returns None for frames whose type this server does not handle.
+    """
+    try:
+        return CLIENT_MESSAGE_ADAPTER.validate_json(raw)
+    except ValidationError as e:
+        errors = e.errors()
+        if len(errors) == 1 and errors[0]["type"] in _UNKNOWN_TYPE_ERRORS:
+            return None
+        raise
+
+
+def decode_canvas(raw: Union[str, bytes]) -> CanvasState:
+    """Validate a canvas state from JSON"""
+    return CANVAS_STATE_ADAPTER.validate_json(raw)
+
+
+def encode_canvas(state: CanvasState) -> bytes:
+    """Serialize a canvas state to JSON"""
+    return CANVAS_STATE_ADAPTER.dump_json(state)
+
+
+def encode_chat_message(message: ChatMessage) -> bytes:
+    """Serialize a chat message to JSON"""
+    return CHAT_MESSAGE_ADAPTER.dump_json(message)
+
+
+def encode_frame(message_type: str, data: Union[str, bytes]) -> str:
+    """
+    Wrap an already-encoded JSON payload in a {"type", "data"} frame
+
+    The payload is spliced in as-is, so trusted payloads (e.g. read back from
+    Redis) are forwarded without being parsed or validated again.
+    """
+    if isinstance(data, bytes):
+        data = data.decode("utf-8")
+    return '{"type":%s,"data":%s}' % (json.dumps(message_type), data)
@@ -0,0 +1,374 @@
+"""
+Offline monthly cost estimates for canvas resources
+
+Prices come from a bundled on-demand table (USD, Linux, no free tier or
+savings plans), so an estimate needs no network round trip. Every resource
+becomes one line item priced as
+
+    fixed + unit * units,   units in [min, max] (autoscaling bounds)
+
+and the line items live in NumPy arrays, so totals and per-type breakdowns are
+a few vector operations. A session's model is kept between canvas edits and
+only resources whose type or properties changed are re-priced.
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from models import AWSResource, CanvasState
+
+logger = logging.getLogger(__name__)
+
+HOURS_PER_MONTH = 730
+
+RESOURCE_TYPES = ("vpc", "ec2", "rds", "alb", "redis", "s3", "lambda", "apigateway")
+_TYPE_INDEX = {resource_type: i for i, resource_type in enumerate(RESOURCE_TYPES)}
+
+# Hourly instance prices plus per-unit rates, per region (approximate list prices)
+PRICING: Dict[str, Dict] = {
+    "us-east-1": {
+        "ec2": {
+            "t3.micro": 0.0104, "t3.small": 0.0208, "t3.medium": 0.0416, "t3.large": 0.0832,
+            "m5.large": 0.096, "m5.xlarge": 0.192, "c5.large": 0.085, "c5.xlarge": 0.17,
+            "r5.large": 0.126
+        },
+        "rds": {
+            "db.t3.micro": 0.017, "db.t3.small": 0.034, "db.t3.medium": 0.068,
+            "db.m5.large": 0.171, "db.r5.large": 0.25
+        },
+        "redis": {
+            "cache.t3.micro": 0.017, "cache.t3.small": 0.034, "cache.t3.medium": 0.068,
+            "cache.m5.large": 0.156, "cache.r5.large": 0.216
+        },
+        "ebs_gb_month": 0.08,
+        "rds_storage_gb_month": 0.115,
+        "alb_hour": 0.0225,
+        "alb_lcu_hour": 0.008,
+        "nat_gateway_hour": 0.045,
+        "s3_gb_month": 0.023,
+        "s3_per_1k_requests": 0.005,
+        "lambda_per_million_requests": 0.20,
+        "lambda_gb_second": 0.0000166667,
+        "apigateway_per_million_requests": 3.50
+    },
+    "eu-west-1": {
+        "ec2": {
+            "t3.micro": 0.0114, "t3.small": 0.0228, "t3.medium": 0.0456, "t3.large": 0.0912,
+            "m5.large": 0.107, "m5.xlarge": 0.214, "c5.large": 0.096, "c5.xlarge": 0.192,
+            "r5.large": 0.141
+        },
+        "rds": {
+            "db.t3.micro": 0.018, "db.t3.small": 0.036, "db.t3.medium": 0.072,
+            "db.m5.large": 0.19, "db.r5.large": 0.28
+        },
+        "redis": {
+            "cache.t3.micro": 0.018, "cache.t3.small": 0.036, "cache.t3.medium": 0.073,
+            "cache.m5.large": 0.172, "cache.r5.large": 0.24
+        },
+        "ebs_gb_month": 0.088,
+        "rds_storage_gb_month": 0.127,
+        "alb_hour": 0.0252,
+        "alb_lcu_hour": 0.008,
+        "nat_gateway_hour": 0.048,
+        "s3_gb_month": 0.023,
+        "s3_per_1k_requests": 0.005,
+        "lambda_per_million_requests": 0.20,
+        "lambda_gb_second": 0.0000166667,
+        "apigateway_per_million_requests": 3.50
+    },
+    "ap-northeast-2": {
+        "ec2": {
+            "t3.micro": 0.013, "t3.small": 0.026, "t3.medium": 0.052, "t3.large": 0.104,
+            "m5.large": 0.118, "m5.xlarge": 0.236, "c5.large": 0.096, "c5.xlarge": 0.192,
+            "r5.large": 0.152
+        },
+        "rds": {
+            "db.t3.micro": 0.026, "db.t3.small": 0.052, "db.t3.medium": 0.104,
+            "db.m5.large": 0.236, "db.r5.large": 0.295
+        },
+        "redis": {
+            "cache.t3.micro": 0.025, "cache.t3.small": 0.05, "cache.t3.medium": 0.1,
+            "cache.m5.large": 0.201, "cache.r5.large": 0.273
+        },
+        "ebs_gb_month": 0.0912,
+        "rds_storage_gb_month": 0.131,
+        "alb_hour": 0.0225,
+        "alb_lcu_hour": 0.008,
+        "nat_gateway_hour": 0.059,
+        "s3_gb_month": 0.025,
+        "s3_per_1k_requests": 0.0045,
+        "lambda_per_million_requests": 0.20,
+        "lambda_gb_second": 0.0000166667,
+        "apigateway_per_million_requests": 3.50
+    }
+}
+
+# Used when a resource does not name an instance type (or names one not in the table)
+DEFAULT_INSTANCE = {"ec2": "t3.micro", "rds": "db.t3.micro", "redis": "cache.t3.micro"}
+# Priced instead of a configured region the table does not cover
+FALLBACK_REGION = "ap-northeast-2"
+
+
+def _default_region(configured: str) -> str:
+    """The configured region if it is in the price table, otherwise FALLBACK_REGION"""
+    if configured in PRICING:
+        return configured
+    logger.warning(f"No bundled prices for {configured}; cost estimates use {FALLBACK_REGION} prices")
+    return FALLBACK_REGION
+
+
+DEFAULT_REGION = _default_region(os.getenv("COST_REGION", os.getenv("AWS_DEFAULT_REGION", FALLBACK_REGION)))
+
+
+def _number(properties: Dict, *names: str, default: float = 0.0) -> float:
+    """First numeric property among `names` (canvas properties may be strings)"""
+    for name in names:
+        value = properties.get(name)
+        if value is None or value == "":
+            continue
+        try:
+            return max(0.0, float(value))
+        except (TypeError, ValueError):
+            continue
+    return default
+
+
+def _instance_price(prices: Dict, resource_type: str, properties: Dict, *names: str) -> Tuple[float, bool]:
+    """Hourly price of the resource's instance type; False if the default size had to be assumed"""
+    table = prices[resource_type]
+    for name in names:
+        instance = properties.get(name)
+        if instance in table:
+            return table[instance], True
+    return table[DEFAULT_INSTANCE[resource_type]], False
+
+
+def price_resource(resource: AWSResource, prices: Dict) -> Tuple[float, float, float, float, float, bool]:
+    """
+    One line item: (fixed, unit, min_units, expected_units, max_units, priced)
+
+    `priced` is False when a missing or unknown instance type fell back to the default.
+    """
+    p = resource.properties
+    kind = resource.type
+    priced = True
+    fixed = unit = 0.0
+    low = expected = high = 1.0
+
+    if kind == "ec2":
+        hourly, priced = _instance_price(prices, "ec2", p, "instance_type")
+        unit = hourly * HOURS_PER_MONTH + _number(p, "volume_size", "storage_gb", default=8) * prices["ebs_gb_month"]
+        count = _number(p, "count", "desired_capacity", default=1)
+        low = _number(p, "min_size", default=count)
+        high = max(low, _number(p, "max_size", default=count))
+        expected = min(max(_number(p, "desired_capacity", "count", default=low), low), high)
+    elif kind == "rds":
+        hourly, priced = _instance_price(prices, "rds", p, "instance_class", "instance_type")
+        multi_az = str(p.get("multi_az", "")).lower() in ("1", "true", "yes")
+        unit = hourly * HOURS_PER_MONTH * (2 if multi_az else 1)
+        fixed = _number(p, "allocated_storage", "storage_gb", default=20) * prices["rds_storage_gb_month"] * (2 if multi_az else 1)
+        low = expected = high = 1 + _number(p, "read_replicas", default=0)
+    elif kind == "redis":
+        hourly, priced = _instance_price(prices, "redis", p, "node_type", "instance_type")
+        unit = hourly * HOURS_PER_MONTH
+        low = expected = high = _number(p, "num_cache_nodes", "num_nodes", "count", default=1)
+    elif kind == "alb":
+        fixed = (prices["alb_hour"] + _number(p, "lcu", default=1) * prices["alb_lcu_hour"]) * HOURS_PER_MONTH
+    elif kind == "s3":
+        fixed = (
+            _number(p, "storage_gb", default=50) * prices["s3_gb_month"]
+            + _number(p, "requests_per_month", default=100_000) / 1000 * prices["s3_per_1k_requests"]
+        )
+    elif kind == "lambda":
+        requests_per_month = _number(p, "requests_per_month", default=1_000_000)
+        gb_seconds = (
+            requests_per_month
+            * _number(p, "duration_ms", default=200) / 1000
+            * _number(p, "memory_size", "memory_mb", default=128) / 1024
+        )
+        fixed = (
+            requests_per_month / 1e6 * prices["lambda_per_million_requests"]
+            + gb_seconds * prices["lambda_gb_second"]
+        )
+    elif kind == "apigateway":
+        fixed = _number(p, "requests_per_month", default=1_000_000) / 1e6 * prices["apigateway_per_million_requests"]
+    elif kind == "vpc":
+        # The VPC itself is free; NAT gateways are not
+        unit = prices["nat_gateway_hour"] * HOURS_PER_MONTH
+        low = expected = high = _number(p, "nat_gateways", default=0)
+
+    return fixed, unit, low, expected, high, priced
+
+
+class SessionCostModel:
+    """Line items of one canvas in parallel arrays, re-priced per changed resource"""
+
+    def __init__(self, region: str, capacity: int = 64):
+        if region not in PRICING:
+            raise ValueError(f"No pricing for region {region}")
+        self.region = region
+        self.prices = PRICING[region]
+        # columns: fixed, unit, min, expected, max
+        self.items = np.zeros((capacity, 5))
+        self.types = np.zeros(capacity, dtype=np.int64)
+        # resource id -> row; rows of removed resources are zeroed and reused
+        self.rows: Dict[str, int] = {}
+        self.free: List[int] = []
+        self.used = 0
+        # resource id -> (type, properties) last priced
+        self.seen: Dict[str, Tuple[str, Dict]] = {}
+        self.unpriced = set()
+        # Summary of the current rows, dropped whenever a row changes
+        self._summary: Optional[Dict] = None
+        self.last_summary: Optional[Dict] = None
+
+    def _row_for(self, resource_id: str) -> int:
+        row = self.rows.get(resource_id)
+        if row is not None:
+            return row
+        if self.free:
+            row = self.free.pop()
+        else:
+            if self.used == len(self.items):
+                self.items = np.vstack([self.items, np.zeros_like(self.items)])
+                self.types = np.concatenate([self.types, np.zeros_like(self.types)])
+            row = self.used
+            self.used += 1
+        self.rows[resource_id] = row
+        return row
+
+    def set(self, resource: AWSResource):
+        """Price a resource if it is new or its type/properties changed"""
+        previous = self.seen.get(resource.id)
+        if previous is not None and previous[0] == resource.type and previous[1] == resource.properties:
+            return
+
+        fixed, unit, low, expected, high, priced = price_resource(resource, self.prices)
+        row = self._row_for(resource.id)
+        self.items[row] = (fixed, unit, low, expected, high)
+        self.types[row] = _TYPE_INDEX[resource.type]
+        self.seen[resource.id] = (resource.type, dict(resource.properties))
+        self._summary = None
+        if priced:
+            self.unpriced.discard(resource.id)
+        else:
+            self.unpriced.add(resource.id)
+
+    def remove(self, resource_id: str):
+        row = self.rows.pop(resource_id, None)
+        if row is None:
+            return
+        self.items[row] = 0.0
+        self.free.append(row)
+        self._summary = None
+        self.seen.pop(resource_id, None)
+        self.unpriced.discard(resource_id)
+
+    def sync(self, resources: Iterable[AWSResource]):
+        """Bring the model in line with a full resource list, re-pricing only changed entries"""
+        seen = self.seen
+        count = 0
+        for resource in resources:
+            count += 1
+            previous = seen.get(resource.id)
+            if previous is None or previous[0] != resource.type or previous[1] != resource.properties:
+                self.set(resource)
+
+        # Every current id has a row now, so extra rows belong to removed resources
+        if len(self.rows) > count:
+            current = {resource.id for resource in resources}
+            for resource_id in [rid for rid in self.rows if rid not in current]:
+                self.remove(resource_id)
+
+    def summary(self) -> Dict:
+        """Monthly totals (min / expected / max) and the expected cost per resource type"""
+        if self._summary is not None:
+            return self._summary
+
+        items = self.items[:self.used]
+        fixed, unit = items[:, 0], items[:, 1]
+        # fixed + unit * units for all three unit columns at once
+        totals = fixed.sum() + unit @ items[:, 2:5]
+        by_type = np.bincount(self.types[:self.used], weights=fixed + unit * items[:, 3], minlength=len(RESOURCE_TYPES))
+        self._summary = {
+            "region": self.region,
+            "currency": "USD",
+            "monthly": {
+                "min": round(float(totals[0]), 2),
+                "expected": round(float(totals[1]), 2),
+                "max": round(float(totals[2]), 2)
+            },
+            "by_type": {
+                RESOURCE_TYPES[i]: round(float(cost), 2)
+                for i, cost in enumerate(by_type) if cost
+            },
+            "resources": len(self.rows),
+            "assumed_defaults": sorted(self.unpriced)
+        }
+        return self._summary
+
+
+def format_estimate(summary: Dict) -> str:
+    """Short human-readable form used for CodeGenerationResponse.estimated_cost"""
+    monthly = summary["monthly"]
+    text = f"~${monthly['expected']:,.2f}/month ({summary['region']} on-demand)"
+    if monthly["max"] != monthly["min"]:
+        text += f", ${monthly['min']:,.2f}-${monthly['max']:,.2f} with autoscaling"
+    if summary["assumed_defaults"]:
+        text += f"; default sizes assumed for {len(summary['assumed_defaults'])} resource(s)"
+    return text
+
+
+def estimate_canvas_cost(state: CanvasState, region: Optional[str] = None) -> Dict:
+    """One-off estimate without a cached session model"""
+    model = SessionCostModel(region or DEFAULT_REGION, capacity=max(len(state.resources), 1))
+    model.sync(state.resources)
+    return model.summary()
+
+
+class CostEstimator:
+    """Session cost models kept between canvas edits (LRU-bounded)"""
+
+    def __init__(self, max_sessions: int = 1024):
+        self.max_sessions = max_sessions
+        # (session_id, region) -> model
+        self._models: "OrderedDict[Tuple[str, str], SessionCostModel]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def estimate(self, state: CanvasState, region: Optional[str] = None) -> Dict:
+        """Current estimate for a session's canvas; only changed resources are re-priced"""
+        region = region or DEFAULT_REGION
+        if region not in PRICING:
+            raise ValueError(f"No pricing for region {region}")
+
+        key = (state.session_id, region)
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                model = SessionCostModel(region)
+                self._models[key] = model
+                if len(self._models) > self.max_sessions:
+                    self._models.popitem(last=False)
+            else:
+                self._models.move_to_end(key)
+            model.sync(state.resources)
+            return model.summary()
+
+    def update(self, state: CanvasState) -> Optional[Dict]:
+        """Estimate after a canvas edit; None if the totals did not change"""
+        summary = self.estimate(state)
+        with self._lock:
+            model = self._models.get((state.session_id, DEFAULT_REGION))
+            if model is None or model.last_summary == summary:
+                return None
+            model.last_summary = summary
+        return summary
+
+    def forget(self, session_id: str):
+        with self._lock:
+            for key in [key for key in self._models if key[0] == session_id]:
+                del self._models[key]
@@ -0,0 +1,318 @@
+"""
+CRDT canvas document
+
+Every replica (the server and each browser session) applies the same ops and
+converges without locks:
+
+- resources and connections are observed-remove sets: an add carries a
+  unique tag (its op id) and a remove deletes only the tags it has seen, so
+  a concurrent re-add survives;
+- resource fields and the prompt are last-writer-wins registers ordered by
+  (lamport clock, replica id).
+
+Ops are plain JSON dicts, `id` is [replica, seq] with seq counting up per
+replica, and a state vector {replica: highest seq applied} says which ops a
+replica has. Two replicas sync by exchanging vectors and sending only the
+ops the other side is missing; if those were already compacted away, a
+snapshot (the full document state, merged as a join) is sent instead.
+
+Pure Python so the frontend can keep an identical copy (frontend/crdt.py;
+the two images are built from separate contexts). Edit both together:
+tests/test_crdt_copy.py fails when they differ.
+"""
+import copy
+from typing import Dict, List, Optional, Tuple
+
+# Resource fields that are LWW registers
+RESOURCE_FIELDS = ("type", "name", "x", "y", "properties", "notes")
+# Defaults for fields a full-state client may leave out
+FIELD_DEFAULTS = {"name": "", "x": 0.0, "y": 0.0, "properties": {}, "notes": ""}
+
+
+def connection_key(connection: Dict) -> str:
+    """Connections are identified by their endpoints and type"""
+    return f"{connection['from_resource']}|{connection['to_resource']}|{connection.get('connection_type', 'default')}"
+
+
+def _tag(op: Dict) -> str:
+    return f"{op['id'][0]}:{op['id'][1]}"
+
+
+class CanvasDocument:
+    def __init__(self, session_id: str, replica: str):
+        self.session_id = session_id
+        self.replica = replica
+        self.clock = 0
+        # replica -> highest seq applied
+        self.vector: Dict[str, int] = {}
+        # rid -> {"tags": set, "fields": {field: [ts, replica, value]}, "created": [ts, replica]}
+        self.resources: Dict[str, Dict] = {}
+        # cid -> {"tags": set, "value": connection dict}
+        self.connections: Dict[str, Dict] = {}
+        # Tags of removed adds, so a late add of an observed-removed tag stays removed
+        self.removed = set()
+        self.prompt = [0, "", ""]
+
+        # Applied ops in order; `floor` is the highest seq per replica no longer in it
+        self.log: List[Dict] = []
+        self.floor: Dict[str, int] = {}
+
+    # -- applying ops ---------------------------------------------------------
+
+    def apply(self, op: Dict, record: bool = True) -> bool:
+        """
+        Apply an op; returns False if it was already applied or arrived out of order
+
+        Ops of one replica are applied strictly in seq order, so a state vector
+        always describes a prefix of each replica's ops.
+        """
+        replica, seq = op["id"]
+        if seq != self.vector.get(replica, 0) + 1:
+            return False
+        self.vector[replica] = seq
+        self.clock = max(self.clock, op["ts"])
+        stamp = (op["ts"], replica)
+        kind = op["op"]
+
+        if kind == "add":
+            tag = _tag(op)
+            entry = self._resource(op["rid"])
+            if tag not in self.removed:
+                entry["tags"].add(tag)
+            if entry["created"] is None or stamp < tuple(entry["created"]):
+                entry["created"] = list(stamp)
+            for field, value in op["fields"].items():
+                self._assign(entry["fields"], field, stamp, value)
+        elif kind == "remove":
+            tags = set(op["tags"])
+            self.removed |= tags
+            entry = self.resources.get(op["rid"])
+            if entry is not None:
+                entry["tags"] -= tags
+        elif kind == "set":
+            if op["rid"]:
+                self._assign(self._resource(op["rid"])["fields"], op["field"], stamp, op.get("value"))
+            elif stamp > (self.prompt[0], self.prompt[1]):
+                self.prompt = [op["ts"], replica, op.get("value") or ""]
+        elif kind == "link":
+            tag = _tag(op)
+            entry = self.connections.setdefault(op["cid"], {"tags": set(), "value": op["value"]})
+            if tag not in self.removed:
+                entry["tags"].add(tag)
+        elif kind == "unlink":
+            tags = set(op["tags"])
+            self.removed |= tags
+            entry = self.connections.get(op["cid"])
+            if entry is not None:
+                entry["tags"] -= tags
+
+        if record:
+            self.log.append(op)
+        return True
+
+    def apply_all(self, ops: List[Dict], record: bool = True) -> Tuple[List[Dict], bool]:
+        """Apply a batch; returns the newly applied ops and whether any op skipped ahead (a gap)"""
+        applied = []
+        gap = False
+        for op in ops:
+            if self.apply(op, record):
+                applied.append(op)
+            elif op["id"][1] > self.vector.get(op["id"][0], 0):
+                gap = True
+        return applied, gap
+
+    def _resource(self, rid: str) -> Dict:
+        entry = self.resources.get(rid)
+        if entry is None:
+            entry = {"tags": set(), "fields": {}, "created": None}
+            self.resources[rid] = entry
+        return entry
+
+    @staticmethod
+    def _assign(fields: Dict, field: str, stamp: tuple, value):
+        current = fields.get(field)
+        if current is None or stamp > (current[0], current[1]):
+            fields[field] = [stamp[0], stamp[1], value]
+
+    # -- local edits ----------------------------------------------------------
+
+    def _local(self, op: Dict) -> Dict:
+        seq = self.vector.get(self.replica, 0) + 1
+        self.clock += 1
+        op = {"id": [self.replica, seq], "ts": self.clock, **op}
+        self.apply(op)
+        return op
+
+    def update_from_state(self, canvas: Dict) -> List[Dict]:
+        """
+        Emit (and apply) the local ops that turn this document into `canvas`
+
+        Only the differences become ops, so unchanged resources are untouched
+        and concurrent edits to other resources or fields are kept.
+        """
+        ops = []
+        wanted = {resource["id"]: resource for resource in canvas.get("resources", [])}
+
+        for rid, resource in wanted.items():
+            entry = self.resources.get(rid)
+            if entry is None or not entry["tags"]:
+                fields = {f: resource.get(f, FIELD_DEFAULTS.get(f)) for f in RESOURCE_FIELDS}
+                ops.append(self._local({"op": "add", "rid": rid, "fields": fields}))
+                continue
+            for field in RESOURCE_FIELDS:
+                if field in resource and entry["fields"].get(field, [0, "", None])[2] != resource[field]:
+                    ops.append(self._local({"op": "set", "rid": rid, "field": field, "value": resource[field]}))
+
+        for rid, entry in self.resources.items():
+            if entry["tags"] and rid not in wanted:
+                ops.append(self._local({"op": "remove", "rid": rid, "tags": sorted(entry["tags"])}))
+
+        wanted_links = {connection_key(c): c for c in canvas.get("connections", [])}
+        for cid, connection in wanted_links.items():
+            entry = self.connections.get(cid)
+            if entry is None or not entry["tags"]:
+                value = {
+                    "from_resource": connection["from_resource"],
+                    "to_resource": connection["to_resource"],
+                    "connection_type": connection.get("connection_type", "default")
+                }
+                ops.append(self._local({"op": "link", "cid": cid, "value": value}))
+        for cid, entry in self.connections.items():
+            if entry["tags"] and cid not in wanted_links:
+                ops.append(self._local({"op": "unlink", "cid": cid, "tags": sorted(entry["tags"])}))
+
+        prompt = canvas.get("user_prompt", "")
+        if prompt != self.prompt[2]:
+            ops.append(self._local({"op": "set", "rid": "", "field": "user_prompt", "value": prompt}))
+        return ops
+
+    # -- sync -----------------------------------------------------------------
+
+    def ops_since(self, vector: Dict[str, int]) -> Optional[List[Dict]]:
+        """Ops the holder of `vector` is missing; None if some were compacted (send a snapshot)"""
+        for replica, floor in self.floor.items():
+            if vector.get(replica, 0) < floor:
+                return None
+        return [op for op in self.log if op["id"][1] > vector.get(op["id"][0], 0)]
+
+    def discard_acked(self, vector: Dict[str, int]):
+        """Drop logged ops the peer holding `vector` already has"""
+        kept = []
+        for op in self.log:
+            replica, seq = op["id"]
+            if seq <= vector.get(replica, 0):
+                self.floor[replica] = max(self.floor.get(replica, 0), seq)
+            else:
+                kept.append(op)
+        self.log = kept
+
+    def compact(self, keep: int):
+        """Keep only the newest `keep` ops; older peers get a snapshot instead"""
+        if len(self.log) <= keep:
+            return
+        for op in self.log[:-keep] if keep else self.log:
+            replica, seq = op["id"]
+            self.floor[replica] = max(self.floor.get(replica, 0), seq)
+        self.log = self.log[-keep:] if keep else []
+
+    def snapshot(self) -> Dict:
+        """Full document state (JSON-ready)
+
+        Field entries are shared, not copied: they are only ever replaced, and
+        merge() copies values on the way in.
+        """
+        return {
+            "vector": dict(self.vector),
+            "clock": self.clock,
+            "resources": {
+                rid: {"tags": sorted(e["tags"]), "fields": dict(e["fields"]), "created": e["created"]}
+                for rid, e in self.resources.items()
+            },
+            "connections": {
+                cid: {"tags": sorted(e["tags"]), "value": dict(e["value"])}
+                for cid, e in self.connections.items()
+            },
+            "removed": sorted(self.removed),
+            "prompt": list(self.prompt)
+        }
+
+    def merge(self, snapshot: Dict):
+        """Join another replica's snapshot into this document"""
+        self.removed |= set(snapshot["removed"])
+        for rid, other in snapshot["resources"].items():
+            entry = self._resource(rid)
+            entry["tags"] = (entry["tags"] | set(other["tags"])) - self.removed
+            for field, (ts, replica, value) in other["fields"].items():
+                self._assign(entry["fields"], field, (ts, replica), copy.deepcopy(value))
+            if other["created"] and (entry["created"] is None or tuple(other["created"]) < tuple(entry["created"])):
+                entry["created"] = list(other["created"])
+            if entry["created"] is None and entry["tags"]:
+                # A snapshot with add tags but no `created`; order it before stamped ones, by tag
+                entry["created"] = [0, min(entry["tags"])]
+        for cid, other in snapshot["connections"].items():
+            entry = self.connections.setdefault(cid, {"tags": set(), "value": dict(other["value"])})
+            entry["tags"] = (entry["tags"] | set(other["tags"])) - self.removed
+        for entry in list(self.resources.values()) + list(self.connections.values()):
+            entry["tags"] -= self.removed
+
+        prompt = snapshot["prompt"]
+        if (prompt[0], prompt[1]) > (self.prompt[0], self.prompt[1]):
+            self.prompt = list(prompt)
+        self.clock = max(self.clock, snapshot["clock"])
+
+        # Ops covered by the snapshot are not in our log
+        for replica, seq in snapshot["vector"].items():
+            if seq > self.vector.get(replica, 0):
+                self.vector[replica] = seq
+                self.floor[replica] = max(self.floor.get(replica, 0), seq)
+
+    def fork(self) -> "CanvasDocument":
+        """
+        Scratch copy to try ops on (without the log)
+
+        Entries are copied one level deep: register values and `created` are
+        only ever replaced, never changed in place, so they can be shared.
+        """
+        other = CanvasDocument(self.session_id, self.replica)
+        other.clock = self.clock
+        other.vector = dict(self.vector)
+        other.floor = dict(self.floor)
+        other.removed = set(self.removed)
+        other.prompt = list(self.prompt)
+        other.resources = {
+            rid: {"tags": set(e["tags"]), "fields": dict(e["fields"]), "created": e["created"]}
+            for rid, e in self.resources.items()
+        }
+        other.connections = {cid: {"tags": set(e["tags"]), "value": e["value"]} for cid, e in self.connections.items()}
+        return other
+
+    @classmethod
+    def from_snapshot(cls, session_id: str, replica: str, snapshot: Dict) -> "CanvasDocument":
+        document = cls(session_id, replica)
+        document.merge(snapshot)
+        return document
+
+    # -- materialized view ----------------------------------------------------
+
+    def to_canvas(self) -> Dict:
+        """The visible canvas as a CanvasState-shaped dict"""
+        visible = [
+            (entry["created"], rid, entry) for rid, entry in self.resources.items()
+            if entry["tags"] and "type" in entry["fields"]
+        ]
+        visible.sort(key=lambda item: (item[0][0], item[0][1], item[1]))
+
+        resources = []
+        for _, rid, entry in visible:
+            resource = {"id": rid}
+            for field in RESOURCE_FIELDS:
+                value = entry["fields"].get(field, [0, "", FIELD_DEFAULTS.get(field)])[2]
+                resource[field] = copy.deepcopy(value) if field == "properties" else value
+            resources.append(resource)
+
+        return {
+            "session_id": self.session_id,
+            "resources": resources,
+            "connections": [dict(e["value"]) for e in self.connections.values() if e["tags"]],
+            "user_prompt": self.prompt[2]
+        }
@@ -0,0 +1,282 @@
+"""
+Drift detection across deployed session stacks
+
+A sweep walks every persisted workspace (see terraform_executor.py) and runs
+`terraform plan -refresh-only -detailed-exitcode` in a bounded process pool:
+exit code 0 means the real infrastructure matches the state, 2 means it
+drifted. Each check has its own timeout and the whole sweep a fixed window;
+stacks that do not get a turn are checked first in the next sweep.
+
+A stack whose state and config have not changed since its last clean check
+is skipped, until DRIFT_RECHECK_AFTER has passed (drift happens outside
+Terraform, so an unchanged state does not rule it out forever).
+
+A stack being deployed or destroyed is reported `busy`: checks take the
+same per-session lock as terraform_executor.py, since a deploy works on a
+staging copy that Terraform's own state lock does not see.
+
+Results are kept per session in Redis. Changes into or out of drift are
+published to every node and pushed to the session's sockets as
+`{"type": "drift_alert", "data": {...}}`. One node per DRIFT_INTERVAL runs
+the sweep.
+"""
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+import re
+import signal
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from metrics import DRIFT_CHECKS, DRIFT_SWEEP_DURATION
+
+logger = logging.getLogger(__name__)
+
+# Seconds between sweeps (0 disables the scheduler; sweeps can still be started by hand)
+DRIFT_INTERVAL = float(os.getenv("DRIFT_INTERVAL", 900))
+# A sweep stops starting checks after this many seconds
+DRIFT_WINDOW = float(os.getenv("DRIFT_WINDOW", 600))
+DRIFT_STACK_TIMEOUT = float(os.getenv("DRIFT_STACK_TIMEOUT", 120))
+DRIFT_WORKERS = int(os.getenv("DRIFT_WORKERS", 8))
+# Unchanged stacks are checked again after this long even if their last check was clean
+DRIFT_RECHECK_AFTER = float(os.getenv("DRIFT_RECHECK_AFTER", 86400))
+TERRAFORM_BIN = os.getenv("TERRAFORM_BIN", "terraform")
+
+# Checks are not started with less time than this left in the window
+MIN_CHECK_SECONDS = 5.0
+# Resource addresses kept per result
+MAX_CHANGES = 50
+
+_CHANGE = re.compile(r"^\s*# (\S+) has (changed|been deleted)", re.MULTILINE)
+
+
+def fingerprint(workspace: Path) -> Optional[str]:
+    """Hash of the workspace's state and config (None if it vanished meanwhile)"""
+    digest = hashlib.sha256()
+    try:
+        digest.update((workspace / "terraform.tfstate").read_bytes())
+        for path in sorted(workspace.glob("**/*.tf")):
+            if ".terraform" in path.parts:
+                continue
+            digest.update(str(path.relative_to(workspace)).encode("utf-8"))
+            digest.update(path.read_bytes())
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def _run(command: List[str], cwd: str, timeout: float):
+    """(return code, stdout, stderr); raises TimeoutExpired after killing the whole process group"""
+    process = subprocess.Popen(
+        command,
+        cwd=cwd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        # Own process group, so provider plugins die with terraform on timeout
+        start_new_session=True
+    )
+    try:
+        stdout, stderr = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.communicate()
+        raise
+    return process.returncode, stdout, stderr
+
+
+def check_stack(workspace: str, timeout: float, terraform_bin: str = TERRAFORM_BIN) -> Dict:
+    """
+    Refresh-only plan of one workspace (runs in a pool process)
+
+    Returns {"status": clean|drifted|busy|error|timeout, "changes": [...],
+    "error": ..., "duration": seconds}.
+    """
+    started = time.monotonic()
+    flags = ["-input=false", "-no-color"]
+    try:
+        if not os.path.isdir(os.path.join(workspace, ".terraform")):
+            code, _, stderr = _run([terraform_bin, "init", *flags], workspace, timeout)
+            if code != 0:
+                return {"status": "error", "changes": [], "error": stderr[-2000:], "duration": time.monotonic() - started}
+
+        remaining = max(1.0, timeout - (time.monotonic() - started))
+        code, stdout, stderr = _run(
+            [terraform_bin, "plan", "-refresh-only", "-detailed-exitcode", "-lock-timeout=0s", *flags],
+            workspace,
+            remaining
+        )
+    except subprocess.TimeoutExpired:
+        return {"status": "timeout", "changes": [], "error": f"No answer within {timeout:.0f}s", "duration": time.monotonic() - started}
+    except OSError as e:
+        return {"status": "error", "changes": [], "error": str(e), "duration": time.monotonic() - started}
+
+    duration = time.monotonic() - started
+    if code == 0:
+        return {"status": "clean", "changes": [], "error": None, "duration": duration}
+    if code == 2:
+        changes = [{"address": address, "change": change} for address, change in _CHANGE.findall(stdout)]
+        return {"status": "drifted", "changes": changes[:MAX_CHANGES], "error": None, "duration": duration}
+    # Someone else holds Terraform's state lock; try again next sweep
+    status = "busy" if "state lock" in stderr else "error"
+    return {"status": status, "changes": [], "error": stderr[-2000:], "duration": duration}
+
+
+class DriftMonitor:
+    def __init__(
+        self,
+        redis_client,
+        ws_manager,
+        terraform_executor,
+        workers: int = DRIFT_WORKERS,
+        window: float = DRIFT_WINDOW,
+        stack_timeout: float = DRIFT_STACK_TIMEOUT,
+        recheck_after: float = DRIFT_RECHECK_AFTER,
+        terraform_bin: str = TERRAFORM_BIN
+    ):
+        self.redis_client = redis_client
+        self.ws_manager = ws_manager
+        self.terraform_executor = terraform_executor
+        self.workers = workers
+        self.window = window
+        self.stack_timeout = stack_timeout
+        self.recheck_after = recheck_after
+        self.terraform_bin = terraform_bin
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.sweeping = False
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        """Worker processes, started on first sweep ("spawn": the API process has threads)"""
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def sweep(self) -> Dict:
+        """Check every deployed stack once, within the window; returns a summary"""
+        self.sweeping = True
+        started, started_at = time.monotonic(), time.time()
+        deadline = started + self.window
+        counts = {"stacks": 0, "checked": 0, "skipped": 0, "deferred": 0, "clean": 0, "drifted": 0, "busy": 0, "error": 0, "timeout": 0}
+        try:
+            stacks = await asyncio.to_thread(
+                lambda: [(session_id, path, fingerprint(path)) for session_id, path in self.terraform_executor.workspaces()]
+            )
+            previous = self.redis_client.get_drift_results([session_id for session_id, _, _ in stacks])
+            counts["stacks"] = len(stacks)
+
+            todo = []
+            for session_id, path, digest in stacks:
+                last = previous.get(session_id)
+                if digest is None:
+                    continue
+                if (
+                    last is not None and last["status"] == "clean" and last.get("fingerprint") == digest
+                    and started_at - last["checked_at"] < self.recheck_after
+                ):
+                    counts["skipped"] += 1
+                    DRIFT_CHECKS.labels("skipped").inc()
+                    continue
+                todo.append((session_id, path, digest))
+            # Never-checked and longest-unchecked stacks first, so deferred ones go next time
+            todo.sort(key=lambda stack: previous.get(stack[0], {}).get("checked_at", 0.0))
+
+            slots = asyncio.Semaphore(self.workers)
+            await asyncio.gather(*(
+                self._check(session_id, path, digest, previous.get(session_id), deadline, slots, counts)
+                for session_id, path, digest in todo
+            ))
+        finally:
+            self.sweeping = False
+
+        duration = time.monotonic() - started
+        DRIFT_SWEEP_DURATION.observe(duration)
+        summary = {**counts, "started_at": started_at, "duration": duration}
+        self.redis_client.save_drift_sweep(summary)
+        logger.info(f"Drift sweep: {summary}")
+        return summary
+
+    async def _check(
+        self,
+        session_id: str,
+        path: Path,
+        digest: str,
+        last: Optional[Dict],
+        deadline: float,
+        slots: asyncio.Semaphore,
+        counts: Dict
+    ):
+        async with slots:
+            remaining = deadline - time.monotonic()
+            if remaining < MIN_CHECK_SECONDS:
+                counts["deferred"] += 1
+                DRIFT_CHECKS.labels("deferred").inc()
+                return
+            timeout = min(self.stack_timeout, remaining)
+            # Held for the check, so a deploy waits instead of swapping the workspace underneath it
+            lock = self.redis_client.stack_lock(session_id, ttl=timeout + MIN_CHECK_SECONDS)
+            if not lock.acquire(blocking=False):
+                result = {"status": "busy", "changes": [], "error": "A deployment of this stack is in progress", "duration": 0.0}
+            else:
+                try:
+                    result = await asyncio.get_running_loop().run_in_executor(
+                        self.pool, check_stack, str(path), timeout, self.terraform_bin
+                    )
+                except BrokenProcessPool as e:
+                    # A worker died; start a fresh pool for the remaining checks
+                    self.shutdown()
+                    result = {"status": "error", "changes": [], "error": f"Drift worker crashed: {e}", "duration": 0.0}
+                finally:
+                    try:
+                        lock.release()
+                    except Exception as e:
+                        logger.warning(f"Stack lock of {session_id} was lost during its drift check: {e}")
+
+        counts["checked"] += 1
+        counts[result["status"]] += 1
+        DRIFT_CHECKS.labels(result["status"]).inc()
+        result = {**result, "fingerprint": digest, "checked_at": time.time()}
+        self.redis_client.save_drift_result(session_id, result)
+
+        was_drifted = last is not None and last["status"] == "drifted"
+        if result["status"] == "drifted" and (not was_drifted or last["changes"] != result["changes"]):
+            self.redis_client.publish_drift_alert({"session_id": session_id, **result})
+        elif result["status"] == "clean" and was_drifted:
+            self.redis_client.publish_drift_alert({"session_id": session_id, **result})
+
+    async def run(self, interval: float = DRIFT_INTERVAL):
+        """Sweep forever; a cluster-wide claim makes one node sweep per interval"""
+        while True:
+            try:
+                # Held for at least a whole sweep, so sweeps never overlap across nodes
+                claim = max(interval, self.window + self.stack_timeout)
+                if not self.sweeping and self.redis_client.claim_interval("drift_sweep", claim):
+                    await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Drift sweep failed: {e}")
+            await asyncio.sleep(min(interval, 60))
+
+    async def forward_alerts(self):
+        """Push alerts published by any node to this node's sockets of the session"""
+        while True:
+            try:
+                async for alert in self.redis_client.drift_alerts():
+                    await self.ws_manager.broadcast_to_session(alert["session_id"], {"type": "drift_alert", "data": alert})
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Drift alert listener error: {e}")
+                await asyncio.sleep(1)
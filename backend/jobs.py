@@ -0,0 +1,279 @@
+"""
+Background jobs for code generation and deployment
+
+A job record lives in Redis (status hash plus an append-only output string),
+so any node can report progress and a client can pick a job up again after a
+reload. The work runs in a worker thread on the node that accepted it, inside
+the admission job queue. Streamed output is flushed to Redis in small batches,
+and cancellation is checked at each flush. While a job waits or runs, a
+heartbeat keeps its record fresh, so only jobs whose node went away turn stale.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+
+import redis
+
+from admission import QueueFullError
+from models import CodeGenerationRequest, DeploymentRequest, DeploymentResponse
+
+logger = logging.getLogger(__name__)
+
+FINISHED = ("succeeded", "failed", "cancelled")
+# Output is written to Redis at most this often
+FLUSH_INTERVAL = 0.5
+# A running job not heard from for this long (e.g. its node died) can be resumed
+STALE_AFTER = 120
+# Queued and running jobs refresh `updated_at` this often, output or not
+HEARTBEAT_INTERVAL = 30
+
+
+class JobCancelled(Exception):
+    """Raised inside a job once cancellation has been requested"""
+
+
+class JobProgress:
+    """Collects output from the worker thread and flushes it to Redis in batches"""
+
+    def __init__(self, redis_client, job_id: str):
+        self.redis_client = redis_client
+        self.job_id = job_id
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def write(self, text: str):
+        with self._lock:
+            self._buffer.append(text)
+        if time.monotonic() - self._last_flush >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self, check_cancel: bool = True):
+        with self._lock:
+            text = "".join(self._buffer)
+            self._buffer.clear()
+        self._last_flush = time.monotonic()
+        if self.redis_client.append_job_output(self.job_id, text) and check_cancel:
+            raise JobCancelled()
+
+
+class JobManager:
+    def __init__(self, redis_client, admission, ws_manager, ai_generator, terraform_executor, artifact_store, placement):
+        self.redis_client = redis_client
+        self.artifact_store = artifact_store
+        self.admission = admission
+        self.ws_manager = ws_manager
+        self.ai_generator = ai_generator
+        self.terraform_executor = terraform_executor
+        self.placement = placement
+        # job_id -> task running on this node
+        self.tasks: Dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def _public(job: Dict) -> Dict:
+        """Job fields returned to clients"""
+        view = {key: value for key, value in job.items() if key not in ("request", "cancel_requested")}
+        for key in ("created_at", "updated_at"):
+            if key in view:
+                view[key] = float(view[key])
+        view["result"] = json.loads(job["result"]) if job.get("result") else None
+        view["cancel_requested"] = job.get("cancel_requested") == "1"
+        view["stale"] = (
+            job.get("status") in ("queued", "running")
+            and time.time() - float(job.get("updated_at", 0)) > STALE_AFTER
+        )
+        return view
+
+    async def _notify(self, job: Dict):
+        """Push status changes to the session's sockets on this node"""
+        await self.ws_manager.broadcast_to_session(
+            job["session_id"],
+            {"type": "job_update", "job": self._public(job)}
+        )
+
+    async def submit(self, kind: str, session_id: str, request: str) -> Dict:
+        """Record a job and start it; raises QueueFullError if the queue is full"""
+        self.admission.jobs[kind].check()
+
+        now = time.time()
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "kind": kind,
+            "session_id": session_id,
+            "node": self.placement.node_id,
+            "status": "queued",
+            "created_at": now,
+            "updated_at": now,
+            "request": request,
+            "result": "",
+            "error": "",
+            "cancel_requested": "0"
+        }
+        self.redis_client.save_job(job)
+        self._start(job)
+        return self._public(job)
+
+    def _start(self, job: Dict):
+        self.tasks[job["job_id"]] = asyncio.create_task(self._run(job))
+
+    async def _set(self, job: Dict, **fields):
+        job.update(fields, updated_at=time.time())
+        self.redis_client.update_job(job["job_id"], **fields)
+        await self._notify(job)
+
+    async def _heartbeat(self, job: Dict):
+        """Refresh `updated_at` while the job waits for a slot or runs without output"""
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            try:
+                self.redis_client.update_job(job["job_id"])
+                job["updated_at"] = time.time()
+            except redis.RedisError as e:
+                logger.warning(f"Heartbeat of job {job['job_id']} failed: {e}")
+
+    def _owner_alive(self, job: Dict) -> bool:
+        """True if the job belongs to another node that is still in the cluster"""
+        node = job.get("node")
+        # On this node (also after a restart under the same id) self.tasks is authoritative
+        if not node or node == self.placement.node_id:
+            return False
+        return self.placement.enabled and node in self.placement.ring.nodes
+
+    async def _run(self, job: Dict):
+        job_id = job["job_id"]
+        progress = JobProgress(self.redis_client, job_id)
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            async with self.admission.jobs[job["kind"]].slot():
+                if self.redis_client.get_job(job_id).get("cancel_requested") == "1":
+                    raise JobCancelled()
+                await self._set(job, status="running")
+
+                result = await asyncio.to_thread(self._execute, job, progress)
+                progress.flush(check_cancel=False)
+
+                # Generators report their own failures; a cancel during the call surfaces here
+                if self.redis_client.get_job(job_id).get("cancel_requested") == "1" and not result.success:
+                    raise JobCancelled()
+                await self._set(
+                    job,
+                    status="succeeded" if result.success else "failed",
+                    result=result.model_dump_json(),
+                    error=result.error or ""
+                )
+        except (JobCancelled, asyncio.CancelledError):
+            await self._set(job, status="cancelled")
+        except QueueFullError as e:
+            await self._set(job, status="failed", error=str(e))
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}")
+            await self._set(job, status="failed", error=str(e))
+        finally:
+            heartbeat.cancel()
+            self.tasks.pop(job_id, None)
+
+    def _execute(self, job: Dict, progress: JobProgress):
+        """Run the job's work (in a worker thread)"""
+        if job["kind"] == "generate-code":
+            request = CodeGenerationRequest.model_validate_json(job["request"])
+            if request.target_format == "terraform":
+                result = self.ai_generator.generate_terraform_code(
+                    request.canvas_state,
+                    provider=request.ai_provider,
+                    on_delta=progress.write,
+                    deadline=request.deadline_seconds
+                )
+            else:
+                result = self.ai_generator.generate_cloudformation_code(
+                    request.canvas_state,
+                    on_delta=progress.write,
+                    deadline=request.deadline_seconds
+                )
+            return self.artifact_store.record_generation(request.session_id, result, request.target_format)
+
+        request = DeploymentRequest.model_validate_json(job["request"])
+        if request.format != "terraform":
+            return DeploymentResponse(
+                success=False,
+                deployment_id=request.session_id,
+                status="failed",
+                error="CloudFormation deployment not supported in MVP"
+            )
+        try:
+            code = self.artifact_store.deployment_code(request)
+        except (LookupError, ValueError) as e:
+            return DeploymentResponse(
+                success=False,
+                deployment_id=request.session_id,
+                status="failed",
+                error=str(e)
+            )
+        success, outputs, error = self.terraform_executor.deploy(
+            code,
+            request.session_id,
+            auto_approve=request.auto_approve,
+            progress=progress.write
+        )
+        return DeploymentResponse(
+            success=success,
+            deployment_id=request.session_id,
+            status="deployed" if success else "failed",
+            outputs=outputs,
+            error=error if not success else None
+        )
+
+    def get(self, job_id: str, offset: int = 0) -> Optional[Dict]:
+        """Job status plus output written since byte `offset`"""
+        job = self.redis_client.get_job(job_id)
+        if job is None:
+            return None
+        output, next_offset = self.redis_client.get_job_output(job_id, offset)
+        return {**self._public(job), "output": output, "next_offset": next_offset}
+
+    def for_session(self, session_id: str, limit: int = 20):
+        """Recent jobs of a session, newest first"""
+        return [self._public(job) for job in self.redis_client.list_jobs(session_id, limit)]
+
+    async def cancel(self, job_id: str) -> Optional[Dict]:
+        """Request cancellation; queued jobs stop at once, running ones at their next output flush"""
+        job = self.redis_client.get_job(job_id)
+        if job is None:
+            return None
+        if job["status"] in FINISHED:
+            return self._public(job)
+
+        self.redis_client.update_job(job_id, cancel_requested="1")
+        job["cancel_requested"] = "1"
+        task = self.tasks.get(job_id)
+        if task is not None and job["status"] == "queued":
+            # Still waiting for a slot on this node
+            task.cancel()
+        return self._public(job)
+
+    async def resume(self, job_id: str) -> Optional[Dict]:
+        """
+        Run a failed, cancelled or stale job again from its stored request
+
+        A job still running here, or owned by a node that is still alive, is left alone
+        (returned unchanged) so the same work never runs twice.
+        """
+        job = self.redis_client.get_job(job_id)
+        if job is None:
+            return None
+        if job["status"] == "succeeded" or (job["status"] not in FINISHED and not self._public(job)["stale"]):
+            return self._public(job)
+        if job_id in self.tasks or (job["status"] not in FINISHED and self._owner_alive(job)):
+            return self._public(job)
+
+        self.admission.jobs[job["kind"]].check()
+        job.update(
+            status="queued", node=self.placement.node_id, result="", error="", cancel_requested="0", updated_at=time.time()
+        )
+        self.redis_client.save_job(job)
+        self.redis_client.clear_job_output(job_id)
+        self._start(job)
+        return self._public(job)
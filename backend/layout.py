@@ -0,0 +1,185 @@
+"""
+Server-side auto-layout for canvas resources
+
+Layered layout: every resource type belongs to a tier (network, entry
+points, compute, data), tiers are stacked top to bottom and wrap into rows
+of at most `max_columns`. Inside a tier, resources stay grouped by type and
+are ordered by the barycenter of their neighbours in the connections graph
+(a few sweeps), which removes most edge crossings. All passes are NumPy
+array operations, so thousands of resources take a few milliseconds.
+
+Incremental mode places only the given resources and leaves everything else
+where it is: a new resource goes into its tier's band, next to the
+resources it is connected to, on the nearest free grid slot.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Top-to-bottom order of resource types
+TIERS = {"vpc": 0, "apigateway": 1, "alb": 1, "ec2": 2, "lambda": 2, "redis": 3, "rds": 3, "s3": 3}
+# Order of type groups inside a tier
+TYPE_ORDER = {t: i for i, t in enumerate(("vpc", "apigateway", "alb", "ec2", "lambda", "redis", "rds", "s3"))}
+
+SWEEPS = 4
+
+
+def _edges(resources: List[Dict], connections: Iterable[Dict]) -> Tuple[np.ndarray, np.ndarray]:
+    """Connection endpoints as index arrays (connections name resources by name or id)"""
+    index = {}
+    for i, resource in enumerate(resources):
+        index.setdefault(resource["name"], i)
+        index.setdefault(resource["id"], i)
+    pairs = [
+        (index[c["from_resource"]], index[c["to_resource"]])
+        for c in connections
+        if c["from_resource"] in index and c["to_resource"] in index
+    ]
+    if not pairs:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    edges = np.array(pairs, dtype=np.int64)
+    # Undirected: each edge pulls on both of its ends
+    return np.concatenate([edges[:, 0], edges[:, 1]]), np.concatenate([edges[:, 1], edges[:, 0]])
+
+
+def _barycenter(x: np.ndarray, src: np.ndarray, dst: np.ndarray) -> np.ndarray:
+    """Mean x of each node's neighbours; nodes without neighbours keep their own x"""
+    total = np.zeros_like(x)
+    count = np.zeros_like(x)
+    np.add.at(total, src, x[dst])
+    np.add.at(count, src, 1.0)
+    return np.where(count > 0, total / np.maximum(count, 1.0), x)
+
+
+def layout_all(
+    resources: List[Dict],
+    connections: Iterable[Dict],
+    spacing_x: float = 200.0,
+    spacing_y: float = 150.0,
+    max_columns: int = 40
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Positions (x, y arrays, in resource order) for a full re-layout"""
+    n = len(resources)
+    if not n:
+        return np.zeros(0), np.zeros(0)
+
+    tier = np.array([TIERS.get(r["type"], len(TIERS)) for r in resources], dtype=np.int64)
+    group = np.array([TYPE_ORDER.get(r["type"], len(TYPE_ORDER)) for r in resources], dtype=np.int64)
+    src, dst = _edges(resources, connections)
+
+    # Rows each tier needs, and the y where each tier starts
+    tiers, counts = np.unique(tier, return_counts=True)
+    rows = -(-counts // max_columns)
+    tier_top = np.zeros(tiers.max() + 1, dtype=np.int64)
+    tier_top[tiers] = np.concatenate([[0], np.cumsum(rows)[:-1]])
+    tier_count = np.zeros(tiers.max() + 1, dtype=np.int64)
+    tier_count[tiers] = counts
+    tier_start = np.zeros(tiers.max() + 1, dtype=np.int64)
+    tier_start[tiers] = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+    key = np.arange(n, dtype=np.float64)
+    x = np.zeros(n)
+    y = np.zeros(n)
+    for _ in range(SWEEPS + 1):
+        # Sort by tier, then type group, then barycenter; rank within the tier
+        order = np.lexsort((key, group, tier))
+        rank = np.empty(n, dtype=np.int64)
+        rank[order] = np.arange(n) - tier_start[tier[order]]
+
+        row = rank // max_columns
+        column = rank % max_columns
+        # Centre every row (the last row of a tier may be short)
+        in_row = np.minimum(max_columns, tier_count[tier] - row * max_columns)
+        x = (column - (in_row - 1) / 2.0) * spacing_x
+        y = (tier_top[tier] + row) * spacing_y
+
+        if not len(src):
+            break
+        key = _barycenter(x, src, dst)
+
+    # Keep coordinates non-negative like hand-placed canvases
+    return x - x.min(), y
+
+
+def layout_new(
+    resources: List[Dict],
+    connections: Iterable[Dict],
+    new_ids: Iterable[str],
+    spacing_x: float = 200.0,
+    spacing_y: float = 150.0,
+    max_columns: int = 40
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Positions for an incremental layout: only `new_ids` move (all new: a full layout with `max_columns`)"""
+    n = len(resources)
+    x = np.array([float(r["x"]) for r in resources])
+    y = np.array([float(r["y"]) for r in resources])
+    new_ids = set(new_ids)
+    new = np.array([r["id"] in new_ids for r in resources], dtype=bool)
+    if not new.any():
+        return x, y
+    if new.all():
+        return layout_all(resources, connections, spacing_x, spacing_y, max_columns)
+
+    tier = np.array([TIERS.get(r["type"], len(TIERS)) for r in resources], dtype=np.int64)
+    src, dst = _edges(resources, connections)
+    fixed = ~new
+
+    # Band of each tier: where its placed resources already are, else below everything
+    bottom = y[fixed].max()
+    band: Dict[int, float] = {}
+    for t in np.unique(tier):
+        members = fixed & (tier == t)
+        if members.any():
+            band[int(t)] = float(np.median(y[members]))
+    for t in sorted(set(np.unique(tier).tolist()) - set(band)):
+        bottom += spacing_y
+        band[t] = bottom
+
+    # Target x: barycenter of already-placed neighbours, else the right end of the band
+    weight = fixed[dst].astype(np.float64)
+    total = np.zeros(n)
+    count = np.zeros(n)
+    np.add.at(total, src, x[dst] * weight)
+    np.add.at(count, src, weight)
+    right_end = {t: (x[fixed & (tier == t)].max() + spacing_x) if (fixed & (tier == t)).any() else 0.0 for t in band}
+    target = np.where(count > 0, total / np.maximum(count, 1.0), [right_end[int(t)] for t in tier])
+
+    # Snap to the nearest free grid slot on the band's row
+    occupied = set(zip(np.rint(x[fixed] / spacing_x).astype(int).tolist(), np.rint(y[fixed] / spacing_y).astype(int).tolist()))
+    for i in np.flatnonzero(new):
+        row = int(round(band[int(tier[i])] / spacing_y))
+        column = max(0, int(round(target[i] / spacing_x)))
+        # 0, +1, -1, +2, -2, ... skipping negative columns; only finitely many slots are taken
+        step = 0
+        while True:
+            candidate = column + (step + 1) // 2 * (1 if step % 2 else -1)
+            if candidate >= 0 and (candidate, row) not in occupied:
+                break
+            step += 1
+        column = candidate
+        occupied.add((column, row))
+        x[i] = column * spacing_x
+        y[i] = row * spacing_y
+    return x, y
+
+
+def auto_layout(
+    canvas: Dict,
+    resource_ids: Optional[Iterable[str]] = None,
+    spacing_x: float = 200.0,
+    spacing_y: float = 150.0,
+    max_columns: int = 40
+) -> Dict[str, Tuple[float, float]]:
+    """New positions {resource_id: (x, y)} for the resources that moved"""
+    resources = canvas["resources"]
+    connections = canvas["connections"]
+    if resource_ids is None:
+        x, y = layout_all(resources, connections, spacing_x, spacing_y, max_columns)
+    else:
+        x, y = layout_new(resources, connections, resource_ids, spacing_x, spacing_y, max_columns)
+
+    return {
+        resource["id"]: (float(x[i]), float(y[i]))
+        for i, resource in enumerate(resources)
+        if (resource["x"], resource["y"]) != (x[i], y[i])
+    }
@@ -0,0 +1,279 @@
+"""
+Tail-latency control for LLM calls: deadlines, hedging, retries and circuit breaking
+
+- Deadline: one time budget per request, created by the caller and passed
+  down; every attempt, hedge and retry backoff is bounded by what is left.
+- hedged(): if an attempt has not answered by the recent latency percentile,
+  a duplicate is started and the first good answer wins (the loser is
+  discarded when it finishes).
+- call_with_retries(): full-jitter exponential backoff for retryable errors
+  (timeouts, connection errors, 408/409/429/5xx), never sleeping past the
+  deadline.
+- CircuitBreaker: after consecutive upstream failures calls fail fast for a
+  cool-down, then a single probe decides whether to close again. Running
+  out of a caller-chosen budget is not an upstream failure.
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, List, Optional, TypeVar, Union
+
+from metrics import LLM_CIRCUIT_STATE, LLM_HEDGES, LLM_RETRIES
+
+T = TypeVar("T")
+
+# Budget for a whole generation when the caller does not set one
+DEFAULT_DEADLINE = float(os.getenv("LLM_DEADLINE", 180))
+
+# Attempts (including hedges) run here; calls beyond this wait for a free worker
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_MAX_INFLIGHT", 16)), thread_name_prefix="llm")
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request's time budget ran out"""
+
+
+class CircuitOpenError(RuntimeError):
+    """The upstream is failing; calls are not attempted until the cool-down ends"""
+
+
+class CallerAborted(Exception):
+    """The caller's own callback raised (e.g. the job was cancelled); never retried"""
+
+
+class StreamInterrupted(RuntimeError):
+    """A stream failed after output was already handed to the caller; not retryable"""
+
+
+class Deadline:
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    @classmethod
+    def coerce(cls, deadline: Union["Deadline", float, None], default: float = DEFAULT_DEADLINE) -> "Deadline":
+        """Accept a Deadline, a budget in seconds, or None (the default budget)"""
+        if isinstance(deadline, Deadline):
+            return deadline
+        return cls(default if deadline is None else float(deadline))
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+class LatencyTracker:
+    """Recent successful latencies, for the hedging threshold"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """The p-th percentile, or None until there are enough samples"""
+        with self._lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+class CircuitBreaker:
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_after: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        # Generations run in worker threads
+        self._lock = threading.Lock()
+        self._publish()
+
+    def _publish(self):
+        LLM_CIRCUIT_STATE.labels(self.name).set({self.CLOSED: 0, self.HALF_OPEN: 1, self.OPEN: 2}[self.state])
+
+    def allow(self) -> bool:
+        """Whether a call may go upstream now (half-open lets exactly one probe through)"""
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_after:
+                self.state = self.HALF_OPEN
+                self._publish()
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    @property
+    def probing(self) -> bool:
+        return self.state == self.HALF_OPEN
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+            self._publish()
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._publish()
+
+    def release(self):
+        """The call ended without telling us anything about the upstream"""
+        with self._lock:
+            self._probing = False
+
+    def snapshot(self) -> dict:
+        return {"state": self.state, "failures": self.failures}
+
+
+def is_retryable(e: BaseException) -> bool:
+    """Transient upstream errors worth another attempt"""
+    if isinstance(e, (DeadlineExceeded, CallerAborted, StreamInterrupted, CircuitOpenError)):
+        return False
+    if isinstance(e, (TimeoutError, ConnectionError)):
+        return True
+    status = getattr(e, "status_code", None)
+    if status is not None:
+        return status in (408, 409, 429) or status >= 500
+    # openai.APITimeoutError / APIConnectionError (matched by name: the SDK is imported lazily)
+    return type(e).__name__ in ("APITimeoutError", "APIConnectionError")
+
+
+def is_out_of_time(e: BaseException, deadline: Deadline) -> bool:
+    """The request's budget ran out (the deadline itself, or an attempt timeout it cut short)"""
+    if isinstance(e, DeadlineExceeded):
+        return True
+    timed_out = isinstance(e, TimeoutError) or type(e).__name__ == "APITimeoutError"
+    return timed_out and deadline.expired
+
+
+def is_upstream_failure(e: BaseException, deadline: Optional[Deadline] = None, full_budget: float = DEFAULT_DEADLINE) -> bool:
+    """
+    Errors that count against the circuit breaker
+
+    Running out of time only counts if the request had at least the full
+    default budget: a short deadline (or one mostly spent elsewhere) says
+    nothing about the upstream, and must not open the circuit for everyone.
+    """
+    if deadline is not None and is_out_of_time(e, deadline):
+        return deadline.seconds >= full_budget
+    return is_retryable(e) or isinstance(e, StreamInterrupted)
+
+
+def _retry_after(e: BaseException) -> float:
+    """Seconds from a Retry-After header on the error's response, if any"""
+    response = getattr(e, "response", None)
+    try:
+        return float(response.headers.get("retry-after", 0)) if response is not None else 0.0
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def hedged(
+    attempt: Callable[[float], T],
+    deadline: Deadline,
+    hedge_after: Optional[float] = None,
+    max_attempts: int = 2,
+    discard: Optional[Callable[[T], None]] = None,
+    latency: Optional[LatencyTracker] = None
+) -> T:
+    """
+    Run `attempt(timeout)` and, if it is still pending after `hedge_after`
+    seconds, a duplicate; return the first successful result
+
+    Results of attempts that lose are passed to `discard` (e.g. to close a
+    stream). If every attempt fails the last error is raised.
+    """
+    started = time.monotonic()
+
+    def timed(timeout: float):
+        begin = time.monotonic()
+        result = attempt(timeout)
+        return result, time.monotonic() - begin
+
+    def drop(future: Future):
+        if discard is not None and not future.cancelled() and future.exception() is None:
+            try:
+                discard(future.result()[0])
+            except Exception:
+                pass
+
+    first = _executor.submit(timed, deadline.remaining())
+    pending: List[Future] = [first]
+    launched = 1
+    error: Optional[BaseException] = None
+    while pending:
+        remaining = deadline.remaining()
+        if remaining <= 0:
+            for future in pending:
+                future.add_done_callback(drop)
+            raise DeadlineExceeded(f"LLM deadline of {deadline.seconds:.1f}s exceeded")
+
+        can_hedge = hedge_after is not None and launched < max_attempts
+        wait_for = min(remaining, max(0.0, started + hedge_after * launched - time.monotonic())) if can_hedge else remaining
+        done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+
+        for future in done:
+            pending.remove(future)
+            if future.exception() is not None:
+                error = future.exception()
+                continue
+            result, elapsed = future.result()
+            if latency is not None:
+                latency.record(elapsed)
+            for other in pending:
+                other.add_done_callback(drop)
+            if future is not first:
+                LLM_HEDGES.labels("won").inc()
+            return result
+
+        if not done and can_hedge and time.monotonic() - started >= hedge_after * launched:
+            LLM_HEDGES.labels("launched").inc()
+            pending.append(_executor.submit(timed, deadline.remaining()))
+            launched += 1
+    raise error
+
+
+def call_with_retries(
+    call: Callable[[], T],
+    deadline: Deadline,
+    retries: int = 2,
+    base_delay: float = 0.5,
+    max_delay: float = 8.0
+) -> T:
+    """`call()` with full-jitter exponential backoff, within the deadline"""
+    for attempt in range(retries + 1):
+        try:
+            return call()
+        except Exception as e:
+            if attempt == retries or not is_retryable(e):
+                raise
+            delay = max(random.uniform(0, min(max_delay, base_delay * 2 ** attempt)), _retry_after(e))
+            # Not worth sleeping if no time is left for the attempt after it
+            if delay >= deadline.remaining():
+                raise
+            LLM_RETRIES.inc()
+            time.sleep(delay)
@@ -0,0 +1,92 @@
+"""
+Bounded in-process read-through cache for hot Redis keys
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class LocalCache:
+    """
+    LRU + TTL cache keyed by Redis key
+
+    Each Redis key holds several cached views (e.g. different chat pages), so
+    invalidating the key drops every view derived from it.
+    """
+
+    def __init__(self, max_keys: int = 1024, ttl: float = 30.0):
+        self.max_keys = max_keys
+        self.ttl = ttl
+        # redis key -> (expires_at, {field: value})
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # Invalidations arrive from the pubsub listener thread
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_keys > 0
+
+    def get(self, key: str, field: str) -> Optional[Any]:
+        """Return a cached value, or None on miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, fields = entry
+                if expires_at < time.monotonic():
+                    del self._entries[key]
+                elif field in fields:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return fields[field]
+            self.misses += 1
+            return None
+
+    def set(self, key: str, field: str, value: Any):
+        """Cache a value derived from `key`"""
+        if not self.enabled:
+            return
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                entry = (time.monotonic() + self.ttl, {})
+                self._entries[key] = entry
+            entry[1][field] = value
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: str):
+        """Drop every cached view of `key`"""
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        """Drop everything (e.g. when invalidation messages may have been missed)"""
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """Hit-rate metrics"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "keys": len(self._entries),
+                "max_keys": self.max_keys,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
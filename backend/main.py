@@ -1,14 +1,22 @@
 """
 Isshoni Backend - FastAPI server with WebSocket support
 """
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Dict
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
+from typing import Dict, List, Optional
 import os
 import json
+import asyncio
+import logging
+import time
+import zlib
 from dotenv import load_dotenv
+from pydantic import ValidationError
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
 from models import (
+    ArtifactUpload,
     CanvasState,
     ChatMessage,
     CodeGenerationRequest,
@@ -16,16 +24,53 @@ from models import (
     DeploymentRequest,
     DeploymentResponse,
     AWSResource,
-    Connection
+    Connection,
+    CanvasUpdateMessage,
+    ChatFrameMessage,
+    ChatBatchMessage,
+    ViewportMessage,
+    PongMessage,
+    CanvasOpsMessage,
+    CanvasSyncMessage,
+    CanvasSyncRequest,
+    LayoutRequest,
+    PresenceMessage
 )
-from websocket_manager import ConnectionManager
-from redis_client import RedisClient
+from codec import decode_client_message, encode_canvas, encode_frame
+from websocket_manager import CLOSE_TOO_BIG, ConnectionManager
+from redis_client import STREAM_ID, RedisClient
+from chat_tail import ChatTail
+from admission import AdmissionController, CanvasCoalescer, QueueFullError
+from placement import REDIRECT_CLOSE_CODE, SessionPlacement
+from jobs import JobManager
+from cost_estimator import PRICING, CostEstimator
+from canvas_docs import CanvasDocuments
+from layout import auto_layout
+from artifacts import (
+    ARTIFACT_MAX_BYTES,
+    ArtifactStore,
+    ArtifactTooLarge,
+    accepts_gzip,
+    decompress,
+    etag_matches,
+    gunzip_limited,
+    media_type,
+    parse_range
+)
+from session_transfer import EXPORT_BATCH, SessionImporter, export_chunks, parse_cursor
+from presence import PresenceHub
+from metrics import ACTIVE_SESSIONS, ACTIVE_SOCKETS, monitor_event_loop_lag
+from tracing import tracer
 from ai_generator import AICodeGenerator
+from llm_resilience import Deadline
 from terraform_executor import TerraformExecutor
+from drift import DRIFT_INTERVAL, DriftMonitor
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Isshoni Backend API",
@@ -46,7 +91,269 @@ app.add_middleware(
 ws_manager = ConnectionManager()
 redis_client = RedisClient()
 ai_generator = AICodeGenerator()
-terraform_executor = TerraformExecutor()
+terraform_executor = TerraformExecutor(stack_lock=redis_client.stack_lock)
+chat_tail = ChatTail(redis_client, ws_manager)
+admission = AdmissionController(redis_client)
+placement = SessionPlacement(redis_client)
+artifact_store = ArtifactStore(redis_client)
+job_manager = JobManager(redis_client, admission, ws_manager, ai_generator, terraform_executor, artifact_store, placement)
+cost_estimator = CostEstimator()
+canvas_docs = CanvasDocuments(redis_client)
+presence = PresenceHub(ws_manager)
+drift_monitor = DriftMonitor(redis_client, ws_manager, terraform_executor)
+
+ACTIVE_SESSIONS.set_function(lambda: len(ws_manager.active_connections))
+ACTIVE_SOCKETS.set_function(ws_manager.get_total_connections)
+
+
+async def apply_canvas_update(session_id: str, canvas_state: CanvasState):
+    """Merge a full canvas state from a non-CRDT client into the session document"""
+    # A newer state supersedes any merged update still waiting for budget
+    canvas_coalescer.discard(session_id)
+    doc = canvas_docs.get(session_id)
+    # Only the differences become ops, so concurrent edits elsewhere survive
+    ops = doc.update_from_state(canvas_state.model_dump(mode="json"))
+    await publish_canvas_ops(session_id, ops)
+
+
+async def publish_canvas_ops(
+    session_id: str,
+    ops: List[Dict],
+    sender: Optional[WebSocket] = None,
+    canvas_state: Optional[CanvasState] = None
+):
+    """Persist newly applied ops and fan the change out to the session"""
+    if not ops:
+        return
+    canvas_docs.persist(session_id, ops)
+    if canvas_state is None:
+        with tracer.span("crdt.materialize", ops=len(ops)):
+            canvas_state = CanvasState.model_validate(canvas_docs.get(session_id).to_canvas())
+    redis_client.save_canvas_state(session_id, canvas_state)
+
+    # CRDT clients get the ops; the others get the (viewport-scoped) full state
+    await ws_manager.broadcast_canvas_ops(session_id, ops, exclude=sender)
+    with tracer.span("ws.encode"):
+        encoded = encode_canvas(canvas_state)
+    await ws_manager.broadcast_canvas_state(session_id, canvas_state, encoded=encoded)
+
+    # Live cost estimate; only re-priced resources cost anything, and only changes are sent
+    try:
+        with tracer.span("cost.estimate", resources=len(canvas_state.resources)):
+            cost = cost_estimator.update(canvas_state)
+    except Exception as e:
+        # The edit itself is already saved and sent; a missing estimate must not fail it
+        logger.warning(f"Cost estimate for {session_id} skipped: {e}")
+        cost = None
+    if cost is not None:
+        await ws_manager.broadcast_to_session(session_id, {"type": "cost_estimate", "data": cost})
+
+
+async def release_socket(websocket: WebSocket, session_id: str):
+    """Per-connection teardown, run once per socket by its handler or by the heartbeat reaper"""
+    ws_manager.disconnect(websocket, session_id)
+    admission.forget(websocket)
+    presence.forget(websocket, session_id)
+    if not ws_manager.get_session_count(session_id):
+        chat_tail.leave(session_id)
+        canvas_docs.release(session_id)
+    # Notify others
+    await ws_manager.broadcast_to_session(
+        session_id,
+        {
+            "type": "user_disconnected",
+            "active_users": ws_manager.get_session_count(session_id)
+        }
+    )
+
+
+ws_manager.release_hook = release_socket
+
+
+def sync_reply(session_id: str, vector: Dict[str, int]) -> Dict:
+    """What a replica holding `vector` is missing: ops, or a snapshot if they were compacted"""
+    doc = canvas_docs.get(session_id)
+    missing = doc.ops_since(vector)
+    if missing is None:
+        return {"vector": dict(doc.vector), "snapshot": doc.snapshot()}
+    return {"vector": dict(doc.vector), "ops": missing}
+
+
+async def sync_canvas(session_id: str, request: CanvasSyncRequest, sender: Optional[WebSocket] = None) -> Dict:
+    """
+    Take the ops (or snapshot) a replica sends and answer with what it is missing
+
+    Raises ValidationError (and changes nothing) if they would make the canvas invalid.
+    """
+    # A snapshot means the replica has ops this server lost (e.g. its Redis keys expired)
+    snapshot = request.snapshot.model_dump() if request.snapshot is not None else None
+    ops, _, canvas_state = canvas_docs.apply_checked(
+        session_id, [op.model_dump(exclude_none=True) for op in request.ops], snapshot
+    )
+    if snapshot is not None:
+        if not ops:
+            redis_client.save_canvas_state(session_id, canvas_state)
+        await ws_manager.broadcast_frame(
+            session_id,
+            json.dumps({"type": "canvas_sync", "data": sync_reply(session_id, {})}),
+            exclude=sender,
+            crdt_only=True
+        )
+    await publish_canvas_ops(session_id, ops, sender, canvas_state)
+    return sync_reply(session_id, request.vector)
+
+
+async def reject_message(websocket: WebSocket, error: ValidationError, message_type: Optional[str] = None):
+    """Tell a client its frame was invalid and not applied; the socket stays open"""
+    await ws_manager.send_personal_message(
+        {
+            "type": "error",
+            "reason": "invalid_message",
+            "message_type": message_type,
+            "detail": "; ".join(
+                f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in error.errors()[:5]
+            )
+        },
+        websocket
+    )
+
+
+# Canvas updates over the rate limit are merged here and applied later
+canvas_coalescer = CanvasCoalescer(apply_canvas_update)
+
+
+def artifact_file_response(request: Request, entry: Dict, blob: bytes) -> Response:
+    """
+    One artifact file, honouring If-None-Match, Range/If-Range and gzip
+
+    The stored gzip bytes are sent as-is when the client accepts gzip;
+    ranges are served from the decompressed content.
+    """
+    digest = entry["digest"]
+    headers = {
+        # Content-addressed: a given URL never changes
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Vary": "Accept-Encoding",
+        "Accept-Ranges": "bytes"
+    }
+    range_header = request.headers.get("range")
+    if range_header and request.headers.get("if-range") and not etag_matches(request.headers["if-range"], f'"{digest}"'):
+        range_header = None
+    use_gzip = not range_header and accepts_gzip(request.headers.get("accept-encoding"))
+    headers["ETag"] = f'"{digest}.gz"' if use_gzip else f'"{digest}"'
+
+    # Both encodings carry the same content, so either validator is current
+    if_none_match = request.headers.get("if-none-match")
+    if etag_matches(if_none_match, f'"{digest}"') or etag_matches(if_none_match, f'"{digest}.gz"'):
+        return Response(status_code=304, headers=headers)
+
+    content_type = media_type(entry["path"])
+    if use_gzip:
+        return Response(blob, media_type=content_type, headers={**headers, "Content-Encoding": "gzip"})
+
+    data = decompress(blob)
+    try:
+        byte_range = parse_range(range_header, len(data))
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{len(data)}"})
+    if byte_range is None:
+        return Response(data, media_type=content_type, headers=headers)
+    start, end = byte_range
+    return Response(
+        data[start:end + 1],
+        status_code=206,
+        media_type=content_type,
+        headers={**headers, "Content-Range": f"bytes {start}-{end}/{len(data)}"}
+    )
+
+
+def too_many_requests(detail: str, retry_after: float) -> HTTPException:
+    """429 with a Retry-After header (whole seconds, at least 1)"""
+    return HTTPException(
+        status_code=429,
+        detail=detail,
+        headers={"Retry-After": str(max(1, int(retry_after + 0.999)))}
+    )
+
+
+async def redirect_socket(websocket: WebSocket, session_id: str):
+    """Point a client at the session's owning node and close the socket"""
+    await websocket.send_json({
+        "type": "redirect",
+        "session_id": session_id,
+        "node": placement.owner(session_id),
+        "url": placement.owner_ws_url(session_id)
+    })
+    await websocket.close(code=REDIRECT_CLOSE_CODE)
+
+
+async def hand_over_sessions():
+    """Move sessions this node no longer owns to their new owners"""
+    for session_id in list(ws_manager.active_connections):
+        if placement.owns(session_id):
+            continue
+
+        # Canvas and chat already live in Redis; flush the merged update that
+        # is still waiting for budget so the new owner starts from it
+        pending = canvas_coalescer.pending.pop(session_id, None)
+        if pending is not None:
+            await apply_canvas_update(session_id, pending)
+        canvas_docs.release(session_id)
+        chat_tail.leave(session_id)
+
+        for websocket in list(ws_manager.active_connections.get(session_id, ())):
+            ws_manager.disconnect(websocket, session_id)
+            admission.forget(websocket)
+            presence.forget(websocket, session_id)
+            try:
+                await redirect_socket(websocket, session_id)
+            except Exception:
+                pass
+        logger.info(f"Handed session {session_id} over to {placement.owner(session_id)}")
+
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Sampled per-request trace; send `X-Isshoni-Trace: 1` to force one"""
+    force = request.headers.get("x-isshoni-trace") == "1"
+    with tracer.trace(f"http {request.method} {request.url.path}", force=force) as root:
+        response = await call_next(request)
+        if root is not None:
+            # Group traces by route template rather than concrete session ids
+            route = request.scope.get("route")
+            if route is not None:
+                root.name = f"http {request.method} {route.path}"
+            root.set("status_code", response.status_code)
+            response.headers["X-Trace-Id"] = root.trace_id
+    return response
+
+
+@app.on_event("startup")
+async def start_background_listeners():
+    """Start the cache invalidation listener, event-loop lag probe, presence ticks, socket and cluster heartbeats, drift sweeps"""
+    app.state.loop_lag_task = asyncio.create_task(monitor_event_loop_lag())
+    app.state.heartbeat_task = asyncio.create_task(ws_manager.run_heartbeats())
+    app.state.presence_task = asyncio.create_task(presence.run())
+    if placement.enabled:
+        app.state.placement_task = asyncio.create_task(placement.run(hand_over_sessions))
+    app.state.drift_alert_task = asyncio.create_task(drift_monitor.forward_alerts())
+    if DRIFT_INTERVAL > 0:
+        app.state.drift_task = asyncio.create_task(drift_monitor.run())
+
+    try:
+        redis_client.start_cache_invalidation()
+    except Exception as e:
+        # Redis may not be reachable yet; the cache still expires entries by TTL
+        logger.warning(f"Cache invalidation listener not started: {e}")
+
+
+@app.on_event("shutdown")
+async def leave_cluster():
+    """Hand this node's sessions to the remaining nodes before exiting"""
+    if placement.enabled:
+        await placement.leave()
+        await hand_over_sessions()
+    drift_monitor.shutdown()
 
 
 @app.get("/")
@@ -59,77 +366,350 @@ async def root():
     }
 
 
+@app.get("/healthz/live")
+async def liveness():
+    """Liveness probe: the process is up and serving requests"""
+    return {"status": "alive"}
+
+
+@app.get("/healthz/ready")
+async def readiness():
+    """Readiness probe: dependencies needed to serve sessions are reachable"""
+    try:
+        await asyncio.wait_for(redis_client.ping(), timeout=2.0)
+    except Exception as e:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "not_ready", "redis": f"unavailable: {e}"}
+        )
+    return {"status": "ready", "redis": "ok"}
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics"""
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/debug/traces")
+async def list_traces(name: Optional[str] = None, min_duration_ms: float = 0.0, limit: int = 50):
+    """Recent sampled traces, newest first"""
+    return {"traces": tracer.query(name, min_duration_ms, limit)}
+
+
+@app.get("/debug/traces/summary")
+async def trace_summary():
+    """Per-stage timing summary over the buffered traces"""
+    return tracer.stage_summary()
+
+
+@app.get("/debug/traces/{trace_id}")
+async def get_trace(trace_id: str):
+    """A single buffered trace"""
+    trace = tracer.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return trace
+
+
+@app.get("/api/connections/stats")
+async def get_connection_stats():
+    """Socket counts, caps, traffic and estimated memory on this worker"""
+    return ws_manager.connection_stats()
+
+
+@app.get("/api/sessions/{session_id}/owner")
+async def get_session_owner(session_id: str):
+    """Node that owns the session (connect WebSockets there)"""
+    return {
+        "session_id": session_id,
+        "node": placement.owner(session_id),
+        "ws_url": placement.owner_ws_url(session_id),
+        "nodes": placement.ring.nodes
+    }
+
+
 @app.get("/api/sessions/{session_id}/canvas")
 async def get_canvas_state(session_id: str):
     """Get current canvas state for a session"""
-    state = redis_client.get_canvas_state(session_id)
-    if state:
-        return state
+    # Stored JSON was validated on write, so forward it as-is
+    data = redis_client.get_canvas_state_raw(session_id)
+    if data:
+        return Response(content=data, media_type="application/json")
     return CanvasState(session_id=session_id)
 
 
 @app.post("/api/sessions/{session_id}/canvas")
 async def update_canvas_state(session_id: str, state: CanvasState):
     """Update canvas state"""
-    # Save to Redis
-    redis_client.save_canvas_state(session_id, state)
+    if not placement.owns(session_id):
+        # Only the owner's sockets would see the broadcast; send the write there
+        url = placement.owner_http_url(session_id, f"/api/sessions/{session_id}/canvas")
+        if url:
+            return RedirectResponse(url, status_code=307)
 
-    # Broadcast to all connected clients
-    await ws_manager.broadcast_to_session(
-        session_id,
-        {
-            "type": "canvas_update",
-            "data": state.model_dump()
-        }
-    )
+    await apply_canvas_update(session_id, state)
+    if not ws_manager.get_session_count(session_id):
+        canvas_docs.release(session_id)
 
     return {"success": True}
 
 
+@app.post("/api/sessions/{session_id}/canvas/sync")
+async def sync_canvas_state(session_id: str, request: CanvasSyncRequest):
+    """CRDT delta sync over HTTP (used by clients while their WebSocket is down)"""
+    if not placement.owns(session_id):
+        url = placement.owner_http_url(session_id, f"/api/sessions/{session_id}/canvas/sync")
+        if url:
+            return RedirectResponse(url, status_code=307)
+
+    try:
+        reply = await sync_canvas(session_id, request)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+    if not ws_manager.get_session_count(session_id):
+        canvas_docs.release(session_id)
+    return reply
+
+
+@app.post("/api/sessions/{session_id}/layout")
+async def layout_canvas(session_id: str, request: LayoutRequest):
+    """Auto-layout the canvas (or only `resource_ids`) and apply it as one batched update"""
+    if not placement.owns(session_id):
+        url = placement.owner_http_url(session_id, f"/api/sessions/{session_id}/layout")
+        if url:
+            return RedirectResponse(url, status_code=307)
+
+    doc = canvas_docs.get(session_id)
+    canvas = doc.to_canvas()
+    started = time.perf_counter()
+    with tracer.span("layout.compute", resources=len(canvas["resources"])):
+        positions = auto_layout(
+            canvas,
+            request.resource_ids,
+            spacing_x=request.spacing_x,
+            spacing_y=request.spacing_y,
+            max_columns=request.max_columns
+        )
+    layout_ms = (time.perf_counter() - started) * 1000
+    for resource in canvas["resources"]:
+        if resource["id"] in positions:
+            resource["x"], resource["y"] = positions[resource["id"]]
+
+    # All moves go out as a single op batch (one frame per socket)
+    ops = doc.update_from_state(canvas)
+    await publish_canvas_ops(session_id, ops)
+    if not ws_manager.get_session_count(session_id):
+        canvas_docs.release(session_id)
+
+    return {
+        "moved": len(positions),
+        "positions": {rid: {"x": x, "y": y} for rid, (x, y) in positions.items()},
+        "layout_ms": round(layout_ms, 2)
+    }
+
+
+@app.get("/api/sessions/{session_id}/cost")
+async def get_cost_estimate(session_id: str, region: Optional[str] = None):
+    """Monthly cost estimate of the session's canvas from the bundled price table"""
+    if region is not None and region not in PRICING:
+        raise HTTPException(status_code=400, detail=f"No pricing for region {region}")
+    state = redis_client.get_canvas_state(session_id) or CanvasState(session_id=session_id)
+    return cost_estimator.estimate(state, region)
+
+
+@app.get("/api/storage/report")
+async def get_storage_report(max_sessions: int = 1000):
+    """Report Redis memory used per session"""
+    return redis_client.storage_report(max_sessions)
+
+
+@app.get("/api/storage/export")
+async def export_sessions(cursor: Optional[str] = None, compress: bool = False, batch: int = EXPORT_BATCH):
+    """
+    Stream every session as NDJSON (gzip with `compress`) for backup or migration
+
+    Checkpoint lines carry the `cursor` to resume an interrupted export with.
+    """
+    try:
+        parse_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # A sync iterator: Starlette pulls it in a worker thread, one SCAN page at a time
+    return StreamingResponse(
+        export_chunks(redis_client, cursor, compress, batch),
+        media_type="application/gzip" if compress else "application/x-ndjson"
+    )
+
+
+@app.post("/api/storage/import")
+async def import_sessions(request: Request, after: Optional[str] = None, replace: bool = True):
+    """
+    Load an export (NDJSON or gzip) streamed in the request body, keeping TTLs
+
+    `after` skips up to that checkpoint, so an interrupted import can be resumed
+    from the `cursor` it reported.
+    """
+    importer = SessionImporter(redis_client, replace=replace, after=after)
+    try:
+        async for data in request.stream():
+            await asyncio.to_thread(importer.feed, data)
+            # Imported sessions reload from Redis on next use
+            for session_id in importer.take_imported():
+                canvas_docs.release(session_id)
+        stats = await asyncio.to_thread(importer.finish)
+    except (ValueError, KeyError, TypeError, zlib.error) as e:
+        # Batches up to the reported cursor are in; resume after it once the dump is fixed
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid export at line {importer.line} (cursor {importer.stats['cursor']}): {e}"
+        )
+    for session_id in importer.take_imported():
+        canvas_docs.release(session_id)
+    return stats
+
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """Local session cache hit-rate metrics"""
+    return redis_client.cache_stats()
+
+
+def check_chat_cursor(name: str, cursor: Optional[str], count: int):
+    """400 for cursors and counts Redis would reject (it answers those with an error, i.e. a 500)"""
+    if cursor is not None and not STREAM_ID.fullmatch(cursor):
+        raise HTTPException(status_code=400, detail=f"'{name}' must be a stream ID such as 1700000000000-0")
+    if not 1 <= count <= 1000:
+        raise HTTPException(status_code=400, detail="'count' must be between 1 and 1000")
+
+
 @app.get("/api/sessions/{session_id}/chat")
-async def get_chat_history(session_id: str, count: int = 50):
-    """Get chat history for a session"""
-    messages = redis_client.get_chat_history(session_id, count)
-    return {"messages": [msg.model_dump() for msg in messages]}
+async def get_chat_history(session_id: str, count: int = 50, before: Optional[str] = None):
+    """Get a page of chat history, newest first page unless `before` (stream ID) is given"""
+    check_chat_cursor("before", before, count)
+    return redis_client.get_chat_page(session_id, count, before)
+
+
+@app.get("/api/sessions/{session_id}/chat/since")
+async def get_chat_since(session_id: str, after: str = "0-0", count: int = 100):
+    """Get chat messages newer than the `after` stream ID"""
+    check_chat_cursor("after", after, count)
+    return redis_client.get_chat_since(session_id, after, count)
 
 
 @app.post("/api/sessions/{session_id}/chat")
 async def send_chat_message(session_id: str, message: ChatMessage):
     """Send a chat message"""
-    # Save to Redis
-    redis_client.save_chat_message(message)
+    # Save to Redis; the session's chat tail broadcasts it to connected clients
+    message_id = redis_client.save_chat_message(message)
 
-    # Broadcast to all connected clients
-    await ws_manager.broadcast_to_session(
-        session_id,
-        {
-            "type": "chat_message",
-            "data": message.model_dump()
-        }
-    )
+    return {"success": True, "message_id": message_id}
+
+
+@app.post("/api/sessions/{session_id}/chat/batch")
+async def send_chat_messages(session_id: str, messages: List[ChatMessage]):
+    """Send a burst of chat messages in one pipelined write"""
+    message_ids = redis_client.save_chat_messages(messages)
+
+    return {"success": True, "message_ids": message_ids}
+
+
+@app.post("/api/sessions/{session_id}/artifacts", status_code=201)
+async def upload_artifact(session_id: str, request: Request):
+    """
+    Store IaC files (ArtifactUpload JSON, optionally `Content-Encoding: gzip`)
+    as the session's next artifact version
+
+    Files already stored are not written again, and unchanged output keeps
+    its existing version.
+    """
+    body = await request.body()
+    try:
+        # JSON escaping can roughly double the size of the files it carries
+        if request.headers.get("content-encoding", "").lower() == "gzip":
+            body = gunzip_limited(body, 2 * ARTIFACT_MAX_BYTES)
+        elif len(body) > 2 * ARTIFACT_MAX_BYTES:
+            raise ArtifactTooLarge(f"Artifact is larger than {ARTIFACT_MAX_BYTES} bytes")
+        upload = ArtifactUpload.model_validate_json(body)
+        return await asyncio.to_thread(artifact_store.put, session_id, upload.files, upload.format)
+    except ArtifactTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=json.loads(e.json()))
+    except (ValueError, zlib.error) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/sessions/{session_id}/artifacts")
+async def list_artifacts(session_id: str, limit: int = 20):
+    """The session's artifact versions, newest first"""
+    return {"versions": artifact_store.versions(session_id, limit)}
 
-    return {"success": True}
+
+@app.get("/api/sessions/{session_id}/artifacts/{version}")
+async def get_artifact_version(session_id: str, version: str):
+    """One version (a number or `latest`) with its manifest"""
+    if version != "latest" and not version.isdigit():
+        raise HTTPException(status_code=404, detail="Artifact version not found")
+    artifact = artifact_store.version(session_id, version)
+    if artifact is None:
+        raise HTTPException(status_code=404, detail="Artifact version not found")
+    return artifact
+
+
+@app.get("/api/artifacts/{artifact_id}")
+async def get_artifact(artifact_id: str, request: Request):
+    """An artifact's manifest (files, digests, sizes)"""
+    # Looked up first: an expired (or never stored) artifact is a 404 even for a matching ETag
+    manifest = artifact_store.manifest(artifact_id)
+    if manifest is None:
+        raise HTTPException(status_code=404, detail="Artifact not found")
+    headers = {"ETag": f'"{artifact_id}"', "Cache-Control": "public, max-age=31536000, immutable"}
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(manifest, headers=headers)
+
+
+@app.get("/api/artifacts/{artifact_id}/files/{path:path}")
+async def get_artifact_file(artifact_id: str, path: str, request: Request):
+    """One file of an artifact (ETag/If-None-Match, Range and gzip supported)"""
+    found = artifact_store.blob(artifact_id, path)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Artifact file not found")
+    return artifact_file_response(request, *found)
 
 
 @app.post("/api/generate-code", response_model=CodeGenerationResponse)
 async def generate_code(request: CodeGenerationRequest):
     """Generate Terraform/CloudFormation code from canvas state"""
-    import logging
-    logger = logging.getLogger(__name__)
+    retry_after = await admission.admit_endpoint("generate-code")
+    if retry_after:
+        raise too_many_requests("Code generation rate limit exceeded", retry_after)
 
     try:
-        if request.target_format == "terraform":
-            result = ai_generator.generate_terraform_code(
-                request.canvas_state,
-                provider=request.ai_provider
-            )
-            logger.info(f"📤 응답 전송 - success: {result.success}, code length: {len(result.code) if result.code else 0}")
-            return result
-        else:
-            result = ai_generator.generate_cloudformation_code(request.canvas_state)
-            logger.info(f"📤 응답 전송 - success: {result.success}, code length: {len(result.code) if result.code else 0}")
-            return result
+        # LLM 호출은 블로킹이므로 스레드에서 실행 (이벤트 루프는 WebSocket 처리 유지)
+        async with admission.jobs["generate-code"].slot():
+            # The budget starts once a slot is free: queueing is not the LLM's time
+            deadline = Deadline.coerce(request.deadline_seconds)
+            if request.target_format == "terraform":
+                result = await asyncio.to_thread(
+                    ai_generator.generate_terraform_code,
+                    request.canvas_state,
+                    provider=request.ai_provider,
+                    deadline=deadline
+                )
+            else:
+                result = await asyncio.to_thread(
+                    ai_generator.generate_cloudformation_code, request.canvas_state, deadline=deadline
+                )
+        result = await asyncio.to_thread(
+            artifact_store.record_generation, request.session_id, result, request.target_format
+        )
+        logger.info(f"📤 응답 전송 - success: {result.success}, code length: {len(result.code) if result.code else 0}")
+        return result
 
+    except QueueFullError as e:
+        raise too_many_requests(str(e), e.retry_after)
     except Exception as e:
         logger.error(f"❌ Exception in generate_code: {str(e)}")
         return CodeGenerationResponse(
@@ -141,13 +721,26 @@ async def generate_code(request: CodeGenerationRequest):
 @app.post("/api/deploy", response_model=DeploymentResponse)
 async def deploy_infrastructure(request: DeploymentRequest):
     """Deploy infrastructure using Terraform"""
+    retry_after = await admission.admit_endpoint("deploy")
+    if retry_after:
+        raise too_many_requests("Deployment rate limit exceeded", retry_after)
+
+    try:
+        code = await asyncio.to_thread(artifact_store.deployment_code, request)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     try:
         if request.format == "terraform":
-            success, outputs, error = terraform_executor.deploy(
-                request.code,
-                request.session_id,
-                auto_approve=request.auto_approve
-            )
+            async with admission.jobs["deploy"].slot():
+                success, outputs, error = await asyncio.to_thread(
+                    terraform_executor.deploy,
+                    code,
+                    request.session_id,
+                    auto_approve=request.auto_approve
+                )
 
             return DeploymentResponse(
                 success=success,
@@ -164,6 +757,8 @@ async def deploy_infrastructure(request: DeploymentRequest):
                 error="CloudFormation deployment not supported in MVP"
             )
 
+    except QueueFullError as e:
+        raise too_many_requests(str(e), e.retry_after)
     except Exception as e:
         return DeploymentResponse(
             success=False,
@@ -173,12 +768,130 @@ async def deploy_infrastructure(request: DeploymentRequest):
         )
 
 
+@app.post("/api/sessions/{session_id}/destroy")
+async def destroy_infrastructure(session_id: str):
+    """Destroy what the session deployed and forget its drift results"""
+    retry_after = await admission.admit_endpoint("deploy")
+    if retry_after:
+        raise too_many_requests("Deployment rate limit exceeded", retry_after)
+    try:
+        async with admission.jobs["deploy"].slot():
+            success, message = await asyncio.to_thread(terraform_executor.destroy, session_id)
+    except QueueFullError as e:
+        raise too_many_requests(str(e), e.retry_after)
+    if success:
+        redis_client.delete_drift_result(session_id)
+    return {"success": success, "message": message}
+
+
+@app.get("/api/sessions/{session_id}/drift")
+async def get_session_drift(session_id: str):
+    """Latest drift check of the session's deployed stack"""
+    result = redis_client.get_drift_results([session_id]).get(session_id)
+    return {"session_id": session_id, **(result or {"status": "unknown"})}
+
+
+@app.get("/api/drift")
+async def get_drift_report(limit: int = 100):
+    """Last sweep summary plus the most recently checked stacks"""
+    return {
+        "sweeping": drift_monitor.sweeping,
+        "last_sweep": redis_client.get_drift_sweep(),
+        "stacks": redis_client.list_drift_results(limit)
+    }
+
+
+@app.post("/api/drift/sweep", status_code=202)
+async def start_drift_sweep():
+    """Start a drift sweep on this node now (409 if one is already running here)"""
+    if drift_monitor.sweeping:
+        raise HTTPException(status_code=409, detail="A drift sweep is already running")
+    app.state.manual_sweep = asyncio.create_task(drift_monitor.sweep())
+    return {"started": True}
+
+
+@app.post("/api/jobs/generate-code", status_code=202)
+async def submit_generate_job(request: CodeGenerationRequest):
+    """Start code generation as a background job; poll /api/jobs/{job_id} for progress"""
+    retry_after = await admission.admit_endpoint("generate-code")
+    if retry_after:
+        raise too_many_requests("Code generation rate limit exceeded", retry_after)
+    try:
+        return await job_manager.submit("generate-code", request.session_id, request.model_dump_json())
+    except QueueFullError as e:
+        raise too_many_requests(str(e), e.retry_after)
+
+
+@app.post("/api/jobs/deploy", status_code=202)
+async def submit_deploy_job(request: DeploymentRequest):
+    """Start a deployment as a background job; poll /api/jobs/{job_id} for progress"""
+    retry_after = await admission.admit_endpoint("deploy")
+    if retry_after:
+        raise too_many_requests("Deployment rate limit exceeded", retry_after)
+    # Same check as deployment_code, up front: a session only deploys its own artifacts
+    if request.artifact_id and (
+        not redis_client.session_has_artifact(request.session_id, request.artifact_id)
+        or artifact_store.manifest(request.artifact_id) is None
+    ):
+        raise HTTPException(status_code=404, detail=f"Artifact {request.artifact_id} not found")
+    try:
+        return await job_manager.submit("deploy", request.session_id, request.model_dump_json())
+    except QueueFullError as e:
+        raise too_many_requests(str(e), e.retry_after)
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, offset: int = 0):
+    """Job status plus streamed output written after byte `offset` (continue from `next_offset`)"""
+    job = job_manager.get(job_id, offset)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.post("/api/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job"""
+    job = await job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.post("/api/jobs/{job_id}/resume")
+async def resume_job(job_id: str):
+    """Re-run a failed, cancelled or stale job from its original request"""
+    try:
+        job = await job_manager.resume(job_id)
+    except QueueFullError as e:
+        raise too_many_requests(str(e), e.retry_after)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.get("/api/sessions/{session_id}/jobs")
+async def list_session_jobs(session_id: str, limit: int = 20):
+    """Recent jobs of a session, newest first (lets a reloaded client resume tracking)"""
+    return {"jobs": job_manager.for_session(session_id, limit)}
+
+
 @app.websocket("/ws/{session_id}")
 async def websocket_endpoint(websocket: WebSocket, session_id: str):
     """WebSocket endpoint for real-time collaboration"""
-    await ws_manager.connect(websocket, session_id)
+    if not placement.owns(session_id):
+        # Each session's sockets and broadcast loop live on its owning node
+        await websocket.accept()
+        await redirect_socket(websocket, session_id)
+        return
+
+    if not await ws_manager.connect(websocket, session_id):
+        # Per-session or per-worker socket cap reached
+        return
 
     try:
+        await chat_tail.join(session_id)
+
         # Send connection confirmation
         await ws_manager.send_personal_message(
             {
@@ -189,61 +902,137 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
             websocket
         )
 
-        # Send current canvas state
-        canvas_state = redis_client.get_canvas_state(session_id)
-        if canvas_state:
+        # Send current canvas state (forwarded from Redis without re-validation)
+        stored_canvas = redis_client.get_canvas_state_raw(session_id)
+        if stored_canvas:
+            await websocket.send_text(encode_frame("canvas_state", stored_canvas))
+
+        # Who is here right now (in-memory only)
+        if session_id in presence.sessions:
             await ws_manager.send_personal_message(
-                {
-                    "type": "canvas_state",
-                    "data": canvas_state.model_dump()
-                },
+                {"type": "presence", "data": presence.snapshot(session_id)},
                 websocket
             )
 
         # Listen for messages
         while True:
             data = await websocket.receive_text()
-            message_data = json.loads(data)
-
-            message_type = message_data.get("type")
-
-            if message_type == "canvas_update":
-                # Update canvas state
-                canvas_state = CanvasState(**message_data["data"])
-                redis_client.save_canvas_state(session_id, canvas_state)
-
-                # Broadcast to others
-                await ws_manager.broadcast_to_session(
-                    session_id,
-                    {
-                        "type": "canvas_update",
-                        "data": canvas_state.model_dump()
-                    }
-                )
+            if not ws_manager.record_frame(websocket, len(data)):
+                await ws_manager.close_connection(websocket, CLOSE_TOO_BIG, "frame_too_big")
+                raise WebSocketDisconnect(CLOSE_TOO_BIG)
+            message = None
+            try:
+                # Sampled per-message trace: decode -> Redis -> encode -> broadcast
+                with tracer.trace("ws message", session_id=session_id, bytes=len(data)) as root:
+                    with tracer.span("ws.decode"):
+                        try:
+                            message = decode_client_message(data)
+                        except ValidationError as e:
+                            await reject_message(websocket, e)
+                            continue
+                    if root is not None and message is not None:
+                        root.name = f"ws {message.type}"
+                    if message is not None and not isinstance(message, PongMessage):
+                        ws_manager.mark_active(websocket)
 
-            elif message_type == "chat_message":
-                # Save and broadcast chat message
-                chat_msg = ChatMessage(**message_data["data"])
-                redis_client.save_chat_message(chat_msg)
-
-                await ws_manager.broadcast_to_session(
-                    session_id,
-                    {
-                        "type": "chat_message",
-                        "data": chat_msg.model_dump()
-                    }
-                )
+                    if isinstance(message, (CanvasUpdateMessage, CanvasOpsMessage, CanvasSyncMessage, ChatFrameMessage, ChatBatchMessage)):
+                        # Canvas and chat traffic is rate limited per socket and per session
+                        kind = "chat_message" if isinstance(message, (ChatFrameMessage, ChatBatchMessage)) else "canvas_update"
+                        retry_after, scope = await admission.admit_message(websocket, session_id, kind)
+                        if retry_after:
+                            if isinstance(message, CanvasUpdateMessage):
+                                # Full-state updates merge: only the newest one is applied later
+                                canvas_coalescer.defer(session_id, message.data, retry_after)
+                                action = "merged"
+                            elif kind == "canvas_update":
+                                # CRDT clients keep unacknowledged ops and resend them with their next sync
+                                action = "resync"
+                            else:
+                                action = "rejected"
+                            await ws_manager.send_personal_message(
+                                {
+                                    "type": "backpressure",
+                                    "scope": scope,
+                                    "message_type": message.type,
+                                    "action": action,
+                                    "retry_after_ms": int(retry_after * 1000)
+                                },
+                                websocket
+                            )
+                            continue
+
+                    if isinstance(message, CanvasUpdateMessage):
+                        # Merge the full state into the document and broadcast the change
+                        await apply_canvas_update(session_id, message.data)
+
+                    elif isinstance(message, CanvasOpsMessage):
+                        ws_manager.set_crdt(websocket)
+                        try:
+                            ops, gap, canvas_state = canvas_docs.apply_checked(
+                                session_id, [op.model_dump(exclude_none=True) for op in message.data]
+                            )
+                        except ValidationError as e:
+                            await reject_message(websocket, e, message.type)
+                            continue
+                        await publish_canvas_ops(session_id, ops, sender=websocket, canvas_state=canvas_state)
+                        if gap:
+                            # Some earlier ops never arrived; tell the client where we are so it resends
+                            await ws_manager.send_personal_message(
+                                {"type": "canvas_sync", "data": {"vector": dict(canvas_docs.get(session_id).vector), "ops": []}},
+                                websocket
+                            )
 
+                    elif isinstance(message, CanvasSyncMessage):
+                        # (Re)connect: exchange only the ops each side is missing
+                        ws_manager.set_crdt(websocket)
+                        try:
+                            reply = await sync_canvas(session_id, message.data, sender=websocket)
+                        except ValidationError as e:
+                            await reject_message(websocket, e, message.type)
+                            continue
+                        await ws_manager.send_personal_message({"type": "canvas_sync", "data": reply}, websocket)
+
+                    elif isinstance(message, PresenceMessage):
+                        # Cursor/selection/typing: kept in memory and batched per tick, never stored
+                        presence.update(websocket, session_id, message.data)
+
+                    elif isinstance(message, PongMessage):
+                        # Heartbeat answer; liveness was already recorded above
+                        ws_manager.record_pong(websocket, message.ts)
+
+                    elif isinstance(message, ViewportMessage):
+                        # Scope future canvas updates to the client's visible region
+                        ws_manager.set_viewport(websocket, message.data)
+
+                        canvas_state = redis_client.get_canvas_state(session_id)
+                        if canvas_state:
+                            await websocket.send_text(
+                                ws_manager.render_canvas_message(
+                                    session_id, canvas_state, websocket, message_type="canvas_state"
+                                )
+                            )
+
+                    elif isinstance(message, ChatFrameMessage):
+                        # Save chat message; the chat tail broadcasts it
+                        redis_client.save_chat_message(message.data)
+
+                    elif isinstance(message, ChatBatchMessage):
+                        # Burst of chat messages in one pipelined write
+                        redis_client.save_chat_messages(message.data)
+
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                # One failed frame (e.g. Redis hiccup) must not take the socket down
+                logger.warning(f"WebSocket message in {session_id} failed: {e!r}")
+                await ws_manager.send_personal_message(
+                    {"type": "error", "reason": "message_failed", "message_type": message.type if message else None},
+                    websocket
+                )
     except WebSocketDisconnect:
-        ws_manager.disconnect(websocket, session_id)
-        # Notify others
-        await ws_manager.broadcast_to_session(
-            session_id,
-            {
-                "type": "user_disconnected",
-                "active_users": ws_manager.get_session_count(session_id)
-            }
-        )
+        pass
+    finally:
+        await ws_manager.release(websocket, session_id)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,116 @@
+"""
+Prometheus metrics for the backend hot paths
+"""
+import asyncio
+import time
+
+from prometheus_client import Counter, Gauge, Histogram
+
+
+# WebSocket fan-out
+BROADCAST_LATENCY = Histogram(
+    "isshoni_broadcast_seconds",
+    "Time to fan a message out to every socket of a session",
+    ["kind"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+)
+BROADCAST_RECIPIENTS = Histogram(
+    "isshoni_broadcast_recipients",
+    "Sockets reached per broadcast",
+    ["kind"],
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+SCOPED_SENDS_SKIPPED = Counter(
+    "isshoni_scoped_sends_skipped_total",
+    "Viewport-scoped canvas frames not sent because nothing in the client's view changed"
+)
+ACTIVE_SESSIONS = Gauge("isshoni_active_sessions", "Sessions with at least one socket on this worker")
+ACTIVE_SOCKETS = Gauge("isshoni_active_sockets", "Open WebSocket connections on this worker")
+REAPED_SOCKETS = Counter(
+    "isshoni_reaped_sockets_total",
+    "Sockets closed by the server (heartbeat timeout, idle, failed send, caps)",
+    ["reason"]
+)
+PRESENCE_COALESCED = Counter(
+    "isshoni_presence_coalesced_total",
+    "Presence updates superseded by a newer one before the next tick"
+)
+
+# Redis
+REDIS_COMMAND_LATENCY = Histogram(
+    "isshoni_redis_command_seconds",
+    "Redis command round-trip time (pipelines are recorded as PIPELINE)",
+    ["command"],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0, 5.0)
+)
+
+# LLM
+LLM_LATENCY = Histogram(
+    "isshoni_llm_request_seconds",
+    "LLM completion latency",
+    ["model", "output_format", "outcome"],
+    buckets=(1, 2.5, 5, 10, 20, 30, 60, 120, 180, 300, 600)
+)
+LLM_TOKENS = Counter(
+    "isshoni_llm_tokens_total",
+    "Tokens consumed by LLM completions",
+    ["model", "kind"]
+)
+LLM_HEDGES = Counter(
+    "isshoni_llm_hedges_total",
+    "Duplicate LLM requests started after the latency threshold, and how many answered first",
+    ["outcome"]
+)
+LLM_RETRIES = Counter("isshoni_llm_retries_total", "LLM calls retried after a transient error")
+LLM_CIRCUIT_STATE = Gauge(
+    "isshoni_llm_circuit_state",
+    "LLM circuit breaker state (0 closed, 1 half-open, 2 open)",
+    ["upstream"]
+)
+LLM_FALLBACKS = Counter(
+    "isshoni_llm_fallbacks_total",
+    "Generations answered without the LLM",
+    ["source", "reason"]
+)
+
+# Terraform
+TERRAFORM_STAGE_DURATION = Histogram(
+    "isshoni_terraform_stage_seconds",
+    "Duration of each Terraform stage in a deployment",
+    ["stage", "outcome"],
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200)
+)
+DRIFT_CHECKS = Counter(
+    "isshoni_drift_checks_total",
+    "Drift checks of deployed stacks by result (skipped = state unchanged since a clean check)",
+    ["outcome"]
+)
+DRIFT_SWEEP_DURATION = Histogram(
+    "isshoni_drift_sweep_seconds",
+    "Duration of a drift sweep over all workspaces",
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800)
+)
+
+# Admission control
+ADMISSION_REJECTIONS = Counter(
+    "isshoni_admission_rejections_total",
+    "Requests and frames rejected or deferred by rate limits and job queues",
+    ["scope", "kind"]
+)
+JOB_QUEUE_DEPTH = Gauge("isshoni_job_queue_depth", "Jobs waiting for a concurrency slot", ["job"])
+JOB_RUNNING = Gauge("isshoni_job_running", "Jobs currently holding a concurrency slot", ["job"])
+
+# Event loop
+EVENT_LOOP_LAG = Histogram(
+    "isshoni_event_loop_lag_seconds",
+    "How late the event loop wakes up a periodic probe",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+)
+
+
+async def monitor_event_loop_lag(interval: float = 0.5):
+    """Sample event-loop lag forever (run as a background task)"""
+    while True:
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, time.perf_counter() - expected))
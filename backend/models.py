@@ -1,8 +1,8 @@
 """
 Data models for Isshoni platform
 """
-from pydantic import BaseModel, Field
-from typing import List, Dict, Optional, Literal
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError, model_validator
+from typing import Any, List, Dict, Optional, Literal, Tuple, Union, Annotated
 from datetime import datetime
 
 
@@ -33,6 +33,15 @@ class CanvasState(BaseModel):
     last_updated: datetime = Field(default_factory=datetime.now)
 
 
+class Viewport(BaseModel):
+    """Visible region of the canvas registered by a client"""
+    x: float
+    y: float
+    width: float = Field(gt=0)
+    height: float = Field(gt=0)
+    margin: float = Field(default=0.0, ge=0)  # Prefetch border around the visible area
+
+
 class ChatMessage(BaseModel):
     """Chat message between team members"""
     session_id: str
@@ -40,6 +49,186 @@ class ChatMessage(BaseModel):
     username: str
     message: str
     timestamp: datetime = Field(default_factory=datetime.now)
+    message_id: Optional[str] = None  # Redis stream ID, assigned when stored
+
+
+# Types of the CRDT resource registers (crdt.RESOURCE_FIELDS). Checked strictly,
+# so every replica stores exactly the value that was validated.
+_RESOURCE_FIELD_TYPES = {
+    name: TypeAdapter(AWSResource.model_fields[name].annotation)
+    for name in ("type", "name", "x", "y", "properties", "notes")
+}
+
+
+def check_resource_field(field: str, value: Any):
+    """ValueError unless `value` is valid for the resource register `field`"""
+    adapter = _RESOURCE_FIELD_TYPES.get(field)
+    if adapter is None:
+        raise ValueError(f"Unknown resource field: {field!r}")
+    try:
+        adapter.validate_python(value, strict=True)
+    except ValidationError as e:
+        raise ValueError(f"Invalid value for {field!r}: {e.errors()[0]['msg']}")
+
+
+class CanvasOp(BaseModel):
+    """One CRDT canvas operation (see crdt.py)"""
+    id: Tuple[str, int]  # (replica, seq)
+    ts: int  # Lamport clock
+    op: Literal["add", "remove", "set", "link", "unlink"]
+    rid: Optional[str] = None
+    cid: Optional[str] = None
+    field: Optional[Literal["type", "name", "x", "y", "properties", "notes", "user_prompt"]] = None
+    value: Any = None
+    fields: Optional[Dict[str, Any]] = None
+    tags: Optional[List[str]] = None
+
+    @model_validator(mode="after")
+    def _check_kind(self):
+        """Each kind carries the keys CanvasDocument.apply reads, with valid values"""
+        if self.id[1] < 1:
+            raise ValueError("Op seq starts at 1")
+        if self.op in ("add", "remove") and not self.rid:
+            raise ValueError(f"'{self.op}' needs a resource id")
+        if self.op in ("link", "unlink") and not self.cid:
+            raise ValueError(f"'{self.op}' needs a connection id")
+        if self.op in ("remove", "unlink") and self.tags is None:
+            raise ValueError(f"'{self.op}' needs the tags it removes")
+
+        if self.op == "add":
+            if self.fields is None:
+                raise ValueError("'add' needs fields")
+            for field, value in self.fields.items():
+                check_resource_field(field, value)
+        elif self.op == "set":
+            if self.rid is None or self.field is None:
+                raise ValueError("'set' needs rid and field")
+            if not self.rid:
+                # rid "" is the prompt register
+                if self.field != "user_prompt" or not isinstance(self.value, (str, type(None))):
+                    raise ValueError("The prompt register only takes a user_prompt string")
+            elif self.field == "user_prompt":
+                raise ValueError("user_prompt is not a resource field")
+            else:
+                check_resource_field(self.field, self.value)
+        elif self.op == "link":
+            try:
+                Connection.model_validate(self.value, strict=True)
+            except ValidationError as e:
+                raise ValueError(f"Invalid connection: {e.errors()[0]['msg']}")
+        return self
+
+
+class ResourceSnapshot(BaseModel):
+    """One resource of a CRDT snapshot: add tags and LWW registers [ts, replica, value]"""
+    tags: List[str]
+    fields: Dict[str, Tuple[int, str, Any]]
+    created: Optional[Tuple[int, str]] = None
+
+    @model_validator(mode="after")
+    def _check_fields(self):
+        for field, (_, _, value) in self.fields.items():
+            check_resource_field(field, value)
+        return self
+
+
+class ConnectionSnapshot(BaseModel):
+    tags: List[str]
+    value: Connection
+
+
+class CanvasSnapshot(BaseModel):
+    """Full CRDT document state of a replica (CanvasDocument.snapshot())"""
+    vector: Dict[str, int]
+    clock: int
+    resources: Dict[str, ResourceSnapshot]
+    connections: Dict[str, ConnectionSnapshot]
+    removed: List[str]
+    prompt: Tuple[int, str, str]
+
+
+class CanvasSyncRequest(BaseModel):
+    """A replica's state vector plus the ops (or snapshot) the other side may be missing"""
+    replica: str
+    vector: Dict[str, int] = Field(default_factory=dict)
+    ops: List[CanvasOp] = Field(default_factory=list)
+    snapshot: Optional[CanvasSnapshot] = None
+
+
+class LayoutRequest(BaseModel):
+    """Auto-layout of a session's canvas"""
+    # None lays out the whole canvas; otherwise only these resources move
+    resource_ids: Optional[List[str]] = None
+    spacing_x: float = Field(default=200.0, gt=0)
+    spacing_y: float = Field(default=150.0, gt=0)
+    max_columns: int = Field(default=40, ge=1)
+
+
+class CanvasUpdateMessage(BaseModel):
+    """WebSocket frame carrying a full canvas state"""
+    type: Literal["canvas_update"]
+    data: CanvasState
+
+
+class CanvasOpsMessage(BaseModel):
+    """WebSocket frame carrying CRDT ops made by the client"""
+    type: Literal["canvas_ops"]
+    data: List[CanvasOp]
+
+
+class CanvasSyncMessage(BaseModel):
+    """WebSocket frame starting a delta sync (sent on (re)connect)"""
+    type: Literal["canvas_sync"]
+    data: CanvasSyncRequest
+
+
+class ChatFrameMessage(BaseModel):
+    """WebSocket frame carrying a chat message"""
+    type: Literal["chat_message"]
+    data: ChatMessage
+
+
+class ChatBatchMessage(BaseModel):
+    """WebSocket frame carrying a burst of chat messages"""
+    type: Literal["chat_batch"]
+    data: List[ChatMessage]
+
+
+class ViewportMessage(BaseModel):
+    """WebSocket frame registering the client's viewport"""
+    type: Literal["viewport"]
+    data: Viewport
+
+
+class PresenceUpdate(BaseModel):
+    """Ephemeral per-user presence; only the fields sent are updated"""
+    user_id: str
+    username: Optional[str] = None
+    cursor: Optional[Dict[str, float]] = None  # {"x": ..., "y": ...} in canvas coordinates
+    selection: Optional[List[str]] = Field(default=None, max_length=200)  # resource ids
+    typing: Optional[bool] = None
+
+
+class PresenceMessage(BaseModel):
+    """WebSocket frame carrying presence; held in memory only, never persisted"""
+    type: Literal["presence"]
+    data: PresenceUpdate
+
+
+class PongMessage(BaseModel):
+    """WebSocket frame answering a server heartbeat `ping` (echoes its ts)"""
+    type: Literal["pong"]
+    ts: Optional[float] = None
+
+
+# Client -> server WebSocket frames, discriminated by "type"
+ClientMessage = Annotated[
+    Union[
+        CanvasUpdateMessage, CanvasOpsMessage, CanvasSyncMessage,
+        ChatFrameMessage, ChatBatchMessage, ViewportMessage, PresenceMessage, PongMessage
+    ],
+    Field(discriminator="type")
+]
 
 
 class CodeGenerationRequest(BaseModel):
@@ -48,6 +237,9 @@ class CodeGenerationRequest(BaseModel):
     canvas_state: CanvasState
     target_format: Literal["terraform", "cloudformation"] = "terraform"
     ai_provider: Literal["anthropic", "openai"] = "anthropic"
+    # Time budget for the generation (retries, hedges), counted from when it gets a
+    # generation slot; None = LLM_DEADLINE
+    deadline_seconds: Optional[float] = Field(default=None, gt=0, le=3600)
 
 
 class CodeGenerationResponse(BaseModel):
@@ -56,15 +248,35 @@ class CodeGenerationResponse(BaseModel):
     code: str = ""
     error: Optional[str] = None
     estimated_cost: Optional[str] = None
+    # Set when the LLM was unavailable and the code came from a fallback
+    fallback: Optional[Literal["cache", "template"]] = None
+    # True for fallback results: usable, but not generated for this request
+    degraded: bool = False
+    # Where the code was stored (see artifacts.py); deploy by this id
+    artifact_id: Optional[str] = None
+    artifact_version: Optional[int] = None
+
+
+class ArtifactUpload(BaseModel):
+    """Generated IaC files to store as a session artifact"""
+    format: Literal["terraform", "cloudformation"] = "terraform"
+    files: Dict[str, str] = Field(min_length=1)  # relative path -> content
 
 
 class DeploymentRequest(BaseModel):
-    """Request to deploy infrastructure"""
+    """Request to deploy infrastructure, from inline `code` or a stored artifact"""
     session_id: str
-    code: str
+    code: str = ""
+    artifact_id: Optional[str] = None
     format: Literal["terraform", "cloudformation"]
     auto_approve: bool = False
 
+    @model_validator(mode="after")
+    def _code_or_artifact(self):
+        if not self.code and not self.artifact_id:
+            raise ValueError("Either code or artifact_id is required")
+        return self
+
 
 class DeploymentResponse(BaseModel):
     """Deployment result"""
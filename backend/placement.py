@@ -0,0 +1,137 @@
+"""
+Session placement: consistent hashing of session_id onto backend nodes
+
+Each node heartbeats itself into a Redis registry. Every node builds the same
+hash ring from the live members, so all of them agree on which node owns a
+session. The owner holds the session's sockets, broadcast loop and chat tail;
+other nodes redirect clients to it.
+
+Placement is off unless CLUSTER_ADVERTISE_URL is set (single-node setups own
+every session).
+"""
+import asyncio
+import bisect
+import hashlib
+import logging
+import os
+import socket
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+# WebSocket close code sent with a `redirect` frame
+REDIRECT_CLOSE_CODE = 4307
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes"""
+
+    def __init__(self, nodes: Iterable[str] = (), vnodes: int = 128):
+        self.vnodes = vnodes
+        self.nodes: List[str] = []
+        self._points: List[int] = []
+        self._owners: List[str] = []
+        self.rebuild(nodes)
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+    def rebuild(self, nodes: Iterable[str]):
+        """Replace the ring's members; only keys near changed nodes move"""
+        self.nodes = sorted(set(nodes))
+        points = sorted(
+            (self._hash(f"{node}#{i}"), node)
+            for node in self.nodes
+            for i in range(self.vnodes)
+        )
+        self._points = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def owner(self, key: str) -> Optional[str]:
+        """Node that owns `key` (None for an empty ring)"""
+        if not self._points:
+            return None
+        i = bisect.bisect(self._points, self._hash(key)) % len(self._points)
+        return self._owners[i]
+
+
+class SessionPlacement:
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self.node_id = os.getenv("CLUSTER_NODE_ID") or socket.gethostname()
+        # Base URL other nodes hand out for this node, e.g. http://backend-1:8000
+        self.advertise_url = os.getenv("CLUSTER_ADVERTISE_URL")
+        self.enabled = bool(self.advertise_url)
+        self.heartbeat_interval = float(os.getenv("CLUSTER_HEARTBEAT_INTERVAL", 2))
+        self.node_ttl = float(os.getenv("CLUSTER_NODE_TTL", 6))
+
+        self.ring = HashRing([self.node_id], vnodes=int(os.getenv("CLUSTER_VNODES", 128)))
+        self.node_urls: Dict[str, str] = {self.node_id: self.advertise_url or ""}
+        self.leaving = False
+
+    def owner(self, session_id: str) -> str:
+        """Node ID that owns the session"""
+        if not self.enabled:
+            return self.node_id
+        return self.ring.owner(session_id) or self.node_id
+
+    def owns(self, session_id: str) -> bool:
+        return self.owner(session_id) == self.node_id
+
+    def owner_ws_url(self, session_id: str) -> Optional[str]:
+        """WebSocket URL of the session on its owning node"""
+        base = self.node_urls.get(self.owner(session_id))
+        if not base:
+            return None
+        if base.startswith("http"):
+            base = "ws" + base[len("http"):]
+        return f"{base.rstrip('/')}/ws/{session_id}"
+
+    def owner_http_url(self, session_id: str, path: str) -> Optional[str]:
+        """HTTP URL of `path` on the session's owning node"""
+        base = self.node_urls.get(self.owner(session_id))
+        return f"{base.rstrip('/')}{path}" if base else None
+
+    async def refresh(self) -> bool:
+        """Heartbeat and rebuild the ring from live members; True if membership changed"""
+        nodes = await self.redis_client.register_node(self.node_id, self.advertise_url)
+
+        cutoff = time.time() - self.node_ttl
+        expired = [node for node, info in nodes.items() if info["last_seen"] < cutoff]
+        await self.redis_client.prune_nodes(expired)
+
+        live = {node: info["url"] for node, info in nodes.items() if node not in expired}
+        live[self.node_id] = self.advertise_url
+        self.node_urls = live
+
+        if sorted(live) == self.ring.nodes:
+            return False
+        logger.info(f"Cluster membership changed: {self.ring.nodes} -> {sorted(live)}")
+        self.ring.rebuild(live)
+        return True
+
+    async def run(self, on_change: Callable[[], Awaitable[None]]):
+        """Heartbeat forever, calling `on_change` after ownership moves (run as a background task)"""
+        while not self.leaving:
+            try:
+                if await self.refresh():
+                    await on_change()
+            except redis.RedisError as e:
+                # Keep the last known ring; a brief Redis outage should not move sessions
+                logger.warning(f"Cluster heartbeat failed: {e}")
+            await asyncio.sleep(self.heartbeat_interval)
+
+    async def leave(self):
+        """Deregister and drop this node from the local ring before shutdown"""
+        self.leaving = True
+        remaining = [node for node in self.ring.nodes if node != self.node_id]
+        if remaining:
+            self.ring.rebuild(remaining)
+        try:
+            await self.redis_client.prune_nodes([self.node_id])
+        except redis.RedisError as e:
+            logger.warning(f"Cluster deregistration failed: {e}")
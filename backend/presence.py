@@ -0,0 +1,111 @@
+"""
+Ephemeral presence: cursors, selections and typing indicators
+
+Presence never touches Redis or the canvas document. Each session keeps the
+latest state per user in memory; updates arriving faster than the tick just
+overwrite it (so each user is throttled to one update per tick, and the last
+position always gets through), and once per tick every session with changes
+gets one batched `presence` frame. Users that stop sending (or whose socket
+closes) expire and are reported under `left`.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, List
+
+from metrics import PRESENCE_COALESCED
+from models import PresenceUpdate
+
+logger = logging.getLogger(__name__)
+
+
+class PresenceEntry:
+    __slots__ = ("state", "updated", "websocket")
+
+    def __init__(self, state: Dict, websocket):
+        self.state = state
+        self.updated = time.monotonic()
+        self.websocket = websocket
+
+
+class PresenceHub:
+    def __init__(self, ws_manager):
+        self.ws_manager = ws_manager
+        # session_id -> user_id -> entry
+        self.sessions: Dict[str, Dict[str, PresenceEntry]] = {}
+        # session_id -> user ids changed / left since the last tick
+        self._changed: Dict[str, set] = {}
+        self._left: Dict[str, set] = {}
+
+        self.tick = float(os.getenv("PRESENCE_TICK", 0.1))
+        self.ttl = float(os.getenv("PRESENCE_TTL", 10))
+
+    def update(self, websocket, session_id: str, update: PresenceUpdate):
+        """Record a user's latest presence for the next tick"""
+        users = self.sessions.setdefault(session_id, {})
+        state = update.model_dump(exclude_none=True)
+        entry = users.get(update.user_id)
+        if entry is None:
+            users[update.user_id] = PresenceEntry(state, websocket)
+        else:
+            entry.state = {**entry.state, **state}
+            entry.updated = time.monotonic()
+            entry.websocket = websocket
+        changed = self._changed.setdefault(session_id, set())
+        if update.user_id in changed:
+            # Superseded before it was sent
+            PRESENCE_COALESCED.inc()
+        changed.add(update.user_id)
+        self._left.get(session_id, set()).discard(update.user_id)
+
+    def snapshot(self, session_id: str) -> Dict:
+        """Everyone currently present, for a socket that just joined"""
+        users = self.sessions.get(session_id, {})
+        return {"users": [entry.state for entry in users.values()], "left": []}
+
+    def forget(self, websocket, session_id: str):
+        """Drop the users announced over a closed socket"""
+        users = self.sessions.get(session_id, {})
+        for user_id in [uid for uid, entry in users.items() if entry.websocket is websocket]:
+            self._remove(session_id, user_id)
+
+    def _remove(self, session_id: str, user_id: str):
+        users = self.sessions.get(session_id)
+        if users is None or users.pop(user_id, None) is None:
+            return
+        self._left.setdefault(session_id, set()).add(user_id)
+        self._changed.get(session_id, set()).discard(user_id)
+        if not users:
+            del self.sessions[session_id]
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl
+        for session_id, users in list(self.sessions.items()):
+            for user_id in [uid for uid, entry in users.items() if entry.updated < cutoff]:
+                self._remove(session_id, user_id)
+
+    def collect(self) -> Dict[str, Dict]:
+        """Batched frames due this tick: session_id -> {"users": [...], "left": [...]}"""
+        self._expire()
+        frames = {}
+        for session_id in set(self._changed) | set(self._left):
+            users = self.sessions.get(session_id, {})
+            changed: List[Dict] = [users[uid].state for uid in self._changed.get(session_id, ()) if uid in users]
+            left = sorted(self._left.get(session_id, ()))
+            if changed or left:
+                frames[session_id] = {"users": changed, "left": left}
+        self._changed.clear()
+        self._left.clear()
+        return frames
+
+    async def run(self):
+        """Send one presence frame per changed session per tick"""
+        while True:
+            await asyncio.sleep(self.tick)
+            try:
+                for session_id, data in self.collect().items():
+                    await self.ws_manager.broadcast_frame(session_id, json.dumps({"type": "presence", "data": data}))
+            except Exception as e:
+                logger.warning(f"Presence tick failed: {e}")
@@ -2,44 +2,450 @@
 Redis client for session management and PubSub
 """
 import redis
+import redis.asyncio
+import redis.client
+import redis.lock
 import json
+import logging
 import os
-from typing import Optional, Dict, List
+import re
+import time
+from typing import Optional, Dict, List, Tuple
+from pydantic import TypeAdapter
 from models import CanvasState, ChatMessage
+from codec import decode_canvas, encode_canvas, encode_chat_message
+from storage_codec import pack_canvas, pack_chat, unpack_canvas_json, unpack_chat, describe
+from local_cache import LocalCache
+from metrics import REDIS_COMMAND_LATENCY
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+class _InstrumentedPipeline(redis.client.Pipeline):
+    """Pipeline that records one PIPELINE latency sample per execute()"""
+
+    def execute(self, raise_on_error=True):
+        start = time.perf_counter()
+        try:
+            with tracer.span("redis.PIPELINE", commands=len(self.command_stack)):
+                return super().execute(raise_on_error)
+        finally:
+            REDIS_COMMAND_LATENCY.labels("PIPELINE").observe(time.perf_counter() - start)
+
+
+class _InstrumentedRedis(redis.Redis):
+    """Redis client that records per-command latency"""
+
+    def execute_command(self, *args, **options):
+        command = str(args[0]).upper()
+        start = time.perf_counter()
+        try:
+            with tracer.span(f"redis.{command}"):
+                return super().execute_command(*args, **options)
+        finally:
+            REDIS_COMMAND_LATENCY.labels(command).observe(time.perf_counter() - start)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return _InstrumentedPipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
+
+
+class _InstrumentedAsyncRedis(redis.asyncio.Redis):
+    """asyncio Redis client that records per-command latency"""
+
+    async def execute_command(self, *args, **options):
+        command = str(args[0]).upper()
+        start = time.perf_counter()
+        try:
+            with tracer.span(f"redis.{command}"):
+                return await super().execute_command(*args, **options)
+        finally:
+            REDIS_COMMAND_LATENCY.labels(command).observe(time.perf_counter() - start)
+
+
+# Per-session keys, in export order: (kind, key prefix)
+SESSION_KEYS = (
+    ("canvas", "canvas"),
+    ("doc", "canvas_doc"),
+    ("ops", "canvas_ops"),
+    ("chat", "chat"),
+    ("artifacts", "artifacts"),
+)
+# Kinds stored as Redis lists
+LIST_KINDS = ("ops", "artifacts")
+
+# Validates a whole history page in one call instead of one model at a time
+CHAT_HISTORY_ADAPTER = TypeAdapter(List[ChatMessage])
+
+# Stream entry ID ("<ms>-<seq>", or just "<ms>"), the form chat cursors take
+STREAM_ID = re.compile(r"\d{1,20}(-\d{1,20})?")
+
+# A deploy holding a stack lock longer than this is presumed dead and loses it
+STACK_LOCK_TTL = float(os.getenv("STACK_LOCK_TTL", 3600))
+
+
+def _chat_entry(session_id: str, entry_id: str, fields: Dict[str, str]) -> Dict:
+    """JSON-ready ChatMessage dict from a stream entry"""
+    fields = unpack_chat(fields)
+    return {
+        "session_id": session_id,
+        "user_id": fields["user_id"],
+        "username": fields["username"],
+        "message": fields["message"],
+        "timestamp": fields["timestamp"],
+        "message_id": entry_id
+    }
 
 
 class RedisClient:
     def __init__(self):
         self.host = os.getenv("REDIS_HOST", "localhost")
         self.port = int(os.getenv("REDIS_PORT", 6379))
-        self.client = redis.Redis(
+        self.client = _InstrumentedRedis(
+            host=self.host,
+            port=self.port,
+            decode_responses=True
+        )
+        # Canvas values are packed binary (see storage_codec), so they need raw bytes
+        self.binary_client = _InstrumentedRedis(
+            host=self.host,
+            port=self.port,
+            decode_responses=False
+        )
+        # Used for blocking XREAD tails so they never block the event loop
+        self.async_client = _InstrumentedAsyncRedis(
             host=self.host,
             port=self.port,
             decode_responses=True
         )
-        self.pubsub = self.client.pubsub()
+        self._pubsub = None
+
+        # Read-through cache for hot session reads, kept coherent across
+        # replicas by keyspace notifications (see start_cache_invalidation)
+        self.cache = LocalCache(
+            max_keys=int(os.getenv("LOCAL_CACHE_SIZE", 1024)),
+            ttl=float(os.getenv("LOCAL_CACHE_TTL", 30))
+        )
+        self._invalidation_thread = None
+
+    @property
+    def pubsub(self):
+        """PubSub object, created on first subscription"""
+        if self._pubsub is None:
+            self._pubsub = self.client.pubsub()
+        return self._pubsub
+
+    async def ping(self) -> bool:
+        """Check Redis reachability without blocking the event loop"""
+        return await self.async_client.ping()
+
+    def start_cache_invalidation(self):
+        """Listen for keyspace notifications on session keys and drop stale cache entries"""
+        if not self.cache.enabled or self._invalidation_thread is not None:
+            return
+
+        try:
+            # K: keyspace channel, g: DEL/EXPIRE..., $: strings, t: streams, x/e: expired/evicted
+            events = self.client.config_get("notify-keyspace-events").get("notify-keyspace-events", "")
+            required = "K" if "A" in events else "Kg$txe"
+            missing = "".join(flag for flag in required if flag not in events)
+            if missing:
+                self.client.config_set("notify-keyspace-events", events + missing)
+        except redis.RedisError as e:
+            # CONFIG may be disabled on managed Redis; it must then be set server-side
+            logger.warning(f"Could not enable keyspace notifications ({e}); relying on cache TTL")
+
+        def on_keyspace_event(message):
+            # Channel: __keyspace@<db>__:<key>
+            self.cache.invalidate(message["channel"].split("__:", 1)[1])
+
+        def on_listener_error(e, pubsub, thread):
+            # Notifications may have been lost while disconnected
+            logger.warning(f"Cache invalidation listener error: {e}")
+            self.cache.clear()
+
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe(**{
+            "__keyspace@*__:canvas:*": on_keyspace_event,
+            "__keyspace@*__:chat:*": on_keyspace_event
+        })
+        self._invalidation_thread = pubsub.run_in_thread(
+            sleep_time=1.0,
+            daemon=True,
+            exception_handler=on_listener_error
+        )
+
+    def cache_stats(self) -> Dict:
+        """Local cache hit-rate metrics"""
+        stats = self.cache.stats()
+        stats["invalidation_listener"] = self._invalidation_thread is not None
+        return stats
 
     def save_canvas_state(self, session_id: str, state: CanvasState):
         """Save canvas state to Redis"""
         key = f"canvas:{session_id}"
-        self.client.setex(
+        with tracer.span("storage.pack_canvas"):
+            payload = pack_canvas(state)
+        self.binary_client.setex(
             key,
             3600 * 24,  # 24 hours TTL
-            state.model_dump_json()
+            payload
         )
+        self.cache.invalidate(key)
 
     def get_canvas_state(self, session_id: str) -> Optional[CanvasState]:
         """Retrieve canvas state from Redis"""
+        data = self.get_canvas_state_raw(session_id)
+        if data:
+            return decode_canvas(data)
+        return None
+
+    def get_canvas_state_raw(self, session_id: str) -> Optional[str]:
+        """Retrieve the stored canvas as JSON without validating it"""
         key = f"canvas:{session_id}"
-        data = self.client.get(key)
+        cached = self.cache.get(key, "json")
+        if cached is not None:
+            return cached
+
+        data = self.binary_client.get(key)
         if data:
-            return CanvasState.model_validate_json(data)
+            with tracer.span("storage.unpack_canvas"):
+                canvas_json = unpack_canvas_json(data)
+            self.cache.set(key, "json", canvas_json)
+            return canvas_json
         return None
 
+    def load_canvas_doc(self, session_id: str) -> Tuple[Optional[Dict], List[Dict]]:
+        """CRDT document snapshot (if any) and the ops appended after it"""
+        pipe = self.client.pipeline(transaction=False)
+        pipe.get(f"canvas_doc:{session_id}")
+        pipe.lrange(f"canvas_ops:{session_id}", 0, -1)
+        snapshot, ops = pipe.execute()
+        return (json.loads(snapshot) if snapshot else None), [json.loads(op) for op in ops]
+
+    def append_canvas_ops(self, session_id: str, ops: List[Dict], ttl: int = 86400) -> int:
+        """Append CRDT ops to the session's op log; returns the log length"""
+        key = f"canvas_ops:{session_id}"
+        pipe = self.client.pipeline(transaction=False)
+        pipe.rpush(key, *[json.dumps(op) for op in ops])
+        pipe.expire(key, ttl)
+        pipe.expire(f"canvas_doc:{session_id}", ttl)
+        return pipe.execute()[0]
+
+    def save_canvas_doc(self, session_id: str, snapshot: Dict, ttl: int = 86400):
+        """Store a CRDT snapshot and truncate the op log it covers"""
+        pipe = self.client.pipeline(transaction=True)
+        pipe.setex(f"canvas_doc:{session_id}", ttl, json.dumps(snapshot))
+        pipe.delete(f"canvas_ops:{session_id}")
+        pipe.execute()
+
+    def storage_report(self, max_sessions: int = 1000) -> Dict:
+        """
+        Report Redis bytes per session for canvas and chat keys
+
+        Samples up to `max_sessions` canvas keys with SCAN and reads MEMORY USAGE,
+        STRLEN and the 4-byte storage header in one pipeline.
+        """
+        keys = []
+        for key in self.binary_client.scan_iter(match="canvas:*", count=500):
+            keys.append(key)
+            if len(keys) >= max_sessions:
+                break
+
+        pipe = self.binary_client.pipeline(transaction=False)
+        for key in keys:
+            session_id = key.decode("utf-8").split(":", 1)[1]
+            pipe.memory_usage(key)
+            pipe.strlen(key)
+            pipe.getrange(key, 0, 3)
+            pipe.memory_usage(f"chat:{session_id}")
+        results = pipe.execute()
+
+        canvas_bytes = 0
+        value_bytes = 0
+        chat_bytes = 0
+        encodings: Dict[str, int] = {}
+        for i in range(len(keys)):
+            memory, length, header, chat_memory = results[i * 4:i * 4 + 4]
+            canvas_bytes += memory or 0
+            value_bytes += length or 0
+            chat_bytes += chat_memory or 0
+            label = describe(header or b"")
+            encodings[label] = encodings.get(label, 0) + 1
+
+        sessions = len(keys)
+        per_session = (canvas_bytes + chat_bytes) / sessions if sessions else 0
+
+        report = {
+            "sessions_sampled": sessions,
+            "canvas_bytes": canvas_bytes,
+            "canvas_value_bytes": value_bytes,
+            "chat_bytes": chat_bytes,
+            "avg_bytes_per_session": round(per_session),
+            "encodings": encodings
+        }
+
+        # Estimate capacity against the configured memory budget
+        try:
+            maxmemory = int(self.client.config_get("maxmemory").get("maxmemory", 0))
+        except redis.RedisError:
+            maxmemory = 0  # CONFIG is often disabled on managed Redis
+        if maxmemory and per_session:
+            report["maxmemory"] = maxmemory
+            report["estimated_session_capacity"] = int(maxmemory // per_session)
+
+        return report
+
+    def scan_sessions(
+        self, prefix: str, cursor: int = 0, count: int = 500, skip_prefixes: Tuple[str, ...] = ()
+    ) -> Tuple[int, List[str]]:
+        """
+        One SCAN page of session ids whose `{prefix}:{id}` key exists; cursor 0 means done
+
+        Sessions that also have a key under one of `skip_prefixes` are left out.
+        """
+        cursor, keys = self.binary_client.scan(cursor, match=f"{prefix}:*", count=count)
+        start = len(prefix) + 1
+        session_ids = [key[start:].decode("utf-8") for key in keys]
+        if skip_prefixes and session_ids:
+            pipe = self.binary_client.pipeline(transaction=False)
+            for session_id in session_ids:
+                pipe.exists(*[f"{other}:{session_id}" for other in skip_prefixes])
+            session_ids = [sid for sid, found in zip(session_ids, pipe.execute()) if not found]
+        return cursor, session_ids
+
+    def dump_sessions(self, session_ids: List[str]) -> List[Dict]:
+        """
+        Raw session keys and their remaining TTLs, read in one pipeline
+
+        Returns {kind: (value, ttl_ms)} per session (kinds as in SESSION_KEYS,
+        only for keys that exist; ttl_ms is None for keys without expiry).
+        """
+        pipe = self.binary_client.pipeline(transaction=False)
+        for session_id in session_ids:
+            for kind, prefix in SESSION_KEYS:
+                key = f"{prefix}:{session_id}"
+                if kind in LIST_KINDS:
+                    pipe.lrange(key, 0, -1)
+                elif kind == "chat":
+                    pipe.xrange(key)
+                else:
+                    pipe.get(key)
+                pipe.pttl(key)
+        results = pipe.execute()
+
+        sessions = []
+        width = len(SESSION_KEYS) * 2
+        for i in range(len(session_ids)):
+            row = results[i * width:(i + 1) * width]
+            keys = {}
+            for j, (kind, _) in enumerate(SESSION_KEYS):
+                value, ttl = row[j * 2], row[j * 2 + 1]
+                # PTTL is -2 for a missing key and -1 for a key without expiry
+                if ttl == -2 or value is None or value == []:
+                    continue
+                keys[kind] = (value, ttl if ttl >= 0 else None)
+            sessions.append(keys)
+        return sessions
+
+    def restore_sessions(self, sessions: Dict[str, Dict], replace: bool = True) -> List[str]:
+        """
+        Write dumped sessions back in one pipeline, keeping their TTLs
+
+        `sessions` maps session_id -> {kind: (value, ttl_ms)} as returned by
+        dump_sessions. Without `replace`, sessions that already have any key
+        here are left alone. Returns the restored session ids.
+        """
+        session_ids = list(sessions)
+        if not replace:
+            pipe = self.binary_client.pipeline(transaction=False)
+            for session_id in session_ids:
+                pipe.exists(*[f"{prefix}:{session_id}" for _, prefix in SESSION_KEYS])
+            session_ids = [sid for sid, found in zip(session_ids, pipe.execute()) if not found]
+
+        pipe = self.binary_client.pipeline(transaction=False)
+        for session_id in session_ids:
+            for kind, prefix in SESSION_KEYS:
+                key = f"{prefix}:{session_id}"
+                pipe.delete(key)
+                if kind not in sessions[session_id]:
+                    continue
+                value, ttl = sessions[session_id][kind]
+                if kind in LIST_KINDS:
+                    pipe.rpush(key, *value)
+                elif kind == "chat":
+                    for entry_id, fields in value:
+                        pipe.xadd(key, fields, id=entry_id)
+                else:
+                    pipe.set(key, value)
+                if ttl is not None:
+                    pipe.pexpire(key, max(1, ttl))
+        pipe.execute()
+
+        for session_id in session_ids:
+            self.cache.invalidate(f"canvas:{session_id}")
+            self.cache.invalidate(f"chat:{session_id}")
+        return session_ids
+
+    def dump_artifact_objects(self, artifact_ids: List[str]) -> Tuple[Dict[str, Tuple], Dict[str, Tuple]]:
+        """
+        Raw manifests and blobs behind artifact versions, with their TTLs
+
+        Returns ({artifact_id: (manifest, ttl_ms)}, {digest: (blob, ttl_ms)});
+        objects that expired meanwhile are left out.
+        """
+        def read(keys: List[str]) -> List[Tuple]:
+            pipe = self.binary_client.pipeline(transaction=False)
+            for key in keys:
+                pipe.get(key)
+                pipe.pttl(key)
+            results = pipe.execute()
+            return [(value, ttl if ttl >= 0 else None) for value, ttl in zip(results[::2], results[1::2])]
+
+        artifact_ids = list(dict.fromkeys(artifact_ids))
+        manifests = {
+            artifact_id: found
+            for artifact_id, found in zip(artifact_ids, read([f"artifact:{a}" for a in artifact_ids]))
+            if found[0] is not None
+        }
+        digests = list(dict.fromkeys(
+            entry["digest"] for manifest, _ in manifests.values() for entry in json.loads(manifest)["files"]
+        ))
+        blobs = {
+            digest: found
+            for digest, found in zip(digests, read([f"artifact_blob:{d}" for d in digests]))
+            if found[0] is not None
+        }
+        return manifests, blobs
+
+    def restore_artifact_objects(self, manifests: Dict[str, Tuple], blobs: Dict[str, Tuple]) -> int:
+        """
+        Write dumped manifests and blobs that are not stored here yet
+
+        Both are content-addressed, so an existing key already holds the same
+        bytes and is left alone. Returns the number of keys written.
+        """
+        keys = [(f"artifact_blob:{digest}", found) for digest, found in blobs.items()]
+        keys += [(f"artifact:{artifact_id}", found) for artifact_id, found in manifests.items()]
+        if not keys:
+            return 0
+        pipe = self.binary_client.pipeline(transaction=False)
+        for key, _ in keys:
+            pipe.exists(key)
+        missing = [(key, found) for (key, found), exists in zip(keys, pipe.execute()) if not exists]
+
+        pipe = self.binary_client.pipeline(transaction=False)
+        for key, (value, ttl) in missing:
+            pipe.set(key, value, nx=True, px=max(1, ttl) if ttl is not None else None)
+        pipe.execute()
+        return len(missing)
+
     def publish_canvas_update(self, session_id: str, state: CanvasState):
         """Publish canvas update to all subscribers"""
         channel = f"canvas_updates:{session_id}"
-        self.client.publish(channel, state.model_dump_json())
+        self.client.publish(channel, encode_canvas(state))
 
     def subscribe_to_canvas(self, session_id: str):
         """Subscribe to canvas updates"""
@@ -47,37 +453,328 @@ class RedisClient:
         self.pubsub.subscribe(channel)
         return self.pubsub
 
-    def save_chat_message(self, message: ChatMessage):
-        """Save chat message to Redis Stream"""
+    def save_chat_message(self, message: ChatMessage) -> str:
+        """Save chat message to Redis Stream, returning its stream ID"""
         stream_key = f"chat:{message.session_id}"
-        self.client.xadd(
+        message_id = self.client.xadd(
             stream_key,
-            {
-                "user_id": message.user_id,
-                "username": message.username,
-                "message": message.message,
-                "timestamp": message.timestamp.isoformat()
-            },
+            pack_chat(message),
             maxlen=1000  # Keep last 1000 messages
         )
+        self.cache.invalidate(stream_key)
+        return message_id
+
+    def save_chat_messages(self, messages: List[ChatMessage]) -> List[str]:
+        """Save a burst of chat messages in one pipelined round trip"""
+        pipe = self.client.pipeline(transaction=False)
+        for message in messages:
+            pipe.xadd(
+                f"chat:{message.session_id}",
+                pack_chat(message),
+                maxlen=1000
+            )
+        message_ids = pipe.execute()
+
+        for session_id in {message.session_id for message in messages}:
+            self.cache.invalidate(f"chat:{session_id}")
+        return message_ids
 
     def get_chat_history(self, session_id: str, count: int = 50) -> List[ChatMessage]:
         """Retrieve chat history"""
+        return CHAT_HISTORY_ADAPTER.validate_python(
+            self.get_chat_page(session_id, count)["messages"]
+        )
+
+    def get_chat_page(
+        self,
+        session_id: str,
+        count: int = 50,
+        before: Optional[str] = None
+    ) -> Dict:
+        """
+        Retrieve up to `count` messages older than the `before` stream ID (newest page if omitted)
+
+        Messages are returned oldest first; `next_before` is the cursor for the
+        previous page, or None when the start of the stream was reached.
+        """
+        stream_key = f"chat:{session_id}"
+        cache_field = f"page:{count}:{before}"
+        cached = self.cache.get(stream_key, cache_field)
+        if cached is not None:
+            return cached
+
+        max_id = f"({before}" if before else "+"
+        entries = self.client.xrevrange(stream_key, max=max_id, count=count)
+
+        messages = [_chat_entry(session_id, entry_id, fields) for entry_id, fields in reversed(entries)]
+        page = {
+            "messages": messages,
+            "next_before": messages[0]["message_id"] if len(entries) == count else None
+        }
+        self.cache.set(stream_key, cache_field, page)
+        return page
+
+    def get_chat_since(self, session_id: str, after: str = "0-0", count: int = 100) -> Dict:
+        """
+        Retrieve up to `count` messages newer than the `after` stream ID
+
+        `latest` is the cursor to pass on the next call.
+        """
         stream_key = f"chat:{session_id}"
-        messages = self.client.xrevrange(stream_key, count=count)
-
-        chat_messages = []
-        for msg_id, msg_data in reversed(messages):
-            chat_messages.append(ChatMessage(
-                session_id=session_id,
-                user_id=msg_data["user_id"],
-                username=msg_data["username"],
-                message=msg_data["message"],
-                timestamp=msg_data["timestamp"]
-            ))
-        return chat_messages
+        cache_field = f"since:{after}:{count}"
+        cached = self.cache.get(stream_key, cache_field)
+        if cached is not None:
+            return cached
+
+        entries = self.client.xrange(stream_key, min=f"({after}", count=count)
+
+        messages = [_chat_entry(session_id, entry_id, fields) for entry_id, fields in entries]
+        page = {
+            "messages": messages,
+            "latest": messages[-1]["message_id"] if messages else after,
+            "has_more": len(entries) == count
+        }
+        self.cache.set(stream_key, cache_field, page)
+        return page
+
+    async def get_chat_tail_id(self, session_id: str) -> str:
+        """Stream ID of the newest chat message ("0-0" for an empty stream)"""
+        entries = await self.async_client.xrevrange(f"chat:{session_id}", count=1)
+        return entries[0][0] if entries else "0-0"
+
+    async def read_chat_after(
+        self,
+        session_id: str,
+        after: str,
+        block_ms: int,
+        count: int = 100
+    ) -> List[Dict]:
+        """Block until messages newer than `after` arrive (or `block_ms` passes)"""
+        stream_key = f"chat:{session_id}"
+        streams = await self.async_client.xread({stream_key: after}, count=count, block=block_ms)
+
+        messages = []
+        for _, entries in streams or []:
+            messages.extend(_chat_entry(session_id, entry_id, fields) for entry_id, fields in entries)
+        return messages
 
     def publish_chat_message(self, message: ChatMessage):
         """Publish chat message to all subscribers"""
         channel = f"chat_updates:{message.session_id}"
-        self.client.publish(channel, message.model_dump_json())
+        self.client.publish(channel, encode_chat_message(message))
+
+    async def register_node(self, node_id: str, url: str) -> Dict[str, Dict]:
+        """Heartbeat this node into the cluster registry and return every registered node"""
+        async with self.async_client.pipeline(transaction=False) as pipe:
+            pipe.zadd("cluster:nodes", {node_id: time.time()})
+            pipe.hset("cluster:node_urls", node_id, url)
+            pipe.hgetall("cluster:node_urls")
+            pipe.zrange("cluster:nodes", 0, -1, withscores=True)
+            _, _, urls, heartbeats = await pipe.execute()
+        return {
+            node: {"url": urls[node], "last_seen": last_seen}
+            for node, last_seen in heartbeats if node in urls
+        }
+
+    async def prune_nodes(self, node_ids: List[str]):
+        """Remove nodes whose heartbeats stopped"""
+        if not node_ids:
+            return
+        async with self.async_client.pipeline(transaction=False) as pipe:
+            pipe.zrem("cluster:nodes", *node_ids)
+            pipe.hdel("cluster:node_urls", *node_ids)
+            await pipe.execute()
+
+    def save_job(self, job: Dict, ttl: int = 86400):
+        """Create or overwrite a job record and index it under its session"""
+        pipe = self.client.pipeline(transaction=False)
+        pipe.delete(f"job:{job['job_id']}")
+        pipe.hset(f"job:{job['job_id']}", mapping=job)
+        pipe.expire(f"job:{job['job_id']}", ttl)
+        pipe.zadd(f"jobs:{job['session_id']}", {job["job_id"]: job["created_at"]})
+        pipe.expire(f"jobs:{job['session_id']}", ttl)
+        pipe.execute()
+
+    def update_job(self, job_id: str, **fields):
+        """Update fields of a job record"""
+        self.client.hset(f"job:{job_id}", mapping={"updated_at": time.time(), **fields})
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        return self.client.hgetall(f"job:{job_id}") or None
+
+    def list_jobs(self, session_id: str, limit: int = 20) -> List[Dict]:
+        """Most recent jobs of a session, newest first"""
+        job_ids = self.client.zrevrange(f"jobs:{session_id}", 0, limit - 1)
+        pipe = self.client.pipeline(transaction=False)
+        for job_id in job_ids:
+            pipe.hgetall(f"job:{job_id}")
+        return [job for job in pipe.execute() if job]
+
+    def append_job_output(self, job_id: str, text: str, ttl: int = 86400) -> bool:
+        """Append streamed output; returns True if cancellation was requested"""
+        pipe = self.client.pipeline(transaction=False)
+        if text:
+            pipe.append(f"job:{job_id}:output", text)
+            pipe.expire(f"job:{job_id}:output", ttl)
+        pipe.hset(f"job:{job_id}", "updated_at", time.time())
+        pipe.hget(f"job:{job_id}", "cancel_requested")
+        return pipe.execute()[-1] == "1"
+
+    def get_job_output(self, job_id: str, offset: int = 0) -> Tuple[str, int]:
+        """Output written after byte `offset`, and the offset to continue from"""
+        # Offsets are bytes; chunks are appended whole, so they stay on UTF-8 boundaries
+        chunk = self.binary_client.getrange(f"job:{job_id}:output", offset, -1) if offset >= 0 else b""
+        return chunk.decode("utf-8", errors="replace"), offset + len(chunk)
+
+    def clear_job_output(self, job_id: str):
+        self.client.delete(f"job:{job_id}:output")
+
+    def save_artifact(
+        self,
+        session_id: str,
+        manifest: Dict,
+        blobs: Dict[str, bytes],
+        version: Dict,
+        ttl: int
+    ) -> Tuple[Dict, int]:
+        """
+        Store an artifact's blobs (only those not stored yet) and manifest, and
+        append a session version unless the latest one is the same artifact
+
+        Returns (version entry, bytes of new blobs written).
+        """
+        digests = list(blobs)
+        pipe = self.binary_client.pipeline(transaction=False)
+        for digest in digests:
+            pipe.exists(f"artifact_blob:{digest}")
+        pipe.lindex(f"artifacts:{session_id}", -1)
+        pipe.llen(f"artifacts:{session_id}")
+        *exists, latest, count = pipe.execute()
+        # Version numbers are list positions (1-based), so they are never stored
+
+        latest = json.loads(latest) if latest else None
+        pipe = self.binary_client.pipeline(transaction=False)
+        stored = 0
+        for digest, found in zip(digests, exists):
+            if not found:
+                pipe.set(f"artifact_blob:{digest}", blobs[digest], nx=True)
+                stored += len(blobs[digest])
+            # Refreshed with every use, so a blob never expires before a manifest using it
+            pipe.expire(f"artifact_blob:{digest}", ttl)
+        pipe.set(f"artifact:{manifest['artifact_id']}", json.dumps(manifest), nx=True)
+        pipe.expire(f"artifact:{manifest['artifact_id']}", ttl)
+        changed = latest is None or latest["artifact_id"] != manifest["artifact_id"]
+        if changed:
+            pipe.rpush(f"artifacts:{session_id}", json.dumps(version))
+        pipe.expire(f"artifacts:{session_id}", ttl)
+        results = pipe.execute()
+        if changed:
+            # RPUSH returns the new length, which is this entry's version
+            return {**version, "version": results[-2]}, stored
+        return {**latest, "version": count}, stored
+
+    def get_artifact(self, artifact_id: str) -> Optional[Dict]:
+        """An artifact's manifest"""
+        raw = self.client.get(f"artifact:{artifact_id}")
+        return json.loads(raw) if raw else None
+
+    def get_artifact_blobs(self, digests: List[str]) -> List[Optional[bytes]]:
+        """Compressed file contents by digest (None where missing)"""
+        return self.binary_client.mget([f"artifact_blob:{digest}" for digest in digests]) if digests else []
+
+    def list_artifact_versions(self, session_id: str, limit: int = 20) -> List[Dict]:
+        """A session's artifact versions, newest first"""
+        pipe = self.client.pipeline(transaction=False)
+        pipe.llen(f"artifacts:{session_id}")
+        pipe.lrange(f"artifacts:{session_id}", -limit, -1)
+        count, rows = pipe.execute()
+        first = count - len(rows) + 1
+        return [{**json.loads(raw), "version": first + i} for i, raw in reversed(list(enumerate(rows)))]
+
+    def session_has_artifact(self, session_id: str, artifact_id: str) -> bool:
+        """Whether `artifact_id` is one of the session's versions"""
+        return any(json.loads(raw)["artifact_id"] == artifact_id for raw in self.client.lrange(f"artifacts:{session_id}", 0, -1))
+
+    def get_artifact_version(self, session_id: str, version: int) -> Optional[Dict]:
+        """Version number `version` (1-based; -1 for the latest) of a session's artifacts"""
+        if version == 0:
+            return None
+        pipe = self.client.pipeline(transaction=False)
+        pipe.llen(f"artifacts:{session_id}")
+        pipe.lindex(f"artifacts:{session_id}", version - 1 if version > 0 else version)
+        count, raw = pipe.execute()
+        if not raw:
+            return None
+        return {**json.loads(raw), "version": version if version > 0 else count + 1 + version}
+
+    def claim_interval(self, name: str, seconds: float) -> bool:
+        """True for exactly one caller per `seconds` across the cluster (e.g. a periodic sweep)"""
+        return bool(self.client.set(f"schedule:{name}", time.time(), nx=True, px=max(1, int(seconds * 1000))))
+
+    def stack_lock(self, session_id: str, ttl: float = STACK_LOCK_TTL) -> redis.lock.Lock:
+        """
+        Cluster-wide lock on a session's deployed stack (deploy, destroy, drift check)
+
+        Not thread-local: async callers may acquire and release it from
+        different threads. `ttl` bounds how long a crashed holder blocks others.
+        """
+        return self.client.lock(f"stack_lock:{session_id}", timeout=ttl, thread_local=False)
+
+    def save_drift_result(self, session_id: str, result: Dict):
+        """Record the latest drift check of a session's stack"""
+        pipe = self.client.pipeline(transaction=False)
+        pipe.delete(f"drift:{session_id}")
+        pipe.hset(f"drift:{session_id}", mapping={
+            key: json.dumps(value) if isinstance(value, (list, dict)) else value
+            for key, value in result.items() if value is not None
+        })
+        pipe.zadd("drift:sessions", {session_id: result["checked_at"]})
+        pipe.execute()
+
+    def get_drift_results(self, session_ids: List[str]) -> Dict[str, Dict]:
+        """Latest drift result per session (sessions never checked are left out)"""
+        pipe = self.client.pipeline(transaction=False)
+        for session_id in session_ids:
+            pipe.hgetall(f"drift:{session_id}")
+        results = {}
+        for session_id, raw in zip(session_ids, pipe.execute()):
+            if raw:
+                raw["checked_at"] = float(raw["checked_at"])
+                raw["duration"] = float(raw.get("duration", 0))
+                raw["changes"] = json.loads(raw.get("changes", "[]"))
+                results[session_id] = raw
+        return results
+
+    def list_drift_results(self, limit: int = 100) -> List[Dict]:
+        """Most recently checked stacks, newest first"""
+        session_ids = self.client.zrevrange("drift:sessions", 0, limit - 1)
+        results = self.get_drift_results(session_ids)
+        return [{"session_id": session_id, **results[session_id]} for session_id in session_ids if session_id in results]
+
+    def delete_drift_result(self, session_id: str):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.delete(f"drift:{session_id}")
+        pipe.zrem("drift:sessions", session_id)
+        pipe.execute()
+
+    def save_drift_sweep(self, summary: Dict):
+        self.client.set("drift:last_sweep", json.dumps(summary))
+
+    def get_drift_sweep(self) -> Optional[Dict]:
+        raw = self.client.get("drift:last_sweep")
+        return json.loads(raw) if raw else None
+
+    def publish_drift_alert(self, alert: Dict):
+        """Tell every node (and so every session's sockets) about a drift change"""
+        self.client.publish("drift_alerts", json.dumps(alert))
+
+    async def drift_alerts(self):
+        """Async iterator over drift alerts published by any node"""
+        pubsub = self.async_client.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe("drift_alerts")
+        try:
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    yield json.loads(message["data"])
+        finally:
+            await pubsub.reset()
@@ -0,0 +1,422 @@
+"""
+Streaming bulk export/import of sessions (backup and migration)
+
+A dump is NDJSON, optionally gzip-compressed (one gzip member per batch, so
+an interrupted dump can be truncated to its last checkpoint and appended to):
+
+    {"format": "isshoni-sessions", "version": 1}
+    {"session_id": "...", "canvas": ["<base64>", 86231000], "chat": [[["1700000000000-0", {...}], ...], null], ...}
+    {"cursor": "canvas:1536", "sessions": 500}
+    ...
+    {"cursor": null, "sessions": 1234, "elapsed": 1.9, "sessions_per_sec": 649.5}
+
+Every session key is stored raw with its remaining TTL in milliseconds (null
+for no expiry). Export walks the keyspace with SCAN (one prefix after the
+other, a session is written under the first prefix it has) and reads each
+page in one pipeline, so memory stays flat however many sessions there are.
+Checkpoint lines carry the cursor to resume from; import reports the last
+checkpoint whose sessions are all written, so it can be resumed the same way.
+
+A session with artifact versions also carries the manifests and blobs they
+point to (`artifact_manifests` / `artifact_blobs`, {id: [value, ttl]}). They
+are shared between sessions, so each is written once per page, and import
+only writes the ones not stored yet.
+
+CLI:
+    python session_transfer.py export sessions.ndjson.gz [--resume]
+    python session_transfer.py import sessions.ndjson.gz [--resume] [--keep-existing]
+"""
+import argparse
+import base64
+import gzip
+import json
+import os
+import sys
+import time
+import zlib
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from redis_client import SESSION_KEYS
+
+FORMAT = "isshoni-sessions"
+FORMAT_VERSION = 2
+# Version 1 dumps have no artifacts
+READABLE_VERSIONS = (1, 2)
+
+# Sessions per SCAN page / pipeline
+EXPORT_BATCH = int(os.getenv("EXPORT_BATCH", 500))
+IMPORT_BATCH = int(os.getenv("IMPORT_BATCH", 200))
+
+KINDS = [kind for kind, _ in SESSION_KEYS]
+
+
+def _encode(kind: str, value):
+    """JSON-ready form of a raw Redis value"""
+    if kind == "canvas":
+        # Packed binary (see storage_codec), kept byte for byte
+        return base64.b64encode(value).decode("ascii")
+    if kind in ("ops", "artifacts"):
+        return [item.decode("utf-8") for item in value]
+    if kind == "chat":
+        return [
+            [entry_id.decode("utf-8"), {k.decode("utf-8"): v.decode("utf-8") for k, v in fields.items()}]
+            for entry_id, fields in value
+        ]
+    return value.decode("utf-8")
+
+
+def _decode(kind: str, value):
+    if kind == "canvas":
+        return base64.b64decode(value)
+    return value
+
+
+def parse_cursor(cursor: Optional[str]) -> Tuple[int, int]:
+    """(prefix index, SCAN cursor) of an export checkpoint; ValueError if malformed"""
+    if not cursor:
+        return 0, 0
+    kind, _, position = cursor.partition(":")
+    if kind not in KINDS or not position.isdigit():
+        raise ValueError(f"Invalid cursor {cursor}")
+    return KINDS.index(kind), int(position)
+
+
+def _artifact_ids(versions: List[bytes]) -> List[str]:
+    return [json.loads(version)["artifact_id"] for version in versions]
+
+
+def _artifact_objects(redis_client, dumped: List[Dict]) -> Tuple[Dict, Dict]:
+    """Manifests and blobs behind every artifact version of a page of sessions"""
+    artifact_ids = [a for keys in dumped if "artifacts" in keys for a in _artifact_ids(keys["artifacts"][0])]
+    return redis_client.dump_artifact_objects(artifact_ids) if artifact_ids else ({}, {})
+
+
+def _attach_artifact_objects(record: Dict, versions: List[bytes], manifests: Dict, blobs: Dict, sent: set):
+    """Add the manifests and blobs of the session's versions not yet sent in this page"""
+    record_manifests, record_blobs = {}, {}
+    for artifact_id in _artifact_ids(versions):
+        if artifact_id not in manifests or ("artifact", artifact_id) in sent:
+            continue
+        sent.add(("artifact", artifact_id))
+        manifest, ttl = manifests[artifact_id]
+        record_manifests[artifact_id] = [manifest.decode("utf-8"), ttl]
+        for entry in json.loads(manifest)["files"]:
+            digest = entry["digest"]
+            if digest in blobs and ("blob", digest) not in sent:
+                sent.add(("blob", digest))
+                blob, ttl = blobs[digest]
+                record_blobs[digest] = [base64.b64encode(blob).decode("ascii"), ttl]
+    if record_manifests:
+        record["artifact_manifests"] = record_manifests
+    if record_blobs:
+        record["artifact_blobs"] = record_blobs
+
+
+def export_sessions(redis_client, cursor: Optional[str] = None, batch: int = EXPORT_BATCH) -> Iterator[Dict]:
+    """
+    Session records, with a checkpoint record after every SCAN page
+
+    `cursor` is a checkpoint from an earlier export to resume after. The last
+    record is a checkpoint with cursor None plus throughput figures.
+    """
+    phase, scan_cursor = parse_cursor(cursor)
+
+    started = time.perf_counter()
+    exported = 0
+    for phase in range(phase, len(SESSION_KEYS)):
+        kind, prefix = SESSION_KEYS[phase]
+        # Written under the first prefix it has; skipped on the later passes
+        earlier = tuple(p for _, p in SESSION_KEYS[:phase])
+        while True:
+            scan_cursor, session_ids = redis_client.scan_sessions(prefix, scan_cursor, batch, earlier)
+            dumped = redis_client.dump_sessions(session_ids)
+            manifests, blobs = _artifact_objects(redis_client, dumped)
+            # Shared objects go out once per page (a resumed import re-reads whole pages)
+            sent = set()
+            for session_id, keys in zip(session_ids, dumped):
+                if kind not in keys:
+                    # Expired since the SCAN
+                    continue
+                record = {"session_id": session_id}
+                for k, (value, ttl) in keys.items():
+                    record[k] = [_encode(k, value), ttl]
+                if "artifacts" in keys:
+                    _attach_artifact_objects(record, keys["artifacts"][0], manifests, blobs, sent)
+                exported += 1
+                yield record
+            if scan_cursor == 0:
+                break
+            yield {"cursor": f"{kind}:{scan_cursor}", "sessions": exported}
+        if phase + 1 < len(SESSION_KEYS):
+            yield {"cursor": f"{KINDS[phase + 1]}:0", "sessions": exported}
+        scan_cursor = 0
+
+    elapsed = time.perf_counter() - started
+    yield {
+        "cursor": None,
+        "sessions": exported,
+        "elapsed": round(elapsed, 3),
+        "sessions_per_sec": round(exported / elapsed, 1) if elapsed else None
+    }
+
+
+def export_batches(
+    redis_client,
+    cursor: Optional[str] = None,
+    compress: bool = False,
+    header: bool = True,
+    batch: int = EXPORT_BATCH
+) -> Iterator[Tuple[bytes, Dict]]:
+    """Encoded dump, one (chunk, checkpoint) per batch; each chunk is its own gzip member when compressing"""
+    lines: List[str] = []
+    if header:
+        lines.append(json.dumps({"format": FORMAT, "version": FORMAT_VERSION}))
+    for record in export_sessions(redis_client, cursor, batch):
+        lines.append(json.dumps(record, separators=(",", ":")))
+        if "cursor" in record:
+            chunk = ("\n".join(lines) + "\n").encode("utf-8")
+            yield (gzip.compress(chunk, compresslevel=6) if compress else chunk), record
+            lines = []
+
+
+def export_chunks(redis_client, cursor: Optional[str] = None, compress: bool = False, batch: int = EXPORT_BATCH) -> Iterator[bytes]:
+    """Encoded dump for streaming responses"""
+    for chunk, _ in export_batches(redis_client, cursor, compress, batch=batch):
+        yield chunk
+
+
+class SessionImporter:
+    """
+    Incremental import: feed() raw (optionally gzip-compressed) dump bytes as
+    they arrive, then finish()
+
+    Sessions are written in pipelined batches, and always up to a checkpoint
+    line before it counts as done; `after` skips everything up to and
+    including that checkpoint (to resume an interrupted import).
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        replace: bool = True,
+        after: Optional[str] = None,
+        batch: int = IMPORT_BATCH,
+        on_checkpoint: Optional[Callable[[str], None]] = None
+    ):
+        self.redis_client = redis_client
+        self.replace = replace
+        self.batch = batch
+        self.on_checkpoint = on_checkpoint
+        self._skipping = after is not None
+        self._after = after
+
+        self._pending: Dict[str, Dict] = {}
+        self._manifests: Dict[str, Tuple] = {}
+        self._blobs: Dict[str, Tuple] = {}
+        # Artifact objects already written (or found) by this import
+        self._written = set()
+        self._buffer = b""
+        self._inflate = None
+        self._sniffed = False
+        self.imported: List[str] = []
+        # Number of the line being read (for error reports)
+        self.line = 0
+
+        self.stats = {"sessions": 0, "skipped": 0, "artifact_objects": 0, "bytes": 0, "cursor": after}
+        self._started = time.perf_counter()
+
+    def feed(self, data: bytes):
+        self.stats["bytes"] += len(data)
+        if not self._sniffed and data:
+            self._sniffed = True
+            if data[:2] == b"\x1f\x8b":
+                self._inflate = zlib.decompressobj(wbits=31)
+        if self._inflate is not None:
+            data = self._gunzip(data)
+
+        self._buffer += data
+        *lines, self._buffer = self._buffer.split(b"\n")
+        for line in lines:
+            self.line += 1
+            if line.strip():
+                self._record(json.loads(line))
+
+    def _gunzip(self, data: bytes) -> bytes:
+        """Inflate across gzip member boundaries"""
+        out = []
+        while data:
+            out.append(self._inflate.decompress(data))
+            if not self._inflate.eof:
+                break
+            data = self._inflate.unused_data
+            self._inflate = zlib.decompressobj(wbits=31)
+        return b"".join(out)
+
+    def _record(self, record: Dict):
+        if "format" in record:
+            if record["format"] != FORMAT or record.get("version") not in READABLE_VERSIONS:
+                raise ValueError(f"Unsupported dump format: {record}")
+        elif "cursor" in record:
+            if self._skipping:
+                self._skipping = record["cursor"] != self._after
+                return
+            self._flush()
+            self.stats["cursor"] = record["cursor"]
+            if self.on_checkpoint is not None:
+                self.on_checkpoint(record["cursor"])
+        elif not self._skipping:
+            self._pending[record["session_id"]] = {
+                kind: (_decode(kind, record[kind][0]), record[kind][1]) for kind in KINDS if kind in record
+            }
+            for artifact_id, (manifest, ttl) in record.get("artifact_manifests", {}).items():
+                if ("artifact", artifact_id) not in self._written:
+                    self._manifests[artifact_id] = (manifest.encode("utf-8"), ttl)
+            for digest, (blob, ttl) in record.get("artifact_blobs", {}).items():
+                if ("blob", digest) not in self._written:
+                    self._blobs[digest] = (base64.b64decode(blob), ttl)
+            if len(self._pending) >= self.batch:
+                self._flush()
+
+    def _flush(self):
+        if self._manifests or self._blobs:
+            # Before the versions that point at them
+            self.stats["artifact_objects"] += self.redis_client.restore_artifact_objects(self._manifests, self._blobs)
+            self._written.update(("artifact", artifact_id) for artifact_id in self._manifests)
+            self._written.update(("blob", digest) for digest in self._blobs)
+            self._manifests, self._blobs = {}, {}
+        if not self._pending:
+            return
+        restored = self.redis_client.restore_sessions(self._pending, replace=self.replace)
+        self.stats["sessions"] += len(restored)
+        self.stats["skipped"] += len(self._pending) - len(restored)
+        self.imported.extend(restored)
+        self._pending = {}
+
+    def take_imported(self) -> List[str]:
+        """Session ids restored since the last call"""
+        imported, self.imported = self.imported, []
+        return imported
+
+    def finish(self) -> Dict:
+        if self._buffer.strip():
+            line, self._buffer = self._buffer, b""
+            self.line += 1
+            self._record(json.loads(line))
+        self._flush()
+        elapsed = time.perf_counter() - self._started
+        return {
+            **self.stats,
+            "elapsed": round(elapsed, 3),
+            "sessions_per_sec": round(self.stats["sessions"] / elapsed, 1) if elapsed else None
+        }
+
+
+# -- CLI ----------------------------------------------------------------------
+
+def _progress(sessions: int, started: float):
+    elapsed = time.perf_counter() - started
+    rate = sessions / elapsed if elapsed else 0
+    print(f"\r{sessions:,} sessions  {rate:,.0f}/s", end="", file=sys.stderr, flush=True)
+
+
+def _load_checkpoint(path: str) -> Optional[Dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_checkpoint(path: str, checkpoint: Dict):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp, path)
+
+
+def export_to_file(redis_client, path: str, resume: bool = False, batch: int = EXPORT_BATCH) -> Dict:
+    """
+    Dump every session to `path` (gzip if it ends in .gz)
+
+    `path`.checkpoint records the cursor and file offset after every batch;
+    --resume truncates the file back to it and carries on from there.
+    """
+    checkpoint_path = path + ".checkpoint"
+    checkpoint = _load_checkpoint(checkpoint_path) if resume else None
+    if checkpoint and checkpoint["cursor"] is None:
+        return checkpoint
+
+    with open(path, "r+b" if checkpoint else "wb") as f:
+        if checkpoint:
+            f.truncate(checkpoint["offset"])
+            f.seek(checkpoint["offset"])
+        done = checkpoint["sessions"] if checkpoint else 0
+        started = time.perf_counter()
+        batches = export_batches(
+            redis_client,
+            cursor=checkpoint["cursor"] if checkpoint else None,
+            compress=path.endswith(".gz"),
+            header=checkpoint is None,
+            batch=batch
+        )
+        for chunk, record in batches:
+            f.write(chunk)
+            f.flush()
+            last = {**record, "sessions": done + record["sessions"], "offset": f.tell()}
+            _save_checkpoint(checkpoint_path, last)
+            _progress(last["sessions"], started)
+        print(file=sys.stderr)
+    return last
+
+
+def import_from_file(redis_client, path: str, resume: bool = False, replace: bool = True) -> Dict:
+    """Load a dump into Redis; `path`.import-checkpoint allows --resume"""
+    checkpoint_path = path + ".import-checkpoint"
+    checkpoint = _load_checkpoint(checkpoint_path) if resume else None
+    if checkpoint and checkpoint["cursor"] is None:
+        return checkpoint
+    started = time.perf_counter()
+
+    def on_checkpoint(cursor: Optional[str]):
+        _save_checkpoint(checkpoint_path, {"cursor": cursor})
+        _progress(importer.stats["sessions"], started)
+
+    importer = SessionImporter(
+        redis_client,
+        replace=replace,
+        after=checkpoint["cursor"] if checkpoint else None,
+        on_checkpoint=on_checkpoint
+    )
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(1 << 20)
+            if not data:
+                break
+            importer.feed(data)
+            importer.take_imported()
+    stats = importer.finish()
+    _save_checkpoint(checkpoint_path, stats)
+    print(file=sys.stderr)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk export/import of Isshoni sessions")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("path", help="Dump file (.ndjson, or .ndjson.gz for gzip)")
+    parser.add_argument("--resume", action="store_true", help="Continue from the last checkpoint")
+    parser.add_argument("--keep-existing", action="store_true", help="Import: skip sessions that already exist")
+    parser.add_argument("--batch", type=int, default=EXPORT_BATCH, help="Export: sessions per SCAN page")
+    args = parser.parse_args()
+
+    from redis_client import RedisClient
+    redis_client = RedisClient()
+
+    if args.command == "export":
+        stats = export_to_file(redis_client, args.path, resume=args.resume, batch=args.batch)
+    else:
+        stats = import_from_file(redis_client, args.path, resume=args.resume, replace=not args.keep_existing)
+    print(json.dumps(stats))
+
+
+if __name__ == "__main__":
+    main()
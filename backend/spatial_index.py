@@ -0,0 +1,159 @@
+"""
+Spatial index for viewport-scoped canvas subscriptions
+"""
+import math
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from models import AWSResource, CanvasState, Viewport
+
+
+# 캔버스 좌표 기준 그리드 셀 크기 (리소스 간격이 100 단위이므로 5x5 블록)
+DEFAULT_CELL_SIZE = 500.0
+
+
+class SpatialIndex:
+    """Uniform grid over canvas resources, keyed by resource id"""
+
+    def __init__(self, cell_size: float = DEFAULT_CELL_SIZE):
+        self.cell_size = cell_size
+        # (cell_x, cell_y) -> Set of resource ids
+        self.cells: Dict[Tuple[int, int], Set[str]] = {}
+        # resource id -> (x, y, type)
+        self.entries: Dict[str, Tuple[float, float, str]] = {}
+        self.type_counts: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _cell_of(self, x: float, y: float) -> Tuple[int, int]:
+        return (math.floor(x / self.cell_size), math.floor(y / self.cell_size))
+
+    def insert(self, resource: AWSResource):
+        """Insert or move a resource"""
+        previous = self.entries.get(resource.id)
+        if previous is not None:
+            if previous == (resource.x, resource.y, resource.type):
+                return
+            self.remove(resource.id)
+
+        self.entries[resource.id] = (resource.x, resource.y, resource.type)
+        self.cells.setdefault(self._cell_of(resource.x, resource.y), set()).add(resource.id)
+        self.type_counts[resource.type] = self.type_counts.get(resource.type, 0) + 1
+
+    def remove(self, resource_id: str):
+        """Remove a resource from the index"""
+        entry = self.entries.pop(resource_id, None)
+        if entry is None:
+            return
+
+        x, y, resource_type = entry
+        cell = self._cell_of(x, y)
+        members = self.cells.get(cell)
+        if members is not None:
+            members.discard(resource_id)
+            # Clean up empty cells
+            if not members:
+                del self.cells[cell]
+
+        self.type_counts[resource_type] -= 1
+        if not self.type_counts[resource_type]:
+            del self.type_counts[resource_type]
+
+    def sync(self, resources: Iterable[AWSResource]):
+        """Bring the index in line with a full resource list, touching only changed entries"""
+        seen = set()
+        for resource in resources:
+            seen.add(resource.id)
+            self.insert(resource)
+
+        for resource_id in [rid for rid in self.entries if rid not in seen]:
+            self.remove(resource_id)
+
+    def query(self, viewport: Viewport) -> Set[str]:
+        """Return ids of resources inside the viewport (margin included)"""
+        min_x = viewport.x - viewport.margin
+        min_y = viewport.y - viewport.margin
+        max_x = viewport.x + viewport.width + viewport.margin
+        max_y = viewport.y + viewport.height + viewport.margin
+
+        cx0, cy0 = self._cell_of(min_x, min_y)
+        cx1, cy1 = self._cell_of(max_x, max_y)
+
+        # 뷰포트가 점유 셀 수보다 넓으면 점유 셀만 순회
+        span = (cx1 - cx0 + 1) * (cy1 - cy0 + 1)
+        if span > len(self.cells):
+            candidate_cells = [
+                cell for cell in self.cells
+                if cx0 <= cell[0] <= cx1 and cy0 <= cell[1] <= cy1
+            ]
+        else:
+            candidate_cells = [
+                (cx, cy)
+                for cx in range(cx0, cx1 + 1)
+                for cy in range(cy0, cy1 + 1)
+                if (cx, cy) in self.cells
+            ]
+
+        visible = set()
+        for cell in candidate_cells:
+            for resource_id in self.cells[cell]:
+                x, y, _ = self.entries[resource_id]
+                if min_x <= x <= max_x and min_y <= y <= max_y:
+                    visible.add(resource_id)
+        return visible
+
+    def bounds(self) -> Optional[Dict[str, float]]:
+        """Bounding box of every indexed resource"""
+        if not self.entries:
+            return None
+
+        xs = [entry[0] for entry in self.entries.values()]
+        ys = [entry[1] for entry in self.entries.values()]
+        return {"min_x": min(xs), "min_y": min(ys), "max_x": max(xs), "max_y": max(ys)}
+
+    def summarize_offscreen(self, visible_ids: Set[str]) -> Dict:
+        """Cheap summary of what lies outside the viewport"""
+        by_type = dict(self.type_counts)
+        for resource_id in visible_ids:
+            resource_type = self.entries[resource_id][2]
+            by_type[resource_type] -= 1
+
+        return {
+            "count": len(self.entries) - len(visible_ids),
+            "by_type": {t: n for t, n in by_type.items() if n},
+            "bounds": self.bounds()
+        }
+
+
+def scope_canvas_to_viewport(
+    state: CanvasState,
+    index: SpatialIndex,
+    viewport: Viewport
+) -> Dict:
+    """
+    Build the JSON-ready canvas payload a viewport subscriber should receive
+
+    Only resources inside the viewport and connections touching them are included;
+    everything else is collapsed into the `offscreen` summary.
+    """
+    visible_ids = index.query(viewport)
+
+    resources: List[Dict] = [
+        resource.model_dump(mode="json")
+        for resource in state.resources
+        if resource.id in visible_ids
+    ]
+    connections: List[Dict] = [
+        connection.model_dump(mode="json")
+        for connection in state.connections
+        if connection.from_resource in visible_ids or connection.to_resource in visible_ids
+    ]
+
+    return {
+        "session_id": state.session_id,
+        "resources": resources,
+        "connections": connections,
+        "user_prompt": state.user_prompt,
+        "last_updated": state.last_updated.isoformat(),
+        "viewport": viewport.model_dump(),
+        "offscreen": index.summarize_offscreen(visible_ids)
+    }
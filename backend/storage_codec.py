@@ -0,0 +1,200 @@
+"""
+Compact, optionally compressed storage encoding for canvas states and chat
+messages in Redis
+
+Layout of a stored canvas value:
+    b"IS" + version byte + codec byte + body
+
+Version 1 bodies are JSON with short keys and positional resource/connection
+tuples. Values without the header are legacy plain-JSON entries and are read
+transparently.
+
+Chat messages stay stream entries (readers tail them with XREAD), with short
+field names, an epoch-millisecond timestamp and, above the size threshold, a
+compressed message body: {"v": "1", "u", "n", "t", "m" | "z"}. Entries
+without "v" are legacy entries with the long field names.
+"""
+import base64
+import json
+import os
+import zlib
+from datetime import datetime
+from typing import Dict
+from models import CanvasState, ChatMessage
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional; fall back to zlib
+    zstandard = None
+
+
+MAGIC = b"IS"
+FORMAT_VERSION = 1
+
+CODEC_PLAIN = b"j"
+CODEC_ZLIB = b"z"
+CODEC_ZSTD = b"s"
+
+# Bodies smaller than this are stored uncompressed
+COMPRESS_THRESHOLD = int(os.getenv("CANVAS_COMPRESS_THRESHOLD", 1024))
+# Optional pre-trained zstd dictionary (e.g. `zstd --train` over exported canvases)
+ZSTD_DICT_PATH = os.getenv("CANVAS_ZSTD_DICT")
+
+_zstd_compressor = None
+_zstd_decompressor = None
+if zstandard is not None:
+    _zstd_dict = None
+    if ZSTD_DICT_PATH and os.path.exists(ZSTD_DICT_PATH):
+        with open(ZSTD_DICT_PATH, "rb") as f:
+            _zstd_dict = zstandard.ZstdCompressionDict(f.read())
+    _zstd_compressor = zstandard.ZstdCompressor(level=3, dict_data=_zstd_dict)
+    _zstd_decompressor = zstandard.ZstdDecompressor(dict_data=_zstd_dict)
+
+
+def _compact(state: CanvasState) -> Dict:
+    """Short-key, positional representation of a canvas state"""
+    return {
+        "s": state.session_id,
+        "r": [
+            [r.id, r.type, r.name, r.x, r.y, r.properties, r.notes]
+            for r in state.resources
+        ],
+        "c": [
+            [c.from_resource, c.to_resource, c.connection_type]
+            for c in state.connections
+        ],
+        "p": state.user_prompt,
+        "t": state.last_updated.isoformat()
+    }
+
+
+def _expand(compact: Dict) -> Dict:
+    """Inverse of `_compact`, producing the canonical CanvasState dict"""
+    return {
+        "session_id": compact["s"],
+        "resources": [
+            {
+                "id": r[0], "type": r[1], "name": r[2], "x": r[3], "y": r[4],
+                "properties": r[5], "notes": r[6]
+            }
+            for r in compact["r"]
+        ],
+        "connections": [
+            {"from_resource": c[0], "to_resource": c[1], "connection_type": c[2]}
+            for c in compact["c"]
+        ],
+        "user_prompt": compact["p"],
+        "last_updated": compact["t"]
+    }
+
+
+def pack_canvas(state: CanvasState) -> bytes:
+    """Encode a canvas state for storage"""
+    body = json.dumps(_compact(state), separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    codec = CODEC_PLAIN
+    if len(body) >= COMPRESS_THRESHOLD:
+        if _zstd_compressor is not None:
+            body = _zstd_compressor.compress(body)
+            codec = CODEC_ZSTD
+        else:
+            body = zlib.compress(body, 6)
+            codec = CODEC_ZLIB
+
+    return MAGIC + bytes([FORMAT_VERSION]) + codec + body
+
+
+def _unpack_dict(blob: bytes) -> Dict:
+    """Decode a stored value into the canonical CanvasState dict"""
+    if not blob.startswith(MAGIC):
+        # Legacy entry written as plain model JSON
+        return json.loads(blob)
+
+    version = blob[2]
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported canvas storage version: {version}")
+
+    codec = blob[3:4]
+    body = blob[4:]
+    if codec == CODEC_ZSTD:
+        if _zstd_decompressor is None:
+            raise ValueError("Canvas entry is zstd-compressed but zstandard is not installed")
+        body = _zstd_decompressor.decompress(body)
+    elif codec == CODEC_ZLIB:
+        body = zlib.decompress(body)
+    elif codec != CODEC_PLAIN:
+        raise ValueError(f"Unknown canvas storage codec: {codec!r}")
+
+    return _expand(json.loads(body))
+
+
+def unpack_canvas(blob: bytes) -> CanvasState:
+    """Decode and validate a stored canvas state"""
+    return CanvasState.model_validate(_unpack_dict(blob))
+
+
+def unpack_canvas_json(blob: bytes) -> str:
+    """Decode a stored canvas state to canonical JSON without validating it"""
+    if not blob.startswith(MAGIC):
+        return blob.decode("utf-8")
+    return json.dumps(_unpack_dict(blob), ensure_ascii=False)
+
+
+def _compress(body: bytes) -> bytes:
+    if _zstd_compressor is not None:
+        return CODEC_ZSTD + _zstd_compressor.compress(body)
+    return CODEC_ZLIB + zlib.compress(body, 6)
+
+
+def _decompress(blob: bytes) -> bytes:
+    codec, body = blob[:1], blob[1:]
+    if codec == CODEC_ZSTD:
+        if _zstd_decompressor is None:
+            raise ValueError("Entry is zstd-compressed but zstandard is not installed")
+        return _zstd_decompressor.decompress(body)
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(body)
+    raise ValueError(f"Unknown chat storage codec: {codec!r}")
+
+
+def pack_chat(message: ChatMessage) -> Dict[str, str]:
+    """Stream entry fields for a chat message"""
+    timestamp = message.timestamp
+    fields = {
+        "v": "1",
+        "u": message.user_id,
+        "n": message.username,
+        # Naive (local) times as epoch ms; aware ones keep their offset as ISO text
+        "t": str(int(timestamp.timestamp() * 1000)) if timestamp.tzinfo is None else timestamp.isoformat()
+    }
+    body = message.message.encode("utf-8")
+    if len(body) >= COMPRESS_THRESHOLD:
+        # Stream values are read as text, hence base64
+        packed = base64.b64encode(_compress(body)).decode("ascii")
+        if len(packed) < len(body):
+            fields["z"] = packed
+            return fields
+    fields["m"] = message.message
+    return fields
+
+
+def unpack_chat(fields: Dict[str, str]) -> Dict[str, str]:
+    """{user_id, username, message, timestamp} of a stream entry, compact or legacy"""
+    if "v" not in fields:
+        return fields
+    if fields["v"] != "1":
+        raise ValueError(f"Unsupported chat storage version: {fields['v']}")
+    timestamp = fields["t"]
+    if timestamp.isdigit():
+        timestamp = datetime.fromtimestamp(int(timestamp) / 1000).isoformat()
+    message = fields["m"] if "m" in fields else _decompress(base64.b64decode(fields["z"])).decode("utf-8")
+    return {"user_id": fields["u"], "username": fields["n"], "message": message, "timestamp": timestamp}
+
+
+def describe(blob: bytes) -> str:
+    """Short label of how a stored value is encoded (used by the storage report)"""
+    if not blob.startswith(MAGIC):
+        return "legacy-json"
+    return {CODEC_PLAIN: "compact", CODEC_ZLIB: "compact+zlib", CODEC_ZSTD: "compact+zstd"}.get(
+        blob[3:4], "unknown"
+    )
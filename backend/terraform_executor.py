@@ -1,60 +1,221 @@
 """
 Terraform executor for deploying infrastructure
+
+Each deployment is planned in a staging directory next to the session's
+workspace (`TERRAFORM_WORKSPACE_DIR/<session>`), starting from the state
+already there. After an apply the staging directory (config, lock file,
+provider links and the new state) replaces the workspace, so later plans,
+`destroy` and drift checks (drift.py) run against what was deployed.
+
+Workspace directories are named after a hash of the session id, so no two
+sessions can share one. Deploys and destroys hold a per-session lock (shared
+with drift checks) for their whole run, since the staging copy they work on
+is invisible to Terraform's own state lock.
 """
+import hashlib
+import json
+import logging
 import os
+import re
 import tempfile
 import shutil
+import time
+import uuid
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, Tuple
-from python_terraform import Terraform
-import boto3
+from typing import Callable, Dict, Iterator, Optional, Tuple, Union
+
+from metrics import TERRAFORM_STAGE_DURATION
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# Persisted per-session workspaces (must be shared by nodes that deploy or check drift)
+WORKSPACE_DIR = os.getenv("TERRAFORM_WORKSPACE_DIR", os.path.join(tempfile.gettempdir(), "isshoni-workspaces"))
+# Written into each workspace so a directory can be mapped back to its session
+SESSION_FILE = ".isshoni-session"
+STATE_FILE = "terraform.tfstate"
+# How long a deploy or destroy waits for a drift check (or another deploy) of the same session
+STACK_LOCK_WAIT = float(os.getenv("STACK_LOCK_WAIT", 180))
+
+
+def _run_stage(stage: str, command, *args, **kwargs):
+    """Run a Terraform command and record its duration"""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        with tracer.span(f"terraform.{stage}") as span:
+            result = command(*args, **kwargs)
+            if span is not None:
+                span.set("return_code", result[0])
+        outcome = "success" if result[0] == 0 else "failed"
+        return result
+    finally:
+        TERRAFORM_STAGE_DURATION.labels(stage, outcome).observe(time.perf_counter() - start)
 
 
 class TerraformExecutor:
-    def __init__(self):
-        self.s3_client = None
+    def __init__(self, workspace_dir: str = WORKSPACE_DIR, stack_lock: Optional[Callable] = None):
+        # boto3 / python_terraform are imported on first use to keep cold start fast
+        self._s3_client = None
         self.state_bucket = os.getenv("TERRAFORM_STATE_BUCKET")
+        self.workspace_root = Path(workspace_dir)
+        # session_id -> lock with acquire()/release() (RedisClient.stack_lock); None = no locking
+        self.stack_lock = stack_lock
+        # Providers are downloaded once and linked into every workspace
+        os.environ.setdefault("TF_PLUGIN_CACHE_DIR", str(self.workspace_root / ".plugin-cache"))
 
-        # Initialize S3 client if credentials are available
-        if os.getenv("AWS_ACCESS_KEY_ID"):
-            self.s3_client = boto3.client('s3')
+    def workspace(self, session_id: str) -> Path:
+        """The session's persisted workspace directory (may not exist yet)"""
+        # Readable prefix for operators; the hash alone keeps sessions apart
+        readable = re.sub(r"[^A-Za-z0-9_-]", "_", session_id)[:40]
+        digest = hashlib.sha256(session_id.encode("utf-8")).hexdigest()[:32]
+        workspace = self.workspace_root / f"{readable}-{digest}"
+        if not workspace.exists():
+            # Workspaces persisted before hashed names, if they really belong to this session
+            legacy = self.workspace_root / re.sub(r"[^A-Za-z0-9_.-]", "_", session_id).lstrip(".")
+            if legacy.name not in ("", ".", "..") and legacy.is_dir() and self._owner(legacy) == session_id:
+                return legacy
+        return workspace
+
+    @staticmethod
+    def _owner(path: Path) -> Optional[str]:
+        try:
+            return (path / SESSION_FILE).read_text().strip()
+        except OSError:
+            return None
+
+    def workspaces(self) -> Iterator[Tuple[str, Path]]:
+        """(session_id, directory) of every workspace holding deployed state"""
+        if not self.workspace_root.is_dir():
+            return
+        for path in self.workspace_root.iterdir():
+            if path.name.startswith(".") or not (path / STATE_FILE).is_file():
+                continue
+            session_id = self._owner(path)
+            if session_id is not None:
+                yield session_id, path
+
+    def _persist(self, staging: Path, session_id: str):
+        """Make a staging directory the session's workspace (keeping the new state)"""
+        (staging / SESSION_FILE).write_text(session_id)
+        (staging / "tfplan").unlink(missing_ok=True)
+        workspace = self.workspace(session_id)
+        retired = None
+        if workspace.exists():
+            retired = workspace.with_name(f".retired-{workspace.name}-{uuid.uuid4().hex[:8]}")
+            workspace.rename(retired)
+        staging.rename(workspace)
+        if retired is not None:
+            shutil.rmtree(retired, ignore_errors=True)
+
+    @property
+    def s3_client(self):
+        """S3 client, created on first use if credentials are available"""
+        if self._s3_client is None and os.getenv("AWS_ACCESS_KEY_ID"):
+            import boto3
+            self._s3_client = boto3.client('s3')
+        return self._s3_client
+
+    @contextmanager
+    def _locked(self, session_id: str):
+        """Hold the session's stack lock (yields False if it stayed busy)"""
+        if self.stack_lock is None:
+            yield True
+            return
+        lock = self.stack_lock(session_id)
+        if not lock.acquire(blocking=True, blocking_timeout=STACK_LOCK_WAIT):
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            try:
+                lock.release()
+            except Exception as e:
+                # Expired meanwhile; nothing left to release
+                logger.warning(f"Stack lock of {session_id} was lost: {e}")
 
     def deploy(
         self,
-        code: str,
+        code: Union[str, Dict[str, str]],
         session_id: str,
-        auto_approve: bool = False
+        auto_approve: bool = False,
+        progress: Optional[Callable[[str], None]] = None
     ) -> Tuple[bool, Dict, str]:
         """
         Deploy infrastructure using Terraform
 
+        `code` is the contents of main.tf, or {relative path: content} for a
+        multi-file module (e.g. a stored artifact).
+        `progress` receives each stage's output as it completes; an exception
+        raised by it stops the deployment before the next stage.
+
         Returns: (success, outputs, error_message)
         """
+        with self._locked(session_id) as locked:
+            if not locked:
+                return False, {}, "Another deployment or drift check of this session is still running"
+            return self._deploy(code, session_id, auto_approve, progress)
+
+    def _deploy(
+        self,
+        code: Union[str, Dict[str, str]],
+        session_id: str,
+        auto_approve: bool,
+        progress: Optional[Callable[[str], None]]
+    ) -> Tuple[bool, Dict, str]:
+        report = progress or (lambda text: None)
+
+        from python_terraform import Terraform
 
-        # Create temporary directory for Terraform files
-        temp_dir = tempfile.mkdtemp(prefix=f"terraform_{session_id}_")
+        # Staging directory next to the workspace, so it can be renamed into place
+        self.workspace_root.mkdir(parents=True, exist_ok=True)
+        Path(os.environ["TF_PLUGIN_CACHE_DIR"]).mkdir(parents=True, exist_ok=True)
+        temp_dir = tempfile.mkdtemp(prefix=".staging-", dir=self.workspace_root)
+        applied = False
 
         try:
-            # Write Terraform code to file
-            tf_file = Path(temp_dir) / "main.tf"
-            tf_file.write_text(code)
+            # Plan against what is already deployed
+            state = self.workspace(session_id) / STATE_FILE
+            if state.is_file():
+                shutil.copy2(state, Path(temp_dir) / STATE_FILE)
+
+            # Write Terraform code to file(s)
+            files = {"main.tf": code} if isinstance(code, str) else code
+            root = Path(temp_dir).resolve()
+            for name, content in files.items():
+                tf_file = (root / name).resolve()
+                if root not in tf_file.parents:
+                    return False, {}, f"Invalid file path: {name}"
+                tf_file.parent.mkdir(parents=True, exist_ok=True)
+                tf_file.write_text(content)
 
             # Initialize Terraform
             tf = Terraform(working_dir=temp_dir)
 
             # Run terraform init
-            return_code, stdout, stderr = tf.init()
+            report("$ terraform init\n")
+            return_code, stdout, stderr = _run_stage("init", tf.init)
+            report(stdout or "")
             if return_code != 0:
                 return False, {}, f"Terraform init failed: {stderr}"
 
             # Run terraform plan
-            return_code, stdout, stderr = tf.plan(out='tfplan')
+            report("$ terraform plan\n")
+            return_code, stdout, stderr = _run_stage("plan", tf.plan, out='tfplan')
+            report(stdout or "")
             if return_code != 0:
                 return False, {}, f"Terraform plan failed: {stderr}"
 
             # Run terraform apply (if auto-approved)
             if auto_approve:
-                return_code, stdout, stderr = tf.apply(
+                report("$ terraform apply\n")
+                # Even a failed apply may have created resources; keep its state
+                applied = True
+                return_code, stdout, stderr = _run_stage(
+                    "apply",
+                    tf.apply,
                     'tfplan',
                     skip_plan=True,
                     capture_output=False
@@ -63,7 +224,7 @@ class TerraformExecutor:
                     return False, {}, f"Terraform apply failed: {stderr}"
 
                 # Get outputs
-                return_code, outputs, stderr = tf.output(json=True)
+                return_code, outputs, stderr = _run_stage("output", tf.output, json=True)
                 if return_code == 0 and outputs:
                     import json
                     output_dict = json.loads(outputs) if isinstance(outputs, str) else outputs
@@ -79,23 +240,42 @@ class TerraformExecutor:
             return False, {}, f"Deployment error: {str(e)}"
 
         finally:
-            # Cleanup temporary directory
-            try:
-                shutil.rmtree(temp_dir)
-            except Exception:
-                pass
+            if applied and (Path(temp_dir) / STATE_FILE).is_file():
+                self._persist(Path(temp_dir), session_id)
+            else:
+                # Cleanup temporary directory
+                shutil.rmtree(temp_dir, ignore_errors=True)
 
     def destroy(self, session_id: str) -> Tuple[bool, str]:
         """
-        Destroy infrastructure
+        Destroy the session's deployed infrastructure and remove its workspace
 
         Returns: (success, message)
         """
-        # Implementation for destroying infrastructure
-        # This would require storing the terraform state somewhere
-        return False, "Destroy not implemented in MVP"
+        with self._locked(session_id) as locked:
+            if not locked:
+                return False, "Another deployment or drift check of this session is still running"
+            return self._destroy(session_id)
+
+    def _destroy(self, session_id: str) -> Tuple[bool, str]:
+        workspace = self.workspace(session_id)
+        if not (workspace / STATE_FILE).is_file():
+            return False, "Nothing deployed for this session"
+
+        from python_terraform import IsFlagged, Terraform
+
+        tf = Terraform(working_dir=str(workspace))
+        return_code, stdout, stderr = _run_stage(
+            "destroy", tf.cmd, "destroy", auto_approve=IsFlagged, input=False, no_color=IsFlagged
+        )
+        if return_code != 0:
+            return False, f"Terraform destroy failed: {stderr}"
+        shutil.rmtree(workspace, ignore_errors=True)
+        return True, stdout
 
     def get_state(self, session_id: str) -> Dict:
-        """Get current Terraform state"""
-        # In production, this would fetch from S3
-        return {}
+        """Get current Terraform state ({} if nothing is deployed)"""
+        try:
+            return json.loads((self.workspace(session_id) / STATE_FILE).read_text())
+        except (OSError, ValueError):
+            return {}
@@ -0,0 +1,74 @@
+"""
+Shared fixtures
+
+Tests run from backend/ (`python -m pytest tests`). The app fixtures back
+RedisClient with an in-process fakeredis server, so no Redis is needed.
+"""
+import os
+import sys
+import uuid
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep admission control out of the way of tests that send bursts
+os.environ.setdefault("WS_SOCKET_BURST", "10000")
+os.environ.setdefault("SESSION_CANVAS_BURST", "10000")
+os.environ.setdefault("SESSION_CHAT_BURST", "10000")
+os.environ.setdefault("DEPLOY_BURST", "10000")
+os.environ.setdefault("GENERATE_CODE_BURST", "10000")
+os.environ.setdefault("DRIFT_INTERVAL", "0")
+
+
+@pytest.fixture(scope="session")
+def fake_redis():
+    """Point every RedisClient at one shared fakeredis server"""
+    import fakeredis
+    import redis
+    import redis.asyncio
+    import redis_client
+
+    server = fakeredis.FakeServer()
+    originals = (redis_client._InstrumentedRedis.__init__, redis_client._InstrumentedAsyncRedis.__init__)
+
+    def sync_init(self, **kwargs):
+        fake = fakeredis.FakeRedis(server=server, decode_responses=kwargs.get("decode_responses"))
+        redis.Redis.__init__(self, connection_pool=fake.connection_pool)
+
+    def async_init(self, **kwargs):
+        fake = fakeredis.FakeAsyncRedis(server=server, decode_responses=kwargs.get("decode_responses"))
+        redis.asyncio.Redis.__init__(self, connection_pool=fake.connection_pool)
+
+    redis_client._InstrumentedRedis.__init__ = sync_init
+    redis_client._InstrumentedAsyncRedis.__init__ = async_init
+    yield server
+    redis_client._InstrumentedRedis.__init__, redis_client._InstrumentedAsyncRedis.__init__ = originals
+
+
+@pytest.fixture(scope="session")
+def app_client(fake_redis):
+    """TestClient for main.app, entered once so the app keeps a single event loop"""
+    from fastapi.testclient import TestClient
+    import main
+
+    client = TestClient(main.app)
+    client.__enter__()
+    yield client
+    client.__exit__(None, None, None)
+
+
+@pytest.fixture
+def session_id():
+    return f"test-{uuid.uuid4().hex[:12]}"
+
+
+def receive_until(websocket, message_type: str, limit: int = 50):
+    """Next frame of `message_type`, answering heartbeats on the way"""
+    for _ in range(limit):
+        message = websocket.receive_json()
+        if message["type"] == "ping":
+            websocket.send_json({"type": "pong", "ts": message.get("ts")})
+        elif message["type"] == message_type:
+            return message
+    raise AssertionError(f"No {message_type} frame within {limit} frames")
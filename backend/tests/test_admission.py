@@ -0,0 +1,112 @@
+"""Token buckets, job queues and canvas coalescing (admission.py)"""
+import asyncio
+from types import SimpleNamespace
+
+import fakeredis
+import pytest
+import redis
+
+import admission
+from admission import AdmissionController, CanvasCoalescer, JobQueue, QueueFullError, TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(admission.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_bucket_allows_a_burst_then_refills(clock):
+    bucket = TokenBucket(rate=2, burst=3)
+    assert [bucket.try_acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.try_acquire() == pytest.approx(0.5)
+    clock[0] += 0.5
+    assert bucket.try_acquire() == 0.0
+    # Idle time never banks more than the burst
+    clock[0] += 60
+    assert [bucket.try_acquire() for _ in range(4)][-1] == pytest.approx(0.5)
+
+
+def test_bucket_waits_for_larger_requests(clock):
+    bucket = TokenBucket(rate=1, burst=5)
+    assert bucket.try_acquire(4) == 0.0
+    assert bucket.try_acquire(3) == pytest.approx(2.0)
+
+
+def test_job_queue_rejects_once_waiters_are_full():
+    async def run():
+        queue = JobQueue("test-queue", concurrency=1, max_waiting=1, typical_seconds=10)
+        release = asyncio.Event()
+
+        async def job():
+            async with queue.slot():
+                await release.wait()
+
+        running = asyncio.create_task(job())
+        waiting = asyncio.create_task(job())
+        await asyncio.sleep(0)
+        assert (queue.running, queue.waiting) == (1, 1)
+        with pytest.raises(QueueFullError) as excinfo:
+            queue.check()
+        assert excinfo.value.retry_after == 20
+
+        release.set()
+        await asyncio.gather(running, waiting)
+        assert (queue.running, queue.waiting) == (0, 0)
+        assert not queue.full()
+
+    asyncio.run(run())
+
+
+def test_coalescer_flushes_only_the_latest_state():
+    async def run():
+        flushed = []
+
+        async def flush(session_id, state):
+            flushed.append((session_id, state))
+
+        coalescer = CanvasCoalescer(flush)
+        for state in ("v1", "v2", "v3"):
+            coalescer.defer("s", state, 0.01)
+        coalescer.defer("t", "t1", 0.01)
+        coalescer.discard("t")
+        await asyncio.sleep(0.05)
+        return flushed
+
+    assert asyncio.run(run()) == [("s", "v3")]
+
+
+@pytest.fixture
+def controller(monkeypatch):
+    monkeypatch.setenv("GENERATE_CODE_RATE", "1")
+    monkeypatch.setenv("GENERATE_CODE_BURST", "2")
+    return AdmissionController(SimpleNamespace(async_client=fakeredis.FakeAsyncRedis()))
+
+
+def test_shared_bucket_limits_an_endpoint(controller):
+    async def run():
+        return [await controller.admit_endpoint("generate-code") for _ in range(3)]
+
+    first, second, third = asyncio.run(run())
+    assert first == second == 0.0
+    assert 0 < third <= 1
+
+
+def test_socket_budget_is_checked_before_the_session_budget(controller):
+    controller.socket_limit = (1, 1)
+
+    async def run():
+        return [await controller.admit_message("ws", "s", "chat_message") for _ in range(2)]
+
+    assert asyncio.run(run()) == [(0.0, None), (pytest.approx(1.0, abs=0.1), "socket")]
+    controller.forget("ws")
+    assert "ws" not in controller._socket_buckets
+
+
+def test_shared_bucket_fails_open_without_redis(controller):
+    async def broken(**kwargs):
+        raise redis.ConnectionError("down")
+
+    controller._script = broken
+    assert asyncio.run(controller.admit_endpoint("deploy")) == 0.0
@@ -0,0 +1,98 @@
+"""Path, compression and HTTP header helpers of the artifact store (artifacts.py)"""
+import gzip
+
+import pytest
+
+from artifacts import (
+    ArtifactTooLarge,
+    accepts_gzip,
+    compress,
+    decompress,
+    etag_matches,
+    gunzip_limited,
+    media_type,
+    normalize_path,
+    parse_range
+)
+
+
+@pytest.mark.parametrize("path, expected", [
+    ("main.tf", "main.tf"),
+    ("modules/vpc/main.tf", "modules/vpc/main.tf"),
+    ("modules\\vpc\\main.tf", "modules/vpc/main.tf"),
+    ("./a//b/../c.tf", "a/c.tf"),
+])
+def test_normalize_path(path, expected):
+    assert normalize_path(path) == expected
+
+
+@pytest.mark.parametrize("path", ["", ".", "..", "../etc/passwd", "a/../../b", "/etc/passwd", "a\x00b"])
+def test_normalize_path_rejects_escapes(path):
+    with pytest.raises(ValueError):
+        normalize_path(path)
+
+
+def test_compression_is_deterministic():
+    data = b"resource \"aws_s3_bucket\" \"logs\" {}\n" * 50
+    assert compress(data) == compress(data)
+    assert decompress(compress(data)) == data
+
+
+def test_gunzip_limited():
+    body = gzip.compress(b"x" * 1000)
+    assert gunzip_limited(body, 1000) == b"x" * 1000
+    with pytest.raises(ArtifactTooLarge):
+        gunzip_limited(body, 999)
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, False),
+    ("", False),
+    ("gzip", True),
+    ("br, gzip;q=0.5", True),
+    ("gzip;q=0", False),
+    ("*", True),
+    ("identity", False),
+])
+def test_accepts_gzip(header, expected):
+    assert accepts_gzip(header) is expected
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, False),
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"xyz", "abc"', True),
+    ("*", True),
+    ('"abcd"', False),
+])
+def test_etag_matches(header, expected):
+    assert etag_matches(header, '"abc"') is expected
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("bytes=0-99", (0, 99)),
+    ("bytes=10-", (10, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=900-5000", (900, 999)),
+    ("bytes=0-1,5-6", None),
+    ("items=0-1", None),
+    ("bytes=abc", None),
+    ("bytes=a-b", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=5-2", "bytes=-0"])
+def test_unsatisfiable_range(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 1000)
+
+
+def test_media_type():
+    assert media_type("template.YAML") == "application/yaml"
+    assert media_type("main.tf").startswith("text/plain")
+    assert media_type("README").startswith("text/plain")
@@ -0,0 +1,99 @@
+"""Artifact access checks, artifacts in session export/import and import errors"""
+import json
+import uuid
+
+import pytest
+
+from session_transfer import SessionImporter, export_chunks
+
+MAIN_TF = 'resource "aws_s3_bucket" "logs" {}\n'
+
+
+def upload(app_client, session_id: str, files: dict) -> dict:
+    response = app_client.post(f"/api/sessions/{session_id}/artifacts", json={"format": "terraform", "files": files})
+    assert response.status_code == 201
+    return response.json()
+
+
+def test_deploy_rejects_another_sessions_artifact(app_client, session_id):
+    artifact = upload(app_client, session_id, {"main.tf": MAIN_TF})
+    response = app_client.post("/api/deploy", json={
+        "session_id": f"other-{uuid.uuid4().hex[:8]}", "artifact_id": artifact["artifact_id"], "format": "terraform"
+    })
+    assert response.status_code == 404
+
+
+def test_deploy_job_rejects_another_sessions_artifact(app_client, session_id):
+    artifact = upload(app_client, session_id, {"main.tf": MAIN_TF})
+    response = app_client.post("/api/jobs/deploy", json={
+        "session_id": f"other-{uuid.uuid4().hex[:8]}", "artifact_id": artifact["artifact_id"], "format": "terraform"
+    })
+    assert response.status_code == 404
+
+
+def test_missing_artifact_is_404_even_with_matching_etag(app_client):
+    artifact_id = uuid.uuid4().hex * 2
+    response = app_client.get(f"/api/artifacts/{artifact_id}", headers={"If-None-Match": f'"{artifact_id}"'})
+    assert response.status_code == 404
+
+
+def test_stored_artifact_honours_etag(app_client, session_id):
+    artifact = upload(app_client, session_id, {"main.tf": MAIN_TF})
+    etag = app_client.get(f"/api/artifacts/{artifact['artifact_id']}").headers["etag"]
+    assert app_client.get(f"/api/artifacts/{artifact['artifact_id']}", headers={"If-None-Match": etag}).status_code == 304
+
+
+@pytest.fixture
+def main(app_client):
+    # Imported once the app fixture has pointed Redis at fakeredis
+    import main
+    return main
+
+
+def test_export_import_keeps_artifacts(app_client, main):
+    shared = f"# shared {uuid.uuid4().hex}\n"
+    sessions = [f"transfer-{uuid.uuid4().hex[:8]}" for _ in range(2)]
+    artifacts = [upload(app_client, s, {"main.tf": shared, "extra.tf": f"# {s}\n"}) for s in sessions]
+
+    dump = b"".join(export_chunks(main.redis_client))
+    records = [json.loads(line) for line in dump.splitlines()]
+    ours = [r for r in records if r.get("session_id") in sessions]
+    assert len(ours) == 2
+    # The blob both sessions use is in the dump once
+    shared_digest = next(
+        f["digest"] for f in main.artifact_store.manifest(artifacts[0]["artifact_id"])["files"] if f["path"] == "main.tf"
+    )
+    assert sum(shared_digest in r.get("artifact_blobs", {}) for r in records) == 1
+
+    client = main.redis_client.binary_client
+    for session_id, artifact in zip(sessions, artifacts):
+        manifest = main.artifact_store.manifest(artifact["artifact_id"])
+        client.delete(f"artifacts:{session_id}", f"artifact:{artifact['artifact_id']}")
+        client.delete(*[f"artifact_blob:{f['digest']}" for f in manifest["files"]])
+    assert main.artifact_store.versions(sessions[0]) == []
+
+    importer = SessionImporter(main.redis_client)
+    importer.feed(dump)
+    stats = importer.finish()
+    assert stats["artifact_objects"] >= 5
+
+    for session_id, artifact in zip(sessions, artifacts):
+        assert [v["artifact_id"] for v in main.artifact_store.versions(session_id)] == [artifact["artifact_id"]]
+        _, files = main.artifact_store.files(artifact["artifact_id"])
+        assert files == {"main.tf": shared, "extra.tf": f"# {session_id}\n"}
+        assert client.pttl(f"artifact:{artifact['artifact_id']}") > 0
+
+    # Importing again writes no shared object twice
+    importer = SessionImporter(main.redis_client)
+    importer.feed(dump)
+    assert importer.finish()["artifact_objects"] == 0
+
+
+@pytest.mark.parametrize("record", [[1, 2], {"session_id": "s", "canvas": 5}])
+def test_import_reports_the_line_of_a_malformed_record(app_client, record):
+    header = {"format": "isshoni-sessions", "version": 2}
+    body = "\n".join(json.dumps(line) for line in (header, {"cursor": "canvas:0", "sessions": 0}, record)) + "\n"
+    response = app_client.post("/api/storage/import", content=body)
+    assert response.status_code == 400
+    assert "line 3" in response.json()["detail"]
+
@@ -0,0 +1,97 @@
+"""Invalid CRDT ops and snapshots are rejected before anything is persisted"""
+import pytest
+from pydantic import ValidationError
+
+from conftest import receive_until
+from crdt import CanvasDocument
+from models import CanvasOp, CanvasSnapshot
+
+
+def add_op(replica: str, seq: int, rid: str, **fields):
+    return {
+        "id": [replica, seq], "ts": seq, "op": "add", "rid": rid,
+        "fields": {"type": "ec2", "name": rid, "x": 0, "y": 0, "properties": {}, "notes": "", **fields}
+    }
+
+
+@pytest.mark.parametrize("op", [
+    {"op": "set", "rid": "r1", "field": "type", "value": "bogus"},
+    {"op": "set", "rid": "r1", "field": "x", "value": "left"},
+    {"op": "set", "rid": "r1", "field": "user_prompt", "value": "hi"},
+    {"op": "set", "rid": "", "field": "name", "value": "x"},
+    {"op": "add", "rid": "r1"},
+    {"op": "add", "rid": "r1", "fields": {"colour": "red"}},
+    {"op": "remove", "rid": "r1"},
+    {"op": "link", "cid": "a|b|default", "value": {"from_resource": "a"}},
+    {"op": "unlink", "tags": ["a:1"]},
+])
+def test_op_rejected_by_kind(op):
+    with pytest.raises(ValidationError):
+        CanvasOp.model_validate({"id": ["c1", 1], "ts": 1, **op})
+
+
+def test_valid_ops_accepted():
+    CanvasOp.model_validate(add_op("c1", 1, "r1"))
+    CanvasOp.model_validate({"id": ["c1", 2], "ts": 2, "op": "set", "rid": "", "field": "user_prompt", "value": "hi"})
+    CanvasOp.model_validate({"id": ["c1", 3], "ts": 3, "op": "set", "rid": "r1", "field": "x", "value": 12})
+
+
+def test_snapshot_with_invalid_register_rejected():
+    doc = CanvasDocument("s", "c1")
+    doc.apply(add_op("c1", 1, "r1"))
+    snapshot = doc.snapshot()
+    CanvasSnapshot.model_validate(snapshot)
+
+    snapshot["resources"]["r1"]["fields"]["type"] = [5, "c1", "bogus"]
+    with pytest.raises(ValidationError):
+        CanvasSnapshot.model_validate(snapshot)
+
+
+def test_invalid_ops_not_persisted_over_websocket(app_client, session_id):
+    import main
+
+    with app_client.websocket_connect(f"/ws/{session_id}") as websocket:
+        websocket.send_json({"type": "canvas_ops", "data": [add_op("c1", 1, "r1")]})
+        websocket.send_json({"type": "canvas_ops", "data": [
+            {"id": ["c1", 2], "ts": 2, "op": "set", "rid": "r1", "field": "type", "value": "bogus"}
+        ]})
+        error = receive_until(websocket, "error")
+        assert error["reason"] == "invalid_message"
+        assert error["message_type"] is None  # rejected while decoding
+
+        # The socket is still usable and the replica's clock did not skip ahead
+        websocket.send_json({"type": "canvas_ops", "data": [add_op("c1", 2, "r2")]})
+        websocket.send_json({"type": "canvas_sync", "data": {"replica": "c1", "vector": {}}})
+        reply = receive_until(websocket, "canvas_sync")
+        assert reply["data"]["vector"] == {"c1": 2}
+
+    _, ops = main.redis_client.load_canvas_doc(session_id)
+    assert [op["id"][1] for op in ops] == [1, 2]
+    state = app_client.get(f"/api/sessions/{session_id}/canvas").json()
+    assert [(r["id"], r["type"]) for r in state["resources"]] == [("r1", "ec2"), ("r2", "ec2")]
+
+
+def test_invalid_snapshot_not_merged(app_client, session_id):
+    import main
+
+    doc = CanvasDocument(session_id, "c1")
+    doc.apply(add_op("c1", 1, "r1"))
+    snapshot = doc.snapshot()
+    snapshot["resources"]["r1"]["fields"]["type"] = [1, "c1", "bogus"]
+
+    response = app_client.post(
+        f"/api/sessions/{session_id}/canvas/sync",
+        json={"replica": "c1", "vector": {}, "snapshot": snapshot}
+    )
+    assert response.status_code == 422
+    assert main.redis_client.load_canvas_doc(session_id) == (None, [])
+
+    # A valid snapshot is merged and materialized
+    response = app_client.post(
+        f"/api/sessions/{session_id}/canvas/sync",
+        json={"replica": "c1", "vector": {}, "snapshot": doc.snapshot()}
+    )
+    assert response.status_code == 200
+    assert response.json()["vector"] == {"c1": 1}
+    state = app_client.get(f"/api/sessions/{session_id}/canvas").json()
+    assert [r["id"] for r in state["resources"]] == ["r1"]
@@ -0,0 +1,55 @@
+"""Chat cursors and the shared live tail"""
+import asyncio
+
+import pytest
+import redis
+
+from chat_tail import ChatTail
+
+
+@pytest.mark.parametrize("query", [
+    "before=abc", "before=1-2-3", "before=-", "before=%2B", "count=0", "count=-5",
+])
+def test_invalid_history_cursor_is_400(app_client, session_id, query):
+    assert app_client.get(f"/api/sessions/{session_id}/chat?{query}").status_code == 400
+
+
+@pytest.mark.parametrize("query", ["after=zzz", "after=1-", "after=", "after=1-2%0A", "count=100000"])
+def test_invalid_since_cursor_is_400(app_client, session_id, query):
+    assert app_client.get(f"/api/sessions/{session_id}/chat/since?{query}").status_code == 400
+
+
+def test_cursors_page_through_history(app_client, session_id):
+    messages = [
+        {"session_id": session_id, "user_id": "u1", "username": "ann", "message": f"m{i}"} for i in range(5)
+    ]
+    ids = app_client.post(f"/api/sessions/{session_id}/chat/batch", json=messages).json()["message_ids"]
+
+    page = app_client.get(f"/api/sessions/{session_id}/chat?count=2&before={ids[3]}").json()
+    assert [m["message"] for m in page["messages"]] == ["m1", "m2"]
+    since = app_client.get(f"/api/sessions/{session_id}/chat/since?after={ids[1]}").json()
+    assert [m["message"] for m in since["messages"]] == ["m2", "m3", "m4"]
+
+
+class FailingRedis:
+    def __init__(self):
+        self.calls = 0
+
+    async def get_chat_tail_id(self, session_id):
+        self.calls += 1
+        raise redis.ConnectionError("Redis went away")
+
+
+def test_failed_join_frees_the_reservation():
+    redis_client = FailingRedis()
+    tail = ChatTail(redis_client, ws_manager=None)
+
+    async def join_twice():
+        for _ in range(2):
+            with pytest.raises(redis.ConnectionError):
+                await tail.join("s1")
+
+    asyncio.run(join_twice())
+    # The second join tried again instead of assuming a tail was running
+    assert redis_client.calls == 2
+    assert "s1" not in tail.tails
@@ -0,0 +1,53 @@
+"""WebSocket frame codec (codec.py)"""
+import json
+
+import pytest
+from pydantic import ValidationError
+
+from codec import decode_canvas, decode_client_message, encode_canvas, encode_chat_message, encode_frame
+from models import AWSResource, CanvasState, ChatFrameMessage, ChatMessage, PongMessage, ViewportMessage
+
+
+def test_frames_decode_to_their_message_type():
+    chat = decode_client_message(json.dumps({
+        "type": "chat_message",
+        "data": {"session_id": "s", "user_id": "u", "username": "ann", "message": "hi"}
+    }))
+    assert isinstance(chat, ChatFrameMessage) and chat.data.message == "hi"
+    assert isinstance(decode_client_message(b'{"type": "pong", "ts": 1.5}'), PongMessage)
+    viewport = decode_client_message('{"type": "viewport", "data": {"x": 0, "y": 0, "width": 10, "height": 10}}')
+    assert isinstance(viewport, ViewportMessage) and viewport.data.width == 10
+
+
+@pytest.mark.parametrize("raw", ['{"type": "telemetry", "data": {}}', '{"data": {}}'])
+def test_unknown_frame_types_are_ignored(raw):
+    assert decode_client_message(raw) is None
+
+
+@pytest.mark.parametrize("raw", [
+    '{"type": "viewport", "data": {"x": 0, "y": 0, "width": -1, "height": 10}}',
+    '{"type": "chat_message", "data": {"session_id": "s"}}',
+    'not json',
+])
+def test_invalid_frames_raise(raw):
+    with pytest.raises(ValidationError):
+        decode_client_message(raw)
+
+
+def test_canvas_round_trip():
+    state = CanvasState(
+        session_id="s",
+        resources=[AWSResource(id="web", type="ec2", name="웹", x=1, y=2, properties={"size": "t3.micro"})]
+    )
+    assert decode_canvas(encode_canvas(state)) == state
+
+
+def test_chat_message_encoding():
+    message = ChatMessage(session_id="s", user_id="u", username="ann", message="hi")
+    assert json.loads(encode_chat_message(message))["message"] == "hi"
+
+
+def test_encode_frame_splices_payload_as_is():
+    frame = encode_frame("canvas_update", b'{"session_id":"s"}')
+    assert json.loads(frame) == {"type": "canvas_update", "data": {"session_id": "s"}}
+    assert encode_frame('odd"type', "[]") == '{"type":"odd\\"type","data":[]}'
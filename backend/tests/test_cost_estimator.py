@@ -0,0 +1,130 @@
+"""Offline cost estimates (cost_estimator.py)"""
+import pytest
+
+import cost_estimator
+from ai_generator import AICodeGenerator
+from cost_estimator import (
+    HOURS_PER_MONTH,
+    PRICING,
+    CostEstimator,
+    SessionCostModel,
+    estimate_canvas_cost,
+    format_estimate,
+    price_resource
+)
+from models import AWSResource, CanvasState
+
+PRICES = PRICING["us-east-1"]
+# t3.micro plus the default 8 GB volume
+EC2_MICRO = 0.0104 * HOURS_PER_MONTH + 8 * 0.08
+
+
+def resource(rid: str, rtype: str, **properties) -> AWSResource:
+    return AWSResource(id=rid, type=rtype, name=rid, x=0, y=0, properties=properties)
+
+
+def canvas(*resources, session_id="s") -> CanvasState:
+    return CanvasState(session_id=session_id, resources=list(resources))
+
+
+def test_ec2_autoscaling_bounds():
+    fixed, unit, low, expected, high, priced = price_resource(
+        resource("web", "ec2", instance_type="t3.micro", min_size="2", desired_capacity=3, max_size=6), PRICES
+    )
+    assert priced and fixed == 0
+    assert unit == pytest.approx(EC2_MICRO)
+    assert (low, expected, high) == (2, 3, 6)
+
+
+def test_unknown_instance_type_falls_back_to_default():
+    *_, priced = price_resource(resource("web", "ec2", instance_type="x9.huge"), PRICES)
+    assert not priced
+    summary = estimate_canvas_cost(canvas(resource("web", "ec2", instance_type="x9.huge")), "us-east-1")
+    assert summary["assumed_defaults"] == ["web"]
+    assert "default sizes assumed for 1 resource(s)" in format_estimate(summary)
+
+
+def test_multi_az_rds_doubles_instance_and_storage():
+    single = price_resource(resource("db", "rds", instance_class="db.t3.micro"), PRICES)
+    multi = price_resource(resource("db", "rds", instance_class="db.t3.micro", multi_az="true"), PRICES)
+    assert multi[0] == pytest.approx(2 * single[0])
+    assert multi[1] == pytest.approx(2 * single[1])
+
+
+def test_vpc_costs_only_its_nat_gateways():
+    assert estimate_canvas_cost(canvas(resource("net", "vpc")), "us-east-1")["monthly"]["expected"] == 0
+    summary = estimate_canvas_cost(canvas(resource("net", "vpc", nat_gateways=2)), "us-east-1")
+    assert summary["monthly"]["expected"] == round(2 * 0.045 * HOURS_PER_MONTH, 2)
+
+
+def test_totals_and_breakdown():
+    summary = estimate_canvas_cost(canvas(
+        resource("web", "ec2", min_size=1, max_size=4),
+        resource("lb", "alb"),
+        resource("site", "s3", storage_gb="bad")
+    ), "us-east-1")
+    alb = (0.0225 + 0.008) * HOURS_PER_MONTH
+    s3 = 50 * 0.023 + 100 * 0.005
+    assert summary["monthly"] == {
+        "min": round(EC2_MICRO + alb + s3, 2),
+        "expected": round(EC2_MICRO + alb + s3, 2),
+        "max": round(4 * EC2_MICRO + alb + s3, 2)
+    }
+    assert summary["by_type"] == {"ec2": round(EC2_MICRO, 2), "alb": round(alb, 2), "s3": round(s3, 2)}
+    assert "with autoscaling" in format_estimate(summary)
+
+
+def test_model_reuses_rows_and_grows():
+    model = SessionCostModel("us-east-1", capacity=2)
+    model.sync([resource(f"w{i}", "ec2") for i in range(5)])
+    assert model.used == 5 and len(model.items) >= 5
+    model.sync([resource("w0", "ec2")])
+    assert len(model.rows) == 1 and len(model.free) == 4
+    model.sync([resource("w0", "ec2"), resource("db", "rds")])
+    assert model.used == 5
+    assert model.summary()["resources"] == 2
+
+
+def test_incremental_model_matches_a_fresh_estimate():
+    estimator = CostEstimator()
+    estimator.estimate(canvas(resource("web", "ec2"), resource("db", "rds")), "us-east-1")
+    edited = canvas(resource("web", "ec2", instance_type="m5.large"), resource("cache", "redis", num_cache_nodes=2))
+    assert estimator.estimate(edited, "us-east-1") == estimate_canvas_cost(edited, "us-east-1")
+
+
+def test_update_reports_only_changes():
+    estimator = CostEstimator()
+    state = canvas(resource("web", "ec2"))
+    assert estimator.update(state) is not None
+    assert estimator.update(state) is None
+    assert estimator.update(canvas(resource("web", "ec2", count=2))) is not None
+
+
+def test_estimator_is_lru_bounded():
+    estimator = CostEstimator(max_sessions=2)
+    for session_id in ("a", "b", "a", "c"):
+        estimator.estimate(canvas(resource("web", "ec2"), session_id=session_id), "us-east-1")
+    assert [key[0] for key in estimator._models] == ["a", "c"]
+    estimator.forget("a")
+    assert [key[0] for key in estimator._models] == ["c"]
+
+
+def test_unknown_region():
+    with pytest.raises(ValueError):
+        CostEstimator().estimate(canvas(), "mars-1")
+
+
+def test_unpriced_configured_region_falls_back():
+    assert cost_estimator._default_region("eu-west-1") == "eu-west-1"
+    assert cost_estimator._default_region("us-west-2") == cost_estimator.FALLBACK_REGION
+
+
+def test_unpriced_region_never_fails_generation(monkeypatch):
+    # As if DEFAULT_REGION had been set to a region without a price table
+    monkeypatch.setattr(cost_estimator, "DEFAULT_REGION", "us-west-2")
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    generator = AICodeGenerator()
+    monkeypatch.setattr(generator, "_generate_resilient", lambda *args: ('resource "aws_instance" "web" {}', None))
+    response = generator.generate_terraform_code(canvas(resource("web", "ec2")))
+    assert response.success and response.code
+    assert response.estimated_cost is None
@@ -0,0 +1,150 @@
+"""Convergence and sync of the CRDT canvas document (crdt.py)"""
+import itertools
+import random
+
+from crdt import CanvasDocument
+
+
+def canvas(*resources, connections=(), prompt=""):
+    return {
+        "resources": [{"id": rid, "type": "ec2", "name": rid, "x": x, "y": 0.0} for rid, x in resources],
+        "connections": [{"from_resource": a, "to_resource": b} for a, b in connections],
+        "user_prompt": prompt
+    }
+
+
+def exchange(a: CanvasDocument, b: CanvasDocument):
+    """Delta sync in both directions"""
+    a.apply_all(b.ops_since(a.vector))
+    b.apply_all(a.ops_since(b.vector))
+
+
+def ids(doc: CanvasDocument):
+    return [r["id"] for r in doc.to_canvas()["resources"]]
+
+
+def test_local_edits_become_minimal_ops():
+    doc = CanvasDocument("s", "a")
+    assert [op["op"] for op in doc.update_from_state(canvas(("web", 1.0), ("db", 2.0)))] == ["add", "add"]
+    ops = doc.update_from_state(canvas(("web", 5.0), ("db", 2.0)))
+    assert [(op["op"], op["rid"], op["field"], op["value"]) for op in ops] == [("set", "web", "x", 5.0)]
+    assert doc.update_from_state(canvas(("web", 5.0), ("db", 2.0))) == []
+
+
+def test_concurrent_edits_converge():
+    a, b = CanvasDocument("s", "a"), CanvasDocument("s", "b")
+    a.update_from_state(canvas(("web", 1.0)))
+    exchange(a, b)
+    # Concurrent: a moves web, b adds db and renames the prompt
+    a.update_from_state(canvas(("web", 9.0)))
+    b.update_from_state(canvas(("web", 1.0), ("db", 2.0), prompt="three tier"))
+    exchange(a, b)
+    assert a.to_canvas() == b.to_canvas()
+    assert ids(a) == ["web", "db"]
+    assert a.to_canvas()["resources"][0]["x"] == 9.0
+    assert a.to_canvas()["user_prompt"] == "three tier"
+
+
+def test_concurrent_re_add_survives_remove():
+    a, b = CanvasDocument("s", "a"), CanvasDocument("s", "b")
+    a.update_from_state(canvas(("web", 1.0)))
+    exchange(a, b)
+    # a removes web while b, not having seen that, removes and adds it back
+    a.update_from_state(canvas())
+    b.update_from_state(canvas())
+    b.update_from_state(canvas(("web", 3.0)))
+    exchange(a, b)
+    assert ids(a) == ids(b) == ["web"]
+
+
+def test_ops_apply_in_any_delivery_order():
+    source = CanvasDocument("s", "a")
+    ops = source.update_from_state(canvas(("web", 1.0), ("db", 2.0), connections=[("web", "db")]))
+    ops += source.update_from_state(canvas(("web", 4.0), ("db", 2.0)))
+    for order in itertools.islice(itertools.permutations(ops), 50):
+        doc = CanvasDocument("s", "b")
+        pending = list(order)
+        # Out-of-order ops are refused (a gap) and retried, as a client would after resyncing
+        while pending:
+            applied, _ = doc.apply_all(pending)
+            assert applied
+            pending = [op for op in pending if op not in applied]
+        assert doc.to_canvas() == source.to_canvas()
+
+
+def test_duplicate_and_gapped_ops():
+    source = CanvasDocument("s", "a")
+    ops = source.update_from_state(canvas(("web", 1.0), ("db", 2.0)))
+    doc = CanvasDocument("s", "b")
+    assert doc.apply_all(ops[1:]) == ([], True)
+    assert doc.apply_all(ops) == (ops, False)
+    assert doc.apply_all(ops) == ([], False)
+
+
+def test_compacted_log_falls_back_to_snapshot():
+    a = CanvasDocument("s", "a")
+    a.update_from_state(canvas(("web", 1.0), ("db", 2.0), ("cache", 3.0)))
+    a.compact(1)
+    assert a.ops_since({}) is None
+    b = CanvasDocument.from_snapshot("s", "b", a.snapshot())
+    assert b.to_canvas() == a.to_canvas()
+    assert b.vector == a.vector
+    # Only what is still logged is sent from here on
+    a.update_from_state(canvas(("web", 1.0)))
+    b.apply_all(a.ops_since(b.vector))
+    assert b.to_canvas() == a.to_canvas()
+
+
+def test_merge_is_idempotent_and_commutative():
+    a, b = CanvasDocument("s", "a"), CanvasDocument("s", "b")
+    a.update_from_state(canvas(("web", 1.0)))
+    b.update_from_state(canvas(("db", 2.0), prompt="b"))
+    left = CanvasDocument.from_snapshot("s", "x", a.snapshot())
+    left.merge(b.snapshot())
+    left.merge(b.snapshot())
+    right = CanvasDocument.from_snapshot("s", "y", b.snapshot())
+    right.merge(a.snapshot())
+    assert left.to_canvas() == right.to_canvas()
+
+
+def test_fork_does_not_touch_the_original():
+    doc = CanvasDocument("s", "a")
+    doc.update_from_state(canvas(("web", 1.0)))
+    before = doc.to_canvas()
+    scratch = doc.fork()
+    scratch.update_from_state(canvas(("db", 2.0)))
+    assert doc.to_canvas() == before
+    assert ids(scratch) == ["db"]
+
+
+def test_random_edits_converge():
+    rng = random.Random(7)
+    replicas = [CanvasDocument("s", name) for name in "abc"]
+    for _ in range(30):
+        doc = rng.choice(replicas)
+        current = {r["id"]: r["x"] for r in doc.to_canvas()["resources"]}
+        rid = rng.choice(["web", "db", "cache", "queue"])
+        if rid in current and rng.random() < 0.4:
+            del current[rid]
+        else:
+            current[rid] = float(rng.randint(0, 9))
+        doc.update_from_state(canvas(*current.items()))
+        if rng.random() < 0.3:
+            exchange(doc, rng.choice(replicas))
+    for a, b in itertools.combinations(replicas, 2):
+        exchange(a, b)
+    for a, b in itertools.combinations(replicas, 2):
+        exchange(a, b)
+    assert replicas[0].to_canvas() == replicas[1].to_canvas() == replicas[2].to_canvas()
+
+
+def test_snapshot_without_created_still_materializes():
+    source = CanvasDocument("s", "a")
+    source.update_from_state(canvas(("web", 1.0), ("db", 2.0)))
+    snapshot = source.snapshot()
+    snapshot["resources"]["db"]["created"] = None
+    left = CanvasDocument.from_snapshot("s", "x", snapshot)
+    right = CanvasDocument("s", "y")
+    right.merge(snapshot)
+    right.merge(snapshot)
+    assert ids(left) == ids(right) == ["db", "web"]
@@ -0,0 +1,10 @@
+"""The frontend ships its own copy of crdt.py; both replicas must run the same code"""
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+
+
+def test_frontend_crdt_is_identical():
+    backend = (ROOT / "backend" / "crdt.py").read_bytes()
+    frontend = (ROOT / "frontend" / "crdt.py").read_bytes()
+    assert frontend == backend, "frontend/crdt.py and backend/crdt.py differ; copy the change to both"
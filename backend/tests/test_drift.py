@@ -0,0 +1,107 @@
+"""Refresh-only plan parsing and workspace fingerprints (drift.py)"""
+import os
+import stat
+import time
+
+import pytest
+
+from drift import check_stack, fingerprint
+
+DRIFTED_PLAN = """
+Note: Objects have changed outside of Terraform
+
+  # aws_instance.web has changed
+  ~ resource "aws_instance" "web" {
+      ~ instance_type = "t3.micro" -> "t3.large"
+    }
+
+  # module.net.aws_subnet.private["a"] has been deleted
+  - resource "aws_subnet" "private" {
+    }
+"""
+
+
+def fake_terraform(tmp_path, plan_body: str, init_body: str = "exit 0"):
+    """A `terraform` stand-in that answers `init` and `plan` with the given shell snippets"""
+    script = tmp_path / "terraform"
+    script.write_text(
+        "#!/bin/sh\n"
+        "case \"$1\" in\n"
+        f"  init) {init_body} ;;\n"
+        f"  plan) {plan_body} ;;\n"
+        "esac\n"
+    )
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    return str(script)
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    path = tmp_path / "stack"
+    (path / ".terraform").mkdir(parents=True)
+    (path / "main.tf").write_text('resource "aws_instance" "web" {}\n')
+    (path / "terraform.tfstate").write_text("{}")
+    return path
+
+
+def test_clean_stack(tmp_path, workspace):
+    result = check_stack(str(workspace), 10, fake_terraform(tmp_path, "exit 0"))
+    assert (result["status"], result["changes"], result["error"]) == ("clean", [], None)
+
+
+def test_drifted_stack_lists_changed_addresses(tmp_path, workspace):
+    (tmp_path / "plan.txt").write_text(DRIFTED_PLAN)
+    result = check_stack(str(workspace), 10, fake_terraform(tmp_path, f"cat {tmp_path / 'plan.txt'}; exit 2"))
+    assert result["status"] == "drifted"
+    assert result["changes"] == [
+        {"address": "aws_instance.web", "change": "changed"},
+        {"address": 'module.net.aws_subnet.private["a"]', "change": "been deleted"}
+    ]
+
+
+@pytest.mark.parametrize("stderr, status", [
+    ("Error: Error acquiring the state lock", "busy"),
+    ("Error: No valid credential sources found", "error"),
+])
+def test_failed_plan(tmp_path, workspace, stderr, status):
+    result = check_stack(str(workspace), 10, fake_terraform(tmp_path, f"echo '{stderr}' >&2; exit 1"))
+    assert result["status"] == status
+    assert stderr in result["error"]
+
+
+def test_init_runs_only_when_missing(tmp_path, workspace):
+    (workspace / ".terraform").rmdir()
+    terraform = fake_terraform(tmp_path, "exit 0", init_body="echo 'init failed' >&2; exit 1")
+    result = check_stack(str(workspace), 10, terraform)
+    assert result["status"] == "error" and "init failed" in result["error"]
+
+
+def test_hanging_plan_times_out(tmp_path, workspace):
+    started = time.monotonic()
+    result = check_stack(str(workspace), 1, fake_terraform(tmp_path, "sleep 30"))
+    assert result["status"] == "timeout"
+    assert time.monotonic() - started < 10
+
+
+def test_missing_binary(workspace):
+    assert check_stack(str(workspace), 10, "/nonexistent/terraform")["status"] == "error"
+
+
+def test_fingerprint_tracks_state_and_config(workspace):
+    digest = fingerprint(workspace)
+    # Provider caches do not count
+    (workspace / ".terraform" / "cache.tf").write_text("x")
+    assert fingerprint(workspace) == digest
+
+    (workspace / "modules").mkdir()
+    (workspace / "modules" / "vpc.tf").write_text("")
+    assert fingerprint(workspace) != digest
+
+    digest = fingerprint(workspace)
+    (workspace / "terraform.tfstate").write_text('{"serial": 2}')
+    assert fingerprint(workspace) != digest
+
+
+def test_fingerprint_of_a_vanished_workspace(workspace):
+    os.remove(workspace / "terraform.tfstate")
+    assert fingerprint(workspace) is None
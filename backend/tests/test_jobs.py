@@ -0,0 +1,126 @@
+"""Background job heartbeats and resume (jobs.py)"""
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import jobs
+from admission import JobQueue
+from jobs import JobManager
+from models import DeploymentRequest
+from placement import HashRing
+
+
+class Executor:
+    """Deploys that block until released and count how often they ran"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.runs = 0
+
+    def deploy(self, code, session_id, auto_approve=False, progress=None):
+        self.runs += 1
+        self.release.wait(5)
+        return True, {}, None
+
+
+class Sockets:
+    async def broadcast_to_session(self, session_id, message):
+        pass
+
+
+@pytest.fixture
+def manager(fake_redis, session_id):
+    from redis_client import RedisClient
+
+    executor = Executor()
+    admission = SimpleNamespace(jobs={"deploy": JobQueue("deploy-test", 1, 4, typical_seconds=1)})
+    placement = SimpleNamespace(node_id="node-a", enabled=True, ring=HashRing(["node-a", "node-b"]))
+    artifact_store = SimpleNamespace(deployment_code=lambda request: request.code)
+    manager = JobManager(RedisClient(), admission, Sockets(), None, executor, artifact_store, placement)
+    yield manager
+    executor.release.set()
+
+
+def deploy_request(session_id: str) -> str:
+    return DeploymentRequest(session_id=session_id, code="# tf", format="terraform").model_dump_json()
+
+
+def backdate(manager: JobManager, job_id: str, seconds: float = jobs.STALE_AFTER + 10):
+    manager.redis_client.update_job(job_id)
+    manager.redis_client.client.hset(f"job:{job_id}", "updated_at", time.time() - seconds)
+
+
+async def wait_for(condition, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        await asyncio.sleep(0.01)
+
+
+def test_heartbeat_keeps_queued_and_running_jobs_fresh(manager, session_id, monkeypatch):
+    monkeypatch.setattr(jobs, "HEARTBEAT_INTERVAL", 0.05)
+
+    async def run():
+        slot = manager.admission.jobs["deploy"]
+        async with slot.slot():
+            # Waiting for the only slot, without any output
+            job = await manager.submit("deploy", session_id, deploy_request(session_id))
+            backdate(manager, job["job_id"])
+            await asyncio.sleep(0.2)
+            assert not manager.get(job["job_id"])["stale"]
+
+        await wait_for(lambda: manager.terraform_executor.runs == 1)
+        backdate(manager, job["job_id"])
+        await asyncio.sleep(0.2)
+        assert manager.get(job["job_id"])["status"] == "running"
+        assert not manager.get(job["job_id"])["stale"]
+
+        manager.terraform_executor.release.set()
+        await wait_for(lambda: not manager.tasks)
+        assert manager.get(job["job_id"])["status"] == "succeeded"
+
+    asyncio.run(run())
+
+
+def test_resume_leaves_a_job_running_here_alone(manager, session_id, monkeypatch):
+    monkeypatch.setattr(jobs, "HEARTBEAT_INTERVAL", 3600)
+
+    async def run():
+        job = await manager.submit("deploy", session_id, deploy_request(session_id))
+        await wait_for(lambda: manager.terraform_executor.runs == 1)
+        backdate(manager, job["job_id"])
+        assert manager.get(job["job_id"])["stale"]
+
+        resumed = await manager.resume(job["job_id"])
+        assert resumed["status"] == "running"
+        manager.terraform_executor.release.set()
+        await wait_for(lambda: not manager.tasks)
+        assert manager.terraform_executor.runs == 1
+
+    asyncio.run(run())
+
+
+def test_resume_waits_for_a_live_owner_node(manager, session_id):
+    async def run():
+        job_id = "job-on-node-b"
+        manager.redis_client.save_job({
+            "job_id": job_id, "kind": "deploy", "session_id": session_id, "node": "node-b", "status": "running",
+            "created_at": time.time(), "updated_at": time.time(), "request": deploy_request(session_id),
+            "result": "", "error": "", "cancel_requested": "0"
+        })
+        backdate(manager, job_id)
+        assert (await manager.resume(job_id))["status"] == "running"
+        assert not manager.tasks
+
+        # node-b left the cluster: the stale job is taken over here
+        manager.placement.ring = HashRing(["node-a"])
+        resumed = await manager.resume(job_id)
+        assert resumed["status"] == "queued" and resumed["node"] == "node-a"
+        manager.terraform_executor.release.set()
+        await wait_for(lambda: not manager.tasks)
+        assert manager.terraform_executor.runs == 1
+
+    asyncio.run(run())
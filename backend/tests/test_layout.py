@@ -0,0 +1,76 @@
+"""Full and incremental auto-layout (layout.py)"""
+import numpy as np
+
+from layout import auto_layout, layout_all, layout_new
+
+
+def resource(rid: str, rtype: str, x: float = 0.0, y: float = 0.0) -> dict:
+    return {"id": rid, "name": rid, "type": rtype, "x": x, "y": y}
+
+
+def slots(x: np.ndarray, y: np.ndarray, spacing_x: float = 200.0, spacing_y: float = 150.0) -> list:
+    return list(zip(np.rint(x / spacing_x).astype(int).tolist(), np.rint(y / spacing_y).astype(int).tolist()))
+
+
+def test_tiers_are_stacked_top_to_bottom():
+    resources = [resource("db", "rds"), resource("web", "ec2"), resource("lb", "alb"), resource("net", "vpc")]
+    x, y = layout_all(resources, [])
+    row = dict(zip([r["id"] for r in resources], y))
+    assert row["net"] < row["lb"] < row["web"] < row["db"]
+    assert x.min() == 0
+
+
+def test_tiers_wrap_into_rows_without_overlap():
+    resources = [resource(f"w{i}", "ec2") for i in range(25)]
+    x, y = layout_all(resources, [], max_columns=10)
+    assert len(np.unique(y)) == 3
+    # The short last row is centred, so compare exact positions
+    assert len(set(zip(x.tolist(), y.tolist()))) == 25
+
+
+def test_new_resource_goes_next_to_its_neighbour():
+    resources = [resource("lb", "alb", 0, 150), resource("web", "ec2", 400, 300), resource("new", "ec2")]
+    x, y = layout_new(resources, [{"from_resource": "new", "to_resource": "web"}], ["new"])
+    assert (x[0], y[0], x[1], y[1]) == (0, 150, 400, 300)
+    assert y[2] == 300 and abs(x[2] - 400) == 200
+
+
+def test_new_resource_never_lands_on_an_occupied_slot():
+    # Six taken slots left of the target: more than the old bounded search looked at
+    resources = [resource(f"f{i}", "ec2", i * 200.0, 300) for i in range(6)] + [resource("new", "ec2")]
+    x, y = layout_new(resources, [{"from_resource": "new", "to_resource": "f0"}], ["new"])
+    assert (x[-1], y[-1]) == (1200.0, 300.0)
+    assert len(set(slots(x, y))) == len(resources)
+
+
+def test_negative_targets_are_clamped():
+    resources = [resource("web", "ec2", -1000, 300), resource("new", "ec2")]
+    x, _ = layout_new(resources, [{"from_resource": "new", "to_resource": "web"}], ["new"])
+    assert x[-1] >= 0
+
+
+def test_many_new_resources_get_distinct_slots():
+    resources = [resource(f"f{i}", "ec2", i * 200.0, 300) for i in range(3)]
+    resources += [resource(f"n{i}", "ec2") for i in range(20)]
+    connections = [{"from_resource": f"n{i}", "to_resource": "f1"} for i in range(20)]
+    x, y = layout_new(resources, connections, [f"n{i}" for i in range(20)])
+    assert len(set(slots(x, y))) == len(resources)
+
+
+def test_auto_layout_reports_only_moved_resources():
+    canvas = {
+        "resources": [resource("web", "ec2", 0, 300), resource("new", "ec2", 0, 0)],
+        "connections": []
+    }
+    moved = auto_layout(canvas, ["new"])
+    assert list(moved) == ["new"]
+
+
+def test_column_limit_applies_when_every_resource_is_new():
+    resources = [resource(f"w{i}", "ec2") for i in range(12)]
+    _, y = layout_new(resources, [], [r["id"] for r in resources], max_columns=5)
+    assert len(np.unique(y)) == 3
+
+    positions = {r["id"]: (r["x"], r["y"]) for r in resources}
+    positions.update(auto_layout({"resources": resources, "connections": []}, list(positions), max_columns=5))
+    assert len({y for _, y in positions.values()}) == 3
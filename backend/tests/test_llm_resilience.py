@@ -0,0 +1,244 @@
+"""
+Circuit breaker, hedging, retries and deadlines (llm_resilience.py), and how
+AICodeGenerator feeds them
+"""
+import threading
+import time
+
+import pytest
+
+import llm_resilience
+from ai_generator import AICodeGenerator
+from llm_resilience import (
+    CircuitBreaker,
+    Deadline,
+    DeadlineExceeded,
+    StreamInterrupted,
+    call_with_retries,
+    hedged,
+    is_out_of_time,
+    is_retryable,
+    is_upstream_failure
+)
+from models import AWSResource, CanvasState
+
+
+class UpstreamError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A monotonic clock the test moves by hand"""
+    now = [1000.0]
+    monkeypatch.setattr(llm_resilience.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_breaker_opens_after_threshold(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_after=30)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_breaker_success_resets_failure_count(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_breaker_half_open_lets_one_probe_through(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_after=30)
+    breaker.record_failure()
+    clock[0] += 29
+    assert not breaker.allow()
+    clock[0] += 1
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN and breaker.probing
+    assert not breaker.allow()
+
+
+def test_breaker_probe_outcomes(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_after=30)
+    breaker.record_failure()
+    clock[0] += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+    clock[0] += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_breaker_release_frees_the_probe(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_after=30)
+    breaker.record_failure()
+    clock[0] += 30
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+
+
+def test_retryable_errors():
+    assert is_retryable(TimeoutError())
+    assert is_retryable(ConnectionError())
+    assert is_retryable(UpstreamError(429))
+    assert is_retryable(UpstreamError(503))
+    assert not is_retryable(UpstreamError(400))
+    assert not is_retryable(DeadlineExceeded())
+    assert not is_retryable(StreamInterrupted())
+
+
+def test_short_deadline_is_not_an_upstream_failure(clock):
+    short = Deadline(5)
+    clock[0] += 5
+    assert is_out_of_time(DeadlineExceeded(), short)
+    assert is_out_of_time(TimeoutError(), short)
+    assert not is_upstream_failure(DeadlineExceeded(), short, full_budget=180)
+    assert not is_upstream_failure(TimeoutError(), short, full_budget=180)
+
+    full = Deadline(180)
+    clock[0] += 180
+    assert is_upstream_failure(DeadlineExceeded(), full, full_budget=180)
+
+
+def test_upstream_failures():
+    deadline = Deadline(5)
+    # A timeout of one attempt with budget left is the upstream's fault
+    assert not is_out_of_time(TimeoutError(), deadline)
+    assert is_upstream_failure(TimeoutError(), deadline, full_budget=180)
+    assert is_upstream_failure(UpstreamError(502), deadline)
+    assert is_upstream_failure(StreamInterrupted(), deadline)
+    assert not is_upstream_failure(UpstreamError(401), deadline)
+
+
+def test_retries_until_success(monkeypatch):
+    monkeypatch.setattr(llm_resilience.time, "sleep", lambda seconds: None)
+    calls = []
+
+    def call():
+        calls.append(1)
+        if len(calls) < 3:
+            raise UpstreamError(503)
+        return "ok"
+
+    assert call_with_retries(call, Deadline(60), retries=2, base_delay=0.01) == "ok"
+    assert len(calls) == 3
+
+
+def test_non_retryable_error_is_raised_at_once():
+    calls = []
+
+    def call():
+        calls.append(1)
+        raise UpstreamError(400)
+
+    with pytest.raises(UpstreamError):
+        call_with_retries(call, Deadline(60), retries=2)
+    assert len(calls) == 1
+
+
+def test_hedge_wins_and_loser_is_discarded():
+    release = threading.Event()
+    discarded = []
+    attempts = []
+
+    def attempt(timeout):
+        attempts.append(timeout)
+        if len(attempts) == 1:
+            release.wait(5)
+            return "slow"
+        return "fast"
+
+    try:
+        assert hedged(attempt, Deadline(10), hedge_after=0.05, discard=discarded.append) == "fast"
+    finally:
+        release.set()
+    for _ in range(100):
+        if discarded:
+            break
+        time.sleep(0.01)
+    assert len(attempts) == 2
+    assert discarded == ["slow"]
+
+
+def test_no_hedge_when_first_attempt_is_fast():
+    attempts = []
+
+    def attempt(timeout):
+        attempts.append(timeout)
+        return "ok"
+
+    assert hedged(attempt, Deadline(10), hedge_after=1.0) == "ok"
+    assert len(attempts) == 1
+
+
+def test_hedged_raises_deadline_exceeded():
+    release = threading.Event()
+    try:
+        with pytest.raises(DeadlineExceeded):
+            hedged(lambda timeout: release.wait(5), Deadline(0.05))
+    finally:
+        release.set()
+
+
+def canvas() -> CanvasState:
+    return CanvasState(
+        session_id="llm-test",
+        resources=[AWSResource(id="web", type="ec2", name="web", x=0, y=0)]
+    )
+
+
+@pytest.fixture
+def generator():
+    generator = AICodeGenerator()
+    generator.breaker = CircuitBreaker("test", failure_threshold=1, reset_after=30)
+    generator.fallback_mode = "template"
+    return generator
+
+
+def test_caller_deadline_does_not_trip_the_breaker(generator, monkeypatch):
+    def out_of_time(prompt, output_format, on_delta, deadline, hedge):
+        raise DeadlineExceeded("budget spent")
+
+    monkeypatch.setattr(generator, "_generate_with_gpt", out_of_time)
+    code, fallback = generator._generate_resilient("prompt", "terraform", canvas(), None, 2.0)
+    assert fallback == "template" and code
+    assert generator.breaker.state == CircuitBreaker.CLOSED
+    assert generator.breaker.failures == 0
+
+
+def test_upstream_errors_trip_the_breaker(generator, monkeypatch):
+    def failing(prompt, output_format, on_delta, deadline, hedge):
+        raise UpstreamError(503)
+
+    monkeypatch.setattr(generator, "_generate_with_gpt", failing)
+    monkeypatch.setattr(llm_resilience.time, "sleep", lambda seconds: None)
+    _, fallback = generator._generate_resilient("prompt", "terraform", canvas(), None, 60.0)
+    assert fallback == "template"
+    assert generator.breaker.state == CircuitBreaker.OPEN
+
+
+def test_fallback_result_is_marked_degraded(generator, monkeypatch):
+    monkeypatch.setattr(generator, "_generate_with_gpt", lambda *args: (_ for _ in ()).throw(DeadlineExceeded()))
+    response = generator.generate_terraform_code(canvas(), deadline=1.0)
+    assert response.success and response.degraded
+    assert response.fallback == "template"
+
+    monkeypatch.setattr(generator, "_generate_with_gpt", lambda *args: 'resource "aws_instance" "web" {}')
+    response = generator.generate_terraform_code(canvas(), deadline=1.0)
+    assert not response.degraded and response.fallback is None
@@ -0,0 +1,97 @@
+"""Consistent-hash session placement (placement.py)"""
+import asyncio
+import time
+from collections import Counter
+
+import pytest
+
+from placement import HashRing, SessionPlacement
+
+SESSIONS = [f"session-{i}" for i in range(3000)]
+
+
+def owners(ring: HashRing) -> dict:
+    return {session: ring.owner(session) for session in SESSIONS}
+
+
+def test_empty_ring_has_no_owner():
+    assert HashRing().owner("s") is None
+
+
+def test_every_node_builds_the_same_ring():
+    assert owners(HashRing(["a", "b", "c"])) == owners(HashRing(["c", "a", "b", "a"]))
+
+
+def test_sessions_spread_over_nodes():
+    counts = Counter(owners(HashRing(["a", "b", "c", "d"])).values())
+    assert set(counts) == {"a", "b", "c", "d"}
+    assert max(counts.values()) < 2 * min(counts.values())
+
+
+def test_membership_change_moves_only_a_share_of_sessions():
+    before = owners(HashRing(["a", "b", "c"]))
+    after = owners(HashRing(["a", "b", "c", "d"]))
+    moved = [session for session in SESSIONS if before[session] != after[session]]
+    # Only sessions taken over by the new node move
+    assert all(after[session] == "d" for session in moved)
+    assert len(moved) < len(SESSIONS) / 2
+
+    removed = owners(HashRing(["a", "b"]))
+    assert all(removed[s] == before[s] for s in SESSIONS if before[s] != "c")
+
+
+class Registry:
+    """In-memory stand-in for the RedisClient node registry"""
+
+    def __init__(self, nodes: dict):
+        self.nodes = nodes
+        self.pruned = []
+
+    async def register_node(self, node_id, url):
+        self.nodes[node_id] = {"url": url, "last_seen": time.time()}
+        return dict(self.nodes)
+
+    async def prune_nodes(self, node_ids):
+        self.pruned.extend(node_ids)
+        for node_id in node_ids:
+            self.nodes.pop(node_id, None)
+
+
+@pytest.fixture
+def placement(monkeypatch):
+    monkeypatch.setenv("CLUSTER_NODE_ID", "a")
+    monkeypatch.setenv("CLUSTER_ADVERTISE_URL", "http://a:8000")
+    registry = Registry({
+        "b": {"url": "http://b:8000", "last_seen": time.time()},
+        "dead": {"url": "http://dead:8000", "last_seen": time.time() - 60},
+    })
+    return SessionPlacement(registry)
+
+
+def test_refresh_drops_expired_nodes(placement):
+    assert asyncio.run(placement.refresh())
+    assert placement.ring.nodes == ["a", "b"]
+    assert placement.redis_client.pruned == ["dead"]
+    assert not asyncio.run(placement.refresh())
+
+
+def test_owner_urls(placement):
+    asyncio.run(placement.refresh())
+    session = next(s for s in SESSIONS if placement.owner(s) == "b")
+    assert not placement.owns(session)
+    assert placement.owner_ws_url(session) == f"ws://b:8000/ws/{session}"
+    assert placement.owner_http_url(session, "/api/x") == "http://b:8000/api/x"
+
+
+def test_disabled_placement_owns_everything(monkeypatch):
+    monkeypatch.delenv("CLUSTER_ADVERTISE_URL", raising=False)
+    placement = SessionPlacement(Registry({}))
+    assert all(placement.owns(session) for session in SESSIONS[:100])
+    assert placement.owner_ws_url("s") is None
+
+
+def test_leave_hands_sessions_to_the_rest(placement):
+    asyncio.run(placement.refresh())
+    asyncio.run(placement.leave())
+    assert placement.ring.nodes == ["b"]
+    assert "a" in placement.redis_client.pruned
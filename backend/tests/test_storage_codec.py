@@ -0,0 +1,96 @@
+"""Stored canvas and chat encodings (storage_codec.py)"""
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import storage_codec
+from models import AWSResource, CanvasState, ChatMessage, Connection
+from storage_codec import describe, pack_canvas, pack_chat, unpack_canvas, unpack_canvas_json, unpack_chat
+
+
+def canvas(resources: int) -> CanvasState:
+    return CanvasState(
+        session_id="codec",
+        resources=[
+            AWSResource(id=f"r{i}", type="ec2", name=f"web-{i}", x=i, y=2.5 * i, properties={"size": "t3.micro"}, notes="한글")
+            for i in range(resources)
+        ],
+        connections=[Connection(from_resource=f"r{i}", to_resource=f"r{i + 1}") for i in range(resources - 1)],
+        user_prompt="three tier app",
+        last_updated=datetime(2026, 1, 2, 3, 4, 5, 678901)
+    )
+
+
+@pytest.mark.parametrize("resources, compressed", [(1, False), (100, True)])
+def test_canvas_round_trip(resources, compressed):
+    state = canvas(resources)
+    blob = pack_canvas(state)
+    # zstandard is optional
+    codec = "+zstd" if storage_codec._zstd_compressor is not None else "+zlib"
+    assert describe(blob) == "compact" + (codec if compressed else "")
+    assert unpack_canvas(blob) == state
+    assert json.loads(unpack_canvas_json(blob)) == json.loads(state.model_dump_json())
+
+
+def test_canvas_zlib_without_zstd(monkeypatch):
+    monkeypatch.setattr(storage_codec, "_zstd_compressor", None)
+    state = canvas(100)
+    blob = pack_canvas(state)
+    assert describe(blob) == "compact+zlib"
+    assert unpack_canvas(blob) == state
+
+
+def test_compact_encoding_is_smaller():
+    state = canvas(100)
+    assert len(pack_canvas(state)) < len(state.model_dump_json()) / 4
+
+
+def test_legacy_canvas_json_is_read():
+    state = canvas(3)
+    legacy = state.model_dump_json().encode("utf-8")
+    assert describe(legacy) == "legacy-json"
+    assert unpack_canvas(legacy) == state
+
+
+def test_unknown_canvas_version_is_rejected():
+    blob = pack_canvas(canvas(1))
+    with pytest.raises(ValueError):
+        unpack_canvas(blob[:2] + b"\x09" + blob[3:])
+
+
+def message(text: str, timestamp: datetime = datetime(2026, 1, 2, 3, 4, 5, 678000)) -> ChatMessage:
+    return ChatMessage(session_id="codec", user_id="u1", username="ann", message=text, timestamp=timestamp)
+
+
+def test_chat_round_trip():
+    fields = pack_chat(message("hello"))
+    assert set(fields) == {"v", "u", "n", "t", "m"}
+    assert unpack_chat(fields) == {
+        "user_id": "u1", "username": "ann", "message": "hello", "timestamp": "2026-01-02T03:04:05.678000"
+    }
+
+
+def test_long_chat_message_is_compressed():
+    text = "resource aws_instance web 한글 " * 200
+    fields = pack_chat(message(text))
+    assert "z" in fields and "m" not in fields
+    assert len(fields["z"]) < len(text.encode("utf-8")) / 4
+    assert unpack_chat(fields)["message"] == text
+
+
+def test_incompressible_chat_message_is_kept_as_text():
+    text = "".join(chr(0x4E00 + (i * 7919) % 20000) for i in range(600))
+    fields = pack_chat(message(text))
+    assert fields.get("m") == text
+
+
+def test_aware_chat_timestamp_keeps_its_offset():
+    timestamp = datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone(timedelta(hours=9)))
+    fields = pack_chat(message("hi", timestamp))
+    assert datetime.fromisoformat(unpack_chat(fields)["timestamp"]) == timestamp
+
+
+def test_legacy_chat_entry_is_read():
+    legacy = {"user_id": "u1", "username": "ann", "message": "hi", "timestamp": "2026-01-02T03:04:05.678901"}
+    assert unpack_chat(legacy) == legacy
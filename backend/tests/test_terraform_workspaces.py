@@ -0,0 +1,81 @@
+"""
+Workspace naming and the per-session stack lock shared by deploys and drift checks
+"""
+import asyncio
+
+import pytest
+
+import terraform_executor
+from drift import DriftMonitor
+from redis_client import RedisClient
+from terraform_executor import SESSION_FILE, STATE_FILE, TerraformExecutor
+
+
+@pytest.fixture
+def redis(fake_redis):
+    return RedisClient()
+
+
+def deployed(executor: TerraformExecutor, session_id: str):
+    workspace = executor.workspace(session_id)
+    workspace.mkdir(parents=True)
+    (workspace / SESSION_FILE).write_text(session_id)
+    (workspace / STATE_FILE).write_text('{"version": 4, "resources": []}')
+    return workspace
+
+
+def test_workspace_names_do_not_collide(tmp_path):
+    executor = TerraformExecutor(str(tmp_path))
+    ids = ["a/b", "a_b", "a.b", ".", "..", "", "../etc", "x" * 200, "x" * 201]
+    paths = [executor.workspace(session_id) for session_id in ids]
+    assert len(set(paths)) == len(ids)
+    for path in paths:
+        assert path.parent == tmp_path
+        assert not path.name.startswith(".")
+
+
+def test_workspaces_map_back_to_sessions(tmp_path):
+    executor = TerraformExecutor(str(tmp_path))
+    for session_id in ("a/b", "a_b"):
+        deployed(executor, session_id)
+    assert sorted(session_id for session_id, _ in executor.workspaces()) == ["a/b", "a_b"]
+
+
+def test_legacy_workspace_is_used_only_by_its_owner(tmp_path):
+    executor = TerraformExecutor(str(tmp_path))
+    legacy = tmp_path / "a_b"
+    legacy.mkdir()
+    (legacy / SESSION_FILE).write_text("a/b")
+    assert executor.workspace("a/b") == legacy
+    assert executor.workspace("a_b") != legacy
+
+
+def test_deploy_waits_for_the_stack_lock(tmp_path, redis, monkeypatch):
+    monkeypatch.setattr(terraform_executor, "STACK_LOCK_WAIT", 0.1)
+    executor = TerraformExecutor(str(tmp_path), stack_lock=redis.stack_lock)
+    held = redis.stack_lock("locked-session", ttl=30)
+    assert held.acquire(blocking=False)
+    try:
+        success, _, error = executor.deploy('resource "null_resource" "x" {}', "locked-session")
+        assert not success and "still running" in error
+        success, message = executor.destroy("locked-session")
+        assert not success and "still running" in message
+    finally:
+        held.release()
+    # Released again once the deploy gave up
+    assert redis.stack_lock("locked-session").acquire(blocking=False)
+
+
+def test_drift_check_skips_a_stack_being_deployed(tmp_path, redis):
+    executor = TerraformExecutor(str(tmp_path), stack_lock=redis.stack_lock)
+    deployed(executor, "deploying")
+    monitor = DriftMonitor(redis, None, executor, workers=1, terraform_bin="/nonexistent/terraform")
+    held = redis.stack_lock("deploying", ttl=30)
+    assert held.acquire(blocking=False)
+    try:
+        summary = asyncio.run(monitor.sweep())
+    finally:
+        held.release()
+        monitor.shutdown()
+    assert summary["busy"] == 1 and summary["checked"] == 1
+    assert redis.get_drift_results(["deploying"])["deploying"]["status"] == "busy"
@@ -0,0 +1,83 @@
+"""Viewport-scoped canvas broadcasts only reach clients whose view changed"""
+import asyncio
+import json
+
+from models import AWSResource, CanvasState, Viewport
+from websocket_manager import ConnectionManager
+
+
+class FakeSocket:
+    def __init__(self):
+        self.frames = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        self.frames.append(json.loads(text))
+
+
+def state(**positions) -> CanvasState:
+    return CanvasState(
+        session_id="view",
+        resources=[AWSResource(id=rid, type="ec2", name=rid, x=x, y=y) for rid, (x, y) in positions.items()]
+    )
+
+
+def test_unchanged_view_is_not_resent():
+    async def scenario():
+        manager = ConnectionManager()
+        left, right, unscoped = FakeSocket(), FakeSocket(), FakeSocket()
+        for socket in (left, right, unscoped):
+            await manager.connect(socket, "view")
+        manager.set_viewport(left, Viewport(x=0, y=0, width=100, height=100))
+        manager.set_viewport(right, Viewport(x=1000, y=0, width=100, height=100))
+
+        # c keeps the canvas bounds (part of the offscreen summary) fixed
+        await manager.broadcast_canvas_state("view", state(a=(10, 10), b=(1010, 10), c=(2000, 500)))
+        # Only b moves (inside the right viewport)
+        await manager.broadcast_canvas_state("view", state(a=(10, 10), b=(1020, 20), c=(2000, 500)))
+        # Nothing moves at all
+        await manager.broadcast_canvas_state("view", state(a=(10, 10), b=(1020, 20), c=(2000, 500)))
+        return left, right, unscoped
+
+    left, right, unscoped = asyncio.run(scenario())
+    assert len(left.frames) == 1
+    assert [r["id"] for r in left.frames[0]["data"]["resources"]] == ["a"]
+    assert len(right.frames) == 2
+    assert right.frames[1]["data"]["resources"][0]["x"] == 1020
+    assert "last_updated" in right.frames[1]["data"]
+    # Clients without a viewport get every full state
+    assert len(unscoped.frames) == 3
+
+
+def test_offscreen_summary_change_is_sent():
+    async def scenario():
+        manager = ConnectionManager()
+        socket = FakeSocket()
+        await manager.connect(socket, "view")
+        manager.set_viewport(socket, Viewport(x=0, y=0, width=100, height=100))
+        await manager.broadcast_canvas_state("view", state(a=(10, 10)))
+        await manager.broadcast_canvas_state("view", state(a=(10, 10), b=(5000, 10)))
+        return socket
+
+    socket = asyncio.run(scenario())
+    assert [frame["data"]["offscreen"]["count"] for frame in socket.frames] == [0, 1]
+
+
+def test_new_viewport_gets_the_next_update():
+    async def scenario():
+        manager = ConnectionManager()
+        socket = FakeSocket()
+        await manager.connect(socket, "view")
+        manager.set_viewport(socket, Viewport(x=0, y=0, width=100, height=100))
+        canvas = state(a=(10, 10), b=(1010, 10))
+        socket.frames.append(json.loads(manager.render_canvas_message("view", canvas, socket, "canvas_state")))
+        await manager.broadcast_canvas_state("view", canvas)
+        manager.set_viewport(socket, Viewport(x=1000, y=0, width=100, height=100))
+        await manager.broadcast_canvas_state("view", canvas)
+        return socket
+
+    socket = asyncio.run(scenario())
+    assert [frame["type"] for frame in socket.frames] == ["canvas_state", "canvas_update"]
+    assert [r["id"] for r in socket.frames[1]["data"]["resources"]] == ["b"]
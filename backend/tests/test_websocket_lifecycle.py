@@ -0,0 +1,77 @@
+"""Per-connection teardown and error frames on the session WebSocket"""
+import time
+
+import redis
+
+from conftest import receive_until
+
+ADD = {"id": ["c1", 1], "ts": 1, "op": "add", "rid": "r1", "fields": {"type": "s3", "name": "logs"}}
+PRESENCE = {"type": "presence", "data": {"user_id": "u1", "username": "ann"}}
+
+
+def session_state(main, session_id):
+    return (
+        session_id in main.ws_manager.active_connections,
+        session_id in main.chat_tail.tails,
+        session_id in main.canvas_docs.docs,
+        "u1" in main.presence.sessions.get(session_id, {})
+    )
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_bad_frames_answered_and_socket_kept(app_client, session_id, monkeypatch):
+    import main
+
+    def redis_down(message):
+        raise redis.ConnectionError("Redis went away")
+
+    monkeypatch.setattr(main.redis_client, "save_chat_message", redis_down)
+    with app_client.websocket_connect(f"/ws/{session_id}") as websocket:
+        websocket.send_text("{not json")
+        assert receive_until(websocket, "error")["reason"] == "invalid_message"
+
+        websocket.send_json({"type": "chat_message", "data": {
+            "session_id": session_id, "user_id": "u1", "username": "ann", "message": "hi"
+        }})
+        error = receive_until(websocket, "error")
+        assert error == {"type": "error", "reason": "message_failed", "message_type": "chat_message"}
+
+        # Still serving the socket
+        websocket.send_json({"type": "canvas_sync", "data": {"replica": "c1", "vector": {}}})
+        assert receive_until(websocket, "canvas_sync")["data"]["vector"] == {}
+
+
+def test_disconnect_releases_everything(app_client, session_id):
+    import main
+
+    with app_client.websocket_connect(f"/ws/{session_id}") as websocket:
+        websocket.send_json({"type": "canvas_ops", "data": [ADD]})
+        websocket.send_json(PRESENCE)
+        websocket.send_json({"type": "canvas_sync", "data": {"replica": "c1", "vector": {"c1": 1}}})
+        receive_until(websocket, "canvas_sync")
+        assert session_state(main, session_id) == (True, True, True, True)
+
+    assert wait_for(lambda: session_state(main, session_id) == (False, False, False, False))
+
+
+def test_reaped_socket_releases_everything(app_client, session_id):
+    import main
+    from websocket_manager import CLOSE_HEARTBEAT_TIMEOUT
+
+    with app_client.websocket_connect(f"/ws/{session_id}") as websocket:
+        websocket.send_json({"type": "canvas_ops", "data": [ADD]})
+        websocket.send_json(PRESENCE)
+        websocket.send_json({"type": "canvas_sync", "data": {"replica": "c1", "vector": {"c1": 1}}})
+        receive_until(websocket, "canvas_sync")
+
+        server_socket = next(iter(main.ws_manager.active_connections[session_id]))
+        app_client.portal.call(
+            main.ws_manager.close_connection, server_socket, CLOSE_HEARTBEAT_TIMEOUT, "heartbeat_timeout"
+        )
+        assert session_state(main, session_id) == (False, False, False, False)
@@ -0,0 +1,173 @@
+"""
+Lightweight in-process tracing with stage timings
+
+Root traces are sampled (TRACE_SAMPLE_RATE, or forced per request); child
+spans are only recorded inside a sampled trace, so un-sampled requests pay a
+single ContextVar lookup per instrumented stage. Finished traces go to an
+in-memory ring buffer (queried via /debug/traces) and, if TRACE_FILE is set,
+are appended to a JSONL file. No external collector is needed.
+"""
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "attributes", "start", "duration_ms", "error")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], attributes: Dict):
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start = time.time()
+        self.duration_ms = 0.0
+        self.error = None
+
+    @property
+    def trace_id(self) -> str:
+        return self.trace.trace_id
+
+    def set(self, key: str, value):
+        """Attach an attribute to the span"""
+        self.attributes[key] = value
+
+    def to_dict(self) -> Dict:
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error
+        }
+
+
+class Trace:
+    __slots__ = ("trace_id", "spans")
+
+    def __init__(self):
+        self.trace_id = uuid.uuid4().hex
+        self.spans: List[Span] = []
+
+    def to_dict(self) -> Dict:
+        root = self.spans[0]
+        return {
+            "trace_id": self.trace_id,
+            "name": root.name,
+            "start": root.start,
+            "duration_ms": round(root.duration_ms, 3),
+            "spans": [span.to_dict() for span in self.spans]
+        }
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("isshoni_current_span", default=None)
+
+
+class Tracer:
+    def __init__(self, sample_rate: float = 0.05, max_traces: int = 500, file_path: Optional[str] = None):
+        self.sample_rate = sample_rate
+        self.file_path = file_path
+        self.traces: deque = deque(maxlen=max_traces)
+        self._file_lock = threading.Lock()
+
+    @contextmanager
+    def trace(self, name: str, force: bool = False, **attributes):
+        """Start a root span, subject to sampling; yields None when not sampled"""
+        if not force and random.random() >= self.sample_rate:
+            yield None
+            return
+
+        trace = Trace()
+        try:
+            with self._record(Span(trace, name, None, attributes)) as span:
+                yield span
+        finally:
+            self._export(trace)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """Time a stage inside the current trace; yields None outside a sampled trace"""
+        parent = _current_span.get()
+        if parent is None:
+            yield None
+            return
+
+        with self._record(Span(parent.trace, name, parent.span_id, attributes)) as span:
+            yield span
+
+    @contextmanager
+    def _record(self, span: Span):
+        span.trace.spans.append(span)
+        token = _current_span.set(span)
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.duration_ms = (time.perf_counter() - start) * 1000
+            _current_span.reset(token)
+
+    def _export(self, trace: Trace):
+        self.traces.append(trace)
+        if self.file_path:
+            line = json.dumps(trace.to_dict(), default=str)
+            with self._file_lock:
+                with open(self.file_path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+
+    def query(self, name: Optional[str] = None, min_duration_ms: float = 0.0, limit: int = 50) -> List[Dict]:
+        """Most recent traces, optionally filtered by root-name substring and duration"""
+        results = []
+        for trace in reversed(self.traces):
+            root = trace.spans[0]
+            if name and name not in root.name:
+                continue
+            if root.duration_ms < min_duration_ms:
+                continue
+            results.append(trace.to_dict())
+            if len(results) >= limit:
+                break
+        return results
+
+    def get(self, trace_id: str) -> Optional[Dict]:
+        """Look up a buffered trace"""
+        for trace in self.traces:
+            if trace.trace_id == trace_id:
+                return trace.to_dict()
+        return None
+
+    def stage_summary(self) -> Dict[str, Dict]:
+        """Per-stage count, mean and p95 duration over the buffered traces"""
+        durations: Dict[str, List[float]] = {}
+        for trace in list(self.traces):
+            for span in trace.spans:
+                durations.setdefault(span.name, []).append(span.duration_ms)
+
+        summary = {}
+        for name, values in durations.items():
+            values.sort()
+            summary[name] = {
+                "count": len(values),
+                "mean_ms": round(sum(values) / len(values), 3),
+                "p95_ms": round(values[min(len(values) - 1, int(len(values) * 0.95))], 3)
+            }
+        return summary
+
+
+tracer = Tracer(
+    sample_rate=float(os.getenv("TRACE_SAMPLE_RATE", 0.05)),
+    max_traces=int(os.getenv("TRACE_BUFFER_SIZE", 500)),
+    file_path=os.getenv("TRACE_FILE") or None
+)
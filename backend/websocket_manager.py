@@ -1,34 +1,285 @@
 """
 WebSocket connection manager for real-time collaboration
 """
-from typing import Dict, Set
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
 from fastapi import WebSocket
 import json
 import asyncio
+import logging
+import os
+import sys
+import time
+
+from models import CanvasState, Viewport
+from codec import encode_canvas, encode_frame
+from spatial_index import SpatialIndex, scope_canvas_to_viewport
+from metrics import BROADCAST_LATENCY, BROADCAST_RECIPIENTS, REAPED_SOCKETS, SCOPED_SENDS_SKIPPED
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# Close codes
+CLOSE_GOING_AWAY = 1001
+CLOSE_TOO_BIG = 1009
+CLOSE_TRY_AGAIN_LATER = 1013
+CLOSE_HEARTBEAT_TIMEOUT = 4408
+
+
+class ConnectionInfo:
+    """Per-socket bookkeeping for heartbeats, idle reaping and memory accounting"""
+    __slots__ = (
+        "session_id", "connected_at", "last_seen", "last_activity",
+        "frames_in", "frames_out", "bytes_in", "bytes_out", "peak_frame_bytes", "rtt"
+    )
+
+    def __init__(self, session_id: str):
+        now = time.monotonic()
+        self.session_id = session_id
+        self.connected_at = now
+        # Any frame (including pong) proves the peer is alive
+        self.last_seen = now
+        # Only real traffic counts against the idle timeout
+        self.last_activity = now
+        self.frames_in = 0
+        self.frames_out = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.peak_frame_bytes = 0
+        self.rtt: Optional[float] = None
 
 
 class ConnectionManager:
     def __init__(self):
         # session_id -> Set of WebSocket connections
         self.active_connections: Dict[str, Set[WebSocket]] = {}
+        # WebSocket -> registered viewport (clients without one get the full canvas)
+        self.viewports: Dict[WebSocket, Viewport] = {}
+        # WebSocket -> hash of the last scoped canvas it was sent (without the timestamp)
+        self.scoped_views: Dict[WebSocket, int] = {}
+        # session_id -> spatial index over the session's canvas resources
+        self.spatial_indexes: Dict[str, SpatialIndex] = {}
+        # WebSocket -> lifecycle bookkeeping
+        self.connection_info: Dict[WebSocket, ConnectionInfo] = {}
+        # Sockets that sync the canvas as CRDT ops instead of full states
+        self.crdt_sockets: Set[WebSocket] = set()
+        # Full per-connection teardown set by the app (chat tail, documents, presence, ...);
+        # without it only this manager's bookkeeping is dropped
+        self.release_hook: Optional[Callable[[WebSocket, str], Awaitable[None]]] = None
+
+        self.max_sockets_per_session = int(os.getenv("WS_MAX_SOCKETS_PER_SESSION", 200))
+        self.max_sockets_per_worker = int(os.getenv("WS_MAX_SOCKETS_PER_WORKER", 5000))
+        self.max_frame_bytes = int(os.getenv("WS_MAX_FRAME_BYTES", 4 * 1024 * 1024))
+        self.heartbeat_interval = float(os.getenv("WS_HEARTBEAT_INTERVAL", 20))
+        self.heartbeat_timeout = float(os.getenv("WS_HEARTBEAT_TIMEOUT", 60))
+        self.idle_timeout = float(os.getenv("WS_IDLE_TIMEOUT", 1800))
+        # A send that cannot drain within this is treated as a dead peer
+        self.send_timeout = float(os.getenv("WS_SEND_TIMEOUT", 5))
 
-    async def connect(self, websocket: WebSocket, session_id: str):
-        """Connect a new WebSocket client"""
+    async def connect(self, websocket: WebSocket, session_id: str) -> bool:
+        """Connect a new WebSocket client; returns False if a socket cap rejected it"""
         await websocket.accept()
 
+        if self.get_total_connections() >= self.max_sockets_per_worker:
+            reason = "worker_full"
+        elif self.get_session_count(session_id) >= self.max_sockets_per_session:
+            reason = "session_full"
+        else:
+            reason = None
+        if reason:
+            REAPED_SOCKETS.labels(reason).inc()
+            await websocket.send_text(json.dumps({"type": "error", "reason": reason}))
+            await websocket.close(code=CLOSE_TRY_AGAIN_LATER)
+            return False
+
         if session_id not in self.active_connections:
             self.active_connections[session_id] = set()
 
         self.active_connections[session_id].add(websocket)
+        self.connection_info[websocket] = ConnectionInfo(session_id)
+        return True
 
     def disconnect(self, websocket: WebSocket, session_id: str):
         """Disconnect a WebSocket client"""
+        self.viewports.pop(websocket, None)
+        self.scoped_views.pop(websocket, None)
+        self.connection_info.pop(websocket, None)
+        self.crdt_sockets.discard(websocket)
+
         if session_id in self.active_connections:
             self.active_connections[session_id].discard(websocket)
 
             # Clean up empty sessions
             if not self.active_connections[session_id]:
                 del self.active_connections[session_id]
+                self.spatial_indexes.pop(session_id, None)
+
+    async def release(self, websocket: WebSocket, session_id: str):
+        """Tear a socket down exactly once, whether its handler or the reaper gets there first"""
+        if websocket not in self.connection_info:
+            return
+        if self.release_hook is not None:
+            await self.release_hook(websocket, session_id)
+        else:
+            self.disconnect(websocket, session_id)
+
+    def record_frame(self, websocket: WebSocket, size: int) -> bool:
+        """Account an inbound frame; returns False if it exceeds the frame size cap"""
+        info = self.connection_info.get(websocket)
+        if info is None:
+            return True
+        info.last_seen = time.monotonic()
+        info.frames_in += 1
+        info.bytes_in += size
+        info.peak_frame_bytes = max(info.peak_frame_bytes, size)
+        return size <= self.max_frame_bytes
+
+    def mark_active(self, websocket: WebSocket):
+        """Reset the idle timer (heartbeat pongs do not count as activity)"""
+        info = self.connection_info.get(websocket)
+        if info is not None:
+            info.last_activity = info.last_seen
+
+    def record_pong(self, websocket: WebSocket, ts: Optional[float]):
+        """Store the heartbeat round-trip time reported by a pong"""
+        info = self.connection_info.get(websocket)
+        if info is not None and ts is not None:
+            info.rtt = max(0.0, time.time() - ts)
+
+    async def _send(self, websocket: WebSocket, text: str):
+        """Send with a deadline so one stalled peer cannot hold up a broadcast"""
+        async with asyncio.timeout(self.send_timeout):
+            await websocket.send_text(text)
+        info = self.connection_info.get(websocket)
+        if info is not None:
+            info.frames_out += 1
+            info.bytes_out += len(text)
+
+    async def close_connection(self, websocket: WebSocket, code: int, reason: str):
+        """Server-side close; the socket's receive loop then sees the disconnect"""
+        info = self.connection_info.get(websocket)
+        if info is not None:
+            # The receive loop of a half-open peer may never wake up, so release here
+            await self.release(websocket, info.session_id)
+        REAPED_SOCKETS.labels(reason).inc()
+        try:
+            async with asyncio.timeout(self.send_timeout):
+                await websocket.close(code=code, reason=reason)
+        except Exception:
+            # Half-open peers never acknowledge; the transport is dropped anyway
+            pass
+
+    async def check_connections(self):
+        """Ping quiet sockets and reap ones that stopped answering or went idle"""
+        now = time.monotonic()
+        ping = json.dumps({"type": "ping", "ts": time.time()})
+        for websocket, info in list(self.connection_info.items()):
+            silent = now - info.last_seen
+            if silent > self.heartbeat_timeout:
+                await self.close_connection(websocket, CLOSE_HEARTBEAT_TIMEOUT, "heartbeat_timeout")
+            elif now - info.last_activity > self.idle_timeout:
+                await self.close_connection(websocket, CLOSE_GOING_AWAY, "idle")
+            elif silent >= self.heartbeat_interval:
+                try:
+                    await self._send(websocket, ping)
+                except Exception:
+                    await self.close_connection(websocket, CLOSE_GOING_AWAY, "send_failed")
+
+    async def run_heartbeats(self):
+        """Heartbeat and reap forever (run as a background task)"""
+        while True:
+            await asyncio.sleep(self.heartbeat_interval / 2)
+            try:
+                await self.check_connections()
+            except Exception as e:
+                logger.warning(f"Heartbeat sweep failed: {e}")
+
+    def connection_stats(self, top: int = 10) -> Dict:
+        """Socket counts, traffic and estimated per-connection memory"""
+        now = time.monotonic()
+        total = len(self.connection_info)
+        # Python objects the worker keeps per socket (shallow sizes: socket,
+        # ASGI scope, bookkeeping, viewport); frame buffers are transient and
+        # bounded by max_frame_bytes
+        retained = sum(
+            sys.getsizeof(websocket) + sys.getsizeof(websocket.scope) + sys.getsizeof(info)
+            + (sys.getsizeof(self.viewports[websocket]) if websocket in self.viewports else 0)
+            for websocket, info in self.connection_info.items()
+        )
+        rtts = [info.rtt for info in self.connection_info.values() if info.rtt is not None]
+        sessions = sorted(
+            ((session_id, len(sockets)) for session_id, sockets in self.active_connections.items()),
+            key=lambda item: item[1],
+            reverse=True
+        )
+        return {
+            "sockets": total,
+            "sessions": len(self.active_connections),
+            "limits": {
+                "sockets_per_session": self.max_sockets_per_session,
+                "sockets_per_worker": self.max_sockets_per_worker,
+                "frame_bytes": self.max_frame_bytes,
+                "heartbeat_interval_s": self.heartbeat_interval,
+                "heartbeat_timeout_s": self.heartbeat_timeout,
+                "idle_timeout_s": self.idle_timeout
+            },
+            "memory": {
+                "retained_bytes": retained,
+                "retained_bytes_per_socket": round(retained / total) if total else 0,
+                "peak_frame_bytes": max((i.peak_frame_bytes for i in self.connection_info.values()), default=0)
+            },
+            "traffic": {
+                "bytes_in": sum(i.bytes_in for i in self.connection_info.values()),
+                "bytes_out": sum(i.bytes_out for i in self.connection_info.values()),
+                "frames_in": sum(i.frames_in for i in self.connection_info.values()),
+                "frames_out": sum(i.frames_out for i in self.connection_info.values())
+            },
+            "heartbeat_rtt_ms_max": round(max(rtts) * 1000, 1) if rtts else None,
+            "oldest_socket_s": round(max((now - i.connected_at for i in self.connection_info.values()), default=0), 1),
+            "largest_sessions": [{"session_id": sid, "sockets": n} for sid, n in sessions[:top]]
+        }
+
+    def set_viewport(self, websocket: WebSocket, viewport: Viewport):
+        """Register the canvas region a client is looking at"""
+        self.viewports[websocket] = viewport
+
+    def set_crdt(self, websocket: WebSocket):
+        """Switch a socket from full canvas states to CRDT ops"""
+        self.crdt_sockets.add(websocket)
+
+    @staticmethod
+    def _scoped_payload(state: CanvasState, index: SpatialIndex, viewport: Viewport) -> Tuple[int, str]:
+        """(hash of what the viewport shows, payload JSON); `last_updated` changes every time, so it is left out of the hash"""
+        data = scope_canvas_to_viewport(state, index, viewport)
+        stamp = data.pop("last_updated")
+        view = json.dumps(data)
+        return hash(view), '%s,"last_updated":%s}' % (view[:-1], json.dumps(stamp))
+
+    def index_canvas(self, session_id: str, state: CanvasState) -> SpatialIndex:
+        """Update the session's spatial index incrementally from a canvas state"""
+        index = self.spatial_indexes.get(session_id)
+        if index is None:
+            index = SpatialIndex()
+            self.spatial_indexes[session_id] = index
+        index.sync(state.resources)
+        return index
+
+    def render_canvas_message(
+        self,
+        session_id: str,
+        state: CanvasState,
+        websocket: WebSocket,
+        message_type: str = "canvas_update",
+        encoded: Optional[bytes] = None
+    ) -> str:
+        """Serialize a canvas message scoped to the client's viewport"""
+        viewport = self.viewports.get(websocket)
+        if viewport is None:
+            return encode_frame(message_type, encoded or encode_canvas(state))
+
+        index = self.index_canvas(session_id, state)
+        view, payload = self._scoped_payload(state, index, viewport)
+        self.scoped_views[websocket] = view
+        return encode_frame(message_type, payload)
 
     async def broadcast_to_session(self, session_id: str, message: dict):
         """Broadcast message to all clients in a session"""
@@ -36,25 +287,117 @@ class ConnectionManager:
             return
 
         # Convert message to JSON
-        json_message = json.dumps(message)
+        await self.broadcast_frame(session_id, json.dumps(message))
+
+    async def broadcast_frame(
+        self,
+        session_id: str,
+        json_message: str,
+        exclude: Optional[WebSocket] = None,
+        crdt_only: bool = False
+    ):
+        """Broadcast an already-serialized frame to all clients in a session"""
+        if session_id not in self.active_connections:
+            return
+
+        start = time.perf_counter()
+        recipients = len(self.active_connections[session_id])
 
         # Send to all connections in the session
         dead_connections = set()
-        for connection in self.active_connections[session_id]:
-            try:
-                await connection.send_text(json_message)
-            except Exception as e:
-                # Mark dead connections for removal
-                dead_connections.add(connection)
+        with tracer.span("ws.broadcast", recipients=recipients, bytes=len(json_message)):
+            for connection in list(self.active_connections[session_id]):
+                if connection is exclude or (crdt_only and connection not in self.crdt_sockets):
+                    continue
+                try:
+                    await self._send(connection, json_message)
+                except Exception as e:
+                    # Mark dead (or stalled) connections for removal
+                    dead_connections.add(connection)
 
         # Clean up dead connections
         for connection in dead_connections:
-            self.disconnect(connection, session_id)
+            await self.close_connection(connection, CLOSE_GOING_AWAY, "send_failed")
+
+        BROADCAST_LATENCY.labels("frame").observe(time.perf_counter() - start)
+        BROADCAST_RECIPIENTS.labels("frame").observe(recipients)
+
+    async def broadcast_canvas_state(
+        self,
+        session_id: str,
+        state: CanvasState,
+        message_type: str = "canvas_update",
+        encoded: Optional[bytes] = None
+    ):
+        """
+        Broadcast a canvas state, sending each client only what intersects its viewport
+
+        `encoded` is the state's JSON when the caller already has it, so the full
+        canvas is never serialized twice. Scoped clients whose view is the same
+        as the last one they were sent get nothing.
+        """
+        if session_id not in self.active_connections:
+            return
+
+        start = time.perf_counter()
+        recipients = len(self.active_connections[session_id])
+
+        index = None
+        full_message = None
+        dead_connections = set()
+        with tracer.span("ws.broadcast_canvas", recipients=recipients):
+            for connection in list(self.active_connections[session_id]):
+                if connection in self.crdt_sockets:
+                    # Gets the same change as ops (broadcast_canvas_ops)
+                    continue
+                viewport = self.viewports.get(connection)
+                if viewport is None:
+                    # Serialize the full canvas once for every unscoped client
+                    if full_message is None:
+                        full_message = encode_frame(message_type, encoded or encode_canvas(state))
+                    json_message = full_message
+                else:
+                    # Only sessions with scoped clients pay for the spatial index
+                    if index is None:
+                        index = self.index_canvas(session_id, state)
+                    view, payload = self._scoped_payload(state, index, viewport)
+                    if self.scoped_views.get(connection) == view:
+                        SCOPED_SENDS_SKIPPED.inc()
+                        continue
+                    self.scoped_views[connection] = view
+                    json_message = encode_frame(message_type, payload)
+
+                try:
+                    await self._send(connection, json_message)
+                except Exception as e:
+                    dead_connections.add(connection)
+
+        # Clean up dead connections
+        for connection in dead_connections:
+            await self.close_connection(connection, CLOSE_GOING_AWAY, "send_failed")
+
+        BROADCAST_LATENCY.labels("canvas").observe(time.perf_counter() - start)
+        BROADCAST_RECIPIENTS.labels("canvas").observe(recipients)
+
+    async def broadcast_canvas_ops(self, session_id: str, ops: list, exclude: Optional[WebSocket] = None):
+        """Send CRDT ops to the session's CRDT sockets, except the one that made them"""
+        if not self.crdt_sockets:
+            return
+        await self.broadcast_frame(
+            session_id,
+            json.dumps({"type": "canvas_ops", "data": ops}),
+            exclude=exclude,
+            crdt_only=True
+        )
 
     async def send_personal_message(self, message: dict, websocket: WebSocket):
         """Send a message to a specific client"""
         json_message = json.dumps(message)
-        await websocket.send_text(json_message)
+        await self._send(websocket, json_message)
+
+    def get_total_connections(self) -> int:
+        """Get number of open connections across all sessions"""
+        return sum(len(connections) for connections in self.active_connections.values())
 
     def get_session_count(self, session_id: str) -> int:
         """Get number of active connections in a session"""
@@ -2,12 +2,11 @@
 Isshoni Frontend - Streamlit UI for Visual Infrastructure Design
 """
 import streamlit as st
-import requests
-import json
-from datetime import datetime
 import uuid
 import os
 
+from live_client import JobTracker, LiveSession, make_http_session
+
 # Page configuration
 st.set_page_config(
     page_title="Isshoni - Visual Infrastructure Generator",
@@ -19,9 +18,27 @@ st.set_page_config(
 # Backend API URL - Docker 환경에서는 서비스 이름 사용
 BACKEND_URL = os.getenv("BACKEND_URL", "http://backend:8000")
 
+# Resources drawn per page and chat messages drawn per refresh; fragment
+# reruns cost O(page), not O(canvas) or O(chat history)
+RESOURCES_PER_PAGE = 25
+CHAT_RENDER_LIMIT = 50
+# How often live fragments check for updates received in the background
+LIVE_REFRESH_SECONDS = 1.0
+
+
+@st.cache_resource
+def get_http_session():
+    """Pooled HTTP session shared by every browser session"""
+    return make_http_session()
+
+
+http = get_http_session()
+
 # Initialize session state
 if "session_id" not in st.session_state:
-    st.session_state.session_id = str(uuid.uuid4())
+    # Join a shared session with ?session=<id>; new sessions put their id in the URL
+    st.session_state.session_id = st.query_params.get("session") or str(uuid.uuid4())
+    st.query_params["session"] = st.session_state.session_id
 
 if "user_id" not in st.session_state:
     st.session_state.user_id = str(uuid.uuid4())[:8]
@@ -29,38 +46,65 @@ if "user_id" not in st.session_state:
 if "username" not in st.session_state:
     st.session_state.username = f"User_{st.session_state.user_id}"
 
-if "canvas_resources" not in st.session_state:
-    st.session_state.canvas_resources = []
-
-if "canvas_connections" not in st.session_state:
-    st.session_state.canvas_connections = []
+if "live" not in st.session_state:
+    # Background WebSocket client; canvas and chat come from the backend session
+    st.session_state.live = LiveSession(BACKEND_URL, st.session_state.session_id, http)
+    st.session_state.live.start()
 
 if "generated_code" not in st.session_state:
     st.session_state.generated_code = ""
-
-if "chat_messages" not in st.session_state:
-    st.session_state.chat_messages = [
-        {
-            "username": "Dev A",
-            "message": "普段はユーザーが10人しかいないけど、災害のときは10万人に通知を送ることになるから、1〜2分の間に一気にアクセスが集中するよね。",
-            "timestamp": "preset"
-        },
-        {
-            "username": "Dev B",
-            "message": "そうだね。開封率を30%としたら3万人、その半分が1分以内にアクセスするとしても、ピーク時は1万5千人ぐらい同時接続になるね。",
-            "timestamp": "preset"
-        },
-        {
-            "username": "Dev A",
-            "message": "そうなると、サーバー1台じゃ厳しいし、ALB（ロードバランサー）とオートスケーリングは必須だな。",
-            "timestamp": "preset"
-        },
-        {
-            "username": "Dev B",
-            "message": "了解！その構成でインフラ設計しよう！",
-            "timestamp": "preset"
-        },
-    ]
+    # Stored copy on the backend; deploys refer to it instead of re-sending the code
+    st.session_state.artifact_id = None
+
+if "jobs" not in st.session_state:
+    # kind -> JobTracker; picks up jobs started before a reload (or by teammates)
+    st.session_state.jobs = {}
+    try:
+        response = http.get(f"{BACKEND_URL}/api/sessions/{st.session_state.session_id}/jobs", timeout=5)
+        response.raise_for_status()
+        for job in response.json()["jobs"]:
+            if job["kind"] not in st.session_state.jobs:
+                st.session_state.jobs[job["kind"]] = JobTracker(BACKEND_URL, http, job)
+            if job["kind"] == "generate-code" and job["status"] == "succeeded" and not st.session_state.generated_code:
+                st.session_state.generated_code = job["result"]["code"]
+                st.session_state.artifact_id = job["result"].get("artifact_id")
+                st.session_state.applied_job = job["job_id"]
+    except Exception:
+        pass
+
+    if not st.session_state.generated_code:
+        # Jobs expire after a day; the session's latest artifact outlives them
+        try:
+            response = http.get(f"{BACKEND_URL}/api/sessions/{st.session_state.session_id}/artifacts/latest", timeout=5)
+            if response.status_code == 200:
+                artifact = response.json()
+                path = artifact["files"][0]["path"]
+                code = http.get(f"{BACKEND_URL}/api/artifacts/{artifact['artifact_id']}/files/{path}", timeout=10)
+                code.raise_for_status()
+                st.session_state.generated_code = code.text
+                st.session_state.artifact_id = artifact["artifact_id"]
+        except Exception:
+            pass
+
+# Example conversation shown while a session has no chat yet
+EXAMPLE_CHAT = [
+    {
+        "username": "Dev A",
+        "message": "普段はユーザーが10人しかいないけど、災害のときは10万人に通知を送ることになるから、1〜2分の間に一気にアクセスが集中するよね。"
+    },
+    {
+        "username": "Dev B",
+        "message": "そうだね。開封率を30%としたら3万人、その半分が1分以内にアクセスするとしても、ピーク時は1万5千人ぐらい同時接続になるね。"
+    },
+    {
+        "username": "Dev A",
+        "message": "そうなると、サーバー1台じゃ厳しいし、ALB（ロードバランサー）とオートスケーリングは必須だな。"
+    },
+    {
+        "username": "Dev B",
+        "message": "了解！その構成でインフラ設計しよう！"
+    },
+]
 
 
 def main():
@@ -97,9 +141,9 @@ def main():
         st.divider()
 
         if st.button("🔄 Reset Canvas"):
-            st.session_state.canvas_resources = []
-            st.session_state.canvas_connections = []
-            st.rerun()
+            st.session_state.live.update_canvas(reset_canvas)
+
+        live_status()
 
     # Main content tabs
     tab1, tab2, tab3, tab4 = st.tabs(["📐 Canvas", "💬 Chat", "🤖 Generate Code", "🚀 Deploy"])
@@ -108,143 +152,35 @@ def main():
     with tab1:
         st.header("Visual Infrastructure Canvas")
 
-        # User prompt
-        user_prompt = st.text_area(
+        # User prompt (shared with the session as part of the canvas)
+        live = st.session_state.live
+        st.text_area(
             "Describe your infrastructure needs:",
+            value=live.canvas.get("user_prompt", ""),
             placeholder="e.g., I need a disaster notification system that can handle 1M concurrent users with WebSocket connections...",
-            height=100
+            height=100,
+            key="user_prompt",
+            on_change=set_user_prompt
         )
 
-        col1, col2 = st.columns([2, 1])
-
-        with col1:
-            st.subheader("Design Canvas")
-
-            # Resource palette
-            st.write("**Available AWS Resources:**")
-            resource_cols = st.columns(4)
-
-            with resource_cols[0]:
-                if st.button("➕ VPC"):
-                    add_resource("vpc", "VPC")
-                if st.button("➕ EC2"):
-                    add_resource("ec2", "EC2 Instance")
-
-            with resource_cols[1]:
-                if st.button("➕ RDS"):
-                    add_resource("rds", "RDS Database")
-                if st.button("➕ ALB"):
-                    add_resource("alb", "Application Load Balancer")
-
-            with resource_cols[2]:
-                if st.button("➕ Redis"):
-                    add_resource("redis", "ElastiCache Redis")
-                if st.button("➕ S3"):
-                    add_resource("s3", "S3 Bucket")
-
-            with resource_cols[3]:
-                if st.button("➕ Lambda"):
-                    add_resource("lambda", "Lambda Function")
-                if st.button("➕ API Gateway"):
-                    add_resource("apigateway", "API Gateway")
-
-            st.divider()
-
-            # Display current resources
-            if st.session_state.canvas_resources:
-                st.write("**Current Resources:**")
-                for i, resource in enumerate(st.session_state.canvas_resources):
-                    col_a, col_b, col_c = st.columns([3, 2, 1])
-                    with col_a:
-                        st.write(f"**{resource['name']}** ({resource['type']})")
-                    with col_b:
-                        notes = st.text_input(
-                            "Notes",
-                            value=resource.get("notes", ""),
-                            key=f"notes_{i}",
-                            placeholder="Add configuration notes..."
-                        )
-                        st.session_state.canvas_resources[i]["notes"] = notes
-                    with col_c:
-                        if st.button("🗑️", key=f"delete_{i}"):
-                            st.session_state.canvas_resources.pop(i)
-                            st.rerun()
-            else:
-                st.info("👆 Click on resources above to add them to your canvas")
-
-        with col2:
-            st.subheader("Connections")
-
-            if len(st.session_state.canvas_resources) >= 2:
-                st.write("**Define connections between resources:**")
-
-                resource_names = [r["name"] for r in st.session_state.canvas_resources]
-
-                from_resource = st.selectbox("From", resource_names, key="conn_from")
-                to_resource = st.selectbox("To", resource_names, key="conn_to")
-                conn_type = st.selectbox(
-                    "Type",
-                    ["network", "data", "api", "message"],
-                    key="conn_type"
-                )
-
-                if st.button("➕ Add Connection"):
-                    if from_resource != to_resource:
-                        st.session_state.canvas_connections.append({
-                            "from_resource": from_resource,
-                            "to_resource": to_resource,
-                            "connection_type": conn_type
-                        })
-                        st.success("Connection added!")
-                    else:
-                        st.warning("Cannot connect a resource to itself")
-
-                if st.session_state.canvas_connections:
-                    st.write("**Current Connections:**")
-                    for i, conn in enumerate(st.session_state.canvas_connections):
-                        col_x, col_y = st.columns([4, 1])
-                        with col_x:
-                            st.write(f"{conn['from_resource']} → {conn['to_resource']} ({conn['connection_type']})")
-                        with col_y:
-                            if st.button("🗑️", key=f"del_conn_{i}"):
-                                st.session_state.canvas_connections.pop(i)
-                                st.rerun()
-            else:
-                st.info("Add at least 2 resources to create connections")
+        canvas_panel()
 
     # Tab 2: Team Chat
     with tab2:
         st.header("💬 Team Chat")
-
-        # Display chat messages
-        chat_container = st.container()
-        with chat_container:
-            for msg in st.session_state.chat_messages:
-                with st.chat_message(msg["username"]):
-                    st.write(msg["message"])
-                    st.caption(msg["timestamp"])
-
-        # Chat input
-        chat_input = st.chat_input("Type your message...")
-        if chat_input:
-            new_message = {
-                "username": st.session_state.username,
-                "message": chat_input,
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }
-            st.session_state.chat_messages.append(new_message)
-            st.rerun()
+        chat_panel()
 
     # Tab 3: Generate Code
     with tab3:
         st.header("🤖 AI Code Generation")
 
-        if not st.session_state.canvas_resources:
+        canvas = st.session_state.live.canvas
+        if not canvas["resources"]:
             st.warning("⚠️ Add some resources to the canvas first!")
         else:
             st.write("**Canvas Summary:**")
-            st.write(f"- Resources: {len(st.session_state.canvas_resources)}")
-            st.write(f"- Connections: {len(st.session_state.canvas_connections)}")
+            st.write(f"- Resources: {len(canvas['resources'])}")
+            st.write(f"- Connections: {len(canvas['connections'])}")
 
             st.divider()
 
@@ -256,65 +192,21 @@ def main():
             with col_gen2:
                 provider = "openai"  
 
-            if st.button("✨ Generate Infrastructure Code", type="primary"):
+            if st.button("✨ Generate Infrastructure Code", type="primary", disabled=job_active("generate-code")):
                 if not api_key:
                     st.error("Please enter your API key in the sidebar!")
                 else:
-                    with st.spinner("AI is generating your infrastructure code..."):
-                        # Prepare request
-                        canvas_state = {
-                            "session_id": st.session_state.session_id,
-                            "resources": [
-                                {
-                                    "id": str(i),
-                                    "type": r["type"],
-                                    "name": r["name"],
-                                    "x": i * 100,
-                                    "y": i * 100,
-                                    "properties": {},
-                                    "notes": r.get("notes", "")
-                                }
-                                for i, r in enumerate(st.session_state.canvas_resources)
-                            ],
-                            "connections": st.session_state.canvas_connections,
-                            "user_prompt": user_prompt
-                        }
-
-                        try:
-                            response = requests.post(
-                                f"{BACKEND_URL}/api/generate-code",
-                                json={
-                                    "session_id": st.session_state.session_id,
-                                    "canvas_state": canvas_state,
-                                    "target_format": target_format.lower(),
-                                    "ai_provider": provider
-                                },
-                                timeout=720  # 12분 (GMS API가 느릴 수 있음)
-                            )
-
-                            st.write(f"🔍 Debug - Response status: {response.status_code}")
-
-                            if response.status_code == 200:
-                                result = response.json()
-                                st.write(f"🔍 Debug - Result keys: {result.keys()}")
-                                st.write(f"🔍 Debug - Success: {result.get('success')}")
-
-                                if result["success"]:
-                                    code_content = result.get("code", "")
-                                    st.write(f"🔍 Debug - Code length: {len(code_content)}")
-                                    st.session_state.generated_code = code_content
-                                    st.success("✅ 코드 생성 완료!")
-                                    st.rerun()  # 페이지 새로고침하여 코드 표시
-                                else:
-                                    st.error(f"생성 실패: {result.get('error', 'Unknown error')}")
-                            else:
-                                st.error(f"API 오류: {response.status_code}")
-                                st.write(f"Response: {response.text}")
-
-                        except Exception as e:
-                            st.error(f"오류: {str(e)}")
-                            import traceback
-                            st.code(traceback.format_exc())
+                    # Prepare request from the shared session canvas
+                    canvas_state = {key: value for key, value in canvas.items() if key != "offscreen"}
+                    submit_job("generate-code", {
+                        "session_id": st.session_state.session_id,
+                        "canvas_state": canvas_state,
+                        "target_format": target_format.lower(),
+                        "ai_provider": provider
+                    })
+
+            if "generate-code" in st.session_state.jobs:
+                job_panel("generate-code")
 
             # Display generated code
             if st.session_state.generated_code:
@@ -351,52 +243,342 @@ def main():
 
             st.warning("⚠️ This will create real AWS resources that may incur costs!")
 
-            if st.button("🚀 Deploy Now", type="primary"):
+            if st.button("🚀 Deploy Now", type="primary", disabled=job_active("deploy")):
                 if not aws_access_key or not aws_secret_key:
                     st.error("Please enter AWS credentials in the sidebar!")
                 else:
-                    with st.spinner("Deploying infrastructure..."):
-                        try:
-                            response = requests.post(
-                                f"{BACKEND_URL}/api/deploy",
-                                json={
-                                    "session_id": st.session_state.session_id,
-                                    "code": st.session_state.generated_code,
-                                    "format": "terraform",
-                                    "auto_approve": auto_approve
-                                },
-                                timeout=300
-                            )
-
-                            if response.status_code == 200:
-                                result = response.json()
-                                if result["success"]:
-                                    st.success("✅ Deployment successful!")
-                                    st.json(result["outputs"])
-                                else:
-                                    st.error(f"Deployment failed: {result['error']}")
-                            else:
-                                st.error(f"API error: {response.status_code}")
-
-                        except Exception as e:
-                            st.error(f"Error: {str(e)}")
+                    request = {
+                        "session_id": st.session_state.session_id,
+                        "format": "terraform",
+                        "auto_approve": auto_approve
+                    }
+                    if st.session_state.artifact_id:
+                        request["artifact_id"] = st.session_state.artifact_id
+                    else:
+                        request["code"] = st.session_state.generated_code
+                    submit_job("deploy", request)
 
             st.divider()
 
             st.subheader("Deployment Status")
-            st.info("No active deployments")
+            if "deploy" in st.session_state.jobs:
+                job_panel("deploy")
+            else:
+                st.info("No active deployments")
+
+
+def job_active(kind: str) -> bool:
+    tracker = st.session_state.jobs.get(kind)
+    return tracker is not None and tracker.active
+
+
+def submit_job(kind: str, request: dict):
+    """Start a background job; progress is shown by job_panel"""
+    try:
+        response = http.post(f"{BACKEND_URL}/api/jobs/{kind}", json=request, timeout=10)
+    except Exception as e:
+        st.error(f"오류: {str(e)}")
+        return
+
+    if response.status_code == 429:
+        st.warning(f"Server is busy, try again in {response.headers.get('Retry-After', '?')}s")
+    elif response.status_code == 202:
+        st.session_state.jobs[kind] = JobTracker(BACKEND_URL, http, response.json())
+    else:
+        st.error(f"API 오류: {response.status_code}")
+        st.write(f"Response: {response.text}")
+
+
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def job_panel(kind: str):
+    """Status, streamed output and cancel/resume for the latest job of a kind"""
+    tracker = st.session_state.jobs[kind]
+    try:
+        tracker.poll()
+    except Exception as e:
+        st.caption(f"Status unavailable: {e}")
+
+    job = tracker.job
+    if tracker.active:
+        st.info(f"⏳ {job['status'].capitalize()}…")
+    elif job["status"] == "succeeded":
+        st.success("✅ 완료!")
+        result = job["result"] or {}
+        fallback = result.get("fallback")
+        if result.get("degraded") or fallback:
+            st.warning(
+                "⚠️ AI 응답을 받지 못해 "
+                + ("이전에 생성된 코드" if fallback == "cache" else "기본 템플릿")
+                + "를 표시합니다. 배포 전에 검토하세요."
+            )
+    elif job["stale"]:
+        st.warning("⚠️ This job stopped reporting progress")
+    else:
+        st.error(f"{job['status'].capitalize()}: {job.get('error') or 'Unknown error'}")
+
+    if tracker.output:
+        # Only the tail; the full code is shown once the job has finished
+        st.code(tracker.output[-4000:], language="hcl" if kind == "generate-code" else None)
+
+    if tracker.active:
+        if st.button("⏹ Cancel", key=f"cancel_{kind}", disabled=job["cancel_requested"]):
+            tracker.cancel()
+    elif job["status"] != "succeeded":
+        if st.button("🔁 Resume", key=f"resume_{kind}"):
+            try:
+                tracker.resume()
+            except Exception as e:
+                st.error(f"오류: {str(e)}")
+
+    if job["status"] == "succeeded" and job["result"]:
+        if kind == "deploy":
+            st.json(job["result"].get("outputs") or {})
+        elif st.session_state.get("applied_job") != tracker.job_id:
+            # Show the finished code in the tab (a full rerun)
+            st.session_state.applied_job = tracker.job_id
+            st.session_state.generated_code = job["result"]["code"]
+            st.session_state.artifact_id = job["result"].get("artifact_id")
+            st.rerun()
+
+
+def live_status():
+    """Connection status of the live session"""
+    live = st.session_state.live
+    if live.connected:
+        st.caption(f"🟢 Live · {live.active_users} user(s) in this session")
+        others = [state.get("username", user_id) for user_id, state in live.presence.items() if user_id != st.session_state.user_id]
+        if others:
+            st.caption("Here now: " + ", ".join(sorted(others)))
+    else:
+        st.caption("🟡 Reconnecting… (polling for updates)")
+    if live.notice:
+        st.caption(live.notice)
+    if live.drift and live.drift.get("status") == "drifted":
+        addresses = ", ".join(change["address"] for change in live.drift.get("changes", [])) or "unknown resources"
+        st.warning(f"⚠️ Deployed infrastructure has drifted from its state: {addresses}")
+
+
+def set_user_prompt():
+    prompt = st.session_state.user_prompt
+    st.session_state.live.update_canvas(lambda canvas: canvas.update(user_prompt=prompt))
+
+
+def reset_canvas(canvas: dict):
+    canvas["resources"] = []
+    canvas["connections"] = []
 
 
 def add_resource(resource_type: str, resource_name: str):
-    """Add a resource to the canvas"""
-    resource_id = f"{resource_type}_{len(st.session_state.canvas_resources)}"
-    st.session_state.canvas_resources.append({
-        "id": resource_id,
-        "type": resource_type,
-        "name": f"{resource_name}_{len(st.session_state.canvas_resources) + 1}",
-        "notes": ""
-    })
-    st.rerun()
+    """Add a resource to the shared canvas"""
+    def mutate(canvas: dict):
+        count = len(canvas["resources"])
+        # Placeholder grid position until the resource is laid out
+        canvas["resources"].append({
+            "id": f"{resource_type}_{uuid.uuid4().hex[:8]}",
+            "type": resource_type,
+            "name": f"{resource_name}_{count + 1}",
+            "x": (count % 6) * 200,
+            "y": (count // 6) * 150,
+            "properties": {},
+            "notes": ""
+        })
+
+    st.session_state.live.update_canvas(mutate)
+
+
+def auto_layout():
+    """Let the backend position every resource from the connections graph"""
+    if not st.session_state.live.auto_layout():
+        st.warning("Auto-layout is unavailable right now")
+
+
+def set_notes(resource_id: str):
+    notes = st.session_state[f"notes_{resource_id}"]
+
+    def mutate(canvas: dict):
+        for resource in canvas["resources"]:
+            if resource["id"] == resource_id:
+                resource["notes"] = notes
+
+    st.session_state.live.update_canvas(mutate)
+
+
+def delete_resource(resource_id: str):
+    def mutate(canvas: dict):
+        names = {r["name"] for r in canvas["resources"] if r["id"] == resource_id}
+        canvas["resources"] = [r for r in canvas["resources"] if r["id"] != resource_id]
+        canvas["connections"] = [
+            c for c in canvas["connections"]
+            if c["from_resource"] not in names and c["to_resource"] not in names
+        ]
+
+    st.session_state.live.update_canvas(mutate)
+
+
+def add_connection(from_resource: str, to_resource: str, connection_type: str):
+    st.session_state.live.update_canvas(lambda canvas: canvas["connections"].append({
+        "from_resource": from_resource,
+        "to_resource": to_resource,
+        "connection_type": connection_type
+    }))
+
+
+def delete_connection(connection: dict):
+    def mutate(canvas: dict):
+        canvas["connections"] = [c for c in canvas["connections"] if c != connection]
+
+    st.session_state.live.update_canvas(mutate)
+
+
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def canvas_panel():
+    """Resource palette, resource list and connections; reruns on its own"""
+    live = st.session_state.live
+    live.poll()
+    canvas = live.canvas
+    resources = canvas["resources"]
+
+    col1, col2 = st.columns([2, 1])
+
+    with col1:
+        st.subheader("Design Canvas")
+        if live.cost and live.cost["resources"]:
+            monthly = live.cost["monthly"]
+            estimate = f"💰 Estimated cost: ~${monthly['expected']:,.2f}/month ({live.cost['region']})"
+            if monthly["max"] != monthly["min"]:
+                estimate += f" · up to ${monthly['max']:,.2f} at max scale"
+            st.caption(estimate)
+
+        # Resource palette
+        st.write("**Available AWS Resources:**")
+        resource_cols = st.columns(4)
+
+        with resource_cols[0]:
+            st.button("➕ VPC", on_click=add_resource, args=("vpc", "VPC"))
+            st.button("➕ EC2", on_click=add_resource, args=("ec2", "EC2 Instance"))
+
+        with resource_cols[1]:
+            st.button("➕ RDS", on_click=add_resource, args=("rds", "RDS Database"))
+            st.button("➕ ALB", on_click=add_resource, args=("alb", "Application Load Balancer"))
+
+        with resource_cols[2]:
+            st.button("➕ Redis", on_click=add_resource, args=("redis", "ElastiCache Redis"))
+            st.button("➕ S3", on_click=add_resource, args=("s3", "S3 Bucket"))
+
+        with resource_cols[3]:
+            st.button("➕ Lambda", on_click=add_resource, args=("lambda", "Lambda Function"))
+            st.button("➕ API Gateway", on_click=add_resource, args=("apigateway", "API Gateway"))
+
+        st.divider()
+
+        # Display current resources, one page at a time
+        if resources:
+            st.button("🧭 Auto-layout", on_click=auto_layout, help="Arrange resources by tier along their connections")
+            pages = (len(resources) - 1) // RESOURCES_PER_PAGE + 1
+            page = st.number_input("Page", min_value=1, max_value=pages, value=1, key="resource_page") if pages > 1 else 1
+            visible = resources[(page - 1) * RESOURCES_PER_PAGE:page * RESOURCES_PER_PAGE]
+
+            # Push notes into the widgets only after a change (or for newly shown rows)
+            changed = st.session_state.get("canvas_seen") != live.canvas_version
+            for resource in visible:
+                key = f"notes_{resource['id']}"
+                if changed or key not in st.session_state:
+                    st.session_state[key] = resource.get("notes", "")
+            st.session_state.canvas_seen = live.canvas_version
+
+            # Tell the others which resources this user is looking at
+            live.announce(
+                st.session_state.user_id,
+                username=st.session_state.username,
+                selection=[resource["id"] for resource in visible]
+            )
+            viewers = {}
+            for user_id, state in live.presence.items():
+                if user_id != st.session_state.user_id:
+                    for resource_id in state.get("selection", ()):
+                        viewers.setdefault(resource_id, []).append(state.get("username", user_id))
+
+            st.write(f"**Current Resources:** {len(resources)}")
+            for resource in visible:
+                col_a, col_b, col_c = st.columns([3, 2, 1])
+                with col_a:
+                    st.write(f"**{resource['name']}** ({resource['type']})")
+                    if resource["id"] in viewers:
+                        st.caption("👀 " + ", ".join(viewers[resource["id"]]))
+                with col_b:
+                    st.text_input(
+                        "Notes",
+                        key=f"notes_{resource['id']}",
+                        placeholder="Add configuration notes...",
+                        on_change=set_notes,
+                        args=(resource["id"],)
+                    )
+                with col_c:
+                    st.button("🗑️", key=f"delete_{resource['id']}", on_click=delete_resource, args=(resource["id"],))
+        else:
+            st.info("👆 Click on resources above to add them to your canvas")
+
+    with col2:
+        st.subheader("Connections")
+
+        if len(resources) >= 2:
+            st.write("**Define connections between resources:**")
+
+            resource_names = [r["name"] for r in resources]
+
+            from_resource = st.selectbox("From", resource_names, key="conn_from")
+            to_resource = st.selectbox("To", resource_names, key="conn_to")
+            conn_type = st.selectbox(
+                "Type",
+                ["network", "data", "api", "message"],
+                key="conn_type"
+            )
+
+            if st.button("➕ Add Connection"):
+                if from_resource != to_resource:
+                    add_connection(from_resource, to_resource, conn_type)
+                    st.success("Connection added!")
+                else:
+                    st.warning("Cannot connect a resource to itself")
+
+            if canvas["connections"]:
+                st.write("**Current Connections:**")
+                for i, conn in enumerate(canvas["connections"][:RESOURCES_PER_PAGE]):
+                    col_x, col_y = st.columns([4, 1])
+                    with col_x:
+                        st.write(f"{conn['from_resource']} → {conn['to_resource']} ({conn['connection_type']})")
+                    with col_y:
+                        st.button("🗑️", key=f"del_conn_{i}", on_click=delete_connection, args=(conn,))
+                if len(canvas["connections"]) > RESOURCES_PER_PAGE:
+                    st.caption(f"… and {len(canvas['connections']) - RESOURCES_PER_PAGE} more")
+        else:
+            st.info("Add at least 2 resources to create connections")
+
+
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def chat_panel():
+    """Recent chat messages and the input box; reruns on its own"""
+    live = st.session_state.live
+    live.poll()
+    with live.lock:
+        messages = list(live.chat)[-CHAT_RENDER_LIMIT:]
+
+    if not messages:
+        with st.expander("Example conversation", expanded=True):
+            for msg in EXAMPLE_CHAT:
+                with st.chat_message(msg["username"]):
+                    st.write(msg["message"])
+
+    for msg in messages:
+        with st.chat_message(msg["username"]):
+            st.write(msg["message"])
+            st.caption(str(msg.get("timestamp", ""))[:19].replace("T", " "))
+
+    with st.form("chat_form", clear_on_submit=True):
+        text = st.text_input("Type your message...", label_visibility="collapsed", placeholder="Type your message...")
+        if st.form_submit_button("Send") and text:
+            username = st.session_state.get("username_input") or st.session_state.username
+            live.send_chat(st.session_state.user_id, username, text)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,392 @@
+"""
+Live session client for the Streamlit frontend
+
+One LiveSession per browser session (kept in st.session_state). A background
+thread holds the backend WebSocket and applies only the frames it receives;
+while the socket is down, `poll()` catches up over HTTP instead. Fragments
+compare the version counters to know whether anything changed.
+
+The canvas is a CRDT replica (crdt.py): local edits become ops that are
+applied at once and sent to the backend, remote ops are merged as they
+arrive, and on (re)connect both sides exchange only the ops the other is
+missing.
+"""
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+import requests
+import websocket
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from crdt import CanvasDocument
+
+logger = logging.getLogger(__name__)
+
+# Chat messages kept in memory per browser session (older pages come from /chat)
+CHAT_WINDOW = 200
+# Unchanged presence is re-announced this often (the backend expires it after PRESENCE_TTL)
+PRESENCE_KEEPALIVE = 4.0
+
+
+def make_http_session(pool_size: int = 32) -> requests.Session:
+    """Pooled keep-alive HTTP session shared by every browser session"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=pool_size,
+        # Only idempotent reads are retried; long-running POSTs are not
+        max_retries=Retry(total=2, backoff_factor=0.3, allowed_methods=["GET"])
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _stream_id(message_id: str) -> tuple:
+    """Redis stream IDs ("ms-seq") as comparable tuples"""
+    ms, _, seq = message_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+class LiveSession:
+    def __init__(self, backend_url: str, session_id: str, http: requests.Session):
+        self.backend_url = backend_url.rstrip("/")
+        self.session_id = session_id
+        self.http = http
+        self.ws_url = "ws" + self.backend_url[len("http"):] + f"/ws/{session_id}"
+
+        self.lock = threading.Lock()
+        self.doc = CanvasDocument(session_id, uuid.uuid4().hex[:12])
+        # Last state vector the backend reported; our ops beyond it are unacknowledged
+        self.server_vector: Dict[str, int] = {}
+        self.canvas: Dict = self.doc.to_canvas()
+        self.chat = deque(maxlen=CHAT_WINDOW)
+        self.chat_cursor = "0-0"
+        # Bumped whenever the corresponding state changes; fragments redraw on change
+        self.canvas_version = 0
+        self.chat_version = 0
+        self.active_users = 1
+        # Monthly cost estimate pushed by the backend after canvas edits
+        self.cost: Optional[Dict] = None
+        # Latest drift check of the deployed stack (status, changes, checked_at)
+        self.drift: Optional[Dict] = None
+        # user_id -> presence (username, selection, ...) of everyone in the session
+        self.presence: Dict[str, Dict] = {}
+        self._announced: Optional[Dict] = None
+        self._announced_at = 0.0
+        self.connected = False
+        self.notice: Optional[str] = None
+
+        self._app: Optional[websocket.WebSocketApp] = None
+        self._opened = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # -- lifecycle -----------------------------------------------------------
+
+    def start(self):
+        """Load the current state once, then keep it live over the WebSocket"""
+        self.poll(full=True)
+        self._thread = threading.Thread(target=self._run, name=f"live-{self.session_id}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._app is not None:
+            self._app.close()
+
+    def _run(self):
+        """Reconnect loop with exponential backoff"""
+        backoff = 1.0
+        while not self._stop.is_set():
+            self._opened = False
+            self._app = websocket.WebSocketApp(
+                self.ws_url,
+                on_open=self._on_open,
+                on_message=self._on_message,
+                on_close=self._on_close
+            )
+            self._app.run_forever()
+            self.connected = False
+            if self._stop.is_set():
+                break
+            backoff = 1.0 if self._opened else min(backoff * 2, 30.0)
+            self._stop.wait(backoff)
+
+    def _on_open(self, app):
+        self._opened = True
+        self.connected = True
+        # Fill the gaps left while disconnected; the socket delivers everything after
+        self._sync_canvas()
+        self._catch_up_chat()
+
+    def _on_close(self, app, status_code, reason):
+        self.connected = False
+
+    # -- inbound frames ------------------------------------------------------
+
+    def _on_message(self, app, raw: str):
+        message = json.loads(raw)
+        message_type = message.get("type")
+
+        if message_type == "canvas_ops":
+            with self.lock:
+                applied, gap = self.doc.apply_all(message["data"], record=False)
+                if applied:
+                    self._refresh_canvas()
+            if gap:
+                # Missed some ops; a sync fetches exactly those
+                self._sync_canvas()
+        elif message_type == "canvas_sync":
+            self._apply_sync(message["data"])
+        elif message_type == "chat_message":
+            self._apply_chat([message["data"]])
+        elif message_type == "cost_estimate":
+            self.cost = message["data"]
+        elif message_type == "drift_alert":
+            self.drift = message["data"]
+        elif message_type == "presence":
+            with self.lock:
+                for user in message["data"]["users"]:
+                    self.presence[user["user_id"]] = {**self.presence.get(user["user_id"], {}), **user}
+                for user_id in message["data"]["left"]:
+                    self.presence.pop(user_id, None)
+        elif message_type in ("connected", "user_connected", "user_disconnected"):
+            self.active_users = message.get("active_users", self.active_users)
+        elif message_type == "ping":
+            app.send(json.dumps({"type": "pong", "ts": message.get("ts")}))
+        elif message_type == "backpressure":
+            self.notice = f"Backend is throttling {message['message_type']} ({message['action']})"
+            if message["action"] == "resync":
+                # Our ops were not taken; they go out again with the next sync
+                timer = threading.Timer(message["retry_after_ms"] / 1000, self._sync_canvas)
+                timer.daemon = True
+                timer.start()
+        elif message_type == "redirect" and message.get("url"):
+            # The session lives on another backend node
+            self.ws_url = message["url"]
+        elif message_type == "error" and message.get("reason") == "invalid_message":
+            # The frame was not applied; the connection stays up
+            self.notice = f"Backend rejected {message.get('message_type') or 'a message'}: {message.get('detail')}"
+        elif message_type == "error" and message.get("reason") == "message_failed":
+            self.notice = f"Backend could not process {message.get('message_type') or 'a message'}; try again"
+        elif message_type == "error":
+            self.notice = f"Live connection refused: {message.get('reason')}"
+
+    def _refresh_canvas(self):
+        """Re-materialize the canvas from the document (caller holds the lock)"""
+        self.canvas = self.doc.to_canvas()
+        self.canvas_version += 1
+
+    def _apply_sync(self, reply: Dict):
+        """Merge what the backend sent and resend any of our ops it does not have"""
+        with self.lock:
+            if "snapshot" in reply:
+                self.doc.merge(reply["snapshot"])
+            else:
+                self.doc.apply_all(reply["ops"], record=False)
+            self.server_vector = reply["vector"]
+            self.doc.discard_acked(self.server_vector)
+            self._refresh_canvas()
+            pending = self.doc.ops_since(self.server_vector)
+        if pending:
+            self._send({"type": "canvas_ops", "data": pending})
+
+    def _apply_chat(self, messages: List[Dict]):
+        with self.lock:
+            cursor = _stream_id(self.chat_cursor)
+            fresh = [m for m in messages if m.get("message_id") and _stream_id(m["message_id"]) > cursor]
+            if not fresh:
+                return
+            self.chat.extend(fresh)
+            self.chat_cursor = fresh[-1]["message_id"]
+            self.chat_version += 1
+
+    # -- HTTP catch-up -------------------------------------------------------
+
+    def _catch_up_chat(self):
+        try:
+            response = self.http.get(
+                f"{self.backend_url}/api/sessions/{self.session_id}/chat/since",
+                params={"after": self.chat_cursor, "count": CHAT_WINDOW},
+                timeout=5
+            )
+            response.raise_for_status()
+            self._apply_chat(response.json()["messages"])
+        except requests.RequestException as e:
+            logger.warning(f"Chat catch-up failed: {e}")
+
+    def _sync_request(self) -> Dict:
+        with self.lock:
+            pending = self.doc.ops_since(self.server_vector)
+            request = {"replica": self.doc.replica, "vector": dict(self.doc.vector), "ops": pending or []}
+            if pending is None:
+                # The backend lost ops we already discarded; send our whole state
+                request["snapshot"] = self.doc.snapshot()
+        return request
+
+    def _sync_canvas(self):
+        """Start a delta sync over the WebSocket, or over HTTP while it is down"""
+        if self._send({"type": "canvas_sync", "data": self._sync_request()}):
+            return
+        try:
+            response = self.http.post(
+                f"{self.backend_url}/api/sessions/{self.session_id}/canvas/sync",
+                json=self._sync_request(),
+                timeout=10
+            )
+            response.raise_for_status()
+            self._apply_sync(response.json())
+        except requests.RequestException as e:
+            logger.warning(f"Canvas sync failed: {e}")
+
+    def poll(self, full: bool = False):
+        """Incremental HTTP catch-up, used while the WebSocket is down"""
+        if self.connected and not full:
+            return
+        self._catch_up_chat()
+        version = self.canvas_version
+        self._sync_canvas()
+        if self.canvas_version != version or full:
+            self._fetch_cost()
+        if full:
+            self._fetch_drift()
+
+    def _fetch_cost(self):
+        try:
+            response = self.http.get(f"{self.backend_url}/api/sessions/{self.session_id}/cost", timeout=5)
+            response.raise_for_status()
+            self.cost = response.json()
+        except requests.RequestException as e:
+            logger.warning(f"Cost estimate unavailable: {e}")
+
+    def _fetch_drift(self):
+        try:
+            response = self.http.get(f"{self.backend_url}/api/sessions/{self.session_id}/drift", timeout=5)
+            response.raise_for_status()
+            self.drift = response.json()
+        except requests.RequestException as e:
+            logger.warning(f"Drift status unavailable: {e}")
+
+    # -- outbound ------------------------------------------------------------
+
+    def _send(self, frame: Dict) -> bool:
+        if self.connected and self._app is not None:
+            try:
+                self._app.send(json.dumps(frame))
+                return True
+            except websocket.WebSocketException:
+                self.connected = False
+        return False
+
+    def update_canvas(self, mutate: Callable[[Dict], None]):
+        """Apply a local edit and send only the resulting ops"""
+        with self.lock:
+            canvas = self.doc.to_canvas()
+            mutate(canvas)
+            ops = self.doc.update_from_state(canvas)
+            if not ops:
+                return
+            self._refresh_canvas()
+
+        if not self._send({"type": "canvas_ops", "data": ops}):
+            # Unacknowledged ops stay in the document's log and go out with the sync
+            self._sync_canvas()
+
+    def auto_layout(self) -> bool:
+        """Have the backend lay the canvas out; the moves come back as one ops frame"""
+        try:
+            response = self.http.post(f"{self.backend_url}/api/sessions/{self.session_id}/layout", json={}, timeout=10)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            logger.warning(f"Auto-layout failed: {e}")
+            return False
+        if not self.connected:
+            self._sync_canvas()
+        return True
+
+    def announce(self, user_id: str, **state):
+        """
+        Share ephemeral presence (lossy: only sent while the socket is up)
+
+        Unchanged presence is re-sent only as a keep-alive, well inside the
+        backend's expiry.
+        """
+        presence = {"user_id": user_id, **state}
+        if presence == self._announced and time.monotonic() - self._announced_at < PRESENCE_KEEPALIVE:
+            return
+        if self._send({"type": "presence", "data": presence}):
+            self._announced = presence
+            self._announced_at = time.monotonic()
+
+    def send_chat(self, user_id: str, username: str, text: str):
+        """Send a chat message; it shows up once the backend echoes it with its stream ID"""
+        message = {"session_id": self.session_id, "user_id": user_id, "username": username, "message": text}
+        if not self._send({"type": "chat_message", "data": message}):
+            self.http.post(
+                f"{self.backend_url}/api/sessions/{self.session_id}/chat",
+                json=message,
+                timeout=10
+            )
+            self._catch_up_chat()
+
+
+class JobTracker:
+    """Follows a backend job by polling its status and streamed output incrementally"""
+
+    def __init__(self, backend_url: str, http: requests.Session, job: Dict):
+        self.backend_url = backend_url.rstrip("/")
+        self.http = http
+        self.job = job
+        self.output = ""
+        self.offset = 0
+        # Set once the finished job's final output has been fetched
+        self.settled = False
+
+    @property
+    def job_id(self) -> str:
+        return self.job["job_id"]
+
+    @property
+    def status(self) -> str:
+        return self.job["status"]
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running") and not self.job.get("stale")
+
+    def poll(self):
+        """Fetch status and only the output written since the last poll"""
+        if self.settled:
+            return
+        response = self.http.get(
+            f"{self.backend_url}/api/jobs/{self.job_id}",
+            params={"offset": self.offset},
+            timeout=5
+        )
+        response.raise_for_status()
+        job = response.json()
+        self.output += job.pop("output")
+        self.offset = job.pop("next_offset")
+        self.job = job
+        self.settled = not self.active
+
+    def cancel(self):
+        response = self.http.post(f"{self.backend_url}/api/jobs/{self.job_id}/cancel", timeout=5)
+        response.raise_for_status()
+        self.job = response.json()
+
+    def resume(self):
+        """Run the job again; its output starts over"""
+        response = self.http.post(f"{self.backend_url}/api/jobs/{self.job_id}/resume", timeout=5)
+        response.raise_for_status()
+        self.job = response.json()
+        self.output = ""
+        self.offset = 0
+        self.settled = False